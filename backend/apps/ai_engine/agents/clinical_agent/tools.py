@@ -79,11 +79,11 @@ def search_clinical_guideline(diagnosis_keyword: str) -> str:
     """
     import asyncio
     from apps.ai_engine.rag_service.vector_service import VectorService
-    from apps.ai_engine.rag_service.embeddings import EmbeddingService
+    from apps.ai_engine.rag_service.embeddings import get_embedding_service
 
     async def _search():
         vector_service = VectorService()
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
 
         # Embed từ khóa chẩn đoán
         embedding = await embedding_service.embed_text(diagnosis_keyword)
@@ -1,3 +1,84 @@
+"""
+AI Engine Tests
+
+Tests:
+  1. Embedding dùng chung - 1 instance / process (nhiều luồng), sync và async chung client + cache
+  2. Embedding dùng chung - LRU giới hạn kích thước, đếm hit / miss / evict
+  3. Embedding dùng chung - VectorStore đổi model / dimension → đọc lại config, xóa cache cũ
+(Client Vertex AI được giả lập — chạy không cần credentials.)
+"""
+
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
 from django.test import TestCase
 
-# Create your tests here.
+from apps.ai_engine.agents.models import VectorStore
+from apps.ai_engine.rag_service import embeddings
+from apps.ai_engine.rag_service.embeddings import EmbeddingService, get_embedding, get_embedding_service
+
+
+class SharedEmbeddingServiceTest(TestCase):
+    """Service dùng chung: 1 instance / process, LRU giới hạn, config đổi → đọc lại."""
+
+    def setUp(self):
+        client = MagicMock()
+        client.models.embed_content.side_effect = lambda model, contents, config: SimpleNamespace(
+            embeddings=[SimpleNamespace(values=[float(len(contents))] * config['output_dimensionality'])]
+        )
+        self.embed_content = client.models.embed_content
+        patcher = patch('google.genai.Client', return_value=client)
+        self.client_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        embeddings._shared_service = None
+        self.addCleanup(setattr, embeddings, '_shared_service', None)
+
+    def test_singleton_across_threads(self):
+        services = []
+        threads = [threading.Thread(target=lambda: services.append(get_embedding_service())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(s) for s in services}), 1)
+
+        # sync và async dùng chung client + cache
+        vector = get_embedding("Đau đầu")
+        self.assertEqual(asyncio.run(services[0].embed_text("Đau đầu")), vector)
+        self.assertEqual(self.embed_content.call_count, 1)
+        self.assertEqual(self.client_cls.call_count, 1)
+
+    def test_lru_bounded_with_stats(self):
+        service = EmbeddingService(cache_size=2)
+        for text in ["a", "bb", "a", "ccc", "bb"]:  # "bb" bị đẩy ra khi thêm "ccc"
+            service.embed_text_sync(text)
+
+        stats = service.cache_stats()
+        self.assertEqual(self.embed_content.call_count, 4)
+        self.assertEqual((stats['size'], stats['maxsize']), (2, 2))
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 4, 2))
+        self.assertEqual(stats['hit_rate'], 0.2)
+
+        service.embed_text_sync("a", use_cache=False)
+        self.assertEqual(service.cache_stats()['misses'], 4)
+
+    def test_config_refresh_on_vector_store_change(self):
+        service = get_embedding_service()
+        self.assertEqual(len(get_embedding("Sốt cao")), service.get_embedding_dimension())
+        self.assertEqual(service.cache_stats()['model'], 'gemini-embedding-001')
+
+        store = VectorStore.objects.create(
+            name='Test', collection_name='test_collection',
+            embedding_model='models/text-embedding-005', dimensions=256,
+        )
+        vector = get_embedding("Sốt cao")
+        self.assertEqual(len(vector), 256)
+        self.assertEqual(self.embed_content.call_args.kwargs['model'], 'text-embedding-005')
+        self.assertEqual(service.cache_stats()['size'], 1)  # vector 768d cũ đã bị xóa
+
+        store.delete()
+        self.assertEqual(len(get_embedding("Sốt cao")), 768)
+        self.assertEqual(self.client_cls.call_count, 1)
@@ -11,7 +11,7 @@ This package provides Retrieval-Augmented Generation capabilities including:
 from .vector_service import VectorService
 from .context_retrieval import retrieve_patient_context, format_context_for_llm
 from .hybrid_search import HybridSearchService
-from .embeddings import EmbeddingService, get_embedding
+from .embeddings import EmbeddingService, get_embedding, get_embedding_service
 
 __all__ = [
     'VectorService',
@@ -20,5 +20,6 @@ __all__ = [
     'HybridSearchService',
     'EmbeddingService',
     'get_embedding',
+    'get_embedding_service',
 ]
 
@@ -13,7 +13,7 @@ from datetime import datetime
 from asgiref.sync import sync_to_async
 
 from .vector_service import VectorService
-from .embeddings import EmbeddingService
+from .embeddings import EmbeddingService, get_embedding_service
 from .pii_masking import mask_patient_id, mask_sensitive_fields
 
 logger = logging.getLogger(__name__)
@@ -34,7 +34,7 @@ async def retrieve_patient_context(
         query: Optional query for semantic search of clinical records
         top_k_records: Number of clinical records to retrieve
         vector_service: VectorService instance (creates new if None)
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         Dictionary with patient context including demographics, clinical history, and prescriptions
@@ -46,7 +46,7 @@ async def retrieve_patient_context(
         if vector_service is None:
             vector_service = VectorService()
         if embedding_service is None:
-            embedding_service = EmbeddingService()
+            embedding_service = get_embedding_service()
         
         # Fetch patient demographics
         demographics = await _get_patient_demographics(patient_id)
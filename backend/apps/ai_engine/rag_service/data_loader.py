@@ -11,7 +11,7 @@ from datetime import datetime
 from asgiref.sync import sync_to_async
 
 from .vector_service import VectorService
-from .embeddings import EmbeddingService, embed_clinical_note, embed_icd10_code, embed_department
+from .embeddings import EmbeddingService, get_embedding_service, embed_clinical_note, embed_icd10_code, embed_department
 from .pii_masking import mask_patient_id
 
 logger = logging.getLogger(__name__)
@@ -29,7 +29,7 @@ async def load_clinical_records_to_vector_db(
     Args:
         batch_size: Number of records to process per batch
         vector_service: VectorService instance (creates new if None)
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         since_date: Only load records created/updated after this date (for incremental updates)
         
     Returns:
@@ -43,7 +43,7 @@ async def load_clinical_records_to_vector_db(
     if vector_service is None:
         vector_service = VectorService()
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Get records to load
     @sync_to_async
@@ -142,7 +142,7 @@ async def load_icd10_codes_to_vector_db(
     Args:
         batch_size: Number of codes to process per batch
         vector_service: VectorService instance (creates new if None)
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         Number of codes loaded
@@ -155,7 +155,7 @@ async def load_icd10_codes_to_vector_db(
     if vector_service is None:
         vector_service = VectorService()
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Get all ICD-10 codes
     @sync_to_async
@@ -245,7 +245,7 @@ async def update_clinical_record_in_vector_db(
     Args:
         record_id: Clinical record UUID
         vector_service: VectorService instance (creates new if None)
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         True if successful
@@ -256,7 +256,7 @@ async def update_clinical_record_in_vector_db(
     if vector_service is None:
         vector_service = VectorService()
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Get record
     @sync_to_async
@@ -331,7 +331,7 @@ async def load_departments_to_vector_db(
     
     Args:
         vector_service: VectorService instance (creates new if None)
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         Number of departments loaded
@@ -344,7 +344,7 @@ async def load_departments_to_vector_db(
     if vector_service is None:
         vector_service = VectorService()
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Get active departments
     @sync_to_async
@@ -434,7 +434,7 @@ async def load_guidelines_to_vector_db(
     if vector_service is None:
         vector_service = VectorService()
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
 
     @sync_to_async
     def _get_guidelines():
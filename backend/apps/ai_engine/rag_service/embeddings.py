@@ -5,23 +5,60 @@ Provides embedding generation with support for multiple backends:
 - Google GenAI Embeddings (gemini-embedding-001)
 - Local Sentence Transformers (default)
 
-Uses caching to avoid re-embedding identical text.
+One shared service per process (get_embedding_service()): the genai client is
+created once, the model / dimension config (VectorStore → settings) is read
+once and re-checked every CONFIG_TTL_SECONDS (immediately in this process when
+a VectorStore is saved, see signals.py), and embeddings are kept in a
+size-bounded LRU (settings.RAG_EMBEDDING_CACHE_SIZE) with hit / miss stats.
+
+    service = get_embedding_service()
+    vector = await service.embed_text("Bệnh nhân đau đầu, sốt cao")
+    vector = get_embedding("Bệnh nhân đau đầu, sốt cao")   # sync code
+    service.cache_stats()  # {'size': 120, 'maxsize': 2048, 'hits': 900, 'misses': 120, ...}
 """
 
+import asyncio
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 from typing import List, Optional, Dict, Any
-from functools import lru_cache
-import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+CONFIG_TTL_SECONDS = 60  # worker khác đổi VectorStore → process này thấy sau tối đa 1 phút
+DEFAULT_MODEL = 'gemini-embedding-001'
+
+_shared_service: Optional['EmbeddingService'] = None
+_shared_lock = threading.Lock()
+
+
+def get_embedding_service() -> 'EmbeddingService':
+    """EmbeddingService dùng chung cho cả process (thread-safe, dùng được từ sync lẫn async)."""
+    global _shared_service
+    if _shared_service is None:
+        with _shared_lock:
+            if _shared_service is None:
+                _shared_service = EmbeddingService()
+    return _shared_service
+
+
+def invalidate_embedding_config() -> None:
+    """Đọc lại cấu hình model / dimension ở lần embed kế tiếp (VectorStore vừa đổi)."""
+    if _shared_service is not None:
+        _shared_service.invalidate_config()
+
 
 def get_embedding(text: str, use_cache: bool = True) -> List[float]:
     """
     Synchronous wrapper for generating text embedding using Google GenAI.
     
     Tiện dụng cho code đồng bộ (sync) không cần async/await.
-    Sử dụng thread pool để tránh vấn đề nested event loops.
+    Gọi thẳng client (không tạo event loop) nên dùng được cả khi đang có loop chạy.
     
     Args:
         text: Text cần chuyển thành embedding
@@ -35,27 +72,58 @@ def get_embedding(text: str, use_cache: bool = True) -> List[float]:
         >>> len(embedding)
         768
     """
-    import concurrent.futures
-    
-    if not text or not text.strip():
-        logger.warning("Empty text provided for embedding")
-        return []
-    
-    def _sync_embed():
-        """Run embedding in new event loop within thread."""
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            service = EmbeddingService()
-            return loop.run_until_complete(service.embed_text(text, use_cache))
-        finally:
-            loop.close()
-    
-    # Always use thread pool to avoid nested event loop issues
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(_sync_embed)
-        return future.result()
+    return get_embedding_service().embed_text_sync(text, use_cache)
+
+
+class EmbeddingCache:
+    """LRU giới hạn số vector, thread-safe, đếm hit / miss / evict."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(int(maxsize), 0)
+        self._data: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: List[float]) -> None:
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
 
 
 class EmbeddingService:
@@ -63,32 +131,54 @@ class EmbeddingService:
     Service for generating embeddings from clinical text.
     
     Supports multiple embedding backends and includes caching.
+    Prefer get_embedding_service() — a new instance means a new client and an empty cache.
     """
     
     
-    def __init__(self, provider: str = 'google', model_name: Optional[str] = None, lazy_init: bool = True):
+    def __init__(
+        self,
+        provider: str = 'google',
+        model_name: Optional[str] = None,
+        lazy_init: bool = True,
+        cache_size: Optional[int] = None,
+    ):
         """
         Initialize embedding service.
         
         Args:
             provider: Embedding provider ('google') - default and only supported
-            model_name: Specific model name (provider-dependent)
+            model_name: Specific model name (provider-dependent); an active VectorStore config wins
             lazy_init: If True, delay model initialization until first use (async-safe)
+            cache_size: Max cached embeddings (default settings.RAG_EMBEDDING_CACHE_SIZE)
         """
         self.provider = 'google'  # Enforce google
+        self._requested_model = model_name
         self.model_name = model_name
         self._embedding_model = None
-        self._embedding_cache: Dict[str, List[float]] = {}
-        self._dimension = 768 # Default
+        if cache_size is None:
+            cache_size = getattr(settings, 'RAG_EMBEDDING_CACHE_SIZE', 2048)
+        self._embedding_cache = EmbeddingCache(cache_size)
+        self._dimension = getattr(settings, 'RAG_EMBEDDING_DIMENSION', 768)
         self._initialized = False
+        self._config_checked_at: Optional[float] = None
+        self._lock = threading.Lock()
         
         if not lazy_init:
             self._initialize_model()
     
+    def _needs_init(self) -> bool:
+        checked = self._config_checked_at
+        return not self._initialized or checked is None or time.monotonic() - checked > CONFIG_TTL_SECONDS
+
     def _ensure_initialized(self):
-        """Ensure the model is initialized (lazy initialization)."""
-        if not self._initialized:
-            self._initialize_model()
+        """Ensure the client exists and the model config is fresh (lazy, thread-safe)."""
+        if not self._needs_init():
+            return
+        with self._lock:
+            if not self._initialized:
+                self._initialize_model()
+            elif self._needs_init():
+                self._refresh_config()
     
     def _initialize_model(self):
         """Initialize the embedding model based on provider."""
@@ -103,33 +193,55 @@ class EmbeddingService:
             logger.error(f"Failed to initialize embedding model: {e}")
             raise RuntimeError("Failed to initialize Google GenAI embeddings via Vertex AI. Ensure GOOGLE_APPLICATION_CREDENTIALS is set.")
     
+    def _resolve_config(self) -> tuple:
+        """(model, dimension): VectorStore đang active → settings → mặc định."""
+        model_name = self._requested_model
+        dimension = getattr(settings, 'RAG_EMBEDDING_DIMENSION', 768)
+
+        # 1. Try to load from Database (VectorStore)
+        try:
+            from apps.ai_engine.agents.models import VectorStore
+            vector_config = VectorStore.get_active_config()
+            
+            if vector_config:
+                model_name = vector_config.embedding_model or model_name
+                dimension = vector_config.dimensions
+        except Exception as db_error:
+            logger.debug(f"Skipping DB config load: {db_error}")
+        
+        # 2. Fallback to settings or default
+        if not model_name:
+            model_name = getattr(settings, 'RAG_EMBEDDING_MODEL', DEFAULT_MODEL)
+
+        if model_name and model_name.startswith('models/'):
+            model_name = model_name.replace('models/', '')
+        
+        # Nếu lỡ model name trống thì set default
+        return model_name or DEFAULT_MODEL, dimension
+
+    def _refresh_config(self):
+        model_name, dimension = self._resolve_config()
+        if (model_name, dimension) != (self.model_name, self._dimension):
+            if self._initialized:
+                logger.info(
+                    f"Embedding config changed: {self.model_name} ({self._dimension}d) → {model_name} ({dimension}d)"
+                )
+                # Key cache gồm model + dimension nên vector cũ không bị dùng lại — xóa cho nhẹ bộ nhớ
+                self._embedding_cache.clear()
+            self.model_name, self._dimension = model_name, dimension
+        self._config_checked_at = time.monotonic()
+
+    def invalidate_config(self):
+        """Đọc lại model / dimension ở lần embed kế tiếp."""
+        self._config_checked_at = None
+
     def _init_google_embeddings(self):
         """Initialize Google GenAI embeddings via Vertex AI."""
         try:
             from google import genai
-            from django.conf import settings
-            
-            # 1. Try to load from Database (VectorStore)
-            try:
-                from apps.ai_engine.agents.models import VectorStore
-                vector_config = VectorStore.get_active_config()
-                
-                if vector_config:
-                    self.model_name = vector_config.embedding_model or self.model_name
-                    self._dimension = vector_config.dimensions
-                    logger.info(f"Loaded embedding config from DB: {self.model_name} ({self._dimension}d)")
-            except Exception as db_error:
-                logger.debug(f"Skipping DB config load: {db_error}")
             
-            # 2. Fallback to settings or default
-            if not self.model_name:
-                self.model_name = getattr(settings, 'RAG_EMBEDDING_MODEL', 'gemini-embedding-001')
-
-            if self.model_name and self.model_name.startswith('models/'):
-                self.model_name = self.model_name.replace('models/', '')
-            
-            # Nếu lỡ model name trống thì set default
-            self.model_name = self.model_name or 'gemini-embedding-001'
+            self._refresh_config()
+            logger.info(f"Loaded embedding config: {self.model_name} ({self._dimension}d)")
 
             # Use Vertex AI backend with service account credentials
             project = getattr(settings, 'VERTEX_AI_PROJECT', 'xiaoyue-api')
@@ -146,9 +258,28 @@ class EmbeddingService:
             raise ImportError("google-genai not installed. Run: pip install google-genai")
     
     def _get_cache_key(self, text: str) -> str:
-        """Generate cache key for text."""
-        return hashlib.md5(text.encode()).hexdigest()
-    
+        """Generate cache key for text (and the model / dimension that embeds it)."""
+        return hashlib.md5(f"{self.model_name}:{self._dimension}:{text}".encode()).hexdigest()
+
+    def _embed_cached(self, text: str, use_cache: bool) -> List[float]:
+        """Sync path shared by embed_text / embed_text_sync — config must already be fresh."""
+        cache_key = self._get_cache_key(text) if use_cache else None
+        if use_cache:
+            cached = self._embedding_cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"Cache hit for text: {text[:50]}...")
+                return cached
+
+        try:
+            embedding = self._embed_google(text)
+        except Exception as e:
+            logger.error(f"Error generating embedding: {e}")
+            raise
+
+        if use_cache:
+            self._embedding_cache.put(cache_key, embedding)
+        return embedding
+
     async def embed_text(self, text: str, use_cache: bool = True) -> List[float]:
         """
         Generate embedding for a single text.
@@ -164,46 +295,38 @@ class EmbeddingService:
             logger.warning("Empty text provided for embedding")
             return []
         
-        # Check cache
+        # Khởi tạo / đọc lại config (query DB) ngoài event loop
+        if self._needs_init():
+            await sync_to_async(self._ensure_initialized)()
+
+        # Cache hit: không rời event loop; miss: gọi API trong executor để không block
         if use_cache:
-            cache_key = self._get_cache_key(text)
-            if cache_key in self._embedding_cache:
-                logger.debug(f"Cache hit for text: {text[:50]}...")
-                return self._embedding_cache[cache_key]
-        
-        # Generate embedding
-        try:
-            # Ensure model is initialized (lazy initialization)
-            self._ensure_initialized()
-            embedding = await self._embed_google(text)
-            
-            # Cache result
-            if use_cache:
-                cache_key = self._get_cache_key(text)
-                self._embedding_cache[cache_key] = embedding
-            
-            return embedding
-            
-        except Exception as e:
-            logger.error(f"Error generating embedding: {e}")
-            raise
-    
-    async def _embed_google(self, text: str) -> List[float]:
-        """Generate embedding using Google GenAI."""
-        import asyncio
-        
-        def _sync_embed():
-            # Use configured dimension
-            result = self._embedding_model.models.embed_content(
-                model=self.model_name,
-                contents=text,
-                config={'output_dimensionality': self._dimension}
-            )
-            return result.embeddings[0].values
-        
-        # Run in executor to avoid blocking
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _sync_embed)
+            cached = self._embedding_cache.get(self._get_cache_key(text))
+            if cached is not None:
+                return cached
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(None, self._embed_cached, text, False)
+        if use_cache:
+            self._embedding_cache.put(self._get_cache_key(text), embedding)
+        return embedding
+
+    def embed_text_sync(self, text: str, use_cache: bool = True) -> List[float]:
+        """Sync version of embed_text (blocks on the API call)."""
+        if not text or not text.strip():
+            logger.warning("Empty text provided for embedding")
+            return []
+        self._ensure_initialized()
+        return self._embed_cached(text, use_cache)
+    
+    def _embed_google(self, text: str) -> List[float]:
+        """Generate embedding using Google GenAI (blocking)."""
+        # Use configured dimension
+        result = self._embedding_model.models.embed_content(
+            model=self.model_name,
+            contents=text,
+            config={'output_dimensionality': self._dimension}
+        )
+        return result.embeddings[0].values
 
     async def embed_batch(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
         """
@@ -216,8 +339,6 @@ class EmbeddingService:
         Returns:
             List of embedding vectors
         """
-        import asyncio
-        
         # For small batches, use concurrent individual calls
         # Note: Google GenAI might have batch support, but for now we stick to implementation
         # that definitely works with current client pattern or use simple loop/gather
@@ -238,6 +359,10 @@ class EmbeddingService:
         """Get the dimension of embeddings from this model."""
         return self._dimension
 
+    def cache_stats(self) -> Dict[str, Any]:
+        """Cache hit / miss / size + the model config in use."""
+        return {**self._embedding_cache.stats(), 'model': self.model_name, 'dimension': self._dimension}
+
 
 async def embed_clinical_note(
     chief_complaint: str,
@@ -256,13 +381,13 @@ async def embed_clinical_note(
         chief_complaint: Patient's chief complaint
         history_of_present_illness: Patient's medical history
         physical_exam: Physical examination findings
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         Embedding vector for the clinical note
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Combine clinical text
     parts = [
@@ -303,7 +428,7 @@ async def embed_drug_info(
         Embedding vector for the drug
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         
     parts = [
         f"Thuốc: {name}",
@@ -339,7 +464,7 @@ async def embed_medical_protocol(
         Embedding vector
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         
     parts = [f"Phác đồ: {title}"]
     
@@ -371,7 +496,7 @@ async def embed_hospital_process(
         Embedding vector
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         
     parts = []
     if category:
@@ -397,13 +522,13 @@ async def embed_icd10_code(
         code: ICD-10 code
         name: Disease name
         description: Optional description
-        embedding_service: EmbeddingService instance (creates new if None)
+        embedding_service: EmbeddingService instance (shared service if None)
         
     Returns:
         Embedding vector for the ICD-10 code
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
     
     # Combine ICD-10 information
     combined_text = f"{code} - {name}"
@@ -439,7 +564,7 @@ async def embed_department(
         Embedding vector
     """
     if embedding_service is None:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         
     parts = [f"Khoa phòng: {name} ({code})"]
     
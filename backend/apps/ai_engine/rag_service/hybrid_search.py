@@ -12,7 +12,7 @@ from typing import List, Dict, Any, Optional, Tuple
 from asgiref.sync import sync_to_async
 
 from .vector_service import VectorService
-from .embeddings import EmbeddingService
+from .embeddings import EmbeddingService, get_embedding_service
 
 logger = logging.getLogger(__name__)
 
@@ -35,10 +35,10 @@ class HybridSearchService:
         
         Args:
             vector_service: VectorService instance (creates new if None)
-            embedding_service: EmbeddingService instance (creates new if None)
+            embedding_service: EmbeddingService instance (shared service if None)
         """
         self.vector_service = vector_service or VectorService()
-        self.embedding_service = embedding_service or EmbeddingService()
+        self.embedding_service = embedding_service or get_embedding_service()
     
     async def search_icd10_by_code(
         self,
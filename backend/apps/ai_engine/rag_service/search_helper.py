@@ -8,7 +8,7 @@ import logging
 from typing import List, Dict, Any, Optional
 
 from .vector_service import VectorService
-from .embeddings import EmbeddingService, get_embedding
+from .embeddings import get_embedding, get_embedding_service
 from .context_retrieval import retrieve_patient_context, format_context_for_llm
 
 logger = logging.getLogger(__name__)
@@ -46,7 +46,7 @@ async def get_rag_context(
         ...     print(f"Score: {r['similarity']:.2f} - {r['document'][:100]}")
     """
     try:
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         vector_service = VectorService()
         
         # Generate query embedding
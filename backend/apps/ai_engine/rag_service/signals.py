@@ -104,3 +104,15 @@ def remove_clinical_record_on_delete(sender, instance, **kwargs):
     
     thread = threading.Thread(target=_run_delete, daemon=True)
     thread.start()
+
+
+@receiver(post_save, sender='agents.VectorStore')
+@receiver(post_delete, sender='agents.VectorStore')
+def refresh_embedding_config(sender, instance, **kwargs):
+    """
+    Signal handler: Cấu hình VectorStore (model / dimension) đổi → EmbeddingService
+    dùng chung đọc lại ngay ở lần embed kế tiếp (process khác: sau CONFIG_TTL_SECONDS).
+    """
+    from .embeddings import invalidate_embedding_config
+
+    invalidate_embedding_config()
@@ -91,6 +91,7 @@ urlpatterns = [
     # ==========================================================================
     path('kiosk/identify/', kiosk_views.kiosk_identify, name='kiosk_identify'),
     path('kiosk/register/', kiosk_views.kiosk_register, name='kiosk_register'),
+    path('kiosk/metrics/', kiosk_views.kiosk_metrics, name='kiosk_metrics'),
 
     # ==========================================================================
     # INSURANCE MOCK ENDPOINTS
@@ -17,6 +17,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 
+from apps.core_services.core.utils import CodeAllocator
 from apps.core_services.appointments.models import Appointment
 from apps.core_services.patients.models import Patient
 from apps.core_services.departments.models import Department
@@ -85,14 +86,16 @@ def create_booking(request):
         
         if not patient:
             # Fallback to finding by contact_number or creating a new one
-            patient, created = Patient.objects.get_or_create(
-                contact_number=data['phone'], 
-                defaults={
-                    'first_name': first_name,
-                    'last_name': last_name,
-                    'id_card': id_card,
-                }
-            )
+            patient = Patient.objects.filter(contact_number=data['phone']).first()
+            created = patient is None
+            if created:
+                patient = CodeAllocator.create('patient', lambda code: Patient.objects.create(
+                    patient_code=code.code,
+                    contact_number=data['phone'],
+                    first_name=first_name,
+                    last_name=last_name,
+                    id_card=id_card,
+                ))
             # If the patient exists but didn't have id_card, update it
             if not created and id_card and not patient.id_card:
                 patient.id_card = id_card
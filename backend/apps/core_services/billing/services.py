@@ -1,12 +1,12 @@
 """
 BillingService — Nghiệp vụ viện phí
 """
-import uuid
 from decimal import Decimal
 from django.db import transaction
 from django.db.models import Sum, Q
 from django.utils import timezone
 
+from apps.core_services.core.utils import CodeAllocator
 from .models import Invoice, InvoiceLineItem, Payment, InvoiceStatus, ServiceCatalog
 
 
@@ -30,21 +30,18 @@ class BillingService:
         if existing:
             return existing
         
-        # Tạo số hóa đơn: INV-YYYYMMDD-XXXXXX
-        today_str = timezone.now().strftime('%Y%m%d')
-        invoice_number = f"INV-{today_str}-{uuid.uuid4().hex[:6].upper()}"
-        
         # Lấy bảng giá mặc định
         from .models import PriceList
         price_list = PriceList.objects.filter(is_default=True, is_active=True).first()
         
-        invoice = Invoice.objects.create(
+        # Số hóa đơn: INV-YYYYMMDD-00001
+        invoice = CodeAllocator.create('invoice', lambda code: Invoice.objects.create(
             visit=visit,
             patient=visit.patient,
-            invoice_number=invoice_number,
+            invoice_number=code.code,
             price_list=price_list,
             created_by=created_by,
-        )
+        ))
         
         return invoice
 
@@ -91,9 +88,6 @@ class BillingService:
         if invoice.status == InvoiceStatus.CANCELLED:
             raise ValueError("Hóa đơn đã bị hủy.")
         
-        today_str = timezone.now().strftime('%Y%m%d')
-        receipt_number = f"RCP-{today_str}-{uuid.uuid4().hex[:6].upper()}"
-        
         # Determine if the payment will fully pay the invoice
         totals = invoice.payments.aggregate(
             paid=Sum('amount', filter=Q(is_refund=False)),
@@ -102,13 +96,14 @@ class BillingService:
         total_paid_so_far = (totals['paid'] or 0) - (totals['refunded'] or 0)
         will_be_paid = (total_paid_so_far + amount) >= invoice.patient_payable
 
-        payment = Payment.objects.create(
+        # Số phiếu thu: RCP-YYYYMMDD-00001
+        payment = CodeAllocator.create('receipt', lambda code: Payment.objects.create(
             invoice=invoice,
-            receipt_number=receipt_number,
+            receipt_number=code.code,
             amount=amount,
             payment_method=payment_method,
             cashier=cashier,
-        )
+        ))
         
         # If invoice is now paid, create LIS and RIS orders.
         if will_be_paid:
@@ -209,7 +204,7 @@ class BillingService:
                         procedure = ImagingProcedure.objects.first()
 
                     if procedure:
-                        imaging_order = ImagingOrder.objects.create(
+                        imaging_order = CodeAllocator.create('accession', lambda code: ImagingOrder.objects.create(
                             visit=visit,
                             patient=visit.patient,
                             doctor=order.requester,
@@ -217,8 +212,8 @@ class BillingService:
                             clinical_indication=f"Chỉ định lâm sàng: {service.name}",
                             status=ImagingOrder.Status.PENDING,
                             priority=ImagingOrder.Priority.URGENT if order.priority == 'STAT' else ImagingOrder.Priority.NORMAL,
-                            accession_number=f"ACC-{uuid.uuid4().hex[:8].upper()}"
-                        )
+                            accession_number=code.code,
+                        ))
                         
                         def send_ris_ws_update():
                             from channels.layers import get_channel_layer
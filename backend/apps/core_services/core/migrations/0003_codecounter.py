@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_icd11code_technicalservice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeCounter',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Bộ đếm cấp mã',
+                'verbose_name_plural': 'Bộ đếm cấp mã',
+            },
+        ),
+    ]
@@ -201,3 +201,19 @@ class TechnicalService(models.Model):
             models.Index(fields=['group', 'code']),
         ]
 
+
+
+class CodeCounter(models.Model):
+    """
+    Bộ đếm cấp mã trong Postgres (utils.codes) — dùng khi Redis không khả dụng.
+    key: '{loại}:{YYYYMMDD}', value: số cuối cùng đã cấp.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+    class Meta:
+        verbose_name = "Bộ đếm cấp mã"
+        verbose_name_plural = "Bộ đếm cấp mã"
@@ -0,0 +1,40 @@
+"""
+Test runner: chạy test trên Redis DB riêng (settings.REDIS_TEST_DB).
+
+Giống test_his_database cho Postgres — test ghi / xóa key (bộ đếm mã, queue
+index, TTS, metrics...) trên DB riêng, không đụng Redis dev / dùng chung.
+DB test được FLUSHDB trước và sau mỗi lần chạy. QMS_BOARD_COALESCE_MS=0: push
+bảng hiển thị gửi ngay thay vì qua timer chạy sau khi test đã rollback.
+
+    python manage.py test                  # TEST_RUNNER trong settings
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from .utils import get_redis_client
+
+
+class RedisTestDBRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        test_db = settings.REDIS_TEST_DB
+        if test_db == settings.REDIS_DB:
+            raise ImproperlyConfigured('REDIS_TEST_DB phải khác REDIS_DB (test sẽ FLUSHDB Redis DB test).')
+        # Test về gộp push tự override lại QMS_BOARD_COALESCE_MS
+        self._redis_override = override_settings(REDIS_DB=test_db, QMS_BOARD_COALESCE_MS=0)
+        self._redis_override.enable()
+        self._flush()
+
+    def teardown_test_environment(self, **kwargs):
+        self._flush()
+        self._redis_override.disable()
+        super().teardown_test_environment(**kwargs)
+
+    @staticmethod
+    def _flush():
+        client = get_redis_client()
+        if client is not None:
+            client.flushdb()
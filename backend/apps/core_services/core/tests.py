@@ -1,3 +1,207 @@
-from django.test import TestCase
+"""
+Core Tests — Tiện ích dùng chung
 
-# Create your tests here.
+Tests:
+  1. Cấp mã - định dạng theo loại, số tiếp nối số lớn nhất trong bảng (bỏ qua mã kiểu cũ)
+  2. Cấp mã - cấp theo lô: nhiều mã / 1 lần tăng bộ đếm; mất Redis → bộ đếm Postgres; lock theo loại mã
+  3. Cấp mã - bộ đếm tụt so với bảng → create() / Prescription.save() dò lại và cấp mã không trùng
+  4. Cấp mã - stress: nhiều luồng cùng tạo bệnh nhân / lượt khám (Redis và Postgres) không trùng mã
+  5. Stage timing - bước lồng nhau tính thời gian riêng, cộng dồn; ngoài request được đo thì không làm gì
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.core_services.authentication.models import Staff, User
+from apps.core_services.core.models import CodeCounter
+from apps.core_services.core.utils import CodeAllocator, get_redis_client
+from apps.core_services.core.utils import codes, timing
+from apps.core_services.patients.models import Patient
+from apps.core_services.reception.models import Visit
+from apps.medical_services.pharmacy.models import Prescription
+
+
+def no_redis():
+    """Giả lập mất Redis cho bộ đếm (các nơi khác vẫn dùng Redis như thường)."""
+    return patch('apps.core_services.core.utils.counters.get_redis_client', return_value=None)
+
+
+class CodeAllocatorMixin:
+    def setUp(self):
+        super().setUp()
+        self.redis = get_redis_client()
+        if self.redis is None:
+            self.skipTest('Redis không khả dụng')
+        self.today = timezone.localdate().strftime('%Y%m%d')
+        self._reset()
+        self.addCleanup(self._reset)
+
+    def _reset(self):
+        # Redis DB riêng cho test (core.test_runner) — không đụng bộ đếm thật
+        codes._blocks.clear()
+        keys = list(self.redis.scan_iter('codes:*'))
+        if keys:
+            self.redis.delete(*keys)
+
+
+class CodeAllocatorTests(CodeAllocatorMixin, TestCase):
+    def test_format_and_seed_from_table(self):
+        Patient.objects.create(patient_code=f'BN-{self.today}-0041', first_name='A', last_name='Le')
+        Patient.objects.create(patient_code=f'BN-{self.today}-ZZZZ', first_name='B', last_name='Le')  # mã kiểu cũ
+        Patient.objects.create(patient_code='P1A2B3C4D', first_name='C', last_name='Le')
+
+        self.assertEqual(CodeAllocator.allocate('patient'), (f'BN-{self.today}-0042', 42))
+        self.assertEqual(CodeAllocator.allocate('visit').code, f'VISIT-{self.today}-0001')
+        self.assertEqual(CodeAllocator.allocate('invoice').code, f'INV-{self.today}-00001')
+        accession = CodeAllocator.allocate('accession').code
+        self.assertEqual(accession, f'ACC{self.today[2:]}-00001')
+        self.assertLessEqual(len(accession), 16)  # DICOM SH
+
+    @override_settings(CODE_BLOCK_SIZES={'prescription': 5})
+    def test_block_allocation_and_postgres_fallback(self):
+        sequences = [CodeAllocator.allocate('prescription').sequence for _ in range(7)]
+        self.assertEqual(sequences, list(range(1, 8)))
+        self.assertEqual(int(self.redis.get(f'codes:prescription:{self.today}')), 10)  # 2 lô
+
+        codes._blocks.clear()
+        with no_redis():
+            self.assertEqual(CodeAllocator.allocate('visit').sequence, 1)
+            self.assertEqual(CodeAllocator.allocate('visit').sequence, 2)
+        self.assertEqual(CodeCounter.objects.get(key=f'visit:{self.today}').value, 2)
+
+    def test_create_recovers_from_stale_counter(self):
+        self.redis.set(f'codes:visit:{self.today}', 0)  # VD: Redis flush rồi nạp lại sai
+        patient = Patient.objects.create(patient_code='BN-CODE-001', first_name='A', last_name='Tran')
+        for seq in (1, 2):
+            Visit.objects.create(patient=patient, visit_code=f'VISIT-{self.today}-{seq:04d}', queue_number=seq)
+
+        visit = CodeAllocator.create('visit', lambda code: Visit.objects.create(
+            patient=patient, visit_code=code.code, queue_number=code.sequence,
+        ))
+        self.assertEqual(visit.visit_code, f'VISIT-{self.today}-0003')
+
+        # Prescription.save() tự cấp mã → cũng đi qua create()
+        doctor = Staff.objects.create(
+            user=User.objects.create_user(email='bs.codes@test.vn', password='x', phone='0900000020'),
+            role=Staff.StaffRole.DOCTOR,
+        )
+        Prescription.objects.create(visit=visit, doctor=doctor, prescription_code=f'RX-{self.today}-00001')
+        codes._blocks.clear()
+        self.redis.set(f'codes:prescription:{self.today}', 0)
+        with self.settings(CODE_BLOCK_SIZES={'prescription': 1}):
+            prescription = Prescription.objects.create(visit=visit, doctor=doctor)
+        self.assertEqual(prescription.prescription_code, f'RX-{self.today}-00002')
+
+        # Lỗi unique khác (không phải mã) → raise ngay
+        Patient.objects.create(patient_code='BN-CODE-002', first_name='B', last_name='Tran', id_card='001')
+        with self.assertRaises(IntegrityError):
+            CodeAllocator.create('patient', lambda code: Patient.objects.create(
+                patient_code=code.code, first_name='C', last_name='Tran', id_card='001',
+            ))
+
+    def test_refill_of_one_kind_does_not_block_others(self):
+        """Lock theo loại mã, lấy lô mới ngoài lock: 1 loại chờ Redis không chặn loại khác."""
+        self.redis.set(f'codes:visit:{self.today}', 0)
+        self.redis.set(f'codes:patient:{self.today}', 0)
+        entered, release = threading.Event(), threading.Event()
+        real_next = codes.next_counter_value
+
+        def slow_visit(key, *args, **kwargs):
+            if key.startswith('codes:visit:'):
+                entered.set()
+                release.wait(5)
+            return real_next(key, *args, **kwargs)
+
+        with patch.object(codes, 'next_counter_value', side_effect=slow_visit):
+            slow = threading.Thread(target=CodeAllocator.allocate, args=('visit',))
+            slow.start()
+            self.assertTrue(entered.wait(5))
+            self.assertEqual(CodeAllocator.allocate('patient').sequence, 1)
+            self.assertTrue(slow.is_alive())  # visit vẫn đang chờ Redis
+            release.set()
+            slow.join()
+        self.assertEqual(CodeAllocator.allocate('visit').sequence, 2)
+
+
+class CodeAllocatorStressTests(CodeAllocatorMixin, TransactionTestCase):
+    THREADS = 8
+    PER_THREAD = 15
+
+    def _run(self, work):
+        errors = []
+
+        def worker(idx):
+            try:
+                for i in range(self.PER_THREAD):
+                    work(idx, i)
+            except Exception as e:  # noqa: BLE001 — báo lại ở luồng chính
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def _create_patient(self, idx, i):
+        CodeAllocator.create('patient', lambda code: Patient.objects.create(
+            patient_code=code.code, first_name=f'T{idx}', last_name=f'Stress {i}',
+        ))
+
+    def test_concurrent_patients_redis_blocks(self):
+        self._run(self._create_patient)
+        patient_codes = list(Patient.objects.values_list('patient_code', flat=True))
+        self.assertEqual(len(patient_codes), self.THREADS * self.PER_THREAD)
+        self.assertTrue(all(code.startswith(f'BN-{self.today}-') for code in patient_codes))
+
+    def test_concurrent_visits_postgres(self):
+        patient = Patient.objects.create(patient_code='BN-STRESS', first_name='A', last_name='Stress')
+
+        def create_visit(idx, i):
+            CodeAllocator.create('visit', lambda code: Visit.objects.create(
+                patient=patient, visit_code=code.code, queue_number=code.sequence,
+            ))
+
+        with no_redis():
+            self._run(create_visit)
+        # Lô 1 → số liền mạch, không trùng, không hụt
+        sequences = sorted(Visit.objects.values_list('queue_number', flat=True))
+        self.assertEqual(sequences, list(range(1, self.THREADS * self.PER_THREAD + 1)))
+
+
+class StageTimingTests(SimpleTestCase):
+    def test_nested_stages_are_exclusive(self):
+        with timing.timed() as timer:
+            with timing.stage('outer'):
+                time.sleep(0.02)
+                with timing.stage('inner'):
+                    time.sleep(0.03)
+            with timing.stage('inner'):
+                time.sleep(0.01)
+
+        self.assertEqual(list(timer.stages), ['inner', 'outer'])
+        self.assertGreaterEqual(timer.stages['inner'], 40)
+        self.assertGreaterEqual(timer.stages['outer'], 20)
+        self.assertLess(timer.stages['outer'], 30)
+        self.assertLessEqual(sum(timer.stages.values()), timer.total_ms)
+        self.assertRegex(timer.header(), r'^inner;dur=\d+\.\d, outer;dur=\d+\.\d, total;dur=\d+\.\d$')
+
+    def test_stage_without_timer_is_noop(self):
+        @timing.staged('work')
+        def work():
+            return 42
+
+        self.assertIsNone(timing.current())
+        self.assertEqual(work(), 42)
+        with timing.timed() as timer:
+            self.assertEqual(work(), 42)
+        self.assertIn('work', timer.stages)
+        self.assertIsNone(timing.current())
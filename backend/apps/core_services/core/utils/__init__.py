@@ -1,6 +1,18 @@
 """
 Redis-based utilities for the core services.
 """
-from .redis_service import AgentMemoryService
+from .redis_service import AgentMemoryService, get_redis_client
+from .counters import next_counter_value, raise_counter_floor
+from .codes import CodeAllocator, CodeAllocationError
+from . import metrics, timing
 
-__all__ = ['AgentMemoryService']
+__all__ = [
+    'AgentMemoryService',
+    'get_redis_client',
+    'next_counter_value',
+    'raise_counter_floor',
+    'CodeAllocator',
+    'CodeAllocationError',
+    'metrics',
+    'timing',
+]
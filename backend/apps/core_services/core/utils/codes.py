@@ -0,0 +1,204 @@
+"""
+Cấp mã nghiệp vụ không trùng: mã bệnh nhân, lượt khám, hóa đơn, phiếu thu, đơn thuốc, accession CĐHA.
+
+    CodeAllocator.allocate('patient')      # Code(code='BN-20260131-0042', sequence=42)
+    CodeAllocator.create('visit', lambda c: Visit.objects.create(visit_code=c.code, ...))
+
+Mã = tiền tố + ngày + số thứ tự trong ngày (CODE_SPECS). Số thứ tự lấy từ bộ
+đếm Redis (utils.counters) — 1 lệnh INCRBY, không đếm / exists() trên bảng;
+Redis mất thì dùng bộ đếm trong Postgres (core.CodeCounter, UPSERT ... RETURNING).
+Bộ đếm mới (ngày mới, Redis flush) bắt đầu từ số lớn nhất đã có trong bảng.
+
+Cấp theo lô: mỗi process (worker) lấy block_size số một lần rồi phát dần trong
+bộ nhớ — bớt round-trip khi cao điểm, đổi lại mã không tăng đúng theo thời gian
+và có thể hụt số khi worker restart. Hóa đơn / phiếu thu / lượt khám giữ block 1.
+Mỗi loại mã có lock riêng, chỉ giữ khi phát số trong bộ nhớ — lấy lô mới (Redis /
+Postgres) nằm ngoài lock, 2 luồng cùng hết lô thì lô thừa bị bỏ (hụt số).
+Ghi đè theo loại: settings.CODE_BLOCK_SIZES = {'accession': 50}.
+
+Bộ đếm tụt so với bảng (Redis flush khi còn block đang phát, mã cấp qua Postgres)
+→ insert trùng unique; create() dò lại bộ đếm theo bảng rồi thử mã mới.
+"""
+
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, NamedTuple, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from .counters import next_counter_value, raise_counter_floor
+
+logger = logging.getLogger(__name__)
+
+COUNTER_TTL_SECONDS = 2 * 86400  # bộ đếm theo ngày — giữ qua nửa đêm rồi tự hết hạn
+MAX_RETRIES = 5
+
+
+@dataclass(frozen=True)
+class CodeSpec:
+    prefix: str
+    model: str  # 'app_label.Model' chứa mã
+    field: str
+    width: int = 4
+    date_format: str = '%Y%m%d'
+    block_size: int = 1
+
+    def day_prefix(self, day: date) -> str:
+        return f'{self.prefix}{day.strftime(self.date_format)}-'
+
+    def format(self, day: date, sequence: int) -> str:
+        return f'{self.day_prefix(day)}{sequence:0{self.width}d}'
+
+
+CODE_SPECS = {
+    'patient': CodeSpec('BN-', 'patients.Patient', 'patient_code', block_size=10),           # BN-20260131-0001
+    'visit': CodeSpec('VISIT-', 'reception.Visit', 'visit_code'),                            # VISIT-20260131-0001
+    'invoice': CodeSpec('INV-', 'billing.Invoice', 'invoice_number', width=5),               # INV-20260131-00001
+    'receipt': CodeSpec('RCP-', 'billing.Payment', 'receipt_number', width=5),               # RCP-20260131-00001
+    'prescription': CodeSpec('RX-', 'pharmacy.Prescription', 'prescription_code', width=5, block_size=20),
+    # DICOM AccessionNumber (VR SH) tối đa 16 ký tự → ACC260131-00001
+    'accession': CodeSpec('ACC', 'ris.ImagingOrder', 'accession_number', width=5, date_format='%y%m%d', block_size=20),
+}
+
+
+class Code(NamedTuple):
+    code: str
+    sequence: int
+
+
+class CodeAllocationError(Exception):
+    """Không cấp được mã không trùng sau MAX_RETRIES lần."""
+    pass
+
+
+# kind → [counter key, số kế tiếp, số cuối của lô] — lô đang phát của process này
+_blocks = {}
+_block_locks = {kind: threading.Lock() for kind in CODE_SPECS}
+
+
+def _counter_key(kind: str, day: date) -> str:
+    return f'{kind}:{day.strftime("%Y%m%d")}'
+
+
+def _block_size(kind: str) -> int:
+    overrides = getattr(settings, 'CODE_BLOCK_SIZES', {}) or {}
+    return max(int(overrides.get(kind, CODE_SPECS[kind].block_size)), 1)
+
+
+def _db_max(kind: str, day: date) -> int:
+    """Số thứ tự lớn nhất đã có trong bảng cho ngày (bỏ qua mã định dạng cũ)."""
+    spec = CODE_SPECS[kind]
+    prefix = spec.day_prefix(day)
+    model = apps.get_model(spec.model)
+    return model.objects.filter(**{f'{spec.field}__regex': rf'^{re.escape(prefix)}\d+$'}).aggregate(
+        m=Max(Cast(Substr(spec.field, len(prefix) + 1), BigIntegerField())),
+    )['m'] or 0
+
+
+def _pg_next(key: str, seed: Callable[[], int], amount: int) -> int:
+    from apps.core_services.core.models import CodeCounter
+
+    table = connection.ops.quote_name(CodeCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET value = value + %s WHERE key = %s RETURNING value', [amount, key])
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                f'INSERT INTO {table} (key, value) VALUES (%s, %s) '
+                f'ON CONFLICT (key) DO UPDATE SET value = {table}.value + %s RETURNING value',
+                [key, int(seed()) + amount, amount],
+            )
+            row = cursor.fetchone()
+    return row[0]
+
+
+def _pg_raise_floor(key: str, floor: int) -> None:
+    from apps.core_services.core.models import CodeCounter
+
+    table = connection.ops.quote_name(CodeCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (key, value) VALUES (%s, %s) '
+            f'ON CONFLICT (key) DO UPDATE SET value = GREATEST({table}.value, EXCLUDED.value)',
+            [key, floor],
+        )
+
+
+def _take(kind: str, key: str, peek: bool = False) -> Optional[int]:
+    """Số kế tiếp của lô đang phát (gọi khi giữ lock của loại), None nếu hết lô / sang ngày."""
+    block = _blocks.get(kind)
+    if block is None or block[0] != key or block[1] > block[2]:
+        return None
+    sequence = block[1]
+    if not peek:
+        block[1] += 1
+    return sequence
+
+
+class CodeAllocator:
+    @staticmethod
+    def allocate(kind: str, day: Optional[date] = None) -> Code:
+        """Cấp mã kế tiếp của loại `kind` cho ngày `day` (mặc định hôm nay)."""
+        spec = CODE_SPECS[kind]
+        day = day or timezone.localdate()
+        key = _counter_key(kind, day)
+
+        lock = _block_locks[kind]
+
+        with lock:
+            sequence = _take(kind, key)
+        if sequence is None:
+            amount = _block_size(kind)
+            last = next_counter_value(
+                f'codes:{key}', seed=lambda: _db_max(kind, day), ttl=COUNTER_TTL_SECONDS, amount=amount,
+            )
+            if last is None:
+                last = _pg_next(key, lambda: _db_max(kind, day), amount)
+            sequence = last - amount + 1
+            if amount > 1:
+                with lock:
+                    if _take(kind, key, peek=True) is None:
+                        _blocks[kind] = [key, sequence + 1, last]
+
+        return Code(spec.format(day, sequence), sequence)
+
+    @staticmethod
+    def resync(kind: str, day: Optional[date] = None) -> None:
+        """Bỏ lô đang phát và kéo bộ đếm lên trên số lớn nhất trong bảng (sau khi gặp mã trùng)."""
+        day = day or timezone.localdate()
+        key = _counter_key(kind, day)
+        with _block_locks[kind]:
+            _blocks.pop(kind, None)
+        floor = _db_max(kind, day)
+        # amount=0: chỉ nâng sàn, không tiêu số — lần allocate sau lấy lô mới phía trên
+        if raise_counter_floor(f'codes:{key}', floor, COUNTER_TTL_SECONDS, amount=0) is None:
+            _pg_raise_floor(key, floor)
+
+    @staticmethod
+    def create(kind: str, factory: Callable[[Code], object], day: Optional[date] = None):
+        """
+        Cấp mã rồi gọi factory(code) để tạo bản ghi (trong savepoint).
+        Mã đã có trong bảng → resync bộ đếm và thử mã mới; IntegrityError khác được raise lại.
+        """
+        spec = CODE_SPECS[kind]
+        model = apps.get_model(spec.model)
+        for attempt in range(MAX_RETRIES):
+            code = CodeAllocator.allocate(kind, day)
+            try:
+                with transaction.atomic():
+                    return factory(code)
+            except IntegrityError:
+                if not model.objects.filter(**{spec.field: code.code}).exists():
+                    raise
+                logger.warning('[CODES] %s %s already used, resyncing counter (attempt %d)',
+                               kind, code.code, attempt + 1)
+                CodeAllocator.resync(kind, day)
+        raise CodeAllocationError(f'Không cấp được mã {kind} sau {MAX_RETRIES} lần thử. Vui lòng thử lại.')
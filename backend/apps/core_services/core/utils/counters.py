@@ -0,0 +1,102 @@
+"""
+Atomic Redis counters for sequence/number allocation.
+
+A counter is a plain Redis integer incremented with INCR, so each allocation
+is O(1) and race-free across processes. When the key is missing (new day,
+Redis restart/flush) it is seeded from a caller-supplied function, usually a
+MAX() over the table the numbers end up in, so numbering continues where
+the database left off.
+
+Example:
+    seq = next_counter_value(
+        'qms:seq:PK01:20260131',
+        seed=lambda: QueueNumber.objects.filter(...).aggregate(m=Max('daily_sequence'))['m'] or 0,
+        ttl=172800,
+    )
+"""
+
+import logging
+from typing import Callable, Optional
+
+import redis
+
+from .redis_service import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# INCRBY ARGV[1] only if the counter has been seeded; false → caller must seed
+_INCR_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# Raise the counter to at least ARGV[1], optionally (re)set TTL ARGV[2], then INCRBY ARGV[3]
+_RAISE_FLOOR_AND_INCR = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local floor = tonumber(ARGV[1])
+if current < floor then
+    redis.call('SET', KEYS[1], floor)
+end
+if tonumber(ARGV[2]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return redis.call('INCRBY', KEYS[1], ARGV[3])
+"""
+
+_scripts = {}
+
+
+def _script(client, source: str):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = client.register_script(source)
+    return script
+
+
+def next_counter_value(key: str, seed: Callable[[], int], ttl: int = 0, amount: int = 1) -> Optional[int]:
+    """
+    Allocate the next value (or the next `amount` values) of a counter.
+
+    Args:
+        key: Redis key of the counter
+        seed: Returns the last value already in use; only called when the key is missing
+        ttl: Expiry in seconds set when the counter is seeded (0 = no expiry)
+        amount: Number of consecutive values to allocate (a block)
+
+    Returns:
+        The allocated value — the last one of the block — or None if Redis is
+        unavailable (caller falls back).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    try:
+        value = _script(client, _INCR_IF_EXISTS)(keys=[key], args=[amount])
+        if value:
+            return int(value)
+        return int(_script(client, _RAISE_FLOOR_AND_INCR)(keys=[key], args=[int(seed()), ttl, amount]))
+    except redis.RedisError as e:
+        logger.warning(f"Counter {key} unavailable, falling back: {e}")
+        return None
+
+
+def raise_counter_floor(key: str, floor: int, ttl: int = 0, amount: int = 1) -> Optional[int]:
+    """
+    Make sure the next allocation is greater than `floor` and allocate it
+    (`amount` values, the last one is returned).
+
+    Used after a unique-constraint collision, when the counter fell behind the
+    database (e.g. numbers were issued through the DB fallback while Redis was down).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    try:
+        return int(_script(client, _RAISE_FLOOR_AND_INCR)(keys=[key], args=[int(floor), ttl, amount]))
+    except redis.RedisError as e:
+        logger.warning(f"Counter {key} unavailable, falling back: {e}")
+        return None
@@ -0,0 +1,126 @@
+"""
+Lightweight Redis-backed metrics shared by all worker processes.
+
+Each metric is one Redis hash `metrics:{name}`:
+    counters   — incr('qms.board', 'mutations')
+    histograms — observe_ms('qms.board.publish_latency', 42.0)
+                 fields: count, sum_ms, le_{bucket} (non-cumulative bucket counts)
+
+Recording is best-effort: Redis being down never breaks the caller.
+
+Example:
+    observe_ms('kiosk.identify', elapsed_ms)
+    snapshot('kiosk.identify')  # {'count': 10, 'avg_ms': 12.3, 'p50_ms': 25, 'p95_ms': 50, ...}
+"""
+
+import logging
+from typing import Dict, Optional
+
+import redis
+
+from .redis_service import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 200, 500, 1000, 2500, 5000, 10000)
+
+
+def _key(name: str) -> str:
+    return f"metrics:{name}"
+
+
+def _bucket_field(value_ms: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if value_ms <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def incr(name: str, field: str, amount: int = 1) -> None:
+    """Increment a counter field of a metric."""
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.hincrby(_key(name), field, amount)
+    except redis.RedisError as e:
+        logger.debug(f"Metric {name}.{field} not recorded: {e}")
+
+
+def observe_ms(name: str, value_ms: float) -> None:
+    """Record one latency observation (milliseconds) in a histogram."""
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.hincrby(_key(name), 'count', 1)
+        pipe.hincrbyfloat(_key(name), 'sum_ms', float(value_ms))
+        pipe.hincrby(_key(name), _bucket_field(value_ms), 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"Metric {name} not recorded: {e}")
+
+
+def observe_many_ms(observations: Dict[str, float]) -> None:
+    """Record several latency observations (name → milliseconds) in one round-trip."""
+    client = get_redis_client()
+    if client is None or not observations:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for name, value_ms in observations.items():
+            pipe.hincrby(_key(name), 'count', 1)
+            pipe.hincrbyfloat(_key(name), 'sum_ms', float(value_ms))
+            pipe.hincrby(_key(name), _bucket_field(value_ms), 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.debug(f"Metrics {', '.join(observations)} not recorded: {e}")
+
+
+def _percentile(buckets: Dict[str, int], count: int, q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-quantile (None if no data)."""
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    for bound in LATENCY_BUCKETS_MS:
+        seen += buckets.get(f"le_{bound}", 0)
+        if seen >= target:
+            return float(bound)
+    return float('inf')
+
+
+def snapshot(name: str) -> Dict[str, float]:
+    """
+    Read a metric. Counter fields are returned as-is; when the metric is a
+    histogram, avg_ms / p50_ms / p95_ms / p99_ms are derived from the buckets.
+    """
+    client = get_redis_client()
+    if client is None:
+        return {}
+    try:
+        raw = client.hgetall(_key(name))
+    except redis.RedisError as e:
+        logger.debug(f"Metric {name} not readable: {e}")
+        return {}
+
+    data = {field: float(value) for field, value in raw.items()}
+    count = int(data.get('count', 0))
+    if count:
+        buckets = {field: int(value) for field, value in data.items() if field.startswith('le_')}
+        data['avg_ms'] = round(data.get('sum_ms', 0.0) / count, 2)
+        data['p50_ms'] = _percentile(buckets, count, 0.50)
+        data['p95_ms'] = _percentile(buckets, count, 0.95)
+        data['p99_ms'] = _percentile(buckets, count, 0.99)
+    return data
+
+
+def reset(name: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(_key(name))
+    except redis.RedisError as e:
+        logger.debug(f"Metric {name} not reset: {e}")
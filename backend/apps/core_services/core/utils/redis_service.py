@@ -5,9 +5,68 @@ This service provides a sliding window of recent messages for LangGraph agents,
 replacing expensive database queries with fast in-memory Redis operations.
 """
 import json
+import time
+import logging
+import threading
 import redis
 from typing import List, Dict, Any, Optional
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Shared client for hot-path caches (QMS, kiosk...). One connection pool per process.
+_shared_client: Optional[redis.Redis] = None
+_shared_client_lock = threading.Lock()
+_unavailable_until = 0.0
+REDIS_RETRY_COOLDOWN = 30  # seconds before re-probing an unreachable Redis
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """
+    Get the process-wide Redis client (decode_responses=True).
+
+    Returns None while Redis is unreachable so callers can fall back to the
+    database. The connection is re-probed after REDIS_RETRY_COOLDOWN seconds.
+    Commands can still raise redis.RedisError if Redis goes away later —
+    callers on hot paths should catch it and degrade the same way.
+    """
+    global _shared_client, _unavailable_until
+
+    if _shared_client is not None:
+        return _shared_client
+    if time.monotonic() < _unavailable_until:
+        return None
+
+    with _shared_client_lock:
+        if _shared_client is not None:
+            return _shared_client
+        try:
+            client = redis.Redis(
+                host=getattr(settings, 'REDIS_HOST', 'localhost'),
+                port=getattr(settings, 'REDIS_PORT', 6379),
+                db=getattr(settings, 'REDIS_DB', 0),
+                decode_responses=True,
+                socket_connect_timeout=2,
+                socket_timeout=2,
+            )
+            client.ping()
+        except redis.RedisError as e:
+            logger.warning(f"Redis not available, falling back to database: {e}")
+            _unavailable_until = time.monotonic() + REDIS_RETRY_COOLDOWN
+            return None
+        _shared_client = client
+        return _shared_client
+
+
+@receiver(setting_changed)
+def reset_redis_client(setting=None, **kwargs):
+    """override_settings(REDIS_DB=...) trong test → client dùng chung kết nối lại theo cấu hình mới."""
+    global _shared_client, _unavailable_until
+    if setting in ('REDIS_HOST', 'REDIS_PORT', 'REDIS_DB'):
+        _shared_client = None
+        _unavailable_until = 0.0
 
 
 class AgentMemoryService:
@@ -0,0 +1,127 @@
+"""
+Per-request stage timing — where did the milliseconds of one request go.
+
+A view activates a timer; code anywhere below it (services, signals,
+on_commit hooks) marks stages. Outside a timed request `stage()` is a no-op,
+so shared services can be instrumented freely.
+
+    @server_timing('kiosk.identify')          # view: Server-Timing header + histograms
+    def kiosk_identify(request): ...
+
+    with timing.stage('insurance'):           # anywhere in the call tree
+        record = InsuranceLookupService.lookup(code)
+
+    @timing.staged('broadcast')               # or a whole function (signal handler, on_commit hook)
+    def broadcast_visit_event(...): ...
+
+Stages are exclusive: a stage nested in another is subtracted from its parent,
+so the stages of a request add up to (at most) its total. A stage entered
+several times (e.g. two broadcasts) accumulates.
+
+Each finished request records `{prefix}.{stage}` and `{prefix}.total` as
+histograms in utils.metrics (one Redis round-trip) and counts requests over
+budget_ms in the `{prefix}.budget` counter (`over`).
+"""
+
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from . import metrics
+
+_current: ContextVar[Optional['StageTimer']] = ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.total_ms: Optional[float] = None
+        self.stages: Dict[str, float] = {}  # name → exclusive ms, in first-seen order
+        self._children = []  # ms spent in nested stages, one slot per open stage
+
+    def finish(self) -> float:
+        self.total_ms = (time.monotonic() - self.started) * 1000
+        return self.total_ms
+
+    def header(self) -> str:
+        """Server-Timing header value: `scan;dur=0.2, insurance;dur=3.1, total;dur=12.5`."""
+        parts = [f'{name};dur={ms:.1f}' for name, ms in self.stages.items()]
+        if self.total_ms is not None:
+            parts.append(f'total;dur={self.total_ms:.1f}')
+        return ', '.join(parts)
+
+    def record(self, prefix: str, budget_ms: Optional[float] = None) -> None:
+        observations = {f'{prefix}.{name}': ms for name, ms in self.stages.items()}
+        if self.total_ms is not None:
+            observations[f'{prefix}.total'] = self.total_ms
+        metrics.observe_many_ms(observations)
+        if budget_ms is not None and self.total_ms is not None and self.total_ms > budget_ms:
+            metrics.incr(f'{prefix}.budget', 'over')
+
+
+def current() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def timed():
+    """Activate a StageTimer for the enclosed block (nested `timed()` gets its own)."""
+    timer = StageTimer()
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        timer.finish()
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute the enclosed block to stage `name` of the current timer (no-op without one)."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+
+    started = time.monotonic()
+    timer._children.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = (time.monotonic() - started) * 1000
+        children = timer._children.pop()
+        timer.stages[name] = timer.stages.get(name, 0.0) + elapsed - children
+        if timer._children:
+            timer._children[-1] += elapsed
+
+
+def staged(name: str):
+    """Decorator form of stage(): the whole function counts as stage `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(prefix: str, budget_ms=None):
+    """
+    View decorator: time the view, attach a Server-Timing header and record
+    the stage histograms under `prefix`. Place it directly above the function
+    (below @api_view / throttling decorators). budget_ms may be a callable
+    (read per request, e.g. from settings).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with timed() as timer:
+                response = view(*args, **kwargs)
+            response['Server-Timing'] = timer.header()
+            timer.record(prefix, budget_ms() if callable(budget_ms) else budget_ms)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,194 @@
+"""
+Insurance lookup — tra cứu BHYT qua cache Redis, dùng chung cho Kiosk và API tra cứu (tiếp đón).
+
+    InsuranceLookupService.lookup('092200012345')  # dict thông tin thẻ hoặc None
+
+Bệnh nhân thường quét 2-3 lần ở Kiosk rồi tiếp đón tra lại cùng mã, nên kết quả
+của cổng BHYT được cache theo mã đã chuẩn hóa:
+
+    insurance:lookup:cccd:092200012345            {"data": {...}} — INSURANCE_LOOKUP_TTL
+    insurance:lookup:insurance_full:TE1790000000123   (cùng bản ghi, ghi kèm khi tra theo CCCD)
+    insurance:lookup:insurance_short:0000000123
+    insurance:lookup:cccd:999999999999            {"data": null} — INSURANCE_LOOKUP_NEGATIVE_TTL
+
+Single-flight: các lần tra cùng mã đồng thời chỉ 1 lần gọi cổng BHYT, các lần
+còn lại chờ tối đa LOCK_WAIT_SECONDS để đọc kết quả (như snapshot bảng LED QMS).
+Không có Redis → gọi thẳng cổng BHYT. Hit / miss / coalesced: metrics 'insurance.lookup'.
+fetch() / fetch_holder_cccd() là chỗ duy nhất chạm backend — hiện là insurance_mock (mock_data),
+thay bằng cổng thật ở đây.
+"""
+
+import copy
+import json
+import logging
+import re
+import time
+
+import redis
+from django.conf import settings
+
+from apps.core_services.core.utils import get_redis_client, metrics
+from .mock_data import LOOKUP_BY_CCCD, LOOKUP_BY_FULL_CODE, LOOKUP_BY_SHORT_CODE, LOOKUP_CCCD_BY_FULL_CODE
+
+logger = logging.getLogger(__name__)
+
+PATTERN_CCCD = re.compile(r'^\d{12}$')
+PATTERN_INSURANCE_SHORT = re.compile(r'^\d{10}$')
+PATTERN_INSURANCE_FULL = re.compile(r'^[A-Z]{2}\d{13}$')
+
+KEY_PREFIX = 'insurance:lookup'
+LOCK_TTL = 10  # seconds — cổng BHYT treo thì lần tra sau được gọi lại
+LOCK_WAIT_SECONDS = 3
+
+METRIC = 'insurance.lookup'
+METRIC_BACKEND = 'insurance.lookup.backend'
+
+
+def normalize(query: str) -> tuple:
+    """
+    Chuỗi quét / gõ → (loại, mã chuẩn hóa).
+    Returns: ('cccd' | 'insurance_short' | 'insurance_full' | 'invalid', mã)
+    """
+    key = re.sub(r'\s', '', query or '').upper()
+    if PATTERN_CCCD.match(key):
+        return 'cccd', key
+    if PATTERN_INSURANCE_SHORT.match(key):
+        return 'insurance_short', key
+    if PATTERN_INSURANCE_FULL.match(key):
+        return 'insurance_full', key
+    return 'invalid', key
+
+
+def _cache_key(query_type: str, key: str) -> str:
+    return f'{KEY_PREFIX}:{query_type}:{key}'
+
+
+def _card_keys(insurance_code: str) -> list:
+    """Key của mã thẻ 15 ký tự và 10 số cuối (số BHYT)."""
+    query_type, code = normalize(insurance_code)
+    if query_type != 'insurance_full':
+        return [_cache_key(query_type, code)] if query_type != 'invalid' else []
+    return [_cache_key('insurance_full', code), _cache_key('insurance_short', code[-10:])]
+
+
+def fetch(query_type: str, key: str) -> dict | None:
+    """Gọi cổng BHYT (insurance_mock) — bản sao, người gọi sửa thoải mái."""
+    if query_type == 'cccd':
+        record = LOOKUP_BY_CCCD.get(key)
+    elif query_type == 'insurance_short':
+        record = LOOKUP_BY_SHORT_CODE.get(key)
+    elif query_type == 'insurance_full':
+        record = LOOKUP_BY_FULL_CODE.get(key)
+    else:
+        return None
+    return copy.deepcopy(record) if record else None
+
+
+def fetch_holder_cccd(insurance_code: str) -> str | None:
+    """CCCD của chủ thẻ BHYT 15 ký tự (insurance_mock) — không nằm trong bản ghi tra cứu công khai."""
+    return LOOKUP_CCCD_BY_FULL_CODE.get(insurance_code)
+
+
+class InsuranceLookupService:
+    @staticmethod
+    def _read(client, cache_key):
+        try:
+            cached = client.get(cache_key)
+        except redis.RedisError as e:
+            logger.warning('[INSURANCE] cache read failed for %s: %s', cache_key, e)
+            return None
+        return json.loads(cached) if cached is not None else None
+
+    @staticmethod
+    def _store(client, cache_key, record: dict | None) -> None:
+        payload = json.dumps({'data': record}, ensure_ascii=False)
+        try:
+            if record is None:
+                client.set(cache_key, payload, ex=settings.INSURANCE_LOOKUP_NEGATIVE_TTL)
+                return
+            pipe = client.pipeline(transaction=False)
+            for key in {cache_key, *_card_keys(record.get('insurance_code', ''))}:
+                pipe.set(key, payload, ex=settings.INSURANCE_LOOKUP_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('[INSURANCE] cache store failed for %s: %s', cache_key, e)
+
+    @staticmethod
+    def _fetch(query_type, key):
+        started = time.monotonic()
+        try:
+            return fetch(query_type, key)
+        finally:
+            metrics.incr(METRIC, 'miss')
+            metrics.observe_ms(METRIC_BACKEND, (time.monotonic() - started) * 1000)
+
+    @staticmethod
+    def lookup(query: str) -> dict | None:
+        """Thông tin thẻ BHYT theo CCCD / mã BHYT 10 số / 15 ký tự, hoặc None (không có / sai định dạng)."""
+        query_type, key = normalize(query)
+        if query_type == 'invalid':
+            return None
+
+        client = get_redis_client()
+        if client is None:
+            return InsuranceLookupService._fetch(query_type, key)
+
+        cache_key = _cache_key(query_type, key)
+        cached = InsuranceLookupService._read(client, cache_key)
+        if cached is not None:
+            metrics.incr(METRIC, 'hit' if cached['data'] is not None else 'negative_hit')
+            return cached['data']
+
+        lock_key = f'{cache_key}:fetching'
+        try:
+            leader = client.set(lock_key, 1, nx=True, ex=LOCK_TTL)
+        except redis.RedisError:
+            return InsuranceLookupService._fetch(query_type, key)
+
+        if not leader:
+            deadline = time.monotonic() + LOCK_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                cached = InsuranceLookupService._read(client, cache_key)
+                if cached is not None:
+                    metrics.incr(METRIC, 'coalesced')
+                    return cached['data']
+
+        try:
+            record = InsuranceLookupService._fetch(query_type, key)
+            InsuranceLookupService._store(client, cache_key, record)
+        finally:
+            if leader:
+                try:
+                    client.delete(lock_key)
+                except redis.RedisError:
+                    pass
+        return copy.deepcopy(record)
+
+    @staticmethod
+    def holder_cccd(insurance_code: str | None) -> str | None:
+        """CCCD gắn với thẻ BHYT 15 ký tự, hoặc None (mã khác / cổng không có)."""
+        query_type, key = normalize(insurance_code or '')
+        if query_type != 'insurance_full':
+            return None
+        return fetch_holder_cccd(key)
+
+    @staticmethod
+    def invalidate(*queries) -> None:
+        """Bỏ cache của các CCCD / mã BHYT (kể cả mã 10 số của thẻ 15 ký tự) — lần tra sau gọi lại cổng."""
+        client = get_redis_client()
+        if client is None:
+            return
+        keys = set()
+        for query in queries:
+            query_type, key = normalize(query or '')
+            if query_type == 'cccd':
+                keys.add(_cache_key(query_type, key))
+            elif query_type != 'invalid':
+                keys.update(_card_keys(key))
+        if not keys:
+            return
+        try:
+            client.delete(*keys)
+        except redis.RedisError as e:
+            logger.warning('[INSURANCE] cache invalidate failed: %s', e)
@@ -260,3 +260,5 @@ def _build_lookups():
 
 
 LOOKUP_BY_CCCD, LOOKUP_BY_SHORT_CODE, LOOKUP_BY_FULL_CODE = _build_lookups()
+# CCCD gắn với thẻ BHYT — Kiosk dùng để tìm / tạo bệnh nhân khi quét mã BHYT
+LOOKUP_CCCD_BY_FULL_CODE = {record["insurance_code"].upper(): record["cccd"] for record in MOCK_RECORDS}
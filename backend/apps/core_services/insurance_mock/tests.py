@@ -10,11 +10,25 @@ Test cases:
   6. Input sai format → HTTP 400
   7. Thiếu field query → HTTP 400
   8. Body không phải JSON → HTTP 400
+  9. Response có đủ trường; chỉ chấp nhận POST
+ 10. Cache tra cứu - lần quét lại không gọi cổng BHYT, tra theo CCCD ghi kèm mã thẻ
+ 11. Cache tra cứu - không có thẻ cache ngắn hạn; tra trùng đồng thời chỉ gọi 1 lần
+ 12. Cache tra cứu - Kiosk đồng bộ dữ liệu thẻ vào bệnh nhân → invalidate sau commit
+ 13. CCCD chủ thẻ BHYT (Kiosk tìm / tạo bệnh nhân khi quét mã BHYT)
 """
 
 import json
+import threading
+import time
+from unittest.mock import patch
+
+from django.conf import settings
 from django.test import TestCase, Client
 
+from apps.core_services.core.utils import get_redis_client
+from . import lookup
+from .lookup import InsuranceLookupService
+
 class InsuranceLookupAPITest(TestCase):
     """Kiểm tra endpoint POST /api/v1/insurance/lookup/"""
 
@@ -238,3 +252,92 @@ class InsuranceLookupAPITest(TestCase):
         """GET method → HTTP 405."""
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 405)
+
+    # ------------------------------------------------------------------
+    # 11. CCCD chủ thẻ - không nằm trong bản ghi tra cứu công khai
+    # ------------------------------------------------------------------
+    def test_holder_cccd(self):
+        """Mã BHYT 15 ký tự → CCCD chủ thẻ; mã khác / không có → None."""
+        self.assertEqual(InsuranceLookupService.holder_cccd('te1790000000123'), '092200012345')
+        self.assertIsNone(InsuranceLookupService.holder_cccd('0000000123'))
+        self.assertIsNone(InsuranceLookupService.holder_cccd('XX0000000000000'))
+        self.assertIsNone(InsuranceLookupService.holder_cccd(None))
+        self.assertNotIn('cccd', InsuranceLookupService.lookup('TE1790000000123'))
+
+
+class InsuranceLookupCacheTest(TestCase):
+    """Cache Redis của InsuranceLookupService (dùng chung Kiosk / tiếp đón)."""
+
+    def setUp(self):
+        self.redis = get_redis_client()
+        if self.redis is None:
+            self.skipTest('Redis không khả dụng')
+        self._clear()
+        self.addCleanup(self._clear)
+        fetch = patch.object(lookup, 'fetch', wraps=lookup.fetch)
+        self.fetch = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def _clear(self):
+        keys = list(self.redis.scan_iter(f'{lookup.KEY_PREFIX}:*'))
+        if keys:
+            self.redis.delete(*keys)
+
+    def test_rescan_served_from_cache(self):
+        first = InsuranceLookupService.lookup('092200012345')
+        self.assertEqual(first['insurance_code'], 'TE1790000000123')
+        first['patient_name'] = 'sửa bản sao'  # người gọi sửa không ảnh hưởng cache
+
+        self.assertEqual(InsuranceLookupService.lookup(' 092200012345 ')['patient_name'], 'NGUYỄN VĂN AN')
+        self.assertEqual(InsuranceLookupService.lookup('te1790000000123')['patient_name'], 'NGUYỄN VĂN AN')
+        self.assertIsNotNone(InsuranceLookupService.lookup('0000000123'))
+        self.assertEqual(self.fetch.call_count, 1)
+
+        # API tra cứu (tiếp đón) dùng cùng cache
+        response = self.client.post('/api/v1/insurance/lookup/', data=json.dumps({'query': '0000000123'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['data']['insurance_code'], 'TE1790000000123')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_negative_cache_and_single_flight(self):
+        self.assertIsNone(InsuranceLookupService.lookup('999999999999'))
+        self.assertIsNone(InsuranceLookupService.lookup('999999999999'))
+        self.assertEqual(self.fetch.call_count, 1)
+        ttl = self.redis.ttl(f'{lookup.KEY_PREFIX}:cccd:999999999999')
+        self.assertTrue(0 < ttl <= settings.INSURANCE_LOOKUP_NEGATIVE_TTL)
+
+        def slow_fetch(query_type, key):
+            time.sleep(0.3)
+            return lookup.LOOKUP_BY_CCCD.get(key)
+
+        self.fetch.side_effect = slow_fetch
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(InsuranceLookupService.lookup('079085001234')))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r['insurance_code'] for r in results], ['DN7910000000456'] * 5)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_kiosk_sync_invalidates(self):
+        from apps.core_services.kiosk.services import KioskService
+        from apps.core_services.patients.models import Patient
+
+        info = InsuranceLookupService.lookup('TE1790000000123')
+        patient = Patient.objects.create(patient_code='BN-INS-001', first_name='An', last_name='Nguyen Van',
+                                         id_card='092200012345')
+        with self.captureOnCommitCallbacks(execute=True):
+            KioskService._sync_patient_from_insurance(patient, info)  # tên có dấu + mã thẻ mới
+        self.assertEqual(self.redis.exists(f'{lookup.KEY_PREFIX}:insurance_full:TE1790000000123',
+                                           f'{lookup.KEY_PREFIX}:insurance_short:0000000123'), 0)
+
+        InsuranceLookupService.lookup('0000000123')
+        self.assertEqual(self.fetch.call_count, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            KioskService._sync_patient_from_insurance(patient, info)  # không có gì mới → giữ cache
+        InsuranceLookupService.lookup('0000000123')
+        self.assertEqual(self.fetch.call_count, 2)
@@ -10,7 +10,6 @@ Hỗ trợ 3 loại đầu vào:
 
 import json
 import re
-import copy
 import logging
 from datetime import datetime, timezone
 
@@ -18,7 +17,7 @@ from django.http import JsonResponse, HttpRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from .mock_data import LOOKUP_BY_CCCD, LOOKUP_BY_SHORT_CODE, LOOKUP_BY_FULL_CODE
+from .lookup import InsuranceLookupService
 
 logger = logging.getLogger(__name__)
 
@@ -136,16 +135,10 @@ def lookup_insurance(request: HttpRequest) -> JsonResponse:
             status=400,
         )
 
-    # --- Tra cứu ---
-    record = None
-    if query_type == 'cccd':
-        record = LOOKUP_BY_CCCD.get(query)
-    elif query_type == 'insurance_short':
-        record = LOOKUP_BY_SHORT_CODE.get(query)
-    elif query_type == 'insurance_full':
-        record = LOOKUP_BY_FULL_CODE.get(query.upper())
+    # --- Tra cứu (qua cache, dùng chung với Kiosk) ---
+    result = InsuranceLookupService.lookup(query)
 
-    if record is None:
+    if result is None:
         return JsonResponse(
             {
                 "status": "not_found",
@@ -154,9 +147,6 @@ def lookup_insurance(request: HttpRequest) -> JsonResponse:
             json_dumps_params={"ensure_ascii": False},
         )
 
-    # --- Deep copy để không ảnh hưởng dữ liệu gốc ---
-    result = copy.deepcopy(record)
-
     # --- Kiểm tra hết hạn ---
     status = _check_expiry(result)
 
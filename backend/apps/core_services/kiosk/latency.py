@@ -0,0 +1,64 @@
+"""
+Kiosk latency — thời gian từng bước của check-in Kiosk (core.utils.timing).
+
+Mỗi response /kiosk/identify/ và /kiosk/register/ có header Server-Timing, VD:
+
+    Server-Timing: scan;dur=0.1, insurance;dur=2.4, patient;dur=3.0, active_visit;dur=1.2, total;dur=7.9
+
+và mỗi bước được ghi thành histogram `kiosk.latency.{flow}.{stage}` (+ `.total`);
+số request vượt KIOSK_LATENCY_BUDGET_MS đếm ở `kiosk.latency.{flow}.budget`.
+Đọc qua GET /api/v1/kiosk/metrics/ hoặc `python manage.py kiosk_latency_metrics [--reset]`.
+
+Các bước là thời gian riêng (không tính bước con), cộng lại ≈ total:
+    scan          phân loại dữ liệu quét
+    insurance     tra cứu BHYT (cache) / snapshot BHYT vào Visit
+    patient       tìm / tạo bệnh nhân
+    active_visit  kiểm tra lượt khám chưa xong
+    station       chọn trạm phân luồng
+    visit_create  tạo Visit + hồ sơ khám
+    queue_number  cấp số thứ tự
+    broadcast     WebSocket tiếp đón + bảng LED
+    queue_index   đồng bộ index hàng đợi / tải trạm (Redis, sau commit)
+    register      phần còn lại của đăng ký (lịch hẹn, phiếu xếp hàng, lưu lý do khám...)
+    commit        COMMIT + việc sau commit còn lại (xếp tóm tắt AI)
+"""
+
+from django.conf import settings
+
+from apps.core_services.core.utils import metrics
+
+PREFIX = 'kiosk.latency'
+
+STAGES = {
+    'identify': ('scan', 'insurance', 'patient', 'active_visit'),
+    'register': (
+        'patient', 'active_visit', 'station', 'visit_create', 'queue_number',
+        'insurance', 'broadcast', 'queue_index', 'register', 'commit',
+    ),
+}
+
+
+def prefix(flow: str) -> str:
+    return f'{PREFIX}.{flow}'
+
+
+def budget_ms() -> int:
+    return settings.KIOSK_LATENCY_BUDGET_MS
+
+
+def latency_metrics() -> dict:
+    """{flow: {total, over_budget, stages: {stage: histogram}}} — histogram như metrics.snapshot()."""
+    result = {'budget_ms': budget_ms()}
+    for flow, stages in STAGES.items():
+        result[flow] = {
+            'total': metrics.snapshot(f'{prefix(flow)}.total'),
+            'over_budget': int(metrics.snapshot(f'{prefix(flow)}.budget').get('over', 0)),
+            'stages': {name: metrics.snapshot(f'{prefix(flow)}.{name}') for name in stages},
+        }
+    return result
+
+
+def reset_latency_metrics() -> None:
+    for flow, stages in STAGES.items():
+        for name in (*stages, 'total', 'budget'):
+            metrics.reset(f'{prefix(flow)}.{name}')
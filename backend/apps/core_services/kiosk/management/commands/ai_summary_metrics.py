@@ -0,0 +1,50 @@
+"""
+Management command: ai_summary_metrics — Backlog tóm tắt AI lúc check-in Kiosk.
+
+  pending        số tóm tắt đang chờ / đang chạy trên queue ai_summary
+  oldest_wait    tuổi của tóm tắt chờ lâu nhất
+  queue_wait     check-in → worker bắt đầu tóm tắt
+  duration       thời gian 1 lần tóm tắt (lịch sử khám + LLM + lưu Visit)
+
+Usage:
+    python manage.py ai_summary_metrics
+    python manage.py ai_summary_metrics --reset
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core_services.kiosk import tasks
+
+
+class Command(BaseCommand):
+    help = 'Xem backlog / độ trễ tóm tắt AI lúc check-in Kiosk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Xóa số liệu sau khi in (không đụng backlog)',
+        )
+
+    def handle(self, *args, **options):
+        stats = tasks.summary_metrics()
+
+        oldest = stats['oldest_wait_s']
+        self.stdout.write(f"  Đang chờ / chạy: {stats['pending']}")
+        self.stdout.write(f"  Chờ lâu nhất:    {f'{oldest:g}s' if oldest is not None else '-'}")
+        self.stdout.write(
+            f"  Đã xếp: {stats['enqueued']} | trùng: {stats['deduplicated']} | "
+            f"xong: {stats['completed']} | lỗi: {stats['failed']} | bỏ (quá hạn): {stats['abandoned']}"
+        )
+        for label, key in (('Queue wait', 'queue_wait'), ('Duration', 'duration')):
+            hist = stats[key]
+            if not hist.get('count'):
+                self.stdout.write(f'  {label}: chưa có số liệu')
+                continue
+            self.stdout.write(
+                f"  {label}: n={int(hist['count'])} avg={hist['avg_ms']}ms "
+                f"p50≤{hist['p50_ms']:g}ms p95≤{hist['p95_ms']:g}ms p99≤{hist['p99_ms']:g}ms"
+            )
+
+        if options['reset']:
+            tasks.reset_summary_metrics()
+            self.stdout.write(self.style.SUCCESS('Đã xóa số liệu.'))
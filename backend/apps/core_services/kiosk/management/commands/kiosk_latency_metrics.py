@@ -0,0 +1,49 @@
+"""
+Management command: kiosk_latency_metrics — Thời gian từng bước của check-in Kiosk.
+
+  total          thời gian cả request (identify / register)
+  over_budget    số request vượt KIOSK_LATENCY_BUDGET_MS
+  stages         histogram từng bước (xem kiosk/latency.py)
+
+Usage:
+    python manage.py kiosk_latency_metrics
+    python manage.py kiosk_latency_metrics --reset
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core_services.kiosk import latency
+
+
+class Command(BaseCommand):
+    help = 'Xem thời gian từng bước của check-in Kiosk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Xóa số liệu sau khi in',
+        )
+
+    def _write_hist(self, label, hist):
+        if not hist.get('count'):
+            self.stdout.write(f'    {label}: chưa có số liệu')
+            return
+        self.stdout.write(
+            f"    {label}: n={int(hist['count'])} avg={hist['avg_ms']}ms "
+            f"p50≤{hist['p50_ms']:g}ms p95≤{hist['p95_ms']:g}ms p99≤{hist['p99_ms']:g}ms"
+        )
+
+    def handle(self, *args, **options):
+        stats = latency.latency_metrics()
+
+        self.stdout.write(f"  Ngân sách: {stats['budget_ms']}ms")
+        for flow in latency.STAGES:
+            flow_stats = stats[flow]
+            self.stdout.write(f"  {flow} (vượt ngân sách: {flow_stats['over_budget']})")
+            self._write_hist('total', flow_stats['total'])
+            for name, hist in flow_stats['stages'].items():
+                self._write_hist(name, hist)
+
+        if options['reset']:
+            latency.reset_latency_metrics()
+            self.stdout.write(self.style.SUCCESS('Đã xóa số liệu.'))
@@ -6,21 +6,19 @@ Layer 2: check_active_visit() — Chặn lượt khám trùng trong ngày
 """
 
 import re
-import copy
 import logging
-import threading
 from datetime import datetime, timezone as dt_timezone
 
 from django.utils import timezone
 from django.db import transaction
 
+from apps.core_services.patients.identifiers import IdentifierType, PatientIdentifierService, insurance_identifiers
 from apps.core_services.patients.models import Patient
 from apps.core_services.reception.models import Visit
 from apps.core_services.qms.models import ServiceStation, StationType
 from apps.core_services.qms.services import ClinicalQueueService, QueueService
-from apps.core_services.insurance_mock.mock_data import (
-    LOOKUP_BY_CCCD, LOOKUP_BY_SHORT_CODE, LOOKUP_BY_FULL_CODE
-)
+from apps.core_services.insurance_mock.lookup import InsuranceLookupService
+from apps.core_services.core.utils import CodeAllocator, timing
 
 logger = logging.getLogger(__name__)
 
@@ -88,19 +86,12 @@ class KioskService:
     @staticmethod
     def _lookup_insurance(scan_data: str, scan_type: str) -> dict | None:
         """
-        Tra cứu thông tin BHYT từ mock data.
+        Tra cứu thông tin BHYT (cache Redis dùng chung với API tra cứu, xem insurance_mock.lookup).
         Returns: dict insurance data hoặc None nếu không tìm thấy.
         """
-        if scan_type == 'cccd':
-            record = LOOKUP_BY_CCCD.get(scan_data)
-        elif scan_type == 'insurance_short':
-            record = LOOKUP_BY_SHORT_CODE.get(scan_data)
-        elif scan_type == 'insurance_full':
-            record = LOOKUP_BY_FULL_CODE.get(scan_data.upper())
-        else:
+        if scan_type == 'invalid':
             return None
-        
-        return copy.deepcopy(record) if record else None
+        return InsuranceLookupService.lookup(scan_data)
 
     @staticmethod
     def _sync_patient_from_insurance(patient: 'Patient', insurance_info: dict | None):
@@ -136,11 +127,21 @@ class KioskService:
         
         if updated_fields:
             patient.save(update_fields=updated_fields)
+            # Dữ liệu mới ghi xuống → lần tra sau lấy lại từ cổng BHYT
+            keys = (patient.id_card, patient.insurance_number, gov_insurance)
+            transaction.on_commit(lambda: InsuranceLookupService.invalidate(*keys))
             logger.info(
                 f"[KIOSK] Synced patient {patient.patient_code} "
                 f"fields: {updated_fields}"
             )
 
+    @staticmethod
+    def _insurance_cccd(insurance_info: dict | None) -> str | None:
+        """CCCD gắn với thẻ BHYT (tra qua cổng BHYT)."""
+        if not insurance_info:
+            return None
+        return InsuranceLookupService.holder_cccd(insurance_info.get('insurance_code'))
+
     @staticmethod
     def _find_or_create_patient(scan_data: str, scan_type: str, insurance_info: dict | None) -> tuple:
         """
@@ -148,42 +149,22 @@ class KioskService:
         
         Returns: (patient, is_new_patient)
         """
-        # --- Tìm theo CCCD ---
+        # --- Tìm theo mọi định danh của lần quét trong 1 query (bảng định danh) ---
+        # Ưu tiên CCCD > mã BHYT 15 ký tự > mã BHYT 10 số
         if scan_type == 'cccd':
-            try:
-                patient = Patient.objects.get(id_card=scan_data)
-                KioskService._sync_patient_from_insurance(patient, insurance_info)
-                return patient, False
-            except Patient.DoesNotExist:
-                pass
-
-        # --- Tìm theo mã BHYT ---
-        if scan_type in ('insurance_short', 'insurance_full'):
-            insurance_code = scan_data if scan_type == 'insurance_full' else None
-            
-            # Thử tìm theo insurance_number
-            if insurance_code:
-                try:
-                    patient = Patient.objects.get(insurance_number=insurance_code)
-                    KioskService._sync_patient_from_insurance(patient, insurance_info)
-                    return patient, False
-                except Patient.DoesNotExist:
-                    pass
-
-        # --- Nếu có insurance_info, tìm theo CCCD trong mock data ---
+            pairs = [(IdentifierType.CCCD, scan_data)]
+        else:
+            pairs = insurance_identifiers(scan_data)
         if insurance_info:
-            # Tìm CCCD tương ứng trong mock data
-            from apps.core_services.insurance_mock.mock_data import MOCK_RECORDS
-            for record in MOCK_RECORDS:
-                if record.get('data', {}).get('insurance_code') == insurance_info.get('insurance_code'):
-                    cccd = record.get('cccd')
-                    if cccd:
-                        try:
-                            patient = Patient.objects.get(id_card=cccd)
-                            KioskService._sync_patient_from_insurance(patient, insurance_info)
-                            return patient, False
-                        except Patient.DoesNotExist:
-                            break
+            pairs += insurance_identifiers(insurance_info.get('insurance_code'))
+            cccd = KioskService._insurance_cccd(insurance_info)
+            if cccd:
+                pairs.append((IdentifierType.CCCD, cccd))
+
+        patient = PatientIdentifierService.match(pairs)
+        if patient is not None:
+            KioskService._sync_patient_from_insurance(patient, insurance_info)
+            return patient, False
 
         # --- Tạo Patient mới nếu có insurance_info ---
         if insurance_info:
@@ -207,47 +188,17 @@ class KioskService:
                     pass
             
             # Tìm CCCD cho patient mới
-            id_card = scan_data if scan_type == 'cccd' else None
-            if not id_card:
-                from apps.core_services.insurance_mock.mock_data import MOCK_RECORDS
-                for record in MOCK_RECORDS:
-                    if record.get('data', {}).get('insurance_code') == insurance_info.get('insurance_code'):
-                        id_card = record.get('cccd')
-                        break
+            id_card = scan_data if scan_type == 'cccd' else KioskService._insurance_cccd(insurance_info)
             
-            # Generate patient_code with retry to handle race conditions
-            from django.db import IntegrityError
-            today_str = timezone.now().strftime('%Y%m%d')
-            count = Patient.objects.filter(created_at__date=timezone.now().date()).count() + 1
-            
-            max_retries = 10
-            patient = None
-            for attempt in range(max_retries):
-                patient_code = f"BN-{today_str}-{count:04d}"
-                try:
-                    with transaction.atomic():
-                        patient = Patient.objects.create(
-                            patient_code=patient_code,
-                            id_card=id_card,
-                            insurance_number=insurance_info.get('insurance_code'),
-                            first_name=first_name,
-                            last_name=last_name,
-                            date_of_birth=dob,
-                            gender=gender,
-                        )
-                    break  # Success
-                except IntegrityError:
-                    count += 1
-                    logger.warning(
-                        f"[KIOSK] patient_code {patient_code} conflict, "
-                        f"retrying with count={count} (attempt {attempt + 1})"
-                    )
-            
-            if patient is None:
-                raise Exception(
-                    f"Không thể tạo mã bệnh nhân sau {max_retries} lần thử. "
-                    f"Vui lòng thử lại."
-                )
+            patient = CodeAllocator.create('patient', lambda code: Patient.objects.create(
+                patient_code=code.code,
+                id_card=id_card,
+                insurance_number=insurance_info.get('insurance_code'),
+                first_name=first_name,
+                last_name=last_name,
+                date_of_birth=dob,
+                gender=gender,
+            ))
             
             logger.info(f"[KIOSK] Tạo Patient mới: {patient.patient_code} - {patient.full_name}")
             return patient, True
@@ -279,8 +230,9 @@ class KioskService:
             InvalidScanDataError: Dữ liệu quét không hợp lệ
             PatientNotFoundError: Không tìm thấy bệnh nhân
         """
-        scan_data = scan_data.strip()
-        scan_type = cls._classify_scan_data(scan_data)
+        with timing.stage('scan'):
+            scan_data = scan_data.strip()
+            scan_type = cls._classify_scan_data(scan_data)
         
         if scan_type == 'invalid':
             raise InvalidScanDataError(
@@ -290,15 +242,18 @@ class KioskService:
             )
         
         # Tra cứu BHYT
-        insurance_info = cls._lookup_insurance(scan_data, scan_type)
+        with timing.stage('insurance'):
+            insurance_info = cls._lookup_insurance(scan_data, scan_type)
         
         # Tìm hoặc tạo Patient
-        patient, is_new_patient = cls._find_or_create_patient(
-            scan_data, scan_type, insurance_info
-        )
+        with timing.stage('patient'):
+            patient, is_new_patient = cls._find_or_create_patient(
+                scan_data, scan_type, insurance_info
+            )
         
         # Check active visit
-        active_visit = cls._get_active_visit(patient)
+        with timing.stage('active_visit'):
+            active_visit = cls._get_active_visit(patient)
         
         logger.info(
             f"[KIOSK] Identify: {patient.patient_code} | "
@@ -367,11 +322,8 @@ class KioskService:
             logger.info(f"[KIOSK] Patient {patient.patient_code} — no insurance card, skipping snapshot")
             return
 
-        # Tra cứu mock data (cùng infrastructure với identify_patient)
-        record = LOOKUP_BY_FULL_CODE.get(ins_num.upper())
-        if not record:
-            # Thử short code (10 chữ số)
-            record = LOOKUP_BY_SHORT_CODE.get(ins_num)
+        # Cùng cache với identify_patient — thường vừa tra xong lúc quét
+        record = InsuranceLookupService.lookup(ins_num)
 
         if not record:
             logger.warning(f"[KIOSK] Insurance {ins_num} not found in mock data for {patient.patient_code}")
@@ -400,10 +352,9 @@ class KioskService:
         )
 
     @classmethod
-    @transaction.atomic
     def register_visit(cls, patient_id, chief_complaint: str) -> dict:
         """
-        Đăng ký lượt khám từ Kiosk.
+        Đăng ký lượt khám từ Kiosk (1 transaction).
         
         Flow:
         1. Tìm Patient
@@ -412,15 +363,25 @@ class KioskService:
         4. Gọi checkin_from_booking (nếu có hẹn) hoặc checkin_walkin (vãng lai)
         5. Cập nhật Visit.chief_complaint
         6. Trigger AI summarize
+
+        Stage 'commit' = COMMIT + việc chạy sau commit chưa có stage riêng
+        (xếp tóm tắt AI...); phần còn lại của thân hàm tính vào 'register'.
         """
+        with timing.stage('commit'), transaction.atomic(), timing.stage('register'):
+            return cls._register_visit(patient_id, chief_complaint)
+
+    @classmethod
+    def _register_visit(cls, patient_id, chief_complaint: str) -> dict:
         # 1. Tìm Patient
-        try:
-            patient = Patient.objects.get(id=patient_id)
-        except Patient.DoesNotExist:
-            raise PatientNotFoundError("Không tìm thấy bệnh nhân.")
+        with timing.stage('patient'):
+            try:
+                patient = Patient.objects.get(id=patient_id)
+            except Patient.DoesNotExist:
+                raise PatientNotFoundError("Không tìm thấy bệnh nhân.")
         
         # 2. Check active visit (Layer 2)
-        cls.check_active_visit(patient)
+        with timing.stage('active_visit'):
+            cls.check_active_visit(patient)
         
         # 3. Mặc định check-in Kiosk tự động chuyển bệnh nhân vào hàng đợi Phân Luồng (Triage) có tải thấp nhất
         station = ClinicalQueueService.get_optimal_station(StationType.TRIAGE)
@@ -467,7 +428,8 @@ class KioskService:
         visit.chief_complaint = chief_complaint
 
         # 5. Snapshot thông tin BHYT vào Visit (để billing dùng không cần tra lại)
-        cls._apply_insurance_snapshot(visit, patient)
+        with timing.stage('insurance'):
+            cls._apply_insurance_snapshot(visit, patient)
 
         visit.save(update_fields=['chief_complaint', 'insurance_number', 'insurance_benefit_rate', 'insurance_card_expire'])
         
@@ -475,7 +437,7 @@ class KioskService:
         estimated_wait = QueueService.get_estimated_wait_time(station)
         
         # 6. Trigger AI summarize (background - fire-and-forget)
-        cls._trigger_ai_summary_async(visit, chief_complaint)
+        cls._trigger_ai_summary_async(visit, chief_complaint, queue_entry.priority)
         
         # 7. TTS: Pre-generate audio for this patient (best-effort)
         try:
@@ -506,182 +468,116 @@ class KioskService:
     # AI SUMMARY (Background Task)
     # ------------------------------------------------------------------
     @staticmethod
-    def _trigger_ai_summary_async(visit: Visit, chief_complaint: str):
+    def _trigger_ai_summary_async(visit: Visit, chief_complaint: str, priority: int = 0):
+        """
+        Xếp tóm tắt AI vào queue Celery riêng (fire-and-forget, sau commit).
+        Không block response cho bệnh nhân; số tóm tắt chạy đồng thời bị giới
+        hạn bởi worker của queue, mỗi visit chỉ xếp 1 lần, cấp cứu chạy trước.
+        """
+        from .tasks import request_summary
+
+        request_summary(visit.id, chief_complaint, priority)
+
+    @staticmethod
+    def generate_ai_summary(visit: Visit, chief_complaint: str):
         """
-        Gọi AI Summarize Agent trong thread riêng (fire-and-forget).
+        Gọi AI Summarize Agent (chạy trong worker queue tóm tắt — xem tasks.py).
         Kết hợp lý do khám + bệnh án cũ → tóm tắt cho agent Phân Luồng.
-        Không block response cho bệnh nhân.
+        Returns True nếu đã lưu tóm tắt của AI vào Visit.
         """
-        def _run_summary():
-            try:
-                logger.info(f"[KIOSK] AI Summary started for visit: {visit.visit_code}")
-                
-                from apps.medical_services.emr.models import ClinicalRecord
+        try:
+            logger.info(f"[KIOSK] AI Summary started for visit: {visit.visit_code}")
+            
+            from apps.medical_services.emr.history import PatientHistoryService
+
+            # Lấy thông tin bệnh nhân
+            patient = visit.patient
+
+            # Lịch sử khám cũ (tối đa 30 lượt) — số query cố định
+            history_text = PatientHistoryService.load(patient, exclude_visit=visit).render_blocks()
+            
+            # Build message cho Summarize Agent
+            age = ''
+            if patient.date_of_birth:
+                from datetime import date as date_type
+                today = date_type.today()
+                age = today.year - patient.date_of_birth.year
+                if (today.month, today.day) < (patient.date_of_birth.month, patient.date_of_birth.day):
+                    age -= 1
+            
+            structured_message = (
+                f"[KIOSK_CHECKIN_SUMMARY]\n"
+                f"THÔNG TIN BỆNH NHÂN:\n"
+                f"Mã BN: {patient.patient_code}\n"
+                f"Họ tên: {patient.full_name}\n"
+                f"Tuổi: {age or 'N/A'} | Giới: {patient.gender}\n"
+                f"Ngày sinh: {patient.date_of_birth or 'N/A'}\n\n"
+                f"LÝ DO KHÁM HÔM NAY:\n{chief_complaint}\n\n"
+                f"LỊCH SỬ KHÁM GẦN ĐÂY:\n{history_text}\n\n"
+                f"YÊU CẦU: Tóm tắt thông tin bệnh nhân, kết hợp lý do khám hôm nay "
+                f"với bệnh án cũ. Đưa ra các chỉ số cần lưu ý khi đo sinh hiệu "
+                f"và gợi ý cho agent Phân Luồng."
+            )
+            
+            # Gọi summarize_node trực tiếp
+            from langchain_core.messages import HumanMessage
+            from apps.ai_engine.agents.summarize_agent.node import summarize_node
+            
+            state = {
+                "messages": [HumanMessage(content=structured_message)],
+                "current_agent": "summarize",
+            }
+            
+            result = summarize_node(state)
+            
+            # Lấy kết quả từ AI
+            ai_messages = result.get("messages", [])
+            if ai_messages:
+                ai_msg = ai_messages[0]
+                ai_content = ai_msg.content
                 
-                # Lấy thông tin bệnh nhân
-                patient = visit.patient
+                # Extract structured data từ additional_kwargs
+                kwargs = getattr(ai_msg, 'additional_kwargs', {})
+                vital_recommendations = kwargs.get('vital_sign_recommendations', [])
+                triage_hints_text = kwargs.get('triage_hints', None)
                 
-                from apps.medical_services.lis.models import LabOrder
-                from apps.medical_services.ris.models import ImagingOrder
-
-                # Lấy lịch sử khám cũ (lấy đến 30 lượt để đảm bảo bao quát hầu hết bệnh nhân)
-                past_visits = Visit.objects.filter(
-                    patient=patient,
-                    status__in=[Visit.Status.COMPLETED, Visit.Status.IN_PROGRESS, Visit.Status.PENDING_RESULTS],
-                ).exclude(
-                    id=visit.id
-                ).order_by('-check_in_time')[:30]
+                # Lưu vào Visit
+                visit.refresh_from_db()
+                visit.triage_ai_response = ai_content
+                visit.pre_triage_summary = ai_content
                 
-                # Build context từ bệnh án cũ
-                history_lines = []
-                for idx, pv in enumerate(past_visits, 1):
-                    pv_complaint = pv.chief_complaint or ''
-                    cr = None
-                    try:
-                        cr = ClinicalRecord.objects.get(visit=pv)
-                        if not pv_complaint:
-                            pv_complaint = getattr(cr, 'final_diagnosis', cr.chief_complaint) or 'Không rõ lý do'
-                    except ClinicalRecord.DoesNotExist:
-                        if not pv_complaint:
-                            pv_complaint = 'Không rõ lý do'
-                    
-                    dept = pv.confirmed_department.name if pv.confirmed_department else 'N/A'
-                    date = pv.check_in_time.strftime('%d/%m/%Y') if pv.check_in_time else 'N/A'
-                    
-                    visit_block = [f"--- Lượt khám {idx} ({date}) ---", f"Khoa: {dept}"]
-                    if pv_complaint:
-                        visit_block.append(f"Lý do khám/Chẩn đoán sơ bộ: {pv_complaint}")
-                        
-                    if cr:
-                        if cr.history_of_present_illness:
-                            visit_block.append(f"Bệnh sử: {cr.history_of_present_illness}")
-                        if cr.physical_exam:
-                            visit_block.append(f"Khám lâm sàng: {cr.physical_exam}")
-                        if cr.medical_summary:
-                            visit_block.append(f"Tóm tắt bệnh án (BS ghi nhận): {cr.medical_summary}")
-                        if cr.final_diagnosis:
-                            visit_block.append(f"Chẩn đoán cuối cùng: {cr.final_diagnosis}")
-                        if cr.treatment_plan:
-                            visit_block.append(f"Hướng điều trị: {cr.treatment_plan}")
+                if vital_recommendations:
+                    visit.vital_sign_recommendations = vital_recommendations
+                if triage_hints_text:
+                    visit.triage_hints = triage_hints_text
                     
-                    # 1. Kết quả Xét nghiệm
-                    lab_orders = LabOrder.objects.filter(visit=pv, status__in=['COMPLETED', 'VERIFIED']).prefetch_related('details__result', 'details__test')
-                    lab_info = []
-                    for order in lab_orders:
-                        for detail in order.details.all():
-                            if hasattr(detail, 'result'):
-                                res = detail.result
-                                val = res.value_numeric if res.value_numeric is not None else res.value_string
-                                unit = detail.test.unit or ''
-                                if res.is_abnormal:
-                                    lab_info.append(f"  - {detail.test.name}: {val} {unit} [BẤT THƯỜNG]")
-                                else:
-                                    lab_info.append(f"  - {detail.test.name}: {val} {unit}")
-                    if lab_info:
-                        visit_block.append("Xét nghiệm:")
-                        visit_block.extend(lab_info)
-                        
-                    # 2. Kết quả CĐHA
-                    imaging_orders = ImagingOrder.objects.filter(visit=pv, status__in=['REPORTED', 'VERIFIED']).select_related('result', 'procedure')
-                    img_info = []
-                    for order in imaging_orders:
-                        if hasattr(order, 'result'):
-                            res = order.result
-                            img_info.append(f"  - {order.procedure.name}:")
-                            img_info.append(f"    + Kết luận: {res.conclusion}")
-                            if res.is_abnormal:
-                                img_info[-1] += " [BẤT THƯỜNG]"
-                    if img_info:
-                        visit_block.append("Chẩn đoán hình ảnh:")
-                        visit_block.extend(img_info)
-
-                    history_lines.append('\n'.join(visit_block))
-
-                history_text = '\n\n'.join(history_lines) if history_lines else 'Chưa có lịch sử khám.'
+                update_fields_vt = ['triage_ai_response', 'pre_triage_summary']
+                if vital_recommendations:
+                    update_fields_vt.append('vital_sign_recommendations')
+                if triage_hints_text:
+                    update_fields_vt.append('triage_hints')
+                visit.save(update_fields=update_fields_vt)
                 
-                # Build message cho Summarize Agent
-                age = ''
-                if patient.date_of_birth:
-                    from datetime import date as date_type
-                    today = date_type.today()
-                    age = today.year - patient.date_of_birth.year
-                    if (today.month, today.day) < (patient.date_of_birth.month, patient.date_of_birth.day):
-                        age -= 1
-                
-                structured_message = (
-                    f"[KIOSK_CHECKIN_SUMMARY]\n"
-                    f"THÔNG TIN BỆNH NHÂN:\n"
-                    f"Mã BN: {patient.patient_code}\n"
-                    f"Họ tên: {patient.full_name}\n"
-                    f"Tuổi: {age or 'N/A'} | Giới: {patient.gender}\n"
-                    f"Ngày sinh: {patient.date_of_birth or 'N/A'}\n\n"
-                    f"LÝ DO KHÁM HÔM NAY:\n{chief_complaint}\n\n"
-                    f"LỊCH SỬ KHÁM GẦN ĐÂY:\n{history_text}\n\n"
-                    f"YÊU CẦU: Tóm tắt thông tin bệnh nhân, kết hợp lý do khám hôm nay "
-                    f"với bệnh án cũ. Đưa ra các chỉ số cần lưu ý khi đo sinh hiệu "
-                    f"và gợi ý cho agent Phân Luồng."
+                logger.info(
+                    f"[KIOSK] AI Summary completed for visit: {visit.visit_code} | "
+                    f"vital_recs={vital_recommendations} | "
+                    f"hints={'YES' if triage_hints_text else 'NO'} -> Saved to Visit"
                 )
-                
-                # Gọi summarize_node trực tiếp
-                from langchain_core.messages import HumanMessage
-                from apps.ai_engine.agents.summarize_agent.node import summarize_node
-                
-                state = {
-                    "messages": [HumanMessage(content=structured_message)],
-                    "current_agent": "summarize",
-                }
-                
-                result = summarize_node(state)
-                
-                # Lấy kết quả từ AI
-                ai_messages = result.get("messages", [])
-                if ai_messages:
-                    ai_msg = ai_messages[0]
-                    ai_content = ai_msg.content
-                    
-                    # Extract structured data từ additional_kwargs
-                    kwargs = getattr(ai_msg, 'additional_kwargs', {})
-                    vital_recommendations = kwargs.get('vital_sign_recommendations', [])
-                    triage_hints_text = kwargs.get('triage_hints', None)
-                    
-                    # Lưu vào Visit
-                    visit.refresh_from_db()
-                    visit.triage_ai_response = ai_content
-                    visit.pre_triage_summary = ai_content
-                    
-                    if vital_recommendations:
-                        visit.vital_sign_recommendations = vital_recommendations
-                    if triage_hints_text:
-                        visit.triage_hints = triage_hints_text
-                        
-                    update_fields_vt = ['triage_ai_response', 'pre_triage_summary']
-                    if vital_recommendations:
-                        update_fields_vt.append('vital_sign_recommendations')
-                    if triage_hints_text:
-                        update_fields_vt.append('triage_hints')
-                    visit.save(update_fields=update_fields_vt)
-                    
-                    logger.info(
-                        f"[KIOSK] AI Summary completed for visit: {visit.visit_code} | "
-                        f"vital_recs={vital_recommendations} | "
-                        f"hints={'YES' if triage_hints_text else 'NO'} -> Saved to Visit"
-                    )
-                else:
-                    logger.warning(f"[KIOSK] AI Summary returned empty for visit: {visit.visit_code}")
-                
-            except Exception as e:
-                logger.error(f"[KIOSK] AI Summary error for visit {visit.visit_code}: {e}")
-                # Fallback: lưu text đơn giản nếu AI fail
-                try:
-                    visit.refresh_from_db()
-                    visit.triage_ai_response = (
-                        f"[Tóm tắt tự động - Kiosk]\n"
-                        f"Lý do khám: {chief_complaint}\n"
-                        f"(AI tóm tắt không khả dụng, vui lòng xem chi tiết tại quầy.)"
-                    )
-                    visit.save(update_fields=['triage_ai_response'])
-                except Exception:
-                    pass
-        
-        thread = threading.Thread(target=_run_summary, daemon=True)
-        thread.start()
+                return True
+            logger.warning(f"[KIOSK] AI Summary returned empty for visit: {visit.visit_code}")
+            return False
+            
+        except Exception as e:
+            logger.error(f"[KIOSK] AI Summary error for visit {visit.visit_code}: {e}")
+            # Fallback: lưu text đơn giản nếu AI fail
+            try:
+                visit.refresh_from_db()
+                visit.triage_ai_response = (
+                    f"[Tóm tắt tự động - Kiosk]\n"
+                    f"Lý do khám: {chief_complaint}\n"
+                    f"(AI tóm tắt không khả dụng, vui lòng xem chi tiết tại quầy.)"
+                )
+                visit.save(update_fields=['triage_ai_response'])
+            except Exception:
+                pass
+            return False
@@ -0,0 +1,180 @@
+"""
+Celery tasks for Kiosk app — tóm tắt AI lúc check-in.
+
+Mỗi check-in Kiosk xếp 1 task summarize_visit vào queue riêng
+(settings.KIOSK_AI_SUMMARY_QUEUE). Worker của queue này chạy với concurrency
+cố định (docker-compose: celery_ai_worker), nên giờ cao điểm chỉ làm dài
+backlog chứ không mở thêm kết nối Postgres / lời gọi LLM.
+
+    request_summary(visit_id, chief_complaint, priority)  # sau commit, 1 lần / visit
+    backlog()  # {'pending': 12, 'oldest_wait_s': 42.0}
+
+Redis (best-effort như request_audio của TTS):
+    kiosk:ai_summary:backlog  ZSET visit_id → thời điểm xếp hàng — chống xếp trùng
+                              và cho độ sâu backlog (gồm cả task đang chạy)
+Cấp cứu chạy trước: priority của message trên broker (Redis: 0 = cao nhất).
+Tóm tắt chờ quá ABANDON_AFTER bị bỏ (bệnh nhân đã được phân luồng từ lâu).
+"""
+
+import logging
+import time
+
+import redis
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from apps.core_services.core.utils import get_redis_client, metrics
+
+logger = logging.getLogger(__name__)
+
+BACKLOG_KEY = 'kiosk:ai_summary:backlog'
+STALE_AFTER = 600  # seconds — task mất (worker chết) thì lần xếp sau được gửi lại
+ABANDON_AFTER = 3600  # seconds — quá hạn này thì không tóm tắt nữa, bỏ khỏi backlog
+
+METRIC = 'kiosk.ai_summary'
+METRIC_QUEUE_WAIT = 'kiosk.ai_summary.queue_wait'
+METRIC_DURATION = 'kiosk.ai_summary.duration'
+
+# priority của broker theo priority hàng chờ (ClinicalQueueService.PRIORITY_*)
+BROKER_PRIORITY_EMERGENCY = 0
+BROKER_PRIORITY_HIGH = 3
+BROKER_PRIORITY_NORMAL = 6
+
+
+def broker_priority(queue_priority: int) -> int:
+    from apps.core_services.qms.services import ClinicalQueueService
+
+    if queue_priority >= ClinicalQueueService.PRIORITY_EMERGENCY:
+        return BROKER_PRIORITY_EMERGENCY
+    if queue_priority >= ClinicalQueueService.PRIORITY_ELDERLY_CHILD:
+        return BROKER_PRIORITY_HIGH
+    return BROKER_PRIORITY_NORMAL
+
+
+def _enqueue(visit_id: str, chief_complaint: str, priority: int) -> None:
+    """Sau commit: thêm vào backlog và gửi task — visit đã có trong backlog thì bỏ qua."""
+    client = get_redis_client()
+    if client is None:
+        return
+    now = time.time()
+    try:
+        if not client.zadd(BACKLOG_KEY, {visit_id: now}, nx=True):
+            queued_at = client.zscore(BACKLOG_KEY, visit_id)
+            if queued_at is not None and now - queued_at < STALE_AFTER:
+                metrics.incr(METRIC, 'deduplicated')
+                return
+            client.zadd(BACKLOG_KEY, {visit_id: now})
+    except redis.RedisError as e:
+        logger.warning('[KIOSK] AI Summary enqueue failed for visit=%s: %s', visit_id, e)
+        return
+
+    try:
+        summarize_visit.apply_async(
+            args=(visit_id, chief_complaint),
+            queue=settings.KIOSK_AI_SUMMARY_QUEUE,
+            priority=priority,
+        )
+    except Exception:
+        logger.exception('[KIOSK] Failed to dispatch summarize_visit for visit=%s', visit_id)
+        _done(visit_id)
+        return
+    metrics.incr(METRIC, 'enqueued')
+
+
+def request_summary(visit_id, chief_complaint: str, queue_priority: int = 0) -> bool:
+    """
+    Xếp tóm tắt AI cho visit sau commit (bỏ qua nếu visit đang chờ / đang chạy).
+
+    Returns False nếu không xếp được (không có Redis → không có broker).
+    """
+    if get_redis_client() is None:
+        logger.warning('[KIOSK] AI Summary skipped for visit=%s: Redis unavailable', visit_id)
+        return False
+    visit_id = str(visit_id)
+    priority = broker_priority(queue_priority)
+    transaction.on_commit(lambda: _enqueue(visit_id, chief_complaint, priority))
+    return True
+
+
+def _done(visit_id: str) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.zrem(BACKLOG_KEY, visit_id)
+    except redis.RedisError as e:
+        logger.warning('[KIOSK] backlog update failed for visit=%s: %s', visit_id, e)
+
+
+def backlog() -> dict:
+    """Số tóm tắt đang chờ / đang chạy và tuổi của cái lâu nhất."""
+    client = get_redis_client()
+    if client is None:
+        return {'pending': 0, 'oldest_wait_s': None}
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zremrangebyscore(BACKLOG_KEY, '-inf', time.time() - ABANDON_AFTER)  # task đã mất
+        pipe.zcard(BACKLOG_KEY)
+        pipe.zrange(BACKLOG_KEY, 0, 0, withscores=True)
+        _, pending, oldest = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[KIOSK] backlog read failed: %s', e)
+        return {'pending': 0, 'oldest_wait_s': None}
+    return {
+        'pending': pending,
+        'oldest_wait_s': round(time.time() - oldest[0][1], 1) if oldest else None,
+    }
+
+
+def summary_metrics() -> dict:
+    counters = metrics.snapshot(METRIC)
+    return {
+        **backlog(),
+        **{field: int(counters.get(field, 0)) for field in ('enqueued', 'deduplicated', 'completed', 'failed', 'abandoned')},
+        'queue_wait': metrics.snapshot(METRIC_QUEUE_WAIT),
+        'duration': metrics.snapshot(METRIC_DURATION),
+    }
+
+
+def reset_summary_metrics() -> None:
+    for name in (METRIC, METRIC_QUEUE_WAIT, METRIC_DURATION):
+        metrics.reset(name)
+
+
+@shared_task(ignore_result=True, soft_time_limit=120)
+def summarize_visit(visit_id: str, chief_complaint: str) -> None:
+    """
+    Celery task (queue KIOSK_AI_SUMMARY_QUEUE): tóm tắt AI cho 1 lượt khám.
+    KioskService.generate_ai_summary lưu kết quả (hoặc text dự phòng) vào Visit.
+    """
+    from apps.core_services.reception.models import Visit
+    from .services import KioskService
+
+    client = get_redis_client()
+    try:
+        queued_at = client.zscore(BACKLOG_KEY, visit_id) if client is not None else None
+    except redis.RedisError:
+        queued_at = None
+    if queued_at is None:
+        return  # đã xong (bản gửi lại sau STALE_AFTER) — hoặc mất Redis, khi đó broker cũng mất
+    if time.time() - queued_at > ABANDON_AFTER:
+        _done(visit_id)
+        metrics.incr(METRIC, 'abandoned')
+        return
+    metrics.observe_ms(METRIC_QUEUE_WAIT, max(time.time() - queued_at, 0) * 1000)
+
+    started = time.monotonic()
+    try:
+        visit = Visit.objects.select_related('patient').get(id=visit_id)
+    except Visit.DoesNotExist:
+        logger.warning('[KIOSK] AI Summary: visit not found: %s', visit_id)
+        _done(visit_id)
+        return
+
+    try:
+        ok = KioskService.generate_ai_summary(visit, chief_complaint)
+    finally:
+        _done(visit_id)
+    metrics.incr(METRIC, 'completed' if ok else 'failed')
+    metrics.observe_ms(METRIC_DURATION, (time.monotonic() - started) * 1000)
@@ -9,15 +9,28 @@ Tests:
   5. Register - Bị chặn do lượt khám active (Layer 2)
   6. Register - Cho phép sau khi visit COMPLETED
   7. Rate limiting (Layer 3)
+  8. Tóm tắt AI - queue Celery riêng, 1 lần / visit, cấp cứu trước, backlog metrics (cần Redis)
+  9. Latency - header Server-Timing theo bước, histogram đọc qua /kiosk/metrics/, đếm vượt ngân sách (cần Redis)
 """
 
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase, override_settings
 from django.utils import timezone
 from rest_framework.test import APIClient
 
+from apps.core_services.authentication.models import User
+from apps.core_services.core.utils import get_redis_client
+
 from apps.core_services.patients.models import Patient
 from apps.core_services.reception.models import Visit
-from apps.core_services.qms.models import ServiceStation, StationType
+from apps.core_services.qms.models import QueueEntry, ServiceStation, StationType
+from apps.core_services.qms.services import ClinicalQueueService
+from . import latency, tasks
+from .throttles import KioskRateThrottle
 from .services import KioskService, ActiveVisitExistsError, PatientNotFoundError, InvalidScanDataError
 
 
@@ -309,3 +322,146 @@ class KioskAPITests(TestCase):
         # Request thứ 4+ phải bị throttle (nếu > rate limit)
         # Note: DRF throttle có thể cache nên test này mang tính minh họa
         # Trong production, rate limit sẽ hoạt động chính xác với Django cache backend
+
+
+class KioskAISummaryTests(TestCase):
+    """Tóm tắt AI chạy trên queue Celery giới hạn concurrency thay vì 1 thread / check-in."""
+
+    def setUp(self):
+        client = get_redis_client()
+        if client is None:
+            self.skipTest('Redis không khả dụng')
+        client.delete(tasks.BACKLOG_KEY)
+        tasks.reset_summary_metrics()
+        self.patient = Patient.objects.create(
+            patient_code='BN-AI-001', first_name='Summary', last_name='Le', gender='M',
+        )
+        self.visit = Visit.objects.create(patient=self.patient, visit_code='VISIT-AI-001', queue_number=1)
+        dispatch = patch.object(tasks.summarize_visit, 'apply_async')
+        self.apply_async = dispatch.start()
+        self.addCleanup(dispatch.stop)
+        # Check-in tạo ClinicalRecord → thread index RAG mở kết nối DB riêng — không cần ở đây
+        indexing = patch('apps.ai_engine.rag_service.signals._run_async_indexing')
+        indexing.start()
+        self.addCleanup(indexing.stop)
+
+    def test_dedup_and_priority(self):
+        """Check-in gửi lại / double-submit → 1 task; cấp cứu lấy priority cao nhất của broker."""
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.request_summary(self.visit.id, 'Khó thở', ClinicalQueueService.PRIORITY_EMERGENCY)
+
+        self.apply_async.assert_called_once_with(
+            args=(str(self.visit.id), 'Khó thở'), queue='ai_summary', priority=tasks.BROKER_PRIORITY_EMERGENCY,
+        )
+        stats = tasks.summary_metrics()
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual((stats['enqueued'], stats['deduplicated']), (1, 2))
+        self.assertEqual(tasks.broker_priority(ClinicalQueueService.PRIORITY_ELDERLY_CHILD), tasks.BROKER_PRIORITY_HIGH)
+        self.assertEqual(tasks.broker_priority(ClinicalQueueService.PRIORITY_WALK_IN), tasks.BROKER_PRIORITY_NORMAL)
+
+    def test_rolled_back_checkin_not_queued(self):
+        """Chỉ gửi sau commit — check-in bị rollback không để lại task / backlog."""
+        with self.captureOnCommitCallbacks(execute=False):
+            tasks.request_summary(self.visit.id, 'Đau đầu')
+        self.apply_async.assert_not_called()
+        self.assertEqual(tasks.backlog()['pending'], 0)
+
+    def test_register_visit_enqueues(self):
+        """register_visit không mở thread — xếp 1 task với priority của phiếu xếp hàng."""
+        ServiceStation.objects.create(
+            code='TRIAGE-AI', name='Phân luồng', station_type=StationType.TRIAGE, is_active=True,
+        )
+        other = Patient.objects.create(patient_code='BN-AI-002', first_name='Walkin', last_name='Vo', gender='F')
+        with self.captureOnCommitCallbacks(execute=True):
+            result = KioskService.register_visit(patient_id=other.id, chief_complaint='Sốt')
+        entry = QueueEntry.objects.get(queue_number__visit=result['visit'])
+        self.apply_async.assert_called_once_with(
+            args=(str(result['visit'].id), 'Sốt'), queue='ai_summary', priority=tasks.broker_priority(entry.priority),
+        )
+
+    def test_task_clears_backlog(self):
+        """Worker tóm tắt xong → rời backlog, có số liệu chờ / chạy; bản gửi lại bị bỏ qua."""
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.request_summary(self.visit.id, 'Ho kéo dài')
+
+        with patch.object(KioskService, 'generate_ai_summary', return_value=True) as generate:
+            tasks.summarize_visit(str(self.visit.id), 'Ho kéo dài')
+            tasks.summarize_visit(str(self.visit.id), 'Ho kéo dài')  # redelivery
+        generate.assert_called_once()
+        self.assertEqual(generate.call_args.args[0].id, self.visit.id)
+
+        stats = tasks.summary_metrics()
+        self.assertEqual((stats['pending'], stats['completed']), (0, 1))
+        self.assertEqual(stats['queue_wait']['count'], 1)
+        self.assertEqual(stats['duration']['count'], 1)
+
+
+class KioskLatencyTests(TestCase):
+    """Thời gian từng bước của check-in Kiosk: Server-Timing + histogram."""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        latency.reset_latency_metrics()
+        self.addCleanup(latency.reset_latency_metrics)
+        # IP riêng + xóa bộ đếm throttle (cache dùng chung với các test rate limit)
+        self.client = APIClient(REMOTE_ADDR='10.99.0.1')
+        cache.delete(KioskRateThrottle.cache_format % {'scope': KioskRateThrottle.scope, 'ident': '10.99.0.1'})
+        self.patient = Patient.objects.create(
+            patient_code='BN-LAT-001', id_card='092200012345', insurance_number='TE1790000000123',
+            first_name='An', last_name='Nguyen Van', gender='M',
+        )
+        ServiceStation.objects.create(code='PL-LAT', name='Phân luồng', station_type=StationType.TRIAGE, is_active=True)
+        indexing = patch('apps.ai_engine.rag_service.signals._run_async_indexing')
+        indexing.start()
+        self.addCleanup(indexing.stop)
+
+    @staticmethod
+    def _stages(response):
+        return dict(part.split(';dur=') for part in response['Server-Timing'].split(', '))
+
+    @override_settings(KIOSK_LATENCY_BUDGET_MS=0)
+    def test_server_timing_and_metrics(self):
+        response = self.client.post('/api/v1/kiosk/identify/', {'scan_data': '092200012345'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        stages = self._stages(response)
+        self.assertEqual(list(stages), ['scan', 'insurance', 'patient', 'active_visit', 'total'])
+        # Bước là thời gian riêng → tổng các bước không vượt total
+        self.assertLessEqual(sum(float(ms) for name, ms in stages.items() if name != 'total'),
+                             float(stages['total']) + 0.5)
+
+        with patch.object(KioskService, '_trigger_ai_summary_async'):
+            response = self.client.post('/api/v1/kiosk/register/', {
+                'patient_id': str(self.patient.id), 'chief_complaint': 'Đau đầu',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        for name in ('patient', 'active_visit', 'station', 'visit_create', 'queue_number', 'broadcast', 'commit'):
+            self.assertIn(name, self._stages(response))
+
+        self.assertEqual(self.client.get('/api/v1/kiosk/metrics/').status_code, 401)
+        self.client.force_authenticate(User.objects.create_user(
+            email='kiosk.latency@test.vn', password='x', phone='0900000011',
+        ))
+        stats = self.client.get('/api/v1/kiosk/metrics/', {'reset': '1'}).data
+        self.assertEqual(stats['budget_ms'], 0)
+        self.assertEqual(stats['identify']['total']['count'], 1)
+        self.assertEqual(stats['identify']['over_budget'], 1)
+        self.assertEqual(stats['identify']['stages']['insurance']['count'], 1)
+        self.assertEqual(stats['register']['stages']['visit_create']['count'], 1)
+        self.assertEqual(stats['register']['stages']['queue_number']['count'], 1)
+
+        # GET chỉ đọc — ?reset không xóa số liệu
+        stats = self.client.get('/api/v1/kiosk/metrics/').data
+        self.assertEqual(stats['identify']['total']['count'], 1)
+
+        out = StringIO()
+        call_command('kiosk_latency_metrics', '--reset', stdout=out)
+        self.assertIn('visit_create: n=1', out.getvalue())
+        stats = self.client.get('/api/v1/kiosk/metrics/').data
+        self.assertEqual(stats['identify']['total'], {})
+
+    def test_error_responses_timed(self):
+        response = self.client.post('/api/v1/kiosk/identify/', {'scan_data': '999999999999'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(list(self._stages(response)), ['scan', 'insurance', 'patient', 'total'])
@@ -4,19 +4,23 @@ Kiosk Views — API endpoints cho Kiosk tự phục vụ
 Endpoints:
   POST /api/kiosk/identify/   — Quét QR CCCD/BHYT → Trả thông tin bệnh nhân
   POST /api/kiosk/register/   — Đăng ký lượt khám → Trả số thứ tự
+  GET  /api/kiosk/metrics/    — Thời gian từng bước (histogram) của 2 endpoint trên
 
-Cả 2 endpoint đều:
+identify / register:
   - AllowAny (không cần login, kiosk là public terminal)
   - KioskRateThrottle (10 req/min per IP)
+  - Header Server-Timing theo từng bước (xem latency.py)
 """
 
 import logging
 
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from apps.core_services.core.utils.timing import server_timing
+from . import latency
 from .serializers import KioskIdentifySerializer, KioskRegisterSerializer
 from .throttles import KioskRateThrottle
 from .services import (
@@ -35,6 +39,7 @@ logger = logging.getLogger(__name__)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @throttle_classes([KioskRateThrottle])
+@server_timing(latency.prefix('identify'), budget_ms=latency.budget_ms)
 def kiosk_identify(request):
     """
     Bước 1: Quét QR CCCD/BHYT → Trả thông tin bệnh nhân.
@@ -113,6 +118,7 @@ def kiosk_identify(request):
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @throttle_classes([KioskRateThrottle])
+@server_timing(latency.prefix('register'), budget_ms=latency.budget_ms)
 def kiosk_register(request):
     """
     Bước 2: Đăng ký lượt khám → Trả số thứ tự.
@@ -183,3 +189,28 @@ def kiosk_register(request):
         'estimated_wait_minutes': result['estimated_wait_minutes'],
         'message': result['message'],
     }, status=status.HTTP_201_CREATED)
+
+
+# ======================================================================
+# GET /api/kiosk/metrics/
+# ======================================================================
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def kiosk_metrics(request):
+    """
+    Thời gian từng bước của check-in Kiosk (histogram, cộng dồn từ mọi worker).
+
+    Response (200):
+        {
+            "budget_ms": 1000,
+            "identify": {
+                "total": {"count": 120, "avg_ms": 38.5, "p50_ms": 25, "p95_ms": 100, "p99_ms": 200, ...},
+                "over_budget": 0,
+                "stages": {"scan": {...}, "insurance": {...}, "patient": {...}, "active_visit": {...}}
+            },
+            "register": {...}
+        }
+
+    Chỉ đọc — xóa số liệu bằng `python manage.py kiosk_latency_metrics --reset`.
+    """
+    return Response(latency.latency_metrics())
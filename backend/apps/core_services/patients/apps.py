@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core_services.patients'
+
+    def ready(self):
+        import apps.core_services.patients.signals  # noqa: F401
@@ -0,0 +1,166 @@
+"""
+Bảng định danh bệnh nhân — mọi mã quét / gõ được về 1 bệnh nhân bằng 1 index lookup.
+
+Mỗi Patient có các dòng (loại, giá trị đã chuẩn hóa):
+
+    CCCD            001090000001
+    INSURANCE       TE1790000000123   mã BHYT 15 ký tự (chữ in hoa)
+    INSURANCE_SHORT 0000000123        10 số cuối — mã BHYT mới / số BHXH
+    PHONE           0912345678        +84912… / 84912… → 0912…
+    PATIENT_CODE    BN-20260101-0001
+
+    PatientIdentifierService.resolve('+84912345678')        # queryset Patient
+    PatientIdentifierService.match([(IdentifierType.CCCD, '0012…')])  # 1 query
+
+Đồng bộ qua signals (post_save Patient). bulk_create / queryset.update không
+gửi signal → chạy `python manage.py rebuild_patient_identifiers` sau đó.
+"""
+
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import IdentifierType, Patient, PatientIdentifier
+
+
+# Thứ tự ưu tiên khi một lần quét khớp nhiều bệnh nhân (SĐT có thể dùng chung trong gia đình)
+TYPE_PRIORITY = [
+    IdentifierType.CCCD,
+    IdentifierType.INSURANCE,
+    IdentifierType.INSURANCE_SHORT,
+    IdentifierType.PATIENT_CODE,
+    IdentifierType.PHONE,
+]
+
+PATTERN_CCCD = re.compile(r'^(\d{9}|\d{12})$')  # CMND 9 số / CCCD 12 số
+PATTERN_INSURANCE_FULL = re.compile(r'^[A-Z]{2}\d{13}$')
+PATTERN_INSURANCE_SHORT = re.compile(r'^\d{10}$')
+PATTERN_PHONE = re.compile(r'^0\d{9,10}$')
+
+
+def _compact(value) -> str:
+    return re.sub(r'[\s.\-]', '', str(value or '')).upper()
+
+
+def normalize_phone(value) -> str | None:
+    digits = _compact(value).lstrip('+')
+    if digits.startswith('84') and len(digits) >= 11:
+        digits = '0' + digits[2:]
+    return digits if PATTERN_PHONE.match(digits) else None
+
+
+def insurance_identifiers(code) -> list:
+    """Mã BHYT 15 ký tự → [INSURANCE, INSURANCE_SHORT (10 số cuối)]; mã 10 số → [INSURANCE_SHORT]."""
+    code = _compact(code)
+    if PATTERN_INSURANCE_FULL.match(code):
+        return [(IdentifierType.INSURANCE, code), (IdentifierType.INSURANCE_SHORT, code[-10:])]
+    if PATTERN_INSURANCE_SHORT.match(code):
+        return [(IdentifierType.INSURANCE_SHORT, code)]
+    return [(IdentifierType.INSURANCE, code)] if code else []
+
+
+def candidates(raw) -> list:
+    """Các (loại, giá trị) mà một chuỗi quét / gõ có thể là — không đụng DB."""
+    value = _compact(raw)
+    if not value:
+        return []
+    pairs = [(IdentifierType.PATIENT_CODE, value)]
+    if PATTERN_CCCD.match(value):
+        pairs.append((IdentifierType.CCCD, value))
+    if PATTERN_INSURANCE_FULL.match(value) or PATTERN_INSURANCE_SHORT.match(value):
+        pairs += insurance_identifiers(value)
+    phone = normalize_phone(value)
+    if phone:
+        pairs.append((IdentifierType.PHONE, phone))
+    return pairs
+
+
+def identifiers_for(patient) -> set:
+    """(loại, giá trị) của một Patient theo các cột hiện tại."""
+    pairs = set()
+    if patient.patient_code:
+        pairs.add((IdentifierType.PATIENT_CODE, _compact(patient.patient_code)))
+    if patient.id_card:
+        pairs.add((IdentifierType.CCCD, _compact(patient.id_card)))
+    pairs.update(insurance_identifiers(patient.insurance_number))
+    phone = normalize_phone(patient.contact_number)
+    if phone:
+        pairs.add((IdentifierType.PHONE, phone))
+    return pairs
+
+
+# Cột Patient sinh ra định danh — save(update_fields=...) không đụng tới thì bỏ qua
+IDENTIFIER_FIELDS = {'patient_code', 'id_card', 'insurance_number', 'contact_number'}
+
+
+class PatientIdentifierService:
+    @staticmethod
+    def _filter(pairs):
+        q = Q()
+        for id_type, value in pairs:
+            q |= Q(id_type=id_type, value=value)
+        return PatientIdentifier.objects.filter(q)
+
+    @staticmethod
+    def match(pairs):
+        """
+        Bệnh nhân khớp tốt nhất (theo TYPE_PRIORITY) cho các (loại, giá trị) — 1 query.
+        Returns: Patient hoặc None.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return None
+        rows = PatientIdentifierService._filter(pairs).select_related('patient')
+        best = min(rows, key=lambda row: TYPE_PRIORITY.index(row.id_type), default=None)
+        return best.patient if best else None
+
+    @staticmethod
+    def resolve(raw, queryset=None):
+        """Queryset các Patient có định danh khớp chuỗi quét / gõ (1 query khi được đánh giá)."""
+        queryset = Patient.objects.all() if queryset is None else queryset
+        pairs = candidates(raw)
+        if not pairs:
+            return queryset.none()
+        return queryset.filter(id__in=PatientIdentifierService._filter(pairs).values('patient_id'))
+
+    @staticmethod
+    def sync(patient, created=False) -> None:
+        """Đưa các dòng định danh của patient về đúng các cột hiện tại."""
+        wanted = identifiers_for(patient)
+        if created:
+            existing = {}
+        else:
+            existing = {
+                (id_type, value): pk
+                for pk, id_type, value in patient.identifiers.values_list('pk', 'id_type', 'value')
+            }
+        stale = [pk for pair, pk in existing.items() if pair not in wanted]
+        missing = wanted - existing.keys()
+        with transaction.atomic():
+            if stale:
+                PatientIdentifier.objects.filter(pk__in=stale).delete()
+            if missing:
+                PatientIdentifier.objects.bulk_create(
+                    [PatientIdentifier(patient=patient, id_type=t, value=v) for t, v in missing],
+                    ignore_conflicts=True,
+                )
+
+    @staticmethod
+    def rebuild(queryset=None, batch_size=2000) -> int:
+        """Dựng lại bảng định danh cho các bệnh nhân (mặc định: tất cả). Returns số dòng đã tạo."""
+        queryset = Patient.objects.all() if queryset is None else queryset
+        queryset = queryset.only('id', 'patient_code', 'id_card', 'insurance_number', 'contact_number').order_by('pk')
+        created = 0
+        batch = []
+        with transaction.atomic():
+            PatientIdentifier.objects.filter(patient__in=queryset.values('pk')).delete()
+            for patient in queryset.iterator(chunk_size=batch_size):
+                batch.extend(PatientIdentifier(patient_id=patient.pk, id_type=t, value=v)
+                             for t, v in identifiers_for(patient))
+                if len(batch) >= batch_size:
+                    created += len(PatientIdentifier.objects.bulk_create(batch, ignore_conflicts=True))
+                    batch = []
+            if batch:
+                created += len(PatientIdentifier.objects.bulk_create(batch, ignore_conflicts=True))
+        return created
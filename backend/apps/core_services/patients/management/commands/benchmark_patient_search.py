@@ -0,0 +1,156 @@
+"""
+Management command: benchmark_patient_search — So sánh tìm kiếm bệnh nhân cũ (SearchFilter) và mới (PatientSearch).
+
+Tạo N bệnh nhân giả lập (mã BENCH-xxxxxxxxx, họ tên tiếng Việt ngẫu nhiên, CCCD /
+SĐT / BHYT), ANALYZE, rồi đo từng loại từ khóa theo cả hai đường:
+
+  old  ILIKE '%x%' trên 6 cột cho mỗi từ (DRF SearchFilter trước đây)
+  new  PatientSearch.search — mã chính xác / họ tên không dấu + trigram
+
+In median / p95 (ms) của trang đầu (20 dòng, như API) và loại node quét bảng
+patients_patient / bảng định danh trong plan. Không có pg_trgm thì đường họ tên vẫn Seq Scan.
+Dữ liệu giả lập bị xóa sau khi chạy trừ khi có --keep (chạy lại với --reuse).
+
+Usage:
+    python manage.py benchmark_patient_search
+    python manage.py benchmark_patient_search --patients 1000000 --keep
+    python manage.py benchmark_patient_search --reuse --repeat 20
+"""
+
+import json
+import operator
+import random
+import statistics
+import time
+from functools import reduce
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from apps.core_services.patients.identifiers import PatientIdentifierService
+from apps.core_services.patients.models import Patient, PatientIdentifier
+from apps.core_services.patients.search import PatientSearch, normalize_name
+
+CODE_PREFIX = 'BENCH-'
+PAGE = 20
+OLD_SEARCH_FIELDS = ['patient_code', 'id_card', 'first_name', 'last_name', 'contact_number', 'insurance_number']
+
+LAST_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ', 'Hồ', 'Ngô', 'Dương', 'Lý']
+MIDDLE_NAMES = ['Văn', 'Thị', 'Hữu', 'Đức', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Gia', 'Xuân', 'Thu', 'Hoài']
+FIRST_NAMES = [
+    'An', 'Anh', 'Bình', 'Châu', 'Cường', 'Dũng', 'Duyên', 'Giang', 'Hà', 'Hải', 'Hạnh', 'Hiếu', 'Hoa', 'Hùng',
+    'Hương', 'Khánh', 'Lan', 'Linh', 'Long', 'Mai', 'Nam', 'Ngân', 'Nhung', 'Phúc', 'Phương', 'Quân', 'Sơn',
+    'Tâm', 'Thảo', 'Trang', 'Trung', 'Tuấn', 'Uyên', 'Việt', 'Yến',
+]
+
+
+def old_search(queryset, query):
+    """Tương đương filters.SearchFilter với search_fields cũ."""
+    for term in query.split():
+        queryset = queryset.filter(reduce(operator.or_, (Q(**{f'{f}__icontains': term}) for f in OLD_SEARCH_FIELDS)))
+    return queryset.order_by('-created_at')
+
+
+def scan_nodes(plan, tables=(Patient._meta.db_table, PatientIdentifier._meta.db_table)):
+    """Loại node đọc bảng bệnh nhân / định danh trong plan (Seq Scan / Index Scan / Bitmap Heap Scan...)."""
+    found = []
+    if plan.get('Relation Name') in tables:
+        found.append(plan['Node Type'])
+    for child in plan.get('Plans', []):
+        found.extend(scan_nodes(child, tables))
+    return found
+
+
+class Command(BaseCommand):
+    help = 'Đo tìm kiếm bệnh nhân (SearchFilter cũ vs PatientSearch) trên N bệnh nhân giả lập'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000, help='Số bệnh nhân giả lập (mặc định 100000)')
+        parser.add_argument('--batch', type=int, default=5000, help='Kích thước bulk_create')
+        parser.add_argument('--repeat', type=int, default=10, help='Số lần đo mỗi từ khóa')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu giả lập sau khi chạy')
+        parser.add_argument('--reuse', action='store_true', help='Dùng dữ liệu BENCH- đã có (từ lần chạy --keep)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        synthetic = Patient.objects.filter(patient_code__startswith=CODE_PREFIX)
+        existing = synthetic.count()
+        if options['reuse']:
+            if not existing:
+                raise CommandError('Chưa có dữ liệu BENCH- — chạy với --keep trước')
+        elif existing:
+            raise CommandError(f'Đã có {existing} bệnh nhân BENCH- — dùng --reuse hoặc xóa trước')
+        else:
+            self._populate(options['patients'], options['batch'], rng)
+
+        try:
+            sample = synthetic.order_by('?').values('last_name', 'first_name', 'id_card', 'contact_number',
+                                                    'insurance_number').first()
+            full_name = f"{sample['last_name']} {sample['first_name']}"
+            queries = {
+                'cccd': sample['id_card'],
+                'phone': sample['contact_number'],
+                'phone_+84': '+84' + sample['contact_number'][1:],
+                'insurance': sample['insurance_number'],
+                'full_name': full_name,
+                'unaccented': normalize_name(full_name),
+                'partial': f"{sample['last_name'].split()[0]} {sample['first_name']}",
+                'typo': full_name[:1] + full_name[2:],  # 'Nguyễn' → 'Nuyễn': chỉ trigram tìm được
+            }
+            self.stdout.write(f'Bệnh nhân: {Patient.objects.count()}  |  repeat={options["repeat"]}  |  trang {PAGE} dòng')
+            self.stdout.write(f'{"query":<12}{"old p50":>10}{"old p95":>10}{"new p50":>10}{"new p95":>10}{"hits":>7}  plan (old → new)')
+            for name, query in queries.items():
+                self._report(name, query, options['repeat'])
+        finally:
+            if not options['keep']:
+                _, deleted = synthetic.delete()
+                self.stdout.write(f'Đã xóa {deleted.get(Patient._meta.label, 0)} bệnh nhân giả lập')
+
+    def _populate(self, count, batch, rng):
+        self.stdout.write(f'Tạo {count} bệnh nhân giả lập...')
+        started = time.monotonic()
+        for offset in range(0, count, batch):
+            Patient.objects.bulk_create([
+                Patient(
+                    patient_code=f'{CODE_PREFIX}{i:09d}',
+                    last_name=f'{rng.choice(LAST_NAMES)} {rng.choice(MIDDLE_NAMES)}',
+                    first_name=rng.choice(FIRST_NAMES),
+                    id_card=f'9{i:011d}',
+                    contact_number=f'09{rng.randrange(10 ** 8):08d}',
+                    insurance_number=f'BN{rng.randrange(10 ** 13):013d}',
+                    gender=rng.choice('MF'),
+                )
+                for i in range(offset, min(offset + batch, count))
+            ])
+        # bulk_create không gửi signal → dựng bảng định danh cho dữ liệu giả lập
+        PatientIdentifierService.rebuild(Patient.objects.filter(patient_code__startswith=CODE_PREFIX))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Patient._meta.db_table}')
+            cursor.execute(f'ANALYZE {PatientIdentifier._meta.db_table}')
+        self.stdout.write(f'  xong sau {time.monotonic() - started:.1f}s')
+
+    def _report(self, name, query, repeat):
+        base = Patient.objects.all()
+        old_ms, old_rows = self._time(lambda: old_search(base, query), repeat)
+        new_ms, new_rows = self._time(lambda: PatientSearch.search(base, query), repeat)
+        old_plan = scan_nodes(json.loads(old_search(base, query)[:PAGE].explain(format='json'))[0]['Plan'])
+        new_plan = scan_nodes(json.loads(PatientSearch.search(base, query)[:PAGE].explain(format='json'))[0]['Plan'])
+        self.stdout.write(
+            f'{name:<12}{old_ms[0]:>10.1f}{old_ms[1]:>10.1f}{new_ms[0]:>10.1f}{new_ms[1]:>10.1f}{new_rows:>7}  '
+            f'{"+".join(old_plan) or "-"} → {"+".join(new_plan) or "-"}'
+            + ('' if new_rows or not old_rows else f'  (old: {old_rows} hits)')
+        )
+
+    @staticmethod
+    def _time(build, repeat):
+        samples = []
+        rows = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(list(build()[:PAGE]))
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+        return (statistics.median(samples), p95), rows
@@ -0,0 +1,33 @@
+"""
+Management command: rebuild_patient_identifiers — Dựng lại bảng định danh bệnh nhân từ bảng Patient.
+
+Signals giữ bảng định danh đồng bộ khi Patient.save(); dùng lệnh này sau khi
+nhập dữ liệu bằng bulk_create / queryset.update / SQL trực tiếp (không có signal).
+
+Usage:
+    python manage.py rebuild_patient_identifiers
+    python manage.py rebuild_patient_identifiers --code-prefix BN-20260101
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core_services.patients.identifiers import PatientIdentifierService
+from apps.core_services.patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại bảng định danh (CCCD / BHYT / SĐT / mã BN) cho bệnh nhân'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--code-prefix', type=str, default=None,
+            help='Chỉ dựng lại cho bệnh nhân có mã bắt đầu bằng tiền tố này',
+        )
+        parser.add_argument('--batch', type=int, default=2000, help='Kích thước bulk_create')
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.all()
+        if options['code_prefix']:
+            patients = patients.filter(patient_code__startswith=options['code_prefix'])
+        created = PatientIdentifierService.rebuild(patients, batch_size=options['batch'])
+        self.stdout.write(self.style.SUCCESS(f'Đã tạo {created} định danh cho {patients.count()} bệnh nhân.'))
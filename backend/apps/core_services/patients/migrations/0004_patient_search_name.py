@@ -0,0 +1,66 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:25
+
+import logging
+
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+TRGM_INDEX = 'patient_search_name_trgm'
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    GIN trigram cho LIKE '%x%' / similarity trên search_name. Cần extension pg_trgm
+    (có sẵn trong image postgres / pgvector) — DB không có thì bỏ qua, tìm kiếm
+    vẫn đúng nhưng quét tuần tự.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            logger.warning('pg_trgm không khả dụng — bỏ qua index %s', TRGM_INDEX)
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX} '
+            f'ON patients_patient USING gin (search_name gin_trgm_ops)'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {TRGM_INDEX}')
+
+
+class Migration(migrations.Migration):
+    # atomic = False để tạo index CONCURRENTLY (không khóa ghi). Riêng AddField
+    # GeneratedField(db_persist=True) vẫn ghi lại toàn bộ bảng bệnh nhân dưới
+    # ACCESS EXCLUSIVE (chặn cả đọc lẫn ghi đến khi xong) → chạy ngoài giờ tiếp đón.
+    atomic = False
+
+    dependencies = [
+        ('patients', '0003_patientallergy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(models.Func(django.db.models.functions.text.Concat('last_name', models.Value(' '), 'first_name'), models.Value('àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ'), models.Value('aaaaaaaaaaaaaaaaaeeeeeeeeeeeiiiiiooooooooooooooooouuuuuuuuuuuyyyyydaaaaaaaaaaaaaaaaaeeeeeeeeeeeiiiiiooooooooooooooooouuuuuuuuuuuyyyyyd'), function='TRANSLATE')), output_field=models.CharField(max_length=101)),
+        ),
+        # varchar_pattern_ops phục vụ cả so khớp chính xác lẫn gõ dần (LIKE 'x%')
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['contact_number'], name='patient_contact_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['insurance_number'], name='patient_insurance_number_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['patient_code'], name='patient_code_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:38
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Bản sao chuẩn hóa của identifiers.py tại thời điểm tạo migration — migration không import code app
+def _compact(value):
+    return re.sub(r'[\s.\-]', '', str(value or '')).upper()
+
+
+def _phone(value):
+    digits = _compact(value).lstrip('+')
+    if digits.startswith('84') and len(digits) >= 11:
+        digits = '0' + digits[2:]
+    return digits if re.match(r'^0\d{9,10}$', digits) else None
+
+
+def _insurance(code):
+    code = _compact(code)
+    if re.match(r'^[A-Z]{2}\d{13}$', code):
+        return [('INSURANCE', code), ('INSURANCE_SHORT', code[-10:])]
+    if re.match(r'^\d{10}$', code):
+        return [('INSURANCE_SHORT', code)]
+    return [('INSURANCE', code)] if code else []
+
+
+def _identifiers_for(patient):
+    pairs = set()
+    if patient.patient_code:
+        pairs.add(('PATIENT_CODE', _compact(patient.patient_code)))
+    if patient.id_card:
+        pairs.add(('CCCD', _compact(patient.id_card)))
+    pairs.update(_insurance(patient.insurance_number))
+    phone = _phone(patient.contact_number)
+    if phone:
+        pairs.add(('PHONE', phone))
+    return pairs
+
+
+def backfill_identifiers(apps, schema_editor):
+    """Định danh cho bệnh nhân đã có — về sau do signals giữ đồng bộ."""
+    Patient = apps.get_model('patients', 'Patient')
+    PatientIdentifier = apps.get_model('patients', 'PatientIdentifier')
+    patients = Patient.objects.only('id', 'patient_code', 'id_card', 'insurance_number', 'contact_number')
+    batch = []
+    for patient in patients.iterator(chunk_size=2000):
+        batch.extend(PatientIdentifier(patient_id=patient.pk, id_type=t, value=v) for t, v in _identifiers_for(patient))
+        if len(batch) >= 2000:
+            PatientIdentifier.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    PatientIdentifier.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_patient_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientIdentifier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_type', models.CharField(choices=[('CCCD', 'CCCD / CMND'), ('INSURANCE', 'Mã BHYT'), ('INSURANCE_SHORT', 'Mã BHYT (10 số)'), ('PHONE', 'Số điện thoại'), ('PATIENT_CODE', 'Mã bệnh nhân')], max_length=20)),
+                ('value', models.CharField(max_length=40)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identifiers', to='patients.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('id_type', 'value', 'patient'), name='patient_identifier_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_identifiers, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,20 @@
 from django.db import models
+from django.db.models import Func, Value
+from django.db.models.functions import Concat, Lower
 from django.utils.translation import gettext_lazy as _
 from apps.core_services.core.models import UUIDModel, Province, Ward
 
+# Bỏ dấu tiếng Việt bằng translate() — immutable nên dùng được cho cột generated / index,
+# không cần extension unaccent. search.normalize_name() dùng đúng bảng này cho từ khóa.
+VIETNAMESE_ACCENTED = (
+    'àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ'
+    'ÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ'
+)
+VIETNAMESE_PLAIN = (
+    'aaaaaaaaaaaaaaaaaeeeeeeeeeeeiiiiiooooooooooooooooouuuuuuuuuuuyyyyyd'
+    'aaaaaaaaaaaaaaaaaeeeeeeeeeeeiiiiiooooooooooooooooouuuuuuuuuuuyyyyyd'
+)
+
 class Patient(UUIDModel):
     class Gender(models.TextChoices):
         MALE = 'M', _('Nam')
@@ -27,6 +40,17 @@ class Patient(UUIDModel):
     )
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
+    # "nguyen van an" — họ tên không dấu, chữ thường (tìm kiếm, index trigram)
+    search_name = models.GeneratedField(
+        expression=Lower(Func(
+            Concat('last_name', Value(' '), 'first_name'),
+            Value(VIETNAMESE_ACCENTED),
+            Value(VIETNAMESE_PLAIN),
+            function='TRANSLATE',
+        )),
+        output_field=models.CharField(max_length=101),
+        db_persist=True,
+    )
 
     date_of_birth = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=1, choices=Gender.choices, default=Gender.OTHER)
@@ -49,6 +73,14 @@ class Patient(UUIDModel):
     )
     address_detail = models.CharField(max_length=255, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # SĐT: tra cứu chính xác + gõ dần (LIKE 'x%') — varchar_pattern_ops phục vụ cả hai
+            models.Index(fields=['contact_number'], name='patient_contact_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['insurance_number'], name='patient_insurance_number_idx'),
+            # Mã BN gõ dần (unique index chỉ phục vụ so khớp chính xác)
+            models.Index(fields=['patient_code'], name='patient_code_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return f"{self.patient_code} - {self.last_name} {self.first_name}"
@@ -74,3 +106,25 @@ class Patient(UUIDModel):
             if self.ward.province != self.province:
                 raise ValidationError({'ward': _('Xã/Phường này không thuộc Tỉnh/Thành phố đã chọn.')})
 
+
+class IdentifierType(models.TextChoices):
+    CCCD = 'CCCD', 'CCCD / CMND'
+    INSURANCE = 'INSURANCE', 'Mã BHYT'
+    INSURANCE_SHORT = 'INSURANCE_SHORT', 'Mã BHYT (10 số)'
+    PHONE = 'PHONE', 'Số điện thoại'
+    PATIENT_CODE = 'PATIENT_CODE', 'Mã bệnh nhân'
+
+
+class PatientIdentifier(models.Model):
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='identifiers')
+    id_type = models.CharField(max_length=20, choices=IdentifierType.choices)
+    value = models.CharField(max_length=40)
+
+    class Meta:
+        constraints = [
+            # (id_type, value) là tiền tố → index cho lookup
+            models.UniqueConstraint(fields=['id_type', 'value', 'patient'], name='patient_identifier_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.id_type}:{self.value}'
@@ -0,0 +1,145 @@
+"""
+Patient search — tìm bệnh nhân theo mã / giấy tờ / SĐT / họ tên.
+
+    PatientSearch.search(Patient.objects.all(), 'Nguyễn Văn An')
+
+Từ khóa dạng mã (có chữ số, không khoảng trắng) → so khớp chính xác qua bảng
+định danh (identifiers.py): mã BN, CCCD, BHYT, SĐT (0912…, +84912…, 84912… là cùng một số).
+Không có kết quả (đang gõ dở: "BN-2026", "09123") → mã BN / SĐT bắt đầu bằng
+từ khóa (LIKE 'x%' trên index varchar_pattern_ops).
+
+Còn lại → họ tên không dấu (Patient.search_name, cột generated): mỗi từ phải có
+trong họ tên, không phân biệt dấu / hoa thường. Index GIN trigram (pg_trgm) phục
+vụ LIKE '%từ%'; không có kết quả thì thử theo độ giống (gõ sai chính tả).
+DB không có pg_trgm: vẫn đúng kết quả nhưng quét tuần tự, không có bước gõ sai.
+
+Xếp hạng: trùng cả họ tên > bắt đầu bằng từ khóa > chứa cả cụm > chứa từng từ,
+rồi độ giống trigram, rồi bệnh nhân mới trước.
+"""
+
+import re
+import unicodedata
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .identifiers import PatientIdentifierService
+from .models import VIETNAMESE_ACCENTED, VIETNAMESE_PLAIN
+
+_UNACCENT = str.maketrans(VIETNAMESE_ACCENTED, VIETNAMESE_PLAIN)
+IDENTIFIER_RE = re.compile(r'^\+?[\w-]*\d[\w-]*$')
+SIMILARITY_THRESHOLD = 0.5  # pg_trgm.word_similarity_threshold mặc định 0.6 — hơi chặt cho tên ngắn
+
+PHONE_PREFIX_RE = re.compile(r'^\+?\d+$')
+
+RANK_EXACT = 4
+RANK_PREFIX = 3
+RANK_PHRASE = 2
+RANK_WORDS = 1
+
+_trigram_enabled = None
+
+
+def normalize_name(text: str) -> str:
+    """Họ tên → dạng của Patient.search_name: không dấu, chữ thường, 1 khoảng trắng."""
+    text = unicodedata.normalize('NFC', text).translate(_UNACCENT).lower()
+    return ' '.join(text.split())
+
+
+def trigram_enabled() -> bool:
+    """pg_trgm đã cài (migration patients 0004 tạo index khi có) — kiểm tra 1 lần / process."""
+    global _trigram_enabled
+    if _trigram_enabled is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_enabled = cursor.fetchone() is not None
+    return _trigram_enabled
+
+
+class PatientSearch:
+    @staticmethod
+    def is_identifier(query: str) -> bool:
+        return bool(IDENTIFIER_RE.match(query))
+
+    @staticmethod
+    def by_identifier(queryset, query: str):
+        """So khớp chính xác mã BN / CCCD / BHYT / SĐT qua bảng định danh (identifiers.py)."""
+        return PatientIdentifierService.resolve(query, queryset).annotate(
+            search_rank=Value(RANK_EXACT, output_field=IntegerField()),
+        )
+
+    @staticmethod
+    def phone_prefixes(query: str) -> list:
+        """SĐT gõ dở → các tiền tố cần dò: 0912… ↔ 84912… ↔ +84912… (cột lưu nguyên dạng nhập)."""
+        if not PHONE_PREFIX_RE.match(query):
+            return []
+        digits = query.lstrip('+')
+        if digits.startswith('84'):
+            rest = digits[2:]
+        elif digits.startswith('0'):
+            rest = digits[1:]
+        else:
+            return [query]
+        return sorted({query, f'0{rest}', f'84{rest}', f'+84{rest}'})
+
+    @staticmethod
+    def by_prefix(queryset, query: str):
+        """Mã BN / SĐT bắt đầu bằng từ khóa — cho ô tìm kiếm gõ dần."""
+        condition = Q(patient_code__startswith=query.upper())
+        for prefix in PatientSearch.phone_prefixes(query):
+            condition |= Q(contact_number__startswith=prefix)
+        return queryset.filter(condition).annotate(
+            search_rank=Value(RANK_PREFIX, output_field=IntegerField()),
+        )
+
+    @staticmethod
+    def by_name(queryset, query: str):
+        """Họ tên chứa mọi từ của từ khóa (không dấu), xếp hạng theo mức khớp."""
+        name = normalize_name(query)
+        if not name:
+            return queryset.none()
+
+        matches = queryset
+        for word in name.split():
+            matches = matches.filter(search_name__contains=word)
+        matches = matches.annotate(search_rank=Case(
+            When(search_name=name, then=Value(RANK_EXACT)),
+            When(search_name__startswith=name, then=Value(RANK_PREFIX)),
+            When(search_name__contains=name, then=Value(RANK_PHRASE)),
+            default=Value(RANK_WORDS),
+            output_field=IntegerField(),
+        ))
+        if not trigram_enabled():
+            return matches.order_by('-search_rank', '-created_at')
+
+        matches = matches.annotate(similarity=TrigramWordSimilarity(name, 'search_name'))
+        if not matches.exists():
+            # Gõ sai chính tả: "nguyn van an" → theo độ giống (toán tử %> dùng index trigram)
+            matches = queryset.annotate(
+                similarity=TrigramWordSimilarity(name, 'search_name'),
+                search_rank=Value(0, output_field=IntegerField()),
+            ).filter(search_name__trigram_word_similar=name, similarity__gte=SIMILARITY_THRESHOLD)
+        return matches.order_by('-search_rank', '-similarity', '-created_at')
+
+    @staticmethod
+    def search(queryset, query: str):
+        query = (query or '').strip()
+        if not query:
+            return queryset
+        if PatientSearch.is_identifier(query):
+            matches = PatientSearch.by_identifier(queryset, query)
+            if not matches.exists():
+                matches = PatientSearch.by_prefix(queryset, query)
+            return matches.order_by('-created_at')
+        return PatientSearch.by_name(queryset, query)
+
+
+class PatientSearchFilter(filters.BaseFilterBackend):
+    """Thay SearchFilter (ILIKE '%x%' trên 6 cột) cho danh sách bệnh nhân — cùng tham số ?search=."""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        return PatientSearch.search(queryset, request.query_params.get(self.search_param, ''))
@@ -0,0 +1,21 @@
+"""
+Signals for Patients app.
+Keeps the identifier table (identifiers.PatientIdentifier) in step with the
+Patient columns it is derived from.
+"""
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .identifiers import IDENTIFIER_FIELDS, PatientIdentifierService
+from .models import Patient
+
+
+@receiver(post_save, sender=Patient)
+def sync_patient_identifiers(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """CCCD / BHYT / SĐT / mã BN đổi → cập nhật bảng định danh (cùng transaction với save)."""
+    if raw:
+        return  # loaddata
+    if update_fields is not None and not IDENTIFIER_FIELDS & set(update_fields):
+        return
+    PatientIdentifierService.sync(instance, created=created)
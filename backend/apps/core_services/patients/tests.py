@@ -1,3 +1,129 @@
+"""
+Patients Tests — Bệnh nhân
+
+Tests:
+  1. search_name - cột generated: họ tên không dấu, chữ thường, cập nhật theo first/last name
+  2. Search - họ tên không phân biệt dấu / hoa thường, mọi từ phải có; xếp hạng theo mức khớp
+  3. Search - mã / CCCD / BHYT / SĐT so khớp chính xác, SĐT nhận 0… / +84… / 84…; không có → mã BN / SĐT theo tiền tố
+  4. API - ?search= trên danh sách và /lookup/ dùng cùng đường tìm kiếm
+  5. Bảng định danh - signals đồng bộ khi CCCD / BHYT / SĐT đổi; mọi mã quét → 1 query
+"""
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from apps.core_services.authentication.models import User
+from .models import IdentifierType, Patient, PatientIdentifier
+from .identifiers import PatientIdentifierService, normalize_phone
+from .search import PatientSearch, normalize_name
+
+
+class PatientSearchTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        def create(code, last, first, **extra):
+            return Patient.objects.create(patient_code=code, last_name=last, first_name=first, **extra)
+
+        cls.an = create('BN-S-001', 'Nguyễn Văn', 'An', id_card='001090000001', contact_number='0912345678')
+        cls.anh = create('BN-S-002', 'Nguyễn Văn', 'Anh', insurance_number='DN4010123456789')
+        cls.binh = create('BN-S-003', 'Trần Thị', 'Bình', contact_number='+84987654321')
+        cls.lan = create('BN-S-004', 'Lê Nguyễn', 'Lan')
+
+
+class PatientSearchTests(PatientSearchTestMixin, TestCase):
+    def _codes(self, query):
+        return [p.patient_code for p in PatientSearch.search(Patient.objects.all(), query)]
+
+    def test_generated_search_name(self):
+        self.an.refresh_from_db()
+        self.assertEqual(self.an.search_name, 'nguyen van an')
+        self.assertEqual(normalize_name('  NGUYỄN   văn  Ấn '), 'nguyen van an')
+
+        self.binh.first_name = 'Đức'
+        self.binh.save()
+        self.binh.refresh_from_db()
+        self.assertEqual(self.binh.search_name, 'tran thi duc')
+
+    def test_name_search_unaccented_and_ranked(self):
+        # Không dấu / có dấu / hoa thường cho cùng kết quả
+        self.assertEqual(self._codes('nguyen van an'), self._codes('Nguyễn Văn An'))
+        # Trùng cả họ tên > bắt đầu bằng > chứa từng từ
+        self.assertEqual(self._codes('nguyen van an'), ['BN-S-001', 'BN-S-002'])
+        self.assertEqual(self._codes('nguyễn'), ['BN-S-002', 'BN-S-001', 'BN-S-004'])
+        # Mọi từ phải có (không theo thứ tự)
+        self.assertEqual(self._codes('van binh'), [])
+        self.assertEqual(self._codes('lan nguyen'), ['BN-S-004'])
+        self.assertEqual(self._codes('bình'), ['BN-S-003'])
+
+    def test_identifier_exact(self):
+        self.assertEqual({normalize_phone(p) for p in ('0912345678', '+84912345678', '84 912 345 678')}, {'0912345678'})
+        self.assertEqual(self._codes('bn-s-002'), ['BN-S-002'])
+        self.assertEqual(self._codes('001090000001'), ['BN-S-001'])
+        self.assertEqual(self._codes('dn4010123456789'), ['BN-S-002'])
+        self.assertEqual(self._codes('+84912345678'), ['BN-S-001'])
+        self.assertEqual(self._codes('0987654321'), ['BN-S-003'])
+        # Không khớp chính xác → gõ dở: mã BN / SĐT bắt đầu bằng từ khóa (không khớp chuỗi con)
+        self.assertEqual(self._codes('0912345'), ['BN-S-001'])
+        self.assertEqual(self._codes('0987'), ['BN-S-003'])  # lưu dạng +84987…
+        self.assertEqual(self._codes('bn-s-00'), ['BN-S-004', 'BN-S-003', 'BN-S-002', 'BN-S-001'])
+        self.assertEqual(self._codes('2345678'), [])
+
+
+class PatientAPITests(PatientSearchTestMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(email='tiepdon.search@test.vn', password='x', phone='0900000009')
+        self.client.force_authenticate(user)
+
+    def test_list_search_and_lookup(self):
+        response = self.client.get('/api/v1/patients/', {'search': 'Tran Thi Binh'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['patient_code'] for p in response.data['results']], ['BN-S-003'])
+
+        response = self.client.get('/api/v1/patients/lookup/', {'q': '84912345678'})
+        self.assertEqual([p['patient_code'] for p in response.data], ['BN-S-001'])
+
+
+class PatientIdentifierTests(PatientSearchTestMixin, TestCase):
+    def _identifiers(self, patient):
+        return set(PatientIdentifier.objects.filter(patient=patient).values_list('id_type', 'value'))
+
+    def test_signals_keep_identifiers_in_sync(self):
+        self.assertEqual(self._identifiers(self.anh), {
+            (IdentifierType.PATIENT_CODE, 'BNS002'),
+            (IdentifierType.INSURANCE, 'DN4010123456789'),
+            (IdentifierType.INSURANCE_SHORT, '0123456789'),
+        })
+        self.assertIn((IdentifierType.PHONE, '0987654321'), self._identifiers(self.binh))  # +84… → 0…
+
+        # Đồng bộ BHYT (Kiosk) chỉ ghi insurance_number
+        self.an.insurance_number = 'HT2790000000999'
+        self.an.contact_number = '0911111111'
+        self.an.save(update_fields=['insurance_number', 'contact_number'])
+        identifiers = self._identifiers(self.an)
+        self.assertIn((IdentifierType.INSURANCE_SHORT, '0000000999'), identifiers)
+        self.assertIn((IdentifierType.PHONE, '0911111111'), identifiers)
+        self.assertNotIn((IdentifierType.PHONE, '0912345678'), identifiers)
+
+        # Không đụng cột định danh → không query bảng định danh
+        with self.assertNumQueries(1):
+            self.an.save(update_fields=['first_name'])
+
+    def test_single_query_resolution(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(PatientIdentifierService.resolve('84912345678')), [self.an])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(PatientIdentifierService.resolve('0123456789')), [self.anh])  # mã BHYT 10 số
+        with self.assertNumQueries(1):
+            patient = PatientIdentifierService.match([
+                (IdentifierType.INSURANCE, 'DN4010123456789'),
+                (IdentifierType.CCCD, '001090000001'),  # CCCD thắng
+            ])
+        self.assertEqual(patient, self.an)
+        self.assertIsNone(PatientIdentifierService.match([(IdentifierType.CCCD, '999999999999')]))
 
-# Create your tests here.
+        # Dữ liệu nhập không qua signal → rebuild
+        PatientIdentifier.objects.all().delete()
+        self.assertFalse(PatientIdentifierService.resolve('001090000001').exists())
+        PatientIdentifierService.rebuild()
+        self.assertEqual(list(PatientIdentifierService.resolve('001090000001')), [self.an])
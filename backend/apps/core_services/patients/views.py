@@ -1,48 +1,37 @@
-from rest_framework import viewsets, filters, status
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core_services.core.utils import CodeAllocator
 from .models import Patient
+from .search import PatientSearch, PatientSearchFilter
 from .serializers import PatientSerializer
 
-import uuid
 
 class PatientViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.all().order_by('-created_at')
     serializer_class = PatientSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
-    search_fields = ['patient_code', 'id_card', 'first_name', 'last_name', 'contact_number', 'insurance_number']
+    filter_backends = [DjangoFilterBackend, PatientSearchFilter]  # ?search= : xem search.PatientSearch
     filterset_fields = ['gender', 'province', 'ward']
 
     def perform_create(self, serializer):
-        # Auto-generate patient_code if needed, though most likely generated by Signal/Model
-        # For now, let's assume manual or auto-gen by model logic.
-        # But looking at model, it has no auto-gen. Let's create a simple one.
+        # Không nhập mã → cấp mã BN-YYYYMMDD-xxxx (cùng bộ đếm với Kiosk)
         if not serializer.validated_data.get('patient_code'):
-             # Simplistic generator: P + timestamp prefix or UUID suffix
-             # Real world: Sequence table.
-             code = f"P{uuid.uuid4().hex[:8].upper()}"
-             serializer.save(patient_code=code)
+            CodeAllocator.create('patient', lambda code: serializer.save(patient_code=code.code))
         else:
-             serializer.save()
+            serializer.save()
 
     @action(detail=False, methods=['get'])
     def lookup(self, request):
         """
-        Quick lookup by ID Card or Phone or Insurance
+        Quick lookup by Patient Code, ID Card, Phone (0912… / +84912…) or Insurance
         Usage: /api/v1/patients/lookup/?q=...
         """
-        q = request.query_params.get('q')
+        q = (request.query_params.get('q') or '').strip()
         if not q:
             return Response({"error": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        patients = Patient.objects.filter(
-            id_card=q
-        ) | Patient.objects.filter(
-            contact_number=q
-        ) | Patient.objects.filter(
-            insurance_number=q
-        )
+
+        patients = PatientSearch.by_identifier(Patient.objects.all(), q)
         
         serializer = self.get_serializer(patients, many=True)
         return Response(serializer.data)
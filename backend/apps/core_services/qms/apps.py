@@ -5,3 +5,6 @@ class QmsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core_services.qms'
     verbose_name = 'Queue Management System'
+
+    def ready(self):
+        import apps.core_services.qms.signals  # noqa: F401
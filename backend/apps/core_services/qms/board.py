@@ -0,0 +1,590 @@
+"""
+QMS Board — versioned queue-board updates for display screens.
+
+Instead of recomputing and pushing the whole board after every mutation,
+mutations publish only the entries that changed:
+
+    { "type": "queue_delta", "seq": 1706700000123,
+      "changes": [
+          {"op": "upsert", "section": "waiting_list", "entry": {...}},
+          {"op": "remove", "entry_id": "..."},
+      ],
+      "total_waiting": 7, "estimated_wait_minutes": 70 }
+
+`section` is one of currently_serving / waiting_list / completed_list /
+no_show_list; an upsert moves the entry into that section (removing it from
+any other). Displays keep the board locally and re-sort/trim each section.
+
+Every message carries a per-station sequence number (Redis INCR). A full
+board (`queue_update`) carries the sequence it is current at, so a consumer
+can tell whether a delta is the next one, stale, or follows a gap (lost
+message, Redis restart) — on a gap it resyncs with a full board.
+
+The counter is seeded from the wall clock in ms, so after a Redis flush the
+sequence keeps moving forward and connected displays see a gap, not a replay.
+
+Coalescing: publishers only add the changed entry ids to a per-station
+pending set in Redis. The first publisher of a burst (SET NX on a flush
+marker) schedules one flush QMS_BOARD_COALESCE_MS later; the flush takes the
+whole pending set atomically and sends ONE message for the burst, whichever
+worker process the mutations came from.
+
+The scheduled flush is an in-process timer (lowest latency), so it dies with
+its worker. Stations with pending changes are also tracked in a Redis ZSET by
+the time of their first pending change; the `flush_stale_boards` beat task
+(every few seconds) flushes any station still pending after STALE_FLUSH_MS,
+so a recycled / killed worker delays a board by at most one sweep.
+
+Snapshot: the full board of each station is kept in Redis as JSON, tagged
+with its seq. Every flush updates it (deltas are applied in place, full
+boards replace it), so display connects/resyncs and the REST queue_board
+endpoint read one key instead of running the board queries. A snapshot that
+is missing, out of sequence or older than SNAPSHOT_TTL is rebuilt from the
+database by a single caller while the others wait for it.
+
+Audio: a called entry whose TTS clip is not ready yet is shown with
+audio_pending=true. When the clip lands the displays get, outside the seq
+order (it changes nothing on the board by itself):
+
+    { "type": "audio_ready", "entry_id": "...", "audio_url": "/media/..." }
+
+followed by a regular delta carrying the entry's audio_url, so the snapshot
+and displays that connect later have it too.
+
+Frames: every message is serialized ONCE by the publisher (the process that
+flushes the station) and group-sent as {type, seq, frame}; consumers — the
+displays and the doctors' clinical screens of the station — check seq and
+forward `frame` as is, never running json.dumps per socket. Connects and
+resyncs forward the snapshot text the same way (get_board_frame), wrapped
+without parsing it: the snapshot JSON starts with its seq.
+
+Metrics (core.utils.metrics):
+    qms.board                     mutations / pushes → coalescing ratio
+    qms.board.publish_latency     first mutation → group_send (ms)
+    qms.board.display_latency     first mutation → frame sent to a display (ms)
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.core_services.core.utils import get_redis_client, metrics, next_counter_value, timing
+from .models import QueueEntry, QueueStatus, ServiceStation
+
+logger = logging.getLogger('qms')
+
+SECTION_SERVING = 'currently_serving'
+SECTION_WAITING = 'waiting_list'
+SECTION_COMPLETED = 'completed_list'
+SECTION_NO_SHOW = 'no_show_list'
+
+SECTION_LIMITS = {SECTION_COMPLETED: 10, SECTION_NO_SHOW: 20}
+
+FULL_BOARD = '*'  # pending marker: send the full board instead of a delta
+FLUSH_MARKER_TTL_MS = 5000  # lost timer → the next mutation after this reschedules (sweeper covers the rest)
+STALE_FLUSH_MS = 1000  # pending this long without a flush → flush_stale() sends it
+DIRTY_KEY = 'qms:board:dirty'  # ZSET station_id → first pending change (ms)
+
+SNAPSHOT_TTL = 60  # seconds — also bounds how stale wait_time_minutes can get
+SNAPSHOT_BUILD_LOCK_TTL = 5
+SNAPSHOT_WAIT_SECONDS = 2.0
+
+METRIC = 'qms.board'
+METRIC_PUBLISH_LATENCY = 'qms.board.publish_latency'
+METRIC_DISPLAY_LATENCY = 'qms.board.display_latency'
+
+
+# Snapshots are serialized with seq as their first key (see _serialize_board)
+_SNAPSHOT_SEQ = re.compile(r'\{"seq": (-?\d+|null)')
+
+
+def group_name(station_id) -> str:
+    return f'qms_station_{station_id}'
+
+
+def _seq_key(station_id) -> str:
+    return f'qms:board:{station_id}:seq'
+
+
+def _snapshot_key(station_id) -> str:
+    return f'qms:board:{station_id}:snapshot'
+
+
+def _pending_keys(station_id) -> list:
+    prefix = f'qms:board:{station_id}'
+    return [f'{prefix}:pending', f'{prefix}:since', f'{prefix}:flush']
+
+
+# KEYS: pending, since, flush marker, dirty set
+# ARGV[1]=now ms, ARGV[2]=marker TTL ms, ARGV[3]=station id, ARGV[4..]=entry ids
+# Returns 1 if the caller must schedule the flush.
+_ENQUEUE_SCRIPT = """
+for i = 4, #ARGV do
+    redis.call('SADD', KEYS[1], ARGV[i])
+end
+redis.call('SET', KEYS[2], ARGV[1], 'NX')
+redis.call('ZADD', KEYS[4], 'NX', ARGV[1], ARGV[3])
+if redis.call('SET', KEYS[3], 1, 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Clear the marker first so mutations arriving after the take schedule a new flush.
+# KEYS: pending, since, flush marker, dirty set — ARGV[1]=station id
+# Returns {since, id1, id2, ...}
+_TAKE_SCRIPT = """
+redis.call('DEL', KEYS[3])
+redis.call('ZREM', KEYS[4], ARGV[1])
+local ids = redis.call('SMEMBERS', KEYS[1])
+local since = redis.call('GET', KEYS[2]) or '0'
+redis.call('DEL', KEYS[1], KEYS[2])
+table.insert(ids, 1, since)
+return ids
+"""
+
+_scripts = {}
+
+
+def _script(client, source):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = client.register_script(source)
+    return script
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def current_seq(station_id):
+    """Sequence the board is currently at (None if Redis is unavailable)."""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        value = client.get(_seq_key(station_id))
+    except Exception as e:
+        logger.warning('[BOARD] read seq failed for station=%s: %s', station_id, e)
+        return None
+    return int(value) if value is not None else None
+
+
+def next_seq(station_id):
+    return next_counter_value(_seq_key(station_id), seed=lambda: int(time.time() * 1000))
+
+
+def _build_board(station) -> dict:
+    """
+    Full board from the database + the sequence it is current at.
+
+    seq is read BEFORE building the board: a delta published meanwhile has a
+    higher seq and is still applied on top (upserts/removes are idempotent).
+    """
+    from .services import ClinicalQueueService
+
+    seq = current_seq(station.id)
+    board = ClinicalQueueService.get_queue_board(station)
+    board['seq'] = seq
+    return board
+
+
+def _serialize_board(board: dict) -> str:
+    """Board JSON with seq first, so its seq can be read without parsing the whole board."""
+    return json.dumps({'seq': board.get('seq'), **board}, cls=DjangoJSONEncoder)
+
+
+def _update_frame(seq, board_json: str) -> str:
+    """queue_update frame around an already serialized board."""
+    return f'{{"type": "queue_update", "seq": {json.dumps(seq)}, "data": {board_json}}}'
+
+
+def _read_snapshot(client, station_id):
+    try:
+        return client.get(_snapshot_key(station_id))
+    except redis.RedisError as e:
+        logger.warning('[BOARD] read snapshot failed for station=%s: %s', station_id, e)
+        return None
+
+
+def _store_snapshot(client, station_id, board_json: str, only_if_missing: bool = False) -> None:
+    try:
+        client.set(_snapshot_key(station_id), board_json, ex=SNAPSHOT_TTL, nx=only_if_missing)
+    except redis.RedisError as e:
+        logger.warning('[BOARD] store snapshot failed for station=%s: %s', station_id, e)
+
+
+def _board_json(station_id) -> str:
+    """
+    Serialized full board (with seq). Served from the Redis snapshot (no
+    database query at all); on a miss one caller rebuilds it from the database
+    while concurrent callers (e.g. a room of TVs reconnecting) wait briefly
+    for that snapshot instead of all querying the database.
+    """
+    client = get_redis_client()
+    if client is None:
+        return _serialize_board(_build_board(ServiceStation.objects.get(id=station_id)))
+
+    board_json = _read_snapshot(client, station_id)
+    if board_json is not None:
+        return board_json
+
+    lock_key = f'{_snapshot_key(station_id)}:building'
+    try:
+        leader = client.set(lock_key, 1, nx=True, ex=SNAPSHOT_BUILD_LOCK_TTL)
+    except redis.RedisError:
+        return _serialize_board(_build_board(ServiceStation.objects.get(id=station_id)))
+
+    if not leader:
+        deadline = time.monotonic() + SNAPSHOT_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            board_json = _read_snapshot(client, station_id)
+            if board_json is not None:
+                return board_json
+
+    try:
+        board_json = _serialize_board(_build_board(ServiceStation.objects.get(id=station_id)))
+        # NX: never overwrite a snapshot a flush stored meanwhile (it is newer)
+        _store_snapshot(client, station_id, board_json, only_if_missing=True)
+    finally:
+        if leader:
+            try:
+                client.delete(lock_key)
+            except redis.RedisError:
+                pass
+    return board_json
+
+
+def get_board(station_id) -> dict:
+    """
+    Full board (with seq) for the REST endpoint — from the snapshot, see _board_json.
+
+    Raises ServiceStation.DoesNotExist when the board has to be built for an
+    unknown station.
+    """
+    return json.loads(_board_json(station_id))
+
+
+def get_board_frame(station_id) -> tuple:
+    """(seq, queue_update frame) for a connecting / resyncing screen — the snapshot text, not re-encoded."""
+    board_json = _board_json(station_id)
+    match = _SNAPSHOT_SEQ.match(board_json)
+    if match is None:
+        # Snapshot written before frames existed — re-encode once
+        board = json.loads(board_json)
+        board_json = _serialize_board(board)
+        seq = board.get('seq')
+    else:
+        seq = None if match.group(1) == 'null' else int(match.group(1))
+    return seq, _update_frame(seq, board_json)
+
+
+def apply_delta(board: dict, message: dict) -> dict:
+    """
+    Apply a queue_delta message to a full board (same rules as the displays:
+    move each entry to its section, re-sort, renumber waiting positions, trim).
+    """
+    sections = {
+        name: list(board.get(name) or [])
+        for name in (SECTION_SERVING, SECTION_WAITING, SECTION_COMPLETED, SECTION_NO_SHOW)
+    }
+    for change in message['changes']:
+        entry_id = change['entry_id'] if change['op'] == 'remove' else change['entry']['entry_id']
+        for name, rows in sections.items():
+            sections[name] = [row for row in rows if row.get('entry_id') != entry_id]
+        if change['op'] == 'upsert':
+            sections[change['section']].append(change['entry'])
+
+    sections[SECTION_SERVING].sort(key=lambda row: (-row.get('priority', 0), row.get('called_time') or ''))
+    sections[SECTION_WAITING].sort(key=lambda row: (-row.get('priority', 0), row.get('entered_queue_time') or ''))
+    for idx, row in enumerate(sections[SECTION_WAITING]):
+        row['position'] = idx + 1
+    for name, limit in SECTION_LIMITS.items():
+        sections[name].sort(key=lambda row: row.get('ended_at') or '', reverse=True)
+        del sections[name][limit:]
+
+    return {
+        **board,
+        **sections,
+        'total_waiting': message.get('total_waiting', len(sections[SECTION_WAITING])),
+        'estimated_wait_minutes': message.get('estimated_wait_minutes', board.get('estimated_wait_minutes')),
+        'seq': message['seq'],
+    }
+
+
+def _apply_to_snapshot(station_id, message: dict) -> None:
+    """
+    Keep the snapshot in step with a delta. Only the snapshot at seq-1 can be
+    advanced; anything else (missing, older, concurrent writer) is dropped and
+    rebuilt on the next read. KEEPTTL: a busy station still refreshes from the
+    database every SNAPSHOT_TTL.
+    """
+    client = get_redis_client()
+    if client is None:
+        return
+
+    key = _snapshot_key(station_id)
+    try:
+        with client.pipeline() as pipe:
+            pipe.watch(key)
+            raw = pipe.get(key)
+            if raw is None:
+                return
+            snapshot = json.loads(raw)
+            pipe.multi()
+            if snapshot.get('seq') is None or message['seq'] != snapshot['seq'] + 1:
+                pipe.delete(key)
+            else:
+                pipe.set(key, _serialize_board(apply_delta(snapshot, message)), keepttl=True)
+            pipe.execute()
+    except redis.WatchError:
+        try:
+            client.delete(key)
+        except redis.RedisError as e:
+            logger.warning('[BOARD] drop snapshot failed for station=%s: %s', station_id, e)
+    except redis.RedisError as e:
+        logger.warning('[BOARD] update snapshot failed for station=%s: %s', station_id, e)
+
+
+def entry_section(entry):
+    """Section of the board an entry belongs to, or None if it is not shown."""
+    if entry.status == QueueStatus.WAITING:
+        return SECTION_WAITING
+    if entry.status in (QueueStatus.CALLED, QueueStatus.IN_PROGRESS):
+        return SECTION_SERVING
+
+    # Đã xong / vắng: chỉ hiện trong ngày
+    if not entry.end_time or timezone.localtime(entry.end_time).date() != timezone.localdate():
+        return None
+    if entry.status in (QueueStatus.COMPLETED, QueueStatus.SKIPPED):
+        return SECTION_COMPLETED
+    if entry.status == QueueStatus.NO_SHOW:
+        return SECTION_NO_SHOW
+    return None
+
+
+def entry_change(entry) -> dict:
+    """Build the delta op for one entry (upsert into its section, or remove)."""
+    from .services import ClinicalQueueService
+
+    section = entry_section(entry)
+    if section is None:
+        return {'op': 'remove', 'entry_id': str(entry.id)}
+
+    if section == SECTION_SERVING:
+        row = ClinicalQueueService._format_called_entry(entry)
+    elif section == SECTION_WAITING:
+        row = ClinicalQueueService._format_waiting_entry(entry)
+    else:
+        row = ClinicalQueueService._format_finished_entry(entry)
+    return {'op': 'upsert', 'section': section, 'entry': row}
+
+
+def build_delta(station, entry_ids) -> dict:
+    """Delta payload (without seq) for the given entries of a station."""
+    from .services import QueueService
+
+    entries = QueueEntry.objects.filter(
+        id__in=entry_ids,
+        station=station,
+    ).select_related(
+        'queue_number',
+        'queue_number__visit',
+        'queue_number__visit__patient',
+        'station',
+    )
+    found = {str(entry.id): entry for entry in entries}
+
+    changes = []
+    for entry_id in entry_ids:
+        entry = found.get(str(entry_id))
+        if entry is None:
+            # Bị xóa / chuyển sang station khác
+            changes.append({'op': 'remove', 'entry_id': str(entry_id)})
+            continue
+        try:
+            changes.append(entry_change(entry))
+        except Exception as exc:
+            logger.error('[BOARD] delta failed for entry %s: %s', entry_id, exc)
+
+    total_waiting = QueueService.get_queue_length(station)
+    return {
+        'changes': changes,
+        'total_waiting': total_waiting,
+        'estimated_wait_minutes': QueueService.get_estimated_wait_time(station, queue_length=total_waiting),
+    }
+
+
+def _group_send(station_id, message: dict) -> None:
+    from channels.layers import get_channel_layer
+    from asgiref.sync import async_to_sync
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group_name(station_id), message)
+
+
+def _send(station, entry_ids, mutated_at: int) -> None:
+    """
+    Build and push one message: delta for entry_ids, full board if FULL_BOARD
+    is among them. Serialized here, once, for every screen of the station.
+    """
+    seq = next_seq(station.id)
+    if seq is None or FULL_BOARD in entry_ids:
+        board = _build_board(station)
+        board['seq'] = seq
+        board_json = _serialize_board(board)
+        if seq is not None:
+            _store_snapshot(get_redis_client(), station.id, board_json)
+        message_type, frame = 'queue_update', _update_frame(seq, board_json)
+    else:
+        message = build_delta(station, entry_ids)
+        message.update(type='queue_delta', seq=seq)
+        _apply_to_snapshot(station.id, message)
+        message_type, frame = 'queue_delta', json.dumps(message, cls=DjangoJSONEncoder)
+
+    _group_send(station.id, {'type': message_type, 'seq': seq, 'frame': frame, 'mutated_at': mutated_at})
+
+    metrics.incr(METRIC, 'pushes')
+    if mutated_at:
+        metrics.observe_ms(METRIC_PUBLISH_LATENCY, max(_now_ms() - mutated_at, 0))
+
+
+def flush_station(station_id) -> None:
+    """Send everything pending for a station as a single message."""
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        taken = _script(client, _TAKE_SCRIPT)(keys=[*_pending_keys(station_id), DIRTY_KEY], args=[str(station_id)])
+    except redis.RedisError as e:
+        logger.warning('[BOARD] flush failed for station=%s: %s', station_id, e)
+        return
+
+    mutated_at, entry_ids = int(taken[0]), taken[1:]
+    if not entry_ids:
+        return
+    try:
+        station = ServiceStation.objects.get(id=station_id)
+        _send(station, entry_ids, mutated_at)
+    except Exception:
+        logger.exception('[BOARD] Failed to publish station=%s', station_id)
+
+
+def flush_stale(older_than_ms: int = STALE_FLUSH_MS) -> int:
+    """
+    Flush every station whose changes have been pending longer than older_than_ms
+    (its timer was lost with its worker). Returns the number of stations flushed.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    try:
+        station_ids = client.zrangebyscore(DIRTY_KEY, '-inf', _now_ms() - older_than_ms)
+    except redis.RedisError as e:
+        logger.warning('[BOARD] stale sweep failed: %s', e)
+        return 0
+    for station_id in station_ids:
+        logger.info('[BOARD] Flushing stale pending changes of station=%s', station_id)
+        flush_station(station_id)
+    return len(station_ids)
+
+
+def _flush_in_thread(station_id) -> None:
+    try:
+        flush_station(station_id)
+    finally:
+        connection.close()
+
+
+def _schedule_flush(station_id, delay_seconds: float) -> None:
+    timer = threading.Timer(delay_seconds, _flush_in_thread, args=[station_id])
+    timer.daemon = True
+    timer.start()
+
+
+@timing.staged('broadcast')
+def _enqueue(station_id, entry_ids) -> None:
+    metrics.incr(METRIC, 'mutations')
+    window_ms = getattr(settings, 'QMS_BOARD_COALESCE_MS', 150)
+    client = get_redis_client()
+
+    if client is not None and window_ms > 0:
+        try:
+            must_schedule = _script(client, _ENQUEUE_SCRIPT)(
+                keys=[*_pending_keys(station_id), DIRTY_KEY],
+                args=[_now_ms(), FLUSH_MARKER_TTL_MS, str(station_id), *entry_ids],
+            )
+        except redis.RedisError as e:
+            logger.warning('[BOARD] enqueue failed for station=%s: %s', station_id, e)
+        else:
+            if must_schedule:
+                _schedule_flush(station_id, window_ms / 1000)
+            return
+
+    # Không có Redis / tắt coalescing → gửi ngay
+    try:
+        _send(ServiceStation.objects.get(id=station_id), entry_ids, _now_ms())
+    except Exception:
+        logger.exception('[BOARD] Failed to publish station=%s', station_id)
+
+
+def publish_board(station) -> None:
+    """
+    Push the full board to every display of a station (after commit, coalesced).
+    station: ServiceStation or its id.
+    """
+    station_id = getattr(station, 'id', station)
+    transaction.on_commit(lambda: _enqueue(station_id, [FULL_BOARD]))
+
+
+def publish_changes(station, entry_ids) -> None:
+    """
+    Push only the changed entries to every display of a station (after commit, coalesced).
+    station: ServiceStation or its id.
+    """
+    station_id = getattr(station, 'id', station)
+    entry_ids = [str(entry_id) for entry_id in entry_ids]
+    transaction.on_commit(lambda: _enqueue(station_id, entry_ids))
+
+
+def publish_audio_ready(station, entry_id, audio_url: str) -> None:
+    """
+    Tell every display of a station the clip of a called entry is ready, then
+    refresh that entry on the board. station: ServiceStation or its id.
+    """
+    station_id = getattr(station, 'id', station)
+    _group_send(station_id, {
+        'type': 'audio_ready',
+        'frame': json.dumps({'type': 'audio_ready', 'entry_id': str(entry_id), 'audio_url': audio_url}),
+    })
+    publish_changes(station_id, [entry_id])
+
+
+def broadcast_metrics() -> dict:
+    """Coalescing ratio + latency percentiles of board pushes."""
+    counters = metrics.snapshot(METRIC)
+    mutations = int(counters.get('mutations', 0))
+    pushes = int(counters.get('pushes', 0))
+    return {
+        'mutations': mutations,
+        'pushes': pushes,
+        'coalescing_ratio': round(mutations / pushes, 2) if pushes else None,
+        'publish_latency': metrics.snapshot(METRIC_PUBLISH_LATENCY),
+        'display_latency': metrics.snapshot(METRIC_DISPLAY_LATENCY),
+    }
+
+
+def reset_broadcast_metrics() -> None:
+    for name in (METRIC, METRIC_PUBLISH_LATENCY, METRIC_DISPLAY_LATENCY):
+        metrics.reset(name)
@@ -4,12 +4,21 @@ Broadcasts real-time queue board updates to display screens.
 
 Protocol:
 - Client connects to: ws://host/ws/qms/display/<station_id>/
-- Server pushes: { "type": "queue_update", "data": { ...queue board... } }
+- Server pushes:
+    { "type": "queue_update", "seq": 123, "data": { ...queue board... } }   (full board)
+    { "type": "queue_delta", "seq": 124, "changes": [...], ... }           (see qms/board.py)
+    { "type": "audio_ready", "entry_id": "...", "audio_url": "..." }       (TTS clip of a called entry)
 - Client can send: { "type": "ping" } for keepalive
+                   { "type": "resync" } to get the full board again
+
+Board messages reach the consumers already serialized ({type, seq, frame},
+see qms/board.py): handlers only check seq and forward the frame.
 """
 
+import asyncio
 import json
 import logging
+import time
 
 try:
     from channels.generic.websocket import AsyncWebsocketConsumer
@@ -17,8 +26,8 @@ except ImportError:
     from channels.generic.websocket import AsyncWebSocketConsumer as AsyncWebsocketConsumer
 
 from channels.db import database_sync_to_async
-from .models import ServiceStation
-from .services import ClinicalQueueService
+from apps.core_services.core.utils import metrics
+from . import board
 
 logger = logging.getLogger(__name__)
 
@@ -28,16 +37,19 @@ class QueueDisplayConsumer(AsyncWebsocketConsumer):
     WebSocket consumer for QMS display screens.
 
     Each display connects with a station_id and joins the group
-    'qms_station_{station_id}'. When queue changes occur,
-    the full board is broadcast to all displays for that station.
+    'qms_station_{station_id}'. When queue changes occur, only the changed
+    entries are broadcast (queue_delta). The consumer tracks the board
+    sequence it last sent; a delta that does not follow it (lost message,
+    Redis restart) triggers a full resync instead of being forwarded.
     """
 
     def get_group_name(self):
-        return f"qms_station_{self.station_id}"
+        return board.group_name(self.station_id)
 
     async def connect(self):
         self.station_id = self.scope['url_route']['kwargs']['station_id']
         self.group_name = self.get_group_name()
+        self.board_seq = None
 
         await self.channel_layer.group_add(
             self.group_name,
@@ -46,11 +58,7 @@ class QueueDisplayConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
         # Send initial queue board on connect
-        board_data = await self._get_board()
-        await self.send(text_data=json.dumps({
-            'type': 'queue_update',
-            'data': board_data,
-        }))
+        await self._send_full_board()
 
         logger.info(f"Display connected: station={self.station_id}")
 
@@ -62,29 +70,80 @@ class QueueDisplayConsumer(AsyncWebsocketConsumer):
         logger.info(f"Display disconnected: station={self.station_id}")
 
     async def receive(self, text_data):
-        """Handle ping/pong keepalive from client."""
+        """Handle ping/pong keepalive and resync requests from client."""
         try:
             data = json.loads(text_data)
             if data.get('type') == 'ping':
                 await self.send(text_data=json.dumps({'type': 'pong'}))
+            elif data.get('type') == 'resync':
+                await self._send_full_board()
         except (json.JSONDecodeError, Exception):
             pass
 
     # ── Group event handlers ────────────────────────────────────────
 
     async def queue_update(self, event):
-        """Broadcast queue board update to connected display."""
-        await self.send(text_data=json.dumps({
-            'type': 'queue_update',
-            'data': event['data'],
-        }))
+        """Forward a full queue board to the connected display."""
+        seq = event.get('seq')
+        if seq is not None and self.board_seq is not None and seq <= self.board_seq:
+            return
+        self.board_seq = seq
+        await self.send(text_data=event['frame'])
+        self._observe_latency(event.get('mutated_at'))
+
+    async def queue_delta(self, event):
+        """Forward an incremental board update, or resync on a sequence gap."""
+        action = self.check_seq(event.get('seq'))
+        if action == 'drop':
+            return
+        if action == 'resync':
+            logger.info(
+                f"Display resync: station={self.station_id} "
+                f"have={self.board_seq} got={event.get('seq')}"
+            )
+            await self._send_full_board()
+            return
+
+        self.board_seq = event['seq']
+        await self.send(text_data=event['frame'])
+        self._observe_latency(event.get('mutated_at'))
+
+    async def audio_ready(self, event):
+        """TTS clip of an entry shown as audio_pending is ready (not part of the seq order)."""
+        await self.send(text_data=event['frame'])
 
     # ── Helpers ──────────────────────────────────────────────────────
 
+    def check_seq(self, seq):
+        """
+        'send' — delta follows the board the display has,
+        'drop' — already included in the board sent (older or equal seq),
+        'resync' — gap or unknown position → send the full board instead.
+        """
+        if seq is None or self.board_seq is None:
+            return 'resync'
+        if seq <= self.board_seq:
+            return 'drop'
+        if seq == self.board_seq + 1:
+            return 'send'
+        return 'resync'
+
+    def _observe_latency(self, mutated_at):
+        """Mutation → frame sent to this display (recorded off the event loop)."""
+        if not mutated_at:
+            return
+        latency_ms = max(time.time() * 1000 - mutated_at, 0)
+        asyncio.get_running_loop().run_in_executor(
+            None, metrics.observe_ms, board.METRIC_DISPLAY_LATENCY, latency_ms,
+        )
+
+    async def _send_full_board(self):
+        self.board_seq, frame = await self._get_board_frame()
+        await self.send(text_data=frame)
+
     @database_sync_to_async
-    def _get_board(self):
-        station = ServiceStation.objects.get(id=self.station_id)
-        return ClinicalQueueService.get_queue_board(station)
+    def _get_board_frame(self):
+        return board.get_board_frame(self.station_id)
 
 
 class ClinicalConsumer(AsyncWebsocketConsumer):
@@ -94,12 +153,15 @@ class ClinicalConsumer(AsyncWebsocketConsumer):
     Each doctor connects with their station_id and joins the group
     'clinical_station_{station_id}'. When a patient is triaged and
     assigned to this station, the group receives a broadcast.
+    It also joins the station's board group, so the board frames built once
+    for the displays are forwarded to the doctor's screen as well.
 
     Protocol:
     - Client connects to: ws://host/ws/clinical/<station_id>/
     - Server pushes:
         { "type": "new_patient_assigned", "visit": { ...visit data... } }
-        { "type": "queue_update", "data": { ...queue board... } }
+        { "type": "queue_update", "seq": 123, "data": { ...queue board... } }
+        { "type": "queue_delta", "seq": 124, "changes": [...], ... }
     - Client can send: { "type": "ping" } for keepalive
     """
 
@@ -109,19 +171,21 @@ class ClinicalConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.station_id = self.scope['url_route']['kwargs']['station_id']
         self.group_name = self.get_group_name()
+        self.board_group_name = board.group_name(self.station_id)
 
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name,
         )
+        await self.channel_layer.group_add(
+            self.board_group_name,
+            self.channel_name,
+        )
         await self.accept()
 
         # Send initial queue board on connect
-        board_data = await self._get_board()
-        await self.send(text_data=json.dumps({
-            'type': 'queue_update',
-            'data': board_data,
-        }))
+        _, frame = await self._get_board_frame()
+        await self.send(text_data=frame)
 
         logger.info(f"Clinical connected: station={self.station_id}")
 
@@ -130,6 +194,10 @@ class ClinicalConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name,
         )
+        await self.channel_layer.group_discard(
+            self.board_group_name,
+            self.channel_name,
+        )
         logger.info(f"Clinical disconnected: station={self.station_id}")
 
     async def receive(self, text_data):
@@ -151,15 +219,18 @@ class ClinicalConsumer(AsyncWebsocketConsumer):
         }))
 
     async def queue_update(self, event):
-        """Broadcast queue board update to connected clinical client."""
-        await self.send(text_data=json.dumps({
-            'type': 'queue_update',
-            'data': event['data'],
-        }))
+        """Forward a queue board frame to the connected clinical client."""
+        await self.send(text_data=event['frame'])
+
+    async def queue_delta(self, event):
+        """Forward a board delta frame (the dashboard refetches its list on any change)."""
+        await self.send(text_data=event['frame'])
+
+    async def audio_ready(self, event):
+        """Announcements are played by the displays only."""
 
     # ── Helpers ──────────────────────────────────────────────────────
 
     @database_sync_to_async
-    def _get_board(self):
-        station = ServiceStation.objects.get(id=self.station_id)
-        return ClinicalQueueService.get_queue_board(station)
+    def _get_board_frame(self):
+        return board.get_board_frame(self.station_id)
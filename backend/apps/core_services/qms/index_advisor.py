@@ -0,0 +1,100 @@
+"""
+QMS index advisor — EXPLAIN the hot QueueEntry queries and flag sequential scans.
+
+Each entry of hot_queries() mirrors a query on a QMS hot path (services,
+queue_store, station_load). queue_entries keeps the whole history, so on a
+real table none of them should read it sequentially; when one does, an index
+is missing or the query stopped matching it (e.g. a `__date` lookup wraps the
+column in a cast and the index on it can no longer be used).
+
+Used by `python manage.py explain_qms_queries` and the QMS tests.
+"""
+
+import json
+
+from django.db.models import Count, FilteredRelation, Q
+
+from .models import QueueEntry, QueueSourceType, QueueStatus, ServiceStation
+
+ACTIVE_STATUSES = [QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS]
+
+
+def hot_queries(station) -> dict:
+    """{name: queryset} for the queries that run on every check-in / call / board refresh."""
+    from .services import QueueService
+
+    today = QueueService.start_of_today()
+    waiting = QueueEntry.objects.filter(
+        station=station, status=QueueStatus.WAITING,
+    ).order_by('-priority', 'entered_queue_time')
+
+    return {
+        # QueueService.claim_next_waiting (DB fallback), get_waiting_list, board, queue_store.rebuild_station
+        'waiting_list': waiting,
+        'claim_next': waiting[:1],
+        'claim_next_emergency': waiting.filter(source_type=QueueSourceType.EMERGENCY)[:1],
+        # ClinicalQueueService.call_next_patient — giới hạn số đang gọi
+        'active_today': QueueEntry.objects.filter(
+            station=station,
+            status__in=[QueueStatus.CALLED, QueueStatus.IN_PROGRESS],
+            entered_queue_time__gte=today,
+        ),
+        # ClinicalQueueService.get_queue_board — các section
+        'serving': QueueEntry.objects.filter(
+            station=station,
+            status__in=[QueueStatus.IN_PROGRESS, QueueStatus.CALLED],
+        ).order_by('-priority', 'called_time'),
+        'completed_today': QueueEntry.objects.filter(
+            station=station,
+            status__in=[QueueStatus.COMPLETED, QueueStatus.SKIPPED],
+            end_time__gte=today,
+        ).order_by('-end_time')[:10],
+        'no_show_today': QueueEntry.objects.filter(
+            station=station,
+            status=QueueStatus.NO_SHOW,
+            end_time__gte=today,
+        ).order_by('-end_time')[:20],
+        # station_load.reconcile
+        'station_load': QueueEntry.objects.filter(
+            status__in=ACTIVE_STATUSES,
+            entered_queue_time__gte=today,
+        ).values_list('station_id', 'id'),
+        # ClinicalQueueService._least_loaded_station (khi không có bộ đếm live)
+        'least_loaded': ServiceStation.objects.filter(
+            station_type=station.station_type, is_active=True,
+        ).annotate(
+            active_entries=FilteredRelation(
+                'queue_entries',
+                condition=Q(
+                    queue_entries__status__in=ACTIVE_STATUSES,
+                    queue_entries__entered_queue_time__gte=today,
+                ),
+            ),
+        ).annotate(active_load=Count('active_entries')).order_by('active_load', 'code'),
+        # QueueService.get_all_stations_status
+        'stations_status': QueueService.stations_status_queryset(),
+    }
+
+
+def explain(queryset) -> dict:
+    """Postgres plan (EXPLAIN FORMAT JSON, not executed) of a queryset."""
+    return json.loads(queryset.explain(format='json'))[0]['Plan']
+
+
+def seq_scans(plan: dict, table: str = QueueEntry._meta.db_table) -> list:
+    """Sequential scan nodes on `table` anywhere in the plan (subplans included)."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') == table:
+        found.append(plan)
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child, table))
+    return found
+
+
+def advise(station) -> dict:
+    """{name: {'plan': plan, 'seq_scans': [...]}} for every hot query of a station."""
+    report = {}
+    for name, queryset in hot_queries(station).items():
+        plan = explain(queryset)
+        report[name] = {'plan': plan, 'seq_scans': seq_scans(plan)}
+    return report
@@ -0,0 +1,45 @@
+"""
+Management command: board_metrics — Thống kê push bảng LED (gộp thay đổi + độ trễ).
+
+  coalescing_ratio   số thay đổi / số lần push (càng cao càng gộp được nhiều)
+  publish_latency    thay đổi đầu tiên → group_send
+  display_latency    thay đổi đầu tiên → frame gửi tới màn hình
+
+Usage:
+    python manage.py board_metrics
+    python manage.py board_metrics --reset
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core_services.qms import board
+
+
+class Command(BaseCommand):
+    help = 'Xem thống kê gộp / độ trễ push bảng LED hàng chờ'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Xóa số liệu sau khi in',
+        )
+
+    def handle(self, *args, **options):
+        stats = board.broadcast_metrics()
+
+        self.stdout.write(f"  Thay đổi:        {stats['mutations']}")
+        self.stdout.write(f"  Lần push:        {stats['pushes']}")
+        self.stdout.write(f"  Tỉ lệ gộp:       {stats['coalescing_ratio'] or '-'}")
+        for label, key in (('Publish latency', 'publish_latency'), ('Display latency', 'display_latency')):
+            hist = stats[key]
+            if not hist.get('count'):
+                self.stdout.write(f'  {label}: chưa có số liệu')
+                continue
+            self.stdout.write(
+                f"  {label}: n={int(hist['count'])} avg={hist['avg_ms']}ms "
+                f"p50≤{hist['p50_ms']:g}ms p95≤{hist['p95_ms']:g}ms p99≤{hist['p99_ms']:g}ms"
+            )
+
+        if options['reset']:
+            board.reset_broadcast_metrics()
+            self.stdout.write(self.style.SUCCESS('Đã xóa số liệu.'))
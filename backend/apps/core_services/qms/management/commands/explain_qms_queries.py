@@ -0,0 +1,62 @@
+"""
+Management command: explain_qms_queries — EXPLAIN các query nóng của QMS, báo Seq Scan trên queue_entries.
+
+Chạy trên database có dữ liệu thật (hoặc sau simulate_qms_day --keep) — trên bảng
+gần rỗng Postgres luôn chọn Seq Scan nên kết quả không có ý nghĩa.
+Có query quét tuần tự → exit code khác 0 (dùng được trong CI / sau migrate).
+
+Usage:
+    python manage.py explain_qms_queries
+    python manage.py explain_qms_queries --station PK01 --verbose
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from apps.core_services.qms import index_advisor
+from apps.core_services.qms.models import ServiceStation
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN các query nóng của QMS và báo query nào quét tuần tự bảng queue_entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--station', type=str, default=None,
+            help='Mã station dùng làm tham số (mặc định: station nhiều phiếu nhất)',
+        )
+        parser.add_argument(
+            '--verbose', action='store_true',
+            help='In toàn bộ plan (JSON) của từng query',
+        )
+
+    def handle(self, *args, **options):
+        code = options['station']
+        if code:
+            station = ServiceStation.objects.filter(code=code).first()
+            if station is None:
+                raise CommandError(f'Không tìm thấy station {code}')
+        else:
+            station = ServiceStation.objects.annotate(
+                entry_count=Count('queue_entries'),
+            ).order_by('-entry_count').first()
+            if station is None:
+                raise CommandError('Chưa có station nào')
+
+        self.stdout.write(f'Station: {station.code}')
+        report = index_advisor.advise(station)
+
+        failed = []
+        for name, result in report.items():
+            if result['seq_scans']:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'  ✗ {name}: Seq Scan trên queue_entries'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'  ✓ {name}'))
+            if options['verbose']:
+                self.stdout.write(json.dumps(result['plan'], indent=2))
+
+        if failed:
+            raise CommandError(f'{len(failed)} query quét tuần tự: {", ".join(failed)}')
@@ -0,0 +1,43 @@
+"""
+Management command: rebuild_queue_index — Nạp lại Redis queue index từ DB.
+
+Dùng sau khi Redis bị flush/restart hoặc khi nghi ngờ index lệch với QueueEntry.
+(Index cũng tự nạp lại khi thiếu marker, lệnh này để chủ động.)
+
+Usage:
+    python manage.py rebuild_queue_index
+    python manage.py rebuild_queue_index --station PK01
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core_services.qms import queue_store
+from apps.core_services.qms.models import ServiceStation
+
+
+class Command(BaseCommand):
+    help = 'Nạp lại Redis queue index (hàng chờ WAITING) từ database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--station', type=str, default=None,
+            help='Chỉ nạp lại cho một điểm dịch vụ (mã station, VD: PK01)',
+        )
+
+    def handle(self, *args, **options):
+        code = options['station']
+        if code:
+            try:
+                station = ServiceStation.objects.get(code=code)
+            except ServiceStation.DoesNotExist:
+                raise CommandError(f'Không tìm thấy điểm dịch vụ: {code}')
+            results = {station.code: queue_store.rebuild_station(station.id)}
+        else:
+            results = queue_store.rebuild_all()
+
+        for station_code, count in results.items():
+            if count is None:
+                self.stdout.write(self.style.WARNING(f'  {station_code}: Redis không khả dụng'))
+            else:
+                self.stdout.write(f'  {station_code}: {count} bệnh nhân đang chờ')
+        self.stdout.write(self.style.SUCCESS(f'Đã nạp lại {len(results)} điểm dịch vụ.'))
@@ -0,0 +1,62 @@
+"""
+Management command: rebuild_wait_estimator — Nạp lại mô hình thời gian phục vụ từ lịch sử.
+
+Mô hình (qms/wait_estimator.py) được cập nhật dần mỗi lần hoàn thành phục vụ;
+lệnh này chỉ cần khi Redis mất dữ liệu hoặc lần đầu triển khai.
+
+Usage:
+    python manage.py rebuild_wait_estimator
+    python manage.py rebuild_wait_estimator --days 30 --station PK01
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core_services.qms import wait_estimator
+from apps.core_services.qms.models import QueueEntry, QueueStatus, ServiceStation
+
+
+class Command(BaseCommand):
+    help = 'Nạp lại mô hình thời gian phục vụ (ước tính thời gian chờ) từ các lượt đã hoàn thành'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=14,
+            help='Số ngày lịch sử dùng để nạp (mặc định: 14)',
+        )
+        parser.add_argument(
+            '--station', type=str, default=None,
+            help='Chỉ nạp cho một điểm dịch vụ (mã station, VD: PK01)',
+        )
+
+    def handle(self, *args, **options):
+        entries = QueueEntry.objects.filter(
+            status=QueueStatus.COMPLETED,
+            end_time__gte=timezone.now() - timedelta(days=options['days']),
+        )
+
+        code = options['station']
+        if code:
+            try:
+                station = ServiceStation.objects.get(code=code)
+            except ServiceStation.DoesNotExist:
+                raise CommandError(f'Không tìm thấy điểm dịch vụ: {code}')
+            entries = entries.filter(station=station)
+            station_ids = [station.id]
+        else:
+            station_ids = list(entries.values_list('station_id', flat=True).distinct())
+
+        for station_id in station_ids:
+            wait_estimator.reset(station_id)
+
+        count = 0
+        rows = entries.order_by('end_time').values_list('station_id', 'start_time', 'called_time', 'end_time')
+        for station_id, start_time, called_time, end_time in rows.iterator(chunk_size=2000):
+            wait_estimator.observe(station_id, start_time or called_time, end_time)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã nạp {count} lượt hoàn thành cho {len(station_ids)} điểm dịch vụ.'
+        ))
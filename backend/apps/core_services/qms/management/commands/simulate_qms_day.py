@@ -0,0 +1,429 @@
+"""
+Management command: simulate_qms_day — Giả lập một buổi khám cao điểm để đo hiệu năng QMS.
+
+Tạo một khoa giả lập (SIM-xxxxxx) với các phòng khám + phòng xét nghiệm, rồi chạy
+song song:
+  - N kiosk lấy số theo đường cong bệnh nhân đến (đỉnh quanh --peak-hour),
+    một phần là cấp cứu (flag_emergency);
+  - mỗi phòng 1 luồng bác sĩ: gọi số → khám → hoàn thành, một phần được chuyển
+    sang phòng xét nghiệm (transfer_to_station).
+
+Mỗi thao tác được đo thời gian + số câu SQL; bảng LED được build / đọc sau mỗi
+lần gọi số; fan-out là thời gian group_send tới --displays màn hình mỗi phòng.
+Channel layer luôn là InMemoryChannelLayer (không cần Redis channel layer);
+dữ liệu giả lập bị xóa sau khi chạy trừ khi có --keep.
+
+Lưu ý: lệnh gọi thẳng tầng service (ClinicalQueueService / QueueService / board),
+KHÔNG đi qua view REST hay WebSocket consumer — chi phí HTTP, xác thực, serializer
+và consumer gửi frame xuống màn hình không nằm trong số đo.
+
+Redis: chạy trên --redis-db (mặc định REDIS_TEST_DB, như RedisTestDBRunner) để
+bộ đếm, queue index, snapshot bảng LED và metrics giả lập không lẫn vào Redis
+dev / dùng chung (board_metrics, kiosk_latency_metrics...). DB này không bị
+FLUSHDB; manage.py test sẽ xóa nó ở lần chạy sau.
+
+  checkin      kiosk: chọn phòng ít tải nhất + lấy số vãng lai
+  emergency    cấp cứu: chọn phòng + flag_emergency
+  call_next    bác sĩ gọi số tiếp theo
+  complete     hoàn thành khám
+  transfer     chọn phòng xét nghiệm + chuyển bệnh nhân
+  board_build  build toàn bộ bảng LED từ DB
+  board_read   đọc bảng LED như consumer / REST (snapshot-first)
+  fanout       group_send một message tới mọi màn hình của phòng
+
+Usage:
+    python manage.py simulate_qms_day
+    python manage.py simulate_qms_day --patients 600 --kiosks 8 --stations 10
+    python manage.py simulate_qms_day --speed 600 --hours 4 --peak-hour 1.5
+    python manage.py simulate_qms_day --coalesce-ms 150 --keep
+    python manage.py simulate_qms_day --redis-db 14
+"""
+
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test.utils import override_settings
+
+from apps.core_services.departments.models import Department
+from apps.core_services.patients.models import Patient
+from apps.core_services.qms import board
+from apps.core_services.qms.models import QueueEntry, ServiceStation, StationType
+from apps.core_services.qms.services import ClinicalQueueService, QueueService
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {'capacity': 100000, 'expiry': 3600},
+    },
+}
+
+OPERATIONS = (
+    'checkin', 'emergency', 'call_next', 'complete', 'transfer',
+    'board_build', 'board_read', 'fanout',
+)
+
+
+def _ms(value):
+    return f'{value:.1f}' if value is not None else '-'
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a sorted list (None if empty)."""
+    if not samples:
+        return None
+    rank = max(math.ceil(q * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class Recorder:
+    """Thread-safe latency / query-count samples per operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.queries = {}
+        self.errors = {}
+
+    def add(self, name, elapsed_ms, query_count=None):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed_ms)
+            if query_count is not None:
+                self.queries.setdefault(name, []).append(query_count)
+
+    def error(self, name, exc):
+        with self._lock:
+            self.errors.setdefault(name, []).append(repr(exc))
+
+    @contextmanager
+    def measure(self, name):
+        """Time the block and count the SQL it runs on this thread's connection."""
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                yield
+        except Exception as exc:
+            self.error(name, exc)
+            raise
+        self.add(name, (time.perf_counter() - started) * 1000, count[0])
+
+
+class Command(BaseCommand):
+    help = (
+        'Giả lập buổi khám cao điểm (kiosk, phòng khám, cấp cứu, chuyển phòng) và đo độ trễ QMS '
+        'ở tầng service — không đo view REST / WebSocket consumer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=300, help='Số lượt bệnh nhân đến (mặc định 300)')
+        parser.add_argument('--kiosks', type=int, default=4, help='Số kiosk lấy số song song (mặc định 4)')
+        parser.add_argument('--stations', type=int, default=6, help='Số phòng khám (mặc định 6)')
+        parser.add_argument('--lab-stations', type=int, default=2, help='Số phòng xét nghiệm nhận chuyển (mặc định 2)')
+        parser.add_argument('--displays', type=int, default=3, help='Số màn hình LED mỗi phòng (mặc định 3)')
+        parser.add_argument('--hours', type=float, default=4.0, help='Độ dài buổi khám giả lập, giờ (mặc định 4)')
+        parser.add_argument('--peak-hour', type=float, default=1.0,
+                            help='Đỉnh lượng bệnh nhân đến, tính từ đầu buổi (giờ, mặc định 1)')
+        parser.add_argument('--service-minutes', type=float, default=8.0,
+                            help='Thời gian khám trung bình (phút giả lập, mặc định 8)')
+        parser.add_argument('--emergency-rate', type=float, default=0.02, help='Tỉ lệ cấp cứu (mặc định 0.02)')
+        parser.add_argument('--transfer-rate', type=float, default=0.3,
+                            help='Tỉ lệ chuyển sang xét nghiệm sau khám (mặc định 0.3)')
+        parser.add_argument('--speed', type=float, default=0,
+                            help='Số giây giả lập mỗi giây thật (0 = chạy nhanh nhất có thể)')
+        parser.add_argument('--coalesce-ms', type=int, default=0,
+                            help='QMS_BOARD_COALESCE_MS khi giả lập (mặc định 0 = gửi ngay)')
+        parser.add_argument('--seed', type=int, default=None, help='Seed ngẫu nhiên (lặp lại được)')
+        parser.add_argument('--with-tts', action='store_true',
+                            help='Gọi TTS thật khi gọi số (mặc định tắt để không đo Celery/edge-tts)')
+        parser.add_argument('--redis-db', type=int, default=None,
+                            help='Redis DB cho giả lập (mặc định REDIS_TEST_DB, phải khác REDIS_DB)')
+        parser.add_argument('--keep', action='store_true', help='Giữ lại dữ liệu giả lập sau khi chạy')
+        parser.add_argument('--force', action='store_true', help='Cho phép chạy khi DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Lệnh ghi dữ liệu giả lập vào database — chỉ chạy khi DEBUG=True (hoặc --force).')
+        for name in ('patients', 'kiosks', 'stations', 'lab_stations'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} phải >= 1')
+        redis_db = settings.REDIS_TEST_DB if options['redis_db'] is None else options['redis_db']
+        if redis_db == settings.REDIS_DB:
+            raise CommandError('--redis-db phải khác REDIS_DB (giả lập ghi bộ đếm / metrics vào Redis DB riêng).')
+
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.recorder = Recorder()
+        self.run_id = uuid.uuid4().hex[:6].upper()
+
+        with override_settings(
+            CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+            QMS_BOARD_COALESCE_MS=options['coalesce_ms'],
+            REDIS_DB=redis_db,
+        ):
+            department = None
+            try:
+                with self._patched():
+                    department = self._setup()
+                    wall_seconds = self._run(department)
+                    delivered = self._drain_displays()
+            finally:
+                # Ngoài _patched: các push bảng LED khi xóa dữ liệu không bị tính vào fan-out
+                if department is not None and not options['keep']:
+                    self._teardown(department)
+        self._report(wall_seconds, delivered)
+
+    # ------------------------------------------------------------------ setup
+
+    @contextmanager
+    def _patched(self):
+        """Đo fan-out quanh group_send; tắt TTS (Celery + edge-tts) nếu không có --with-tts."""
+        real_group_send = board._group_send
+
+        def timed_group_send(station_id, message):
+            started = time.perf_counter()
+            real_group_send(station_id, message)
+            self.recorder.add('fanout', (time.perf_counter() - started) * 1000)
+
+        patches = [mock.patch.object(board, '_group_send', timed_group_send)]
+        if not self.options['with_tts']:
+            patches += [
+                mock.patch('apps.core_services.qms.tts_service.get_audio_url', return_value=None),
+                mock.patch('apps.core_services.qms.tts_service.generate_tts_audio'),
+                mock.patch('apps.core_services.qms.tts_service.request_audio', return_value=False),
+                mock.patch.object(ClinicalQueueService, '_trigger_tts_pre_generate'),
+            ]
+        for patcher in patches:
+            patcher.start()
+        try:
+            yield
+        finally:
+            for patcher in reversed(patches):
+                patcher.stop()
+
+    def _setup(self):
+        opts = self.options
+        department = Department.objects.create(code=f'SIM-{self.run_id}', name=f'Khoa giả lập {self.run_id}')
+        self.clinics = [
+            ServiceStation.objects.create(
+                code=f'SIM-{self.run_id}-PK{i:02d}', name=f'Phòng khám giả lập {i}',
+                station_type=StationType.DOCTOR, department=department,
+            )
+            for i in range(1, opts['stations'] + 1)
+        ]
+        self.labs = [
+            ServiceStation.objects.create(
+                code=f'SIM-{self.run_id}-XN{i:02d}', name=f'Phòng xét nghiệm giả lập {i}',
+                station_type=StationType.LIS, department=department,
+            )
+            for i in range(1, opts['lab_stations'] + 1)
+        ]
+        self.patients = Patient.objects.bulk_create([
+            Patient(
+                patient_code=f'SIM{self.run_id}{i:06d}',
+                first_name='Giả lập', last_name=f'BN {i}',
+                gender=self.rng.choice(Patient.Gender.values),
+            )
+            for i in range(opts['patients'])
+        ])
+
+        # Màn hình LED: mỗi phòng --displays channel trong group của phòng
+        self.channel_layer = get_channel_layer()
+        self.display_channels = []
+        for station in self.clinics + self.labs:
+            for _ in range(opts['displays']):
+                channel = async_to_sync(self.channel_layer.new_channel)()
+                async_to_sync(self.channel_layer.group_add)(board.group_name(station.id), channel)
+                self.display_channels.append(channel)
+
+        self.stdout.write(
+            f'Khoa {department.code}: {len(self.clinics)} phòng khám, {len(self.labs)} phòng xét nghiệm, '
+            f'{len(self.display_channels)} màn hình, {len(self.patients)} bệnh nhân'
+        )
+        return department
+
+    def _arrivals(self):
+        """
+        [(giây giả lập, patient, is_emergency)] — giờ đến rút từ phân phối chuẩn
+        quanh peak-hour (cắt trong [0, hours]): dồn vào buổi sáng như thực tế.
+        """
+        hours = self.options['hours']
+        peak = min(max(self.options['peak_hour'], 0), hours)
+        spread = max(hours / 4, 0.25)
+        arrivals = []
+        for patient in self.patients:
+            at = self.rng.gauss(peak, spread)
+            while not 0 <= at <= hours:
+                at = self.rng.gauss(peak, spread)
+            arrivals.append((at * 3600, patient, self.rng.random() < self.options['emergency_rate']))
+        arrivals.sort(key=lambda arrival: arrival[0])
+        return arrivals
+
+    # -------------------------------------------------------------------- run
+
+    def _sleep_until(self, started, sim_seconds):
+        speed = self.options['speed']
+        if speed > 0:
+            delay = started + sim_seconds / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _outstanding(self, delta=0):
+        with self._outstanding_lock:
+            self._outstanding_count += delta
+            return self._outstanding_count
+
+    def _checkin(self, patient, is_emergency, department):
+        try:
+            if is_emergency:
+                with self.recorder.measure('emergency'):
+                    station = ClinicalQueueService.get_optimal_station_for_department(
+                        StationType.DOCTOR, department,
+                    )
+                    ClinicalQueueService.flag_emergency(patient, station, reason='Giả lập cấp cứu')
+            else:
+                with self.recorder.measure('checkin'):
+                    station = ClinicalQueueService.get_optimal_station_for_department(
+                        StationType.DOCTOR, department,
+                    )
+                    ClinicalQueueService.checkin_walkin(patient, station, reason='Giả lập')
+            self._outstanding(+1)
+        except Exception:
+            pass  # đã ghi vào recorder.errors
+        finally:
+            close_old_connections()
+
+    def _doctor(self, station, department):
+        opts = self.options
+        is_lab = station.station_type == StationType.LIS
+        try:
+            while True:
+                try:
+                    with self.recorder.measure('call_next'):
+                        called = ClinicalQueueService.call_next_patient(station)
+                except Exception:
+                    called = None
+
+                if not called or 'entry_id' not in called:
+                    if self._arrivals_done.is_set() and self._outstanding() <= 0:
+                        return
+                    time.sleep(0.005)
+                    continue
+
+                try:
+                    with self.recorder.measure('board_build'):
+                        board._build_board(station)
+                    with self.recorder.measure('board_read'):
+                        board.get_board(station.id)
+                except Exception:
+                    pass
+
+                service_minutes = self.rng.expovariate(1 / opts['service_minutes'])
+                if opts['speed'] > 0:
+                    time.sleep(service_minutes * 60 / opts['speed'])
+
+                try:
+                    entry = QueueEntry.objects.select_related('queue_number__visit').get(id=called['entry_id'])
+                    with self.recorder.measure('complete'):
+                        QueueService.complete_service(entry)
+                    if not is_lab and self.rng.random() < opts['transfer_rate']:
+                        with self.recorder.measure('transfer'):
+                            lab = ClinicalQueueService.get_optimal_station_for_department(
+                                StationType.LIS, department,
+                            )
+                            QueueService.transfer_to_station(entry.queue_number.visit, lab)
+                        self._outstanding(+1)
+                except Exception:
+                    pass
+                finally:
+                    self._outstanding(-1)
+        finally:
+            connection.close()
+
+    def _run(self, department):
+        opts = self.options
+        arrivals = self._arrivals()
+        self._arrivals_done = threading.Event()
+        self._outstanding_lock = threading.Lock()
+        self._outstanding_count = 0
+
+        speed = f'x{opts["speed"]:g}' if opts['speed'] > 0 else 'tối đa'
+        self.stdout.write(
+            f'Giả lập {opts["hours"]:g} giờ, đỉnh ở giờ thứ {opts["peak_hour"]:g}, '
+            f'{sum(1 for *_, emergency in arrivals if emergency)} cấp cứu, tốc độ {speed}...'
+        )
+
+        started = time.perf_counter()
+        stations = self.clinics + self.labs
+        with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix='sim-doctor') as doctors:
+            for station in stations:
+                doctors.submit(self._doctor, station, department)
+            with ThreadPoolExecutor(max_workers=opts['kiosks'], thread_name_prefix='sim-kiosk') as kiosks:
+                for at, patient, is_emergency in arrivals:
+                    self._sleep_until(started, at)
+                    kiosks.submit(self._checkin, patient, is_emergency, department)
+            self._arrivals_done.set()
+        return time.perf_counter() - started
+
+    def _drain_displays(self):
+        """Số frame mỗi màn hình thực sự nhận được (kiểm tra fan-out không rơi message)."""
+        delivered = 0
+        for channel in self.display_channels:
+            while True:
+                queue = self.channel_layer.channels.get(channel)
+                if not queue or queue.empty():
+                    break
+                async_to_sync(self.channel_layer.receive)(channel)
+                delivered += 1
+        return delivered
+
+    def _teardown(self, department):
+        Patient.objects.filter(patient_code__startswith=f'SIM{self.run_id}').delete()
+        department.delete()  # CASCADE: các phòng giả lập + hàng đợi còn lại
+        self.stdout.write(f'Đã xóa dữ liệu giả lập {department.code}.')
+
+    # ----------------------------------------------------------------- report
+
+    def _report(self, wall_seconds, delivered):
+        recorder = self.recorder
+        self.stdout.write('')
+        self.stdout.write(f'Thời gian chạy: {wall_seconds:.2f}s')
+        self.stdout.write(
+            f'{"Thao tác":<12} {"n":>6} {"p50 ms":>9} {"p99 ms":>9} {"max ms":>9} '
+            f'{"SQL p50":>8} {"SQL max":>8} {"lỗi":>5}'
+        )
+        for name in OPERATIONS:
+            samples = sorted(recorder.latencies.get(name, []))
+            queries = sorted(recorder.queries.get(name, []))
+            errors = len(recorder.errors.get(name, []))
+            if not samples and not errors:
+                continue
+            self.stdout.write(
+                f'{name:<12} {len(samples):>6} {_ms(percentile(samples, 0.50)):>9} '
+                f'{_ms(percentile(samples, 0.99)):>9} {_ms(samples[-1] if samples else None):>9} '
+                f'{percentile(queries, 0.50) if queries else "-":>8} {queries[-1] if queries else "-":>8} '
+                f'{errors:>5}'
+            )
+
+        sent = len(recorder.latencies.get('fanout', []))
+        self.stdout.write(
+            f'Fan-out: {sent} message × {self.options["displays"]} màn hình/phòng, '
+            f'{delivered} frame đã tới màn hình'
+        )
+        for name, errors in recorder.errors.items():
+            self.stdout.write(self.style.WARNING(f'{name}: {len(errors)} lỗi, ví dụ: {errors[0]}'))
@@ -0,0 +1,33 @@
+"""
+Management command: warm_tts_segments — Tổng hợp trước các đoạn audio cố định của câu gọi số.
+
+Câu dẫn ("Mời bệnh nhân", "số thứ tự"), các số 1..N và nhãn của mọi phòng đang
+hoạt động. Sau đó mỗi lần gọi số chỉ còn phải tổng hợp tên bệnh nhân.
+Đoạn đã có trong cache được bỏ qua — chạy lại sau khi thêm / đổi tên phòng.
+
+Usage:
+    python manage.py warm_tts_segments
+    python manage.py warm_tts_segments --max-number 500
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.core_services.qms import tts_segments
+from apps.core_services.qms.models import ServiceStation
+
+
+class Command(BaseCommand):
+    help = 'Tổng hợp trước các đoạn audio cố định (câu dẫn, số thứ tự, tên phòng) cho câu gọi số'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-number', type=int, default=300,
+            help='Số thứ tự lớn nhất cần có sẵn (mặc định 300)',
+        )
+
+    def handle(self, *args, **options):
+        stations = list(ServiceStation.objects.filter(is_active=True))
+        rendered = tts_segments.warm_segments(stations, options['max_number'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã tổng hợp {rendered} đoạn mới ({len(stations)} phòng, số 1..{options["max_number"]}).'
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:55
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Bảng queue_entries đang được ghi liên tục → tạo index không khóa ghi
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0002_appointment_time_slot_end'),
+        ('qms', '0002_queueentry_booking_ref_queueentry_source_type_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='queueentry',
+            index=models.Index(condition=models.Q(('status', 'WAITING')), fields=['station', '-priority', 'entered_queue_time'], name='qentry_waiting_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='queueentry',
+            index=models.Index(condition=models.Q(('status__in', ['WAITING', 'CALLED', 'IN_PROGRESS'])), fields=['station', 'status', 'entered_queue_time'], name='qentry_active_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='queueentry',
+            index=models.Index(condition=models.Q(('end_time__isnull', False)), fields=['station', 'status', '-end_time'], name='qentry_finished_idx'),
+        ),
+    ]
@@ -204,6 +204,28 @@ class QueueEntry(UUIDModel):
         verbose_name = "Phiếu xếp hàng"
         verbose_name_plural = "Các phiếu xếp hàng"
         ordering = ['-priority', 'entered_queue_time']
+        # Partial: bảng chứa cả lịch sử, các query nóng chỉ chạm vào phần rất nhỏ đang hoạt động.
+        # Kiểm tra bằng: python manage.py explain_qms_queries
+        indexes = [
+            # Danh sách chờ / gọi số / đếm số chờ: (station, WAITING) ORDER BY -priority, entered_queue_time
+            models.Index(
+                fields=['station', '-priority', 'entered_queue_time'],
+                condition=models.Q(status='WAITING'),
+                name='qentry_waiting_idx',
+            ),
+            # Đang gọi / đang khám, tải trạm trong ngày (phân luồng, tổng quan station)
+            models.Index(
+                fields=['station', 'status', 'entered_queue_time'],
+                condition=models.Q(status__in=['WAITING', 'CALLED', 'IN_PROGRESS']),
+                name='qentry_active_idx',
+            ),
+            # Đã xong / vắng mặt hôm nay trên bảng LED: ORDER BY -end_time
+            models.Index(
+                fields=['station', 'status', '-end_time'],
+                condition=models.Q(end_time__isnull=False),
+                name='qentry_finished_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.queue_number.number_code} @ {self.station.code} - {self.status}"
@@ -0,0 +1,317 @@
+"""
+QMS Queue Store — Redis priority index of WAITING entries per station.
+
+Keeps one sorted set per station mirroring the WAITING QueueEntry rows, so
+"call next" becomes an atomic O(log n) pop shared by every daphne/celery
+worker instead of an ORDER BY scan over the day's entries.
+
+Keys (per station):
+    qms:queue:{station_id}:waiting    ZSET — every WAITING entry
+    qms:queue:{station_id}:emergency  ZSET — WAITING entries with source EMERGENCY
+    qms:queue:{station_id}:ready      marker — index has been loaded from the DB
+
+Ordering:
+    score  = -priority                              (highest priority first)
+    member = "{entered_queue_time µs:020d}:{entry_id}"
+
+Redis orders equal scores lexicographically by member, so the zero-padded
+timestamp gives FCFS inside a priority level without float precision issues.
+
+The database stays the source of truth: a popped id is only "called" once a
+conditional UPDATE (status=WAITING) succeeds, so stale members are harmless.
+The index is rebuilt from the database whenever the ready marker is missing
+(first use, Redis restart/eviction) or via `manage.py rebuild_queue_index`.
+
+A member popped but never claimed (DB error → restore(); worker killed or an
+outer transaction rolled back after the pop) is put back by the periodic
+reconcile() task, which re-adds every WAITING row of the loaded stations.
+"""
+
+import logging
+from typing import NamedTuple
+
+import redis
+
+from apps.core_services.core.utils import get_redis_client, timing
+
+logger = logging.getLogger('qms')
+
+READY_TTL = 86400  # Queues are daily — force a fresh load at least once a day
+
+# Sentinels returned by pop_next()
+NOT_READY = 'NOT_READY'
+UNAVAILABLE = 'UNAVAILABLE'
+
+# KEYS[1]=set to pop from, KEYS[2]=sibling set, KEYS[3]=ready marker
+# ARGV[1]='1' when popping from the emergency set
+# → {member, score in the waiting set, was in the emergency set}
+_POP_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    return -1
+end
+local popped = redis.call('ZPOPMIN', KEYS[1])
+if #popped == 0 then
+    return 0
+end
+local member = popped[1]
+local score, emergency
+if ARGV[1] == '1' then
+    score = redis.call('ZSCORE', KEYS[2], member)
+    emergency = 1
+else
+    score = popped[2]
+    emergency = redis.call('ZSCORE', KEYS[2], member) and 1 or 0
+end
+redis.call('ZREM', KEYS[2], member)
+return {member, score or '0', emergency}
+"""
+_pop_script = None
+
+
+class Popped(NamedTuple):
+    """A member taken off the index by pop_next() — enough to restore() it."""
+    entry_id: str
+    member: str
+    score: float
+    emergency: bool
+
+
+def _keys(station_id) -> tuple[str, str, str]:
+    prefix = f"qms:queue:{station_id}"
+    return f"{prefix}:waiting", f"{prefix}:emergency", f"{prefix}:ready"
+
+
+def _member(entry_id, entered_queue_time) -> str:
+    micros = int(entered_queue_time.timestamp() * 1_000_000)
+    return f"{micros:020d}:{entry_id}"
+
+
+def _entry_id_from_member(member: str) -> str:
+    return member.split(':', 1)[1]
+
+
+def _get_pop_script(client):
+    global _pop_script
+    if _pop_script is None:
+        _pop_script = client.register_script(_POP_SCRIPT)
+    return _pop_script
+
+
+@timing.staged('queue_index')
+def sync_entry(entry_id, station_id, status, priority, source_type, entered_queue_time) -> None:
+    """
+    Mirror one QueueEntry into the index (called after commit by signals).
+    WAITING → upsert; any other status → remove.
+    """
+    from .models import QueueStatus, QueueSourceType
+
+    client = get_redis_client()
+    if client is None or entered_queue_time is None:
+        return
+
+    waiting_key, emergency_key, _ = _keys(station_id)
+    member = _member(entry_id, entered_queue_time)
+    try:
+        pipe = client.pipeline(transaction=True)
+        if status == QueueStatus.WAITING:
+            pipe.zadd(waiting_key, {member: -priority})
+            if source_type == QueueSourceType.EMERGENCY:
+                pipe.zadd(emergency_key, {member: 0})
+            else:
+                pipe.zrem(emergency_key, member)
+        else:
+            pipe.zrem(waiting_key, member)
+            pipe.zrem(emergency_key, member)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] sync failed for entry=%s: %s', entry_id, e)
+
+
+def pop_next(station_id, emergency_only: bool = False):
+    """
+    Atomically pop the best WAITING entry id for a station.
+
+    Returns:
+        Popped (entry_id, ...), None if the index is empty,
+        NOT_READY if the index must be rebuilt first,
+        UNAVAILABLE if Redis cannot be used.
+    """
+    client = get_redis_client()
+    if client is None:
+        return UNAVAILABLE
+
+    waiting_key, emergency_key, ready_key = _keys(station_id)
+    if emergency_only:
+        keys = [emergency_key, waiting_key, ready_key]
+    else:
+        keys = [waiting_key, emergency_key, ready_key]
+
+    try:
+        result = _get_pop_script(client)(keys=keys, args=['1' if emergency_only else '0'])
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] pop failed for station=%s: %s', station_id, e)
+        return UNAVAILABLE
+
+    if result == -1:
+        return NOT_READY
+    if result == 0:
+        return None
+    member, score, emergency = result
+    return Popped(_entry_id_from_member(member), member, float(score), bool(emergency))
+
+
+def restore(station_id, popped: Popped) -> None:
+    """Put a popped member back (the claim failed) so it keeps its place in line."""
+    client = get_redis_client()
+    if client is None:
+        return
+
+    waiting_key, emergency_key, _ = _keys(station_id)
+    try:
+        pipe = client.pipeline(transaction=True)
+        pipe.zadd(waiting_key, {popped.member: popped.score})
+        if popped.emergency:
+            pipe.zadd(emergency_key, {popped.member: 0})
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] restore failed for entry=%s: %s', popped.entry_id, e)
+        invalidate(station_id)
+
+
+def waiting_count(station_id):
+    """
+    Number of WAITING entries from the index (O(1)), or None when the index is
+    not loaded / Redis is unavailable — the caller then counts in the DB.
+    May briefly include entries changed by queryset .update() (no signal).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    waiting_key, _, ready_key = _keys(station_id)
+    try:
+        pipe = client.pipeline(transaction=True)
+        pipe.exists(ready_key)
+        pipe.zcard(waiting_key)
+        ready, count = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] count failed for station=%s: %s', station_id, e)
+        return None
+    return count if ready else None
+
+
+def invalidate(station_id) -> None:
+    """Drop the ready marker so the next pop reloads the station from the DB."""
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(_keys(station_id)[2])
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] invalidate failed for station=%s: %s', station_id, e)
+
+
+def rebuild_station(station_id) -> int | None:
+    """
+    Reload a station's index from the WAITING rows in the database.
+
+    Returns the number of indexed entries, or None if Redis is unavailable.
+    """
+    from .models import QueueEntry, QueueStatus, QueueSourceType
+
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    rows = QueueEntry.objects.filter(
+        station_id=station_id,
+        status=QueueStatus.WAITING,
+    ).values_list('id', 'priority', 'source_type', 'entered_queue_time')
+
+    waiting = {}
+    emergency = {}
+    for entry_id, priority, source_type, entered in rows:
+        member = _member(entry_id, entered)
+        waiting[member] = -priority
+        if source_type == QueueSourceType.EMERGENCY:
+            emergency[member] = 0
+
+    waiting_key, emergency_key, ready_key = _keys(station_id)
+    try:
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(waiting_key, emergency_key)
+        if waiting:
+            pipe.zadd(waiting_key, waiting)
+        if emergency:
+            pipe.zadd(emergency_key, emergency)
+        pipe.set(ready_key, 1, ex=READY_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] rebuild failed for station=%s: %s', station_id, e)
+        return None
+
+    logger.info('[QUEUE_STORE] Rebuilt station=%s waiting=%d emergency=%d',
+                station_id, len(waiting), len(emergency))
+    return len(waiting)
+
+
+def rebuild_all() -> dict:
+    """Rebuild the index for every active station. Returns {station_code: count}."""
+    from .models import ServiceStation
+
+    result = {}
+    for station_id, code in ServiceStation.objects.filter(is_active=True).values_list('id', 'code'):
+        result[code] = rebuild_station(station_id)
+    return result
+
+
+def reconcile() -> int | None:
+    """
+    Re-add every WAITING row of the stations whose index is loaded (periodic task).
+
+    ZADD is an upsert, so members already present are untouched and nothing is
+    removed — concurrent pops / syncs are never undone; at worst a just-claimed
+    entry comes back as a stale member, which pop skips. Stations not loaded
+    are left to the rebuild on their next pop.
+    Returns the number of WAITING rows re-added, or None if Redis is unavailable.
+    """
+    from .models import QueueEntry, QueueStatus, QueueSourceType
+
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    rows = QueueEntry.objects.filter(
+        status=QueueStatus.WAITING,
+    ).values_list('station_id', 'id', 'priority', 'source_type', 'entered_queue_time')
+    by_station = {}
+    for station_id, entry_id, priority, source_type, entered in rows.iterator(chunk_size=2000):
+        by_station.setdefault(station_id, []).append((entry_id, priority, source_type, entered))
+
+    try:
+        pipe = client.pipeline(transaction=False)
+        for station_id in by_station:
+            pipe.exists(_keys(station_id)[2])
+        loaded = [station_id for station_id, ready in zip(by_station, pipe.execute()) if ready]
+
+        total = 0
+        pipe = client.pipeline(transaction=False)
+        for station_id in loaded:
+            waiting_key, emergency_key, _ = _keys(station_id)
+            waiting, emergency = {}, {}
+            for entry_id, priority, source_type, entered in by_station[station_id]:
+                member = _member(entry_id, entered)
+                waiting[member] = -priority
+                if source_type == QueueSourceType.EMERGENCY:
+                    emergency[member] = 0
+            pipe.zadd(waiting_key, waiting)
+            if emergency:
+                pipe.zadd(emergency_key, emergency)
+            total += len(waiting)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[QUEUE_STORE] reconcile failed: %s', e)
+        return None
+
+    logger.info('[QUEUE_STORE] Reconciled %d stations, %d waiting entries', len(loaded), total)
+    return total
@@ -1,21 +1,79 @@
 """
 QMS Services - Business logic for Queue Management System
 """
+import logging
 from datetime import date
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Max, Count, Q
+from django.db import transaction, IntegrityError
+from django.core.cache import cache
+from django.db.models import Max, Count, Q, OuterRef, Subquery, FilteredRelation
 
+from apps.core_services.core.utils import next_counter_value, raise_counter_floor, timing
 from .models import ServiceStation, QueueNumber, QueueEntry, QueueStatus, QueueSourceType, StationType
 
+logger = logging.getLogger('qms')
+
 
 class QueueService:
     """Service class for queue management operations"""
     
+    # Bộ đếm STT theo (station, ngày) — giữ 2 ngày rồi tự hết hạn
+    SEQUENCE_TTL_SECONDS = 2 * 86400
+    SEQUENCE_MAX_RETRIES = 5
+
+    # Tổng quan toàn viện — cache ngắn, đủ cho màn hình admin tự refresh
+    STATIONS_STATUS_CACHE_KEY = 'qms:stations_status'
+    STATIONS_STATUS_CACHE_TTL = 5
+
+    @staticmethod
+    def start_of_today():
+        """
+        00:00 hôm nay (giờ địa phương). Lọc "hôm nay" bằng khoảng thời gian thay vì
+        __date để Postgres dùng được index trên cột thời gian.
+        """
+        return timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
     @staticmethod
+    def _sequence_key(station: ServiceStation, day: date) -> str:
+        return f"qms:seq:{station.id}:{day.strftime('%Y%m%d')}"
+
+    @staticmethod
+    def _max_daily_sequence(station: ServiceStation, day: date) -> int:
+        return QueueNumber.objects.filter(
+            station=station,
+            created_date=day
+        ).aggregate(max_seq=Max('daily_sequence'))['max_seq'] or 0
+
+    @staticmethod
+    def allocate_daily_sequence(station: ServiceStation, day: date) -> int:
+        """
+        Cấp số thứ tự tiếp theo trong ngày cho một điểm dịch vụ.
+
+        Redis INCR trên key (station, ngày): chi phí cố định, không phụ thuộc số lượt
+        check-in trong ngày, không trùng giữa nhiều kiosk/worker. Key chỉ được seed
+        bằng MAX(daily_sequence) khi chưa có (đầu ngày / Redis restart).
+
+        Redis không khả dụng → khóa dòng ServiceStation rồi lấy MAX + 1 (tuần tự hóa
+        theo station, vẫn không trùng).
+        """
+        seq = next_counter_value(
+            QueueService._sequence_key(station, day),
+            seed=lambda: QueueService._max_daily_sequence(station, day),
+            ttl=QueueService.SEQUENCE_TTL_SECONDS,
+        )
+        if seq is not None:
+            return seq
+
+        # Fallback: lock tới hết transaction bên ngoài
+        ServiceStation.objects.select_for_update().filter(id=station.id).first()
+        return QueueService._max_daily_sequence(station, day) + 1
+
+    @staticmethod
+    @timing.staged('queue_number')
     def generate_queue_number(visit, station: ServiceStation) -> QueueNumber:
         """
         Tạo số thứ tự mới cho bệnh nhân tại một điểm dịch vụ.
+        Dùng chung cho mọi luồng check-in (kiosk, vãng lai, đặt lịch, cấp cứu, chuyển phòng).
         
         Format: {station_code}-{YYYYMMDD}-{sequence:03d}
         VD: PK01-20260131-005
@@ -24,26 +82,37 @@ class QueueService:
         date_str = today.strftime('%Y%m%d')
         
         with transaction.atomic():
-            # Lấy số thứ tự lớn nhất trong ngày cho station này
-            max_seq = QueueNumber.objects.filter(
-                station=station,
-                created_date=today
-            ).aggregate(max_seq=Max('daily_sequence'))['max_seq']
-            
-            next_seq = (max_seq or 0) + 1
-            
-            # Tạo mã số thứ tự
-            number_code = f"{station.code}-{date_str}-{next_seq:03d}"
-            
-            queue_number = QueueNumber.objects.create(
-                number_code=number_code,
-                daily_sequence=next_seq,
-                visit=visit,
-                station=station,
-                created_date=today
+            next_seq = QueueService.allocate_daily_sequence(station, today)
+
+            for attempt in range(QueueService.SEQUENCE_MAX_RETRIES):
+                # Tạo mã số thứ tự
+                number_code = f"{station.code}-{date_str}-{next_seq:03d}"
+                try:
+                    with transaction.atomic():
+                        return QueueNumber.objects.create(
+                            number_code=number_code,
+                            daily_sequence=next_seq,
+                            visit=visit,
+                            station=station,
+                            created_date=today
+                        )
+                except IntegrityError:
+                    # Bộ đếm Redis bị tụt so với DB (VD: đã cấp số qua fallback) → kéo lên theo DB
+                    logger.warning(
+                        '[QUEUE_SEQ] %s conflict, resyncing counter (attempt %d)',
+                        number_code, attempt + 1,
+                    )
+                    floor = QueueService._max_daily_sequence(station, today)
+                    next_seq = raise_counter_floor(
+                        QueueService._sequence_key(station, today),
+                        floor,
+                        QueueService.SEQUENCE_TTL_SECONDS,
+                    ) or floor + 1
+
+            raise Exception(
+                f"Không thể cấp số thứ tự tại {station.code} sau "
+                f"{QueueService.SEQUENCE_MAX_RETRIES} lần thử."
             )
-            
-            return queue_number
     
     @staticmethod
     def add_to_queue(visit, station: ServiceStation, priority: int = 0) -> QueueEntry:
@@ -77,18 +146,72 @@ class QueueService:
         Gọi bệnh nhân tiếp theo trong hàng đợi.
         Trả về QueueEntry đã được cập nhật hoặc None nếu hàng đợi trống.
         """
-        # Tìm entry đang chờ có priority cao nhất và vào sớm nhất
-        next_entry = QueueEntry.objects.filter(
-            station=station,
-            status=QueueStatus.WAITING
-        ).order_by('-priority', 'entered_queue_time').first()
-        
-        if next_entry:
+        return QueueService.claim_next_waiting(station)
+
+    @staticmethod
+    def claim_next_waiting(station: ServiceStation, emergency_only: bool = False) -> QueueEntry | None:
+        """
+        Lấy entry WAITING tốt nhất (priority cao nhất, vào sớm nhất) và chuyển sang CALLED.
+
+        Ưu tiên pop nguyên tử từ Redis queue index (queue_store) — O(log n), an toàn
+        giữa nhiều worker. DB vẫn là nguồn sự thật: chỉ coi là "đã gọi" khi UPDATE có
+        điều kiện status=WAITING thành công; member cũ (stale) bị bỏ qua.
+        Redis không khả dụng → SELECT ... FOR UPDATE SKIP LOCKED trên DB.
+
+        Nhánh Redis dùng queryset .update() (không có post_save) nên tự publish
+        thay đổi lên bảng hiển thị; nhánh DB dùng save() → signals publish.
+        """
+        from . import board, queue_store
+
+        waiting = QueueEntry.objects.filter(station=station, status=QueueStatus.WAITING)
+        if emergency_only:
+            waiting = waiting.filter(source_type=QueueSourceType.EMERGENCY)
+
+        rebuilt = False
+        while True:
+            popped = queue_store.pop_next(station.id, emergency_only)
+            if popped == queue_store.UNAVAILABLE:
+                break
+            if popped == queue_store.NOT_READY:
+                # Index chưa nạp → nạp lại từ DB 1 lần. Index đã nạp mà rỗng thì tin index
+                # (không query DB mỗi lần "Next" khi hàng trống) — member thất lạc do
+                # queue_store.reconcile định kỳ bù lại.
+                if rebuilt or queue_store.rebuild_station(station.id) is None:
+                    break
+                rebuilt = True
+                continue
+            if popped is None:
+                return None
+
+            entry_id = popped.entry_id
+            now = timezone.now()
+            try:
+                called = QueueEntry.objects.filter(
+                    id=entry_id, status=QueueStatus.WAITING,
+                ).update(status=QueueStatus.CALLED, called_time=now, updated_at=now)
+            except Exception:
+                # Entry đã bị pop nhưng DB lỗi → trả lại đúng chỗ trong hàng.
+                # (Worker chết / transaction ngoài rollback sau khi pop → queue_store.reconcile định kỳ.)
+                queue_store.restore(station.id, popped)
+                raise
+            if called:
+                board.publish_changes(station.id, [entry_id])
+                return QueueEntry.objects.select_related(
+                    'queue_number', 'queue_number__visit', 'queue_number__visit__patient', 'station',
+                ).get(id=entry_id)
+            # Stale member (đã gọi/hủy ở nơi khác) → pop tiếp
+
+        # Fallback: DB với row lock
+        with transaction.atomic():
+            next_entry = waiting.select_for_update(
+                skip_locked=True, of=('self',),
+            ).order_by('-priority', 'entered_queue_time').first()
+            if next_entry is None:
+                return None
             next_entry.status = QueueStatus.CALLED
             next_entry.called_time = timezone.now()
-            next_entry.save()
-        
-        return next_entry
+            next_entry.save(update_fields=['status', 'called_time'])
+            return next_entry
     
     @staticmethod
     def start_service(entry: QueueEntry) -> QueueEntry:
@@ -104,10 +227,14 @@ class QueueService:
     def complete_service(entry: QueueEntry) -> QueueEntry:
         """
         Hoàn thành phục vụ bệnh nhân tại điểm dịch vụ.
+        Ghi nhận thời gian phục vụ vào mô hình ước tính thời gian chờ.
         """
+        from . import wait_estimator
+
         entry.status = QueueStatus.COMPLETED
         entry.end_time = timezone.now()
         entry.save()
+        transaction.on_commit(lambda: wait_estimator.observe_entry(entry))
         return entry
     
     @staticmethod
@@ -156,42 +283,82 @@ class QueueService:
         return list(entries)
     
     @staticmethod
-    def get_estimated_wait_time(station: ServiceStation, avg_service_time_minutes: int = 10) -> int:
+    def get_estimated_wait_time(station: ServiceStation, avg_service_time_minutes: float = None,
+                                queue_length: int = None) -> int:
         """
         Ước tính thời gian chờ (phút) dựa trên số người đang chờ.
         
         Args:
             station: Điểm dịch vụ
-            avg_service_time_minutes: Thời gian phục vụ trung bình mỗi bệnh nhân (phút)
+            avg_service_time_minutes: Thời gian phục vụ trung bình mỗi bệnh nhân (phút).
+                Mặc định lấy từ mô hình thực tế của station theo giờ trong ngày (wait_estimator).
+            queue_length: Số người đang chờ nếu caller đã biết (bỏ qua bước đếm)
         
         Returns:
             Thời gian chờ ước tính (phút)
         """
-        queue_length = QueueService.get_queue_length(station)
-        return queue_length * avg_service_time_minutes
+        from . import queue_store, wait_estimator
+
+        if queue_length is None:
+            queue_length = queue_store.waiting_count(station.id)
+        if queue_length is None:
+            queue_length = QueueService.get_queue_length(station)
+        if avg_service_time_minutes is None:
+            avg_service_time_minutes = wait_estimator.average_service_minutes(station.id)
+        return wait_estimator.estimate_wait_minutes(queue_length, avg_service_time_minutes)
     
     @staticmethod
-    def get_all_stations_status() -> list:
+    def stations_status_queryset():
+        """Các station active kèm waiting_count, in_progress_count, current_patient (1 query)."""
+        current_patient = QueueEntry.objects.filter(
+            station=OuterRef('pk'),
+            status=QueueStatus.IN_PROGRESS,
+        ).order_by('-priority', 'entered_queue_time').values('queue_number__number_code')[:1]
+
+        return ServiceStation.objects.filter(is_active=True).annotate(
+            active_entries=FilteredRelation(
+                'queue_entries',
+                condition=Q(queue_entries__status__in=[QueueStatus.WAITING, QueueStatus.IN_PROGRESS]),
+            ),
+        ).annotate(
+            waiting_count=Count('active_entries', filter=Q(active_entries__status=QueueStatus.WAITING)),
+            in_progress_count=Count('active_entries', filter=Q(active_entries__status=QueueStatus.IN_PROGRESS)),
+            current_patient=Subquery(current_patient),
+        ).order_by('code')
+
+    @staticmethod
+    def get_all_stations_status(use_cache: bool = True) -> list:
         """
         Lấy tình trạng tất cả các điểm dịch vụ đang hoạt động.
+
+        1 query duy nhất cho cả viện: JOIN chỉ các entry đang hoạt động (không quét
+        lịch sử), đếm có điều kiện theo trạng thái, bệnh nhân đang phục vụ lấy bằng
+        subquery. Kết quả cache vài giây.
         """
-        stations = ServiceStation.objects.filter(is_active=True)
-        result = []
-        
-        for station in stations:
-            waiting_count = QueueService.get_queue_length(station)
-            in_progress = QueueEntry.objects.filter(
-                station=station,
-                status=QueueStatus.IN_PROGRESS
-            ).first()
-            
-            result.append({
+        from . import wait_estimator
+
+        if use_cache:
+            cached = cache.get(QueueService.STATIONS_STATUS_CACHE_KEY)
+            if cached is not None:
+                return cached
+
+        stations = list(QueueService.stations_status_queryset())
+        avg_minutes = wait_estimator.average_service_minutes_many([station.id for station in stations])
+
+        result = [
+            {
                 'station': station,
-                'waiting_count': waiting_count,
-                'estimated_wait_minutes': QueueService.get_estimated_wait_time(station),
-                'current_patient': in_progress.queue_number.number_code if in_progress else None
-            })
-        
+                'waiting_count': station.waiting_count,
+                'in_progress_count': station.in_progress_count,
+                'estimated_wait_minutes': wait_estimator.estimate_wait_minutes(
+                    station.waiting_count, avg_minutes[str(station.id)],
+                ),
+                'current_patient': station.current_patient,
+            }
+            for station in stations
+        ]
+
+        cache.set(QueueService.STATIONS_STATUS_CACHE_KEY, result, QueueService.STATIONS_STATUS_CACHE_TTL)
         return result
 
 
@@ -220,6 +387,34 @@ class ClinicalQueueService:
     LATE_THRESHOLD_MILD = 15    # ≤15p: vẫn ưu tiên đầy đủ
     LATE_THRESHOLD_SEVERE = 30  # >30p: mất ưu tiên hoàn toàn
 
+    # Trạm mặc định tạo khi chưa có trạm nào thuộc loại này
+    DEFAULT_STATION_CODES = {
+        StationType.RECEPTION: 'TIEP-DON-01',
+        StationType.TRIAGE: 'PHAN-LUONG-01',
+        StationType.DOCTOR: 'PK-01',
+        StationType.LIS: 'LIS-01',
+        StationType.RIS: 'RIS-01',
+        StationType.PHARMACY: 'NHATHUOC-01',
+        StationType.CASHIER: 'THUNGAN-01',
+    }
+    DEFAULT_STATION_NAMES = {
+        StationType.RECEPTION: 'Quầy Tiếp Đón',
+        StationType.TRIAGE: 'Quầy Phân Luồng',
+        StationType.DOCTOR: 'Phòng Khám Bệnh',
+        StationType.LIS: 'Phòng Xét Nghiệm',
+        StationType.RIS: 'Phòng CĐHA',
+        StationType.PHARMACY: 'Nhà Thuốc',
+        StationType.CASHIER: 'Quầy Thu Ngân',
+    }
+    # Prefix mã phòng mặc định theo khoa
+    DEPARTMENT_STATION_PREFIXES = {
+        StationType.DOCTOR: 'PK',
+        StationType.LIS: 'XN',
+        StationType.RIS: 'CDHA',
+    }
+    CANDIDATES_CACHE_TTL = 60
+    CANDIDATES_VERSION_KEY = 'qms:candidates:version'
+
     @staticmethod
     def _evaluate_lateness(appointment, check_in_time=None):
         """
@@ -469,35 +664,28 @@ class ClinicalQueueService:
         Bác sĩ gọi bệnh nhân tiếp theo.
         """
         import logging
+        from . import wait_estimator
         logger = logging.getLogger('qms')
-        from datetime import date as date_cls
 
         logger.info('[CALL_NEXT] station=%s (id=%s)', station.code, station.id)
 
-        # Bước 0: Đếm số đang active (CALLED hoặc IN_PROGRESS) hôm nay
-        active_count = QueueEntry.objects.filter(
-            station=station,
-            status__in=[QueueStatus.CALLED, QueueStatus.IN_PROGRESS],
-            entered_queue_time__date=date_cls.today(),
-        ).count()
-
         # Bước 1: Quét Emergency — bỏ qua giới hạn
-        emergency = QueueEntry.objects.filter(
-            station=station,
-            status=QueueStatus.WAITING,
-            source_type=QueueSourceType.EMERGENCY,
-        ).order_by('entered_queue_time').first()
-        
+        emergency = QueueService.claim_next_waiting(station, emergency_only=True)
         if emergency:
-            emergency.status = QueueStatus.CALLED
-            emergency.called_time = timezone.now()
-            emergency.save(update_fields=['status', 'called_time'])
             logger.info('[CALL_NEXT] Called EMERGENCY entry=%s station_id=%s', emergency.id, emergency.station_id)
-            # TTS: pre-generate for upcoming patients
+            transaction.on_commit(lambda: wait_estimator.observe_call(station.id))
+            # TTS: pre-generate for upcoming patients (cửa sổ theo tốc độ gọi)
             ClinicalQueueService._trigger_tts_pre_generate(station)
             return ClinicalQueueService._format_called_entry(emergency)
 
         # Bước 2: Kiểm tra giới hạn (only for non-emergency)
+        # Đếm số đang active (CALLED hoặc IN_PROGRESS) hôm nay
+        active_count = QueueEntry.objects.filter(
+            station=station,
+            status__in=[QueueStatus.CALLED, QueueStatus.IN_PROGRESS],
+            entered_queue_time__gte=QueueService.start_of_today(),
+        ).count()
+
         if active_count >= ClinicalQueueService.MAX_CONCURRENT_CALLS:
             return {
                 'error': f'Đã đạt tối đa {ClinicalQueueService.MAX_CONCURRENT_CALLS} số đang gọi. '
@@ -506,22 +694,15 @@ class ClinicalQueueService:
             }
         
         # Bước 3: Gọi theo priority + FCFS
-        next_entry = QueueEntry.objects.filter(
-            station=station,
-            status=QueueStatus.WAITING,
-        ).order_by('-priority', 'entered_queue_time').first()
+        next_entry = QueueService.claim_next_waiting(station)
         
         if next_entry:
-            next_entry.status = QueueStatus.CALLED
-            next_entry.called_time = timezone.now()
-            next_entry.save(update_fields=['status', 'called_time'])
-            # Verify save succeeded
-            next_entry.refresh_from_db()
             logger.info(
                 '[CALL_NEXT] Called entry=%s station_id=%s status_after_save=%s',
                 next_entry.id, next_entry.station_id, next_entry.status
             )
-            # TTS: pre-generate for upcoming patients
+            transaction.on_commit(lambda: wait_estimator.observe_call(station.id))
+            # TTS: pre-generate for upcoming patients (cửa sổ theo tốc độ gọi)
             ClinicalQueueService._trigger_tts_pre_generate(station)
             return ClinicalQueueService._format_called_entry(next_entry)
         
@@ -543,35 +724,19 @@ class ClinicalQueueService:
         # Patient model dùng @property full_name (có underscore)
         patient_name = getattr(patient, 'full_name', None) or str(patient)
 
-        # TTS: get pre-generated audio URL (or trigger generation)
+        # TTS: chỉ đọc con trỏ clip — chưa có thì xếp task tạo, không chờ;
+        # màn hình nhận audio_ready khi clip xong
         audio_url = None
+        audio_pending = False
         try:
-            from .tts_service import get_audio_url, generate_tts_audio
-            import logging as _log
-            _tts_logger = _log.getLogger('qms.tts')
-            _tts_logger.info('[TTS] _format_called_entry: checking audio for entry=%s', entry.id)
+            from .tts_service import get_audio_url, request_audio
             audio_url = get_audio_url(str(entry.id))
             if not audio_url:
-                _tts_logger.info('[TTS] No cached audio, triggering generate_tts_audio for entry=%s', entry.id)
-                # Audio not pre-generated — trigger now and try to get result
-                task = generate_tts_audio.apply_async(
-                    args=[str(entry.id)],
-                    expires=30,
-                )
-                _tts_logger.info('[TTS] Task dispatched: task_id=%s, waiting up to 5s...', task.id)
-                # Wait briefly for result (up to 5 seconds)
-                try:
-                    result = task.get(timeout=5)
-                    _tts_logger.info('[TTS] Task result: %s', result)
-                    audio_url = result.get('audio_url') if isinstance(result, dict) else None
-                except Exception as inner_exc:
-                    _tts_logger.warning('[TTS] Task.get() failed: %s', inner_exc)
-            else:
-                _tts_logger.info('[TTS] Found cached audio_url=%s', audio_url)
+                audio_pending = request_audio(entry.id)
         except Exception as exc:
             import logging as _log
             _log.getLogger('qms.tts').error('[TTS] _format_called_entry error: %s', exc, exc_info=True)
-        
+
         return {
             'entry_id': str(entry.id),
             'visit_id': str(entry.queue_number.visit.id),
@@ -587,6 +752,41 @@ class ClinicalQueueService:
             'wait_time_minutes': entry.wait_time_minutes,
             'status': entry.status,
             'audio_url': audio_url,
+            'audio_pending': audio_pending,
+            'called_time': entry.called_time.isoformat() if entry.called_time else None,
+        }
+
+    @staticmethod
+    def _format_waiting_entry(entry, position=None):
+        """Format 1 dòng danh sách chờ (position do bảng LED tự tính khi nhận delta)"""
+        patient = entry.queue_number.visit.patient
+        return {
+            'position': position,
+            'entry_id': str(entry.id),
+            'queue_number': entry.queue_number.number_code,
+            'daily_sequence': entry.queue_number.daily_sequence,
+            'patient_name': getattr(patient, 'full_name', None) or str(patient),
+            'source_type': entry.source_type,
+            'priority': entry.priority,
+            'priority_label': entry.priority_label,
+            'wait_time_minutes': entry.wait_time_minutes,
+            'entered_queue_time': entry.entered_queue_time.isoformat() if entry.entered_queue_time else None,
+        }
+
+    @staticmethod
+    def _format_finished_entry(entry):
+        """Format 1 dòng đã xong / vắng mặt (COMPLETED, SKIPPED, NO_SHOW)"""
+        patient = entry.queue_number.visit.patient
+        return {
+            'entry_id': str(entry.id),
+            'visit_id': str(entry.queue_number.visit.id),
+            'queue_number': entry.queue_number.number_code,
+            'daily_sequence': entry.queue_number.daily_sequence,
+            'patient_name': getattr(patient, 'full_name', None) or str(patient),
+            'source_type': entry.source_type,
+            'status': entry.status,
+            'end_time': entry.end_time.strftime('%H:%M') if entry.end_time else None,
+            'ended_at': entry.end_time.isoformat() if entry.end_time else None,
         }
 
     @staticmethod
@@ -600,67 +800,88 @@ class ClinicalQueueService:
             logging.getLogger('qms').exception('Failed to trigger TTS pre-generation')
 
     @staticmethod
-    def get_optimal_station(station_type: StationType) -> ServiceStation:
+    def _candidate_stations(station_type, department=None) -> list:
         """
-        Tìm điểm dịch vụ có tải trọng (số người đang chờ hoặc đang phục vụ) thấp nhất
-        để phân luồng bệnh nhân vào nhằm cân bằng tải.
-        
-        Nếu chưa có trạm nào thuộc loại này thì tạo mới 1 trạm mặc định.
+        [(id, code)] các trạm active cùng loại (và cùng khoa) — cache ngắn,
+        đổi version khi ServiceStation thay đổi (signals). Trạm bị tắt mà cache
+        chưa hết hạn vẫn bị loại khi chọn (lọc is_active).
         """
-        import logging
-        logger = logging.getLogger('qms')
-        
-        # Chỉ các trạng thái xếp hàng trực tiếp mới tính là tải thực tế
-        active_statuses = [QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS]
-        
-        # Query stations of the requested type that are active
+        department_id = getattr(department, 'id', None)
+        version = cache.get_or_set(ClinicalQueueService.CANDIDATES_VERSION_KEY, 1, None)
+        cache_key = f'qms:candidates:{version}:{station_type}:{department_id or "*"}'
+        candidates = cache.get(cache_key)
+        if candidates is None:
+            stations = ServiceStation.objects.filter(station_type=station_type, is_active=True)
+            if department is not None:
+                stations = stations.filter(department=department)
+            candidates = list(stations.order_by('code').values_list('id', 'code'))
+            cache.set(cache_key, candidates, ClinicalQueueService.CANDIDATES_CACHE_TTL)
+        return candidates
+
+    @staticmethod
+    def _least_loaded_station(station_type, department=None):
+        """
+        Trạm có tải (WAITING / CALLED / IN_PROGRESS vào hàng hôm nay) thấp nhất, hòa thì theo mã.
+
+        Tải lấy từ bộ đếm live (station_load) — không JOIN/COUNT trên queue_entries.
+        Bộ đếm không khả dụng → đếm trong DB (chỉ JOIN các entry đang hoạt động).
+
+        Returns:
+            (station, load) hoặc (None, None) nếu không có trạm nào
+        """
+        from . import station_load
+
+        candidates = ClinicalQueueService._candidate_stations(station_type, department)
+        if not candidates:
+            return None, None
+
+        loads = station_load.get_loads([station_id for station_id, _ in candidates])
+        if loads is not None:
+            station_id, _ = min(candidates, key=lambda c: (loads.get(str(c[0]), 0), c[1]))
+            station = ServiceStation.objects.filter(id=station_id, is_active=True).first()
+            if station is not None:
+                return station, loads.get(str(station_id), 0)
+
         stations = ServiceStation.objects.filter(
-            station_type=station_type,
-            is_active=True
+            id__in=[station_id for station_id, _ in candidates],
+            is_active=True,
         ).annotate(
-            active_load=Count(
+            active_entries=FilteredRelation(
                 'queue_entries',
-                filter=Q(
-                    queue_entries__status__in=active_statuses,
-                    queue_entries__entered_queue_time__date=timezone.now().date()
-                )
-            )
+                condition=Q(
+                    queue_entries__status__in=[QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS],
+                    queue_entries__entered_queue_time__gte=QueueService.start_of_today(),
+                ),
+            ),
+        ).annotate(
+            active_load=Count('active_entries'),
         ).order_by('active_load', 'code')
+        station = stations.first()
+        return (station, station.active_load) if station else (None, None)
+
+    @staticmethod
+    @timing.staged('station')
+    def get_optimal_station(station_type: StationType) -> ServiceStation:
+        """
+        Tìm điểm dịch vụ có tải trọng (số người đang chờ hoặc đang phục vụ) thấp nhất
+        để phân luồng bệnh nhân vào nhằm cân bằng tải.
         
-        optimal_station = stations.first()
+        Nếu chưa có trạm nào thuộc loại này thì tạo mới 1 trạm mặc định.
+        """
+        optimal_station, load = ClinicalQueueService._least_loaded_station(station_type)
         
         if optimal_station:
             logger.info(
                 f"[LOAD_BALANCE] Chọn điểm {optimal_station.code} ({optimal_station.name}) "
-                f"cho type {station_type} với tải {optimal_station.active_load}"
+                f"cho type {station_type} với tải {load}"
             )
             return optimal_station
             
         # Fallback: Create a default station if none exists
         logger.warning(f"[LOAD_BALANCE] Không tìm thấy điểm dịch vụ active nào loại {station_type}. Tạo mới.")
         
-        # Mặc định tạo trạm dựa trên tên loại
-        default_codes = {
-            StationType.RECEPTION: 'TIEP-DON-01',
-            StationType.TRIAGE: 'PHAN-LUONG-01',
-            StationType.DOCTOR: 'PK-01',
-            StationType.LIS: 'LIS-01',
-            StationType.RIS: 'RIS-01',
-            StationType.PHARMACY: 'NHATHUOC-01',
-            StationType.CASHIER: 'THUNGAN-01',
-        }
-        default_names = {
-            StationType.RECEPTION: 'Quầy Tiếp Đón',
-            StationType.TRIAGE: 'Quầy Phân Luồng',
-            StationType.DOCTOR: 'Phòng Khám Bệnh',
-            StationType.LIS: 'Phòng Xét Nghiệm',
-            StationType.RIS: 'Phòng CĐHA',
-            StationType.PHARMACY: 'Nhà Thuốc',
-            StationType.CASHIER: 'Quầy Thu Ngân',
-        }
-        
-        code = default_codes.get(station_type, f"{station_type}-01")
-        name = default_names.get(station_type, f"Điểm dịch vụ {station_type}")
+        code = ClinicalQueueService.DEFAULT_STATION_CODES.get(station_type, f"{station_type}-01")
+        name = ClinicalQueueService.DEFAULT_STATION_NAMES.get(station_type, f"Điểm dịch vụ {station_type}")
         
         station = ServiceStation.objects.create(
             code=code,
@@ -678,31 +899,12 @@ class ClinicalQueueService:
         
         Nếu chưa có trạm nào thuộc khoa này đang active, tạo mới 1 trạm mặc định cho khoa đó.
         """
-        import logging
-        logger = logging.getLogger('qms')
-        
-        active_statuses = [QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS]
-        
-        stations = ServiceStation.objects.filter(
-            station_type=station_type,
-            department=department,
-            is_active=True
-        ).annotate(
-            active_load=Count(
-                'queue_entries',
-                filter=Q(
-                    queue_entries__status__in=active_statuses,
-                    queue_entries__entered_queue_time__date=timezone.now().date()
-                )
-            )
-        ).order_by('active_load', 'code')
-        
-        optimal_station = stations.first()
+        optimal_station, load = ClinicalQueueService._least_loaded_station(station_type, department)
         
         if optimal_station:
             logger.info(
                 f"[LOAD_BALANCE] Chọn phòng {optimal_station.code} ({optimal_station.name}) "
-                f"thuộc khoa {department.name} với tải {optimal_station.active_load}"
+                f"thuộc khoa {department.name} với tải {load}"
             )
             return optimal_station
             
@@ -714,13 +916,7 @@ class ClinicalQueueService:
         import uuid
         short_id = str(uuid.uuid4())[:4].upper()
         
-        # Mặc định prefix cho khoa
-        prefix_map = {
-            StationType.DOCTOR: 'PK',
-            StationType.LIS: 'XN',
-            StationType.RIS: 'CDHA',
-        }
-        prefix = prefix_map.get(station_type, str(station_type))
+        prefix = ClinicalQueueService.DEPARTMENT_STATION_PREFIXES.get(station_type, str(station_type))
         dept_code = department.code if getattr(department, 'code', None) else "DEPT"
         
         code = f"{prefix}-{dept_code}-{short_id}"
@@ -734,74 +930,6 @@ class ClinicalQueueService:
             is_active=True,
         )
         return station
-        """
-        Tìm điểm dịch vụ có tải trọng (số người đang chờ hoặc đang phục vụ) thấp nhất
-        để phân luồng bệnh nhân vào nhằm cân bằng tải.
-        
-        Nếu chưa có trạm nào thuộc loại này thì tạo mới 1 trạm mặc định.
-        """
-        import logging
-        logger = logging.getLogger('qms')
-        
-        # Chỉ các trạng thái xếp hàng trực tiếp mới tính là tải thực tế
-        active_statuses = [QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS]
-        
-        # Query stations of the requested type that are active
-        stations = ServiceStation.objects.filter(
-            station_type=station_type,
-            is_active=True
-        ).annotate(
-            active_load=Count(
-                'queue_entries',
-                filter=Q(
-                    queue_entries__status__in=active_statuses,
-                    queue_entries__entered_queue_time__date=timezone.now().date()
-                )
-            )
-        ).order_by('active_load', 'code')
-        
-        optimal_station = stations.first()
-        
-        if optimal_station:
-            logger.info(
-                f"[LOAD_BALANCE] Chọn điểm {optimal_station.code} ({optimal_station.name}) "
-                f"cho type {station_type} với tải {optimal_station.active_load}"
-            )
-            return optimal_station
-            
-        # Fallback: Create a default station if none exists
-        logger.warning(f"[LOAD_BALANCE] Không tìm thấy điểm dịch vụ active nào loại {station_type}. Tạo mới.")
-        
-        # Mặc định tạo trạm dựa trên tên loại
-        default_codes = {
-            StationType.RECEPTION: 'TIEP-DON-01',
-            StationType.TRIAGE: 'PHAN-LUONG-01',
-            StationType.DOCTOR: 'PK-01',
-            StationType.LIS: 'LIS-01',
-            StationType.RIS: 'RIS-01',
-            StationType.PHARMACY: 'NHATHUOC-01',
-            StationType.CASHIER: 'THUNGAN-01',
-        }
-        default_names = {
-            StationType.RECEPTION: 'Quầy Tiếp Đón',
-            StationType.TRIAGE: 'Quầy Phân Luồng',
-            StationType.DOCTOR: 'Phòng Khám Bệnh',
-            StationType.LIS: 'Phòng Xét Nghiệm',
-            StationType.RIS: 'Phòng CĐHA',
-            StationType.PHARMACY: 'Nhà Thuốc',
-            StationType.CASHIER: 'Quầy Thu Ngân',
-        }
-        
-        code = default_codes.get(station_type, f"{station_type}-01")
-        name = default_names.get(station_type, f"Điểm dịch vụ {station_type}")
-        
-        station = ServiceStation.objects.create(
-            code=code,
-            name=name,
-            station_type=station_type,
-            is_active=True,
-        )
-        return station
 
     @staticmethod
     def get_queue_board(station):
@@ -817,7 +945,6 @@ class ClinicalQueueService:
                 estimated_wait_minutes: int,
             }
         """
-        from datetime import date as date_cls
         import logging
         logger = logging.getLogger('qms')
 
@@ -868,19 +995,7 @@ class ClinicalQueueService:
         waiting_list = []
         for idx, entry in enumerate(waiting):
             try:
-                patient = entry.queue_number.visit.patient
-                patient_name = getattr(patient, 'full_name', None) or str(patient)
-                waiting_list.append({
-                    'position': idx + 1,
-                    'entry_id': str(entry.id),
-                    'queue_number': entry.queue_number.number_code,
-                    'daily_sequence': entry.queue_number.daily_sequence,
-                    'patient_name': patient_name,
-                    'source_type': entry.source_type,
-                    'priority': entry.priority,
-                    'priority_label': entry.priority_label,
-                    'wait_time_minutes': entry.wait_time_minutes,
-                })
+                waiting_list.append(ClinicalQueueService._format_waiting_entry(entry, idx + 1))
             except Exception as exc:
                 logger.error('waiting_list entry failed for entry %s: %s', entry.id, exc)
 
@@ -888,7 +1003,7 @@ class ClinicalQueueService:
         done_entries = QueueEntry.objects.filter(
             station=station,
             status__in=[QueueStatus.COMPLETED, QueueStatus.SKIPPED],
-            end_time__date=date_cls.today(),
+            end_time__gte=QueueService.start_of_today(),
         ).order_by('-end_time').select_related(
             'queue_number',
             'queue_number__visit',
@@ -898,17 +1013,7 @@ class ClinicalQueueService:
         completed_list = []
         for entry in done_entries:
             try:
-                patient = entry.queue_number.visit.patient
-                patient_name = getattr(patient, 'full_name', None) or str(patient)
-                completed_list.append({
-                    'entry_id': str(entry.id),
-                    'queue_number': entry.queue_number.number_code,
-                    'daily_sequence': entry.queue_number.daily_sequence,
-                    'patient_name': patient_name,
-                    'source_type': entry.source_type,
-                    'status': entry.status,
-                    'end_time': entry.end_time.strftime('%H:%M') if entry.end_time else None,
-                })
+                completed_list.append(ClinicalQueueService._format_finished_entry(entry))
             except Exception as exc:
                 logger.error('completed_list entry failed for entry %s: %s', entry.id, exc)
 
@@ -916,7 +1021,7 @@ class ClinicalQueueService:
         noshow_entries = QueueEntry.objects.filter(
             station=station,
             status=QueueStatus.NO_SHOW,
-            end_time__date=date_cls.today(),
+            end_time__gte=QueueService.start_of_today(),
         ).order_by('-end_time').select_related(
             'queue_number',
             'queue_number__visit',
@@ -926,18 +1031,7 @@ class ClinicalQueueService:
         no_show_list = []
         for entry in noshow_entries:
             try:
-                patient = entry.queue_number.visit.patient
-                patient_name = getattr(patient, 'full_name', None) or str(patient)
-                no_show_list.append({
-                    'entry_id': str(entry.id),
-                    'visit_id': str(entry.queue_number.visit.id),
-                    'queue_number': entry.queue_number.number_code,
-                    'daily_sequence': entry.queue_number.daily_sequence,
-                    'patient_name': patient_name,
-                    'source_type': entry.source_type,
-                    'status': entry.status,
-                    'end_time': entry.end_time.strftime('%H:%M') if entry.end_time else None,
-                })
+                no_show_list.append(ClinicalQueueService._format_finished_entry(entry))
             except Exception as exc:
                 logger.error('no_show_list entry failed for entry %s: %s', entry.id, exc)
         
@@ -951,6 +1045,8 @@ class ClinicalQueueService:
             'completed_list': completed_list,
             'no_show_list': no_show_list,
             'total_waiting': len(waiting_list),
-            'estimated_wait_minutes': len(waiting_list) * 10,
+            'estimated_wait_minutes': QueueService.get_estimated_wait_time(
+                station, queue_length=len(waiting_list),
+            ),
         }
 
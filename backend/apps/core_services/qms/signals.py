@@ -0,0 +1,61 @@
+"""
+Signals for QMS app.
+Keeps the Redis queue index (queue_store) and the live station load counters
+(station_load) in sync with QueueEntry rows, and publishes every entry change
+to the display boards / board snapshot (board).
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import board, queue_store, station_load
+from .models import QueueEntry, QueueStatus, ServiceStation
+
+
+@receiver(post_save, sender=QueueEntry)
+def sync_queue_index_on_save(sender, instance, **kwargs):
+    """
+    Mirror the entry into the station index after the transaction commits,
+    so rolled-back check-ins never become callable.
+    """
+    args = (
+        instance.id,
+        instance.station_id,
+        instance.status,
+        instance.priority,
+        instance.source_type,
+        instance.entered_queue_time,
+    )
+    load_args = (instance.id, instance.station_id, instance.status, instance.entered_queue_time)
+    transaction.on_commit(lambda: queue_store.sync_entry(*args))
+    transaction.on_commit(lambda: station_load.sync_entry(*load_args))
+    board.publish_changes(instance.station_id, [instance.id])
+
+
+@receiver(post_delete, sender=QueueEntry)
+def remove_from_queue_index_on_delete(sender, instance, **kwargs):
+    args = (
+        instance.id,
+        instance.station_id,
+        QueueStatus.COMPLETED,
+        instance.priority,
+        instance.source_type,
+        instance.entered_queue_time,
+    )
+    load_args = (instance.id, instance.station_id, QueueStatus.COMPLETED, instance.entered_queue_time)
+    transaction.on_commit(lambda: queue_store.sync_entry(*args))
+    transaction.on_commit(lambda: station_load.sync_entry(*load_args))
+    board.publish_changes(instance.station_id, [instance.id])
+
+
+@receiver([post_save, post_delete], sender=ServiceStation)
+def invalidate_station_candidates(sender, instance, **kwargs):
+    """Danh sách trạm dùng để phân luồng (get_optimal_station) được cache ngắn → đổi version."""
+    from .services import ClinicalQueueService
+
+    try:
+        cache.incr(ClinicalQueueService.CANDIDATES_VERSION_KEY)
+    except ValueError:
+        cache.set(ClinicalQueueService.CANDIDATES_VERSION_KEY, 1, None)
@@ -0,0 +1,139 @@
+"""
+QMS Station Load — live count of active patients per station for routing.
+
+Each station has a Redis SET `qms:load:{station_id}` holding the ids of its
+entries that count as load: WAITING / CALLED / IN_PROGRESS and entered the
+queue today. QueueEntry signals add/remove the entry on every save (SADD /
+SREM are idempotent, so no "previous status" bookkeeping is needed) and the
+load of a station is a SCARD.
+
+The sets are reconciled from the database by a periodic Celery task (drops
+yesterday's leftovers, fixes drift from queryset .update() calls that bypass
+signals). The `qms:load:ready` marker expires if that task stops running; the
+next reader then reconciles inline (one caller at a time, the others fall
+back to counting in the database).
+"""
+
+import logging
+
+import redis
+from django.utils import timezone
+
+from apps.core_services.core.utils import get_redis_client, timing
+
+logger = logging.getLogger('qms')
+
+READY_KEY = 'qms:load:ready'
+RECONCILE_LOCK_KEY = 'qms:load:reconciling'
+READY_TTL = 15 * 60   # must be refreshed by the periodic reconcile
+SET_TTL = 2 * 86400   # a station that gets no traffic loses its set
+
+
+def _key(station_id) -> str:
+    return f'qms:load:{station_id}'
+
+
+def _active_statuses():
+    from .models import QueueStatus
+    return (QueueStatus.WAITING, QueueStatus.CALLED, QueueStatus.IN_PROGRESS)
+
+
+def _start_of_today():
+    return timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_active(status, entered_queue_time) -> bool:
+    return (
+        status in _active_statuses()
+        and entered_queue_time is not None
+        and entered_queue_time >= _start_of_today()
+    )
+
+
+@timing.staged('queue_index')
+def sync_entry(entry_id, station_id, status, entered_queue_time) -> None:
+    """Add/remove one entry from its station's load set (called after commit)."""
+    client = get_redis_client()
+    if client is None:
+        return
+    key = _key(station_id)
+    try:
+        if is_active(status, entered_queue_time):
+            pipe = client.pipeline(transaction=False)
+            pipe.sadd(key, str(entry_id))
+            pipe.expire(key, SET_TTL)
+            pipe.execute()
+        else:
+            client.srem(key, str(entry_id))
+    except redis.RedisError as e:
+        logger.warning('[STATION_LOAD] sync failed for entry=%s: %s', entry_id, e)
+
+
+def _read_loads(client, station_ids):
+    pipe = client.pipeline(transaction=False)
+    pipe.exists(READY_KEY)
+    for station_id in station_ids:
+        pipe.scard(_key(station_id))
+    ready, *counts = pipe.execute()
+    return dict(zip(station_ids, counts)) if ready else None
+
+
+def get_loads(station_ids):
+    """
+    {station_id (str): active load} for the given stations, or None when the
+    counters cannot be trusted (Redis down / stale and being reconciled).
+    """
+    client = get_redis_client()
+    if client is None:
+        return None
+    station_ids = [str(station_id) for station_id in station_ids]
+    try:
+        loads = _read_loads(client, station_ids)
+        if loads is None and client.set(RECONCILE_LOCK_KEY, 1, nx=True, ex=30):
+            try:
+                reconcile()
+            finally:
+                client.delete(RECONCILE_LOCK_KEY)
+            loads = _read_loads(client, station_ids)
+    except redis.RedisError as e:
+        logger.warning('[STATION_LOAD] read failed: %s', e)
+        return None
+    return loads
+
+
+def reconcile() -> int | None:
+    """
+    Rebuild every station's load set from the database.
+    Returns the number of active entries, or None if Redis is unavailable.
+    """
+    from .models import QueueEntry, ServiceStation
+
+    client = get_redis_client()
+    if client is None:
+        return None
+
+    members = {}
+    rows = QueueEntry.objects.filter(
+        status__in=_active_statuses(),
+        entered_queue_time__gte=_start_of_today(),
+    ).values_list('station_id', 'id')
+    for station_id, entry_id in rows.iterator(chunk_size=2000):
+        members.setdefault(str(station_id), []).append(str(entry_id))
+
+    station_ids = ServiceStation.objects.values_list('id', flat=True)
+    try:
+        pipe = client.pipeline(transaction=True)
+        for station_id in station_ids:
+            pipe.delete(_key(station_id))
+        for station_id, entry_ids in members.items():
+            pipe.sadd(_key(station_id), *entry_ids)
+            pipe.expire(_key(station_id), SET_TTL)
+        pipe.set(READY_KEY, 1, ex=READY_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[STATION_LOAD] reconcile failed: %s', e)
+        return None
+
+    total = sum(len(entry_ids) for entry_ids in members.values())
+    logger.info('[STATION_LOAD] Reconciled %d stations, %d active entries', len(members), total)
+    return total
@@ -5,8 +5,34 @@ autodiscover_tasks() only imports 'tasks.py'. This file re-exports
 the actual TTS tasks from tts_service.py so Celery workers can find them.
 """
 
+from celery import shared_task
+
 from .tts_service import (  # noqa: F401
     generate_tts_audio,
     pre_generate_for_upcoming,
     cleanup_old_audio,
 )
+
+
+@shared_task
+def flush_stale_boards() -> dict:
+    """Gửi các thay đổi bảng hiển thị bị treo (timer gộp push mất theo worker bị restart)."""
+    from .board import flush_stale
+
+    return {'stations': flush_stale()}
+
+
+@shared_task
+def reconcile_station_load() -> dict:
+    """Đồng bộ lại bộ đếm tải của các station (station_load) với DB."""
+    from .station_load import reconcile
+
+    return {'active_entries': reconcile()}
+
+
+@shared_task
+def reconcile_queue_index() -> dict:
+    """Trả lại Redis queue index các entry WAITING bị pop nhưng chưa gọi được (queue_store)."""
+    from .queue_store import reconcile
+
+    return {'waiting_entries': reconcile()}
@@ -0,0 +1,783 @@
+"""
+QMS Tests — Hàng chờ lâm sàng
+
+Tests:
+  1. Call next - Emergency → Priority → FCFS; gọi qua Redis index (.update()) vẫn publish lên bảng
+  2. Call next - Giới hạn số đang gọi (emergency bỏ qua giới hạn)
+  3. Call next - Entry đã bị xử lý ở nơi khác không bị gọi lại; pop mà không gọi được (DB lỗi / rollback) → trả lại index
+  4. STT trong ngày - tăng dần, tự đồng bộ khi bộ đếm bị tụt so với DB
+  5. Board delta - entry chuyển đúng section, consumer resync khi mất gói
+  6. Board coalescing - nhiều thay đổi liên tiếp → 1 lần push; timer mất → sweeper gửi (cần Redis)
+  7. Board snapshot - áp delta lên bảng, connect/REST đọc snapshot không query DB
+  8. Tổng quan station - 1 query cho mọi station, cache vài giây
+  9. Ước tính thời gian chờ - học từ thời gian phục vụ thực tế (cần Redis)
+  10. Phân luồng - chọn station tải thấp nhất, bộ đếm live không quét queue_entries
+  11. Index advisor - query nóng không Seq Scan queue_entries trên dữ liệu lớn
+  12. TTS segment cache - chỉ tổng hợp tên bệnh nhân, clip ghép là chuỗi frame MP3 hợp lệ
+  13. TTS store - clip theo hash (câu, giọng) dùng chung, evict theo LRU / tuổi (cần Redis)
+  14. Audio không chặn - gọi số trả về ngay (audio_pending), audio_ready khi clip xong (cần Redis)
+  15. Tạo trước TTS - 1 lô cho cả cửa sổ, cửa sổ theo tốc độ gọi của phòng (cần Redis)
+  16. Frame bảng - serialize 1 lần cho mọi màn hình, consumer chỉ chuyển tiếp (không json.dumps)
+"""
+
+import json
+import shutil
+import tempfile
+import time
+from unittest.mock import AsyncMock, patch
+
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.core_services.core.utils import get_redis_client
+from apps.core_services.patients.models import Patient
+from apps.core_services.reception.models import Visit
+from .models import ServiceStation, StationType, QueueNumber, QueueEntry, QueueStatus, QueueSourceType
+from .services import QueueService, ClinicalQueueService
+from . import board, index_advisor, queue_store, tts_segments, tts_service, tts_store, wait_estimator
+from .tts_service import generate_tts_audio, synthesize_announcement
+from .tts_synthesizers import OfflineSynthesizer, SILENT_FRAME, iter_frames, mp3_frames
+from . import consumers
+from .consumers import ClinicalConsumer, QueueDisplayConsumer
+
+
+class QueueTestMixin:
+    """Helpers tạo bệnh nhân / lượt khám / phiếu xếp hàng."""
+
+    def _make_station(self, code='PK-TEST-01'):
+        return ServiceStation.objects.create(
+            code=code,
+            name='Phòng khám Test',
+            station_type=StationType.DOCTOR,
+            is_active=True,
+        )
+
+    def _enqueue(self, station, idx, priority=0, source_type=QueueSourceType.WALK_IN):
+        patient = Patient.objects.create(
+            patient_code=f'BN-{station.code}-{idx:03d}',
+            first_name=f'Test{idx}',
+            last_name='Nguyen',
+            insurance_number=f'DN79100000{idx:05d}',
+        )
+        visit = Visit.objects.create(
+            patient=patient,
+            visit_code=f'V-{station.code}-{idx:03d}',
+            status=Visit.Status.WAITING,
+            queue_number=idx,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            queue_number = QueueService.generate_queue_number(visit, station)
+            return QueueEntry.objects.create(
+                queue_number=queue_number,
+                station=station,
+                status=QueueStatus.WAITING,
+                priority=priority,
+                source_type=source_type,
+            )
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class CallNextTests(QueueTestMixin, TestCase):
+    """Thuật toán gọi số: Emergency → Priority → FCFS."""
+
+    def setUp(self):
+        self.station = self._make_station()
+
+    def test_call_order(self):
+        """Cấp cứu trước, rồi priority cao, cùng priority thì ai vào trước gọi trước."""
+        walkin_1 = self._enqueue(self.station, 1, priority=0)
+        booking = self._enqueue(self.station, 2, priority=ClinicalQueueService.PRIORITY_BOOKING_ON_TIME)
+        walkin_2 = self._enqueue(self.station, 3, priority=0)
+        emergency = self._enqueue(
+            self.station, 4,
+            priority=ClinicalQueueService.PRIORITY_EMERGENCY,
+            source_type=QueueSourceType.EMERGENCY,
+        )
+
+        called = []
+        for _ in range(4):
+            entry = QueueService.call_next_patient(self.station)
+            called.append(entry.id)
+            # Hoàn thành để không chạm giới hạn MAX_CONCURRENT_CALLS
+            QueueService.complete_service(entry)
+
+        self.assertEqual(called, [emergency.id, booking.id, walkin_1.id, walkin_2.id])
+        self.assertIsNone(QueueService.call_next_patient(self.station))
+
+    def test_redis_call_publishes_board(self):
+        """Nhánh Redis chuyển CALLED bằng .update() (không post_save) → tự publish lên bảng."""
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        entry = self._enqueue(self.station, 1)
+
+        with patch.object(board, 'publish_changes') as publish:
+            called = QueueService.call_next_patient(self.station)
+
+        self.assertEqual(called.id, entry.id)
+        publish.assert_called_once_with(self.station.id, [str(entry.id)])
+
+    def test_empty_index_skips_db(self):
+        """Index đã nạp mà rỗng → trả None không query DB (hàng trống, bác sĩ bấm "Next" liên tục)."""
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        entry = self._enqueue(self.station, 1)
+        QueueService.call_next_patient(self.station)
+        QueueService.complete_service(entry)
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(QueueService.call_next_patient(self.station))
+
+    def test_max_concurrent_calls(self):
+        """Đủ MAX_CONCURRENT_CALLS số đang gọi → chặn, trừ cấp cứu."""
+        for i in range(ClinicalQueueService.MAX_CONCURRENT_CALLS + 1):
+            self._enqueue(self.station, i + 1)
+
+        for _ in range(ClinicalQueueService.MAX_CONCURRENT_CALLS):
+            result = ClinicalQueueService.call_next_patient(self.station)
+            self.assertNotIn('error', result)
+
+        blocked = ClinicalQueueService.call_next_patient(self.station)
+        self.assertIn('error', blocked)
+
+        emergency = self._enqueue(
+            self.station, 99,
+            priority=ClinicalQueueService.PRIORITY_EMERGENCY,
+            source_type=QueueSourceType.EMERGENCY,
+        )
+        result = ClinicalQueueService.call_next_patient(self.station)
+        self.assertEqual(result['entry_id'], str(emergency.id))
+
+    def test_skips_entries_changed_elsewhere(self):
+        """Entry đã bị bỏ qua (không qua hàng chờ) không được gọi lại."""
+        first = self._enqueue(self.station, 1, priority=5)
+        second = self._enqueue(self.station, 2, priority=0)
+
+        # Cập nhật trực tiếp bằng queryset (không có signal) → index có thể còn member cũ
+        QueueEntry.objects.filter(id=first.id).update(status=QueueStatus.SKIPPED)
+
+        entry = QueueService.call_next_patient(self.station)
+        self.assertEqual(entry.id, second.id)
+        self.assertEqual(entry.status, QueueStatus.CALLED)
+
+    def test_unclaimed_pop_is_restored(self):
+        """Entry bị pop nhưng UPDATE lỗi / transaction ngoài rollback → vẫn giữ chỗ trong hàng."""
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        emergency = self._enqueue(
+            self.station, 1,
+            priority=ClinicalQueueService.PRIORITY_EMERGENCY,
+            source_type=QueueSourceType.EMERGENCY,
+        )
+        walkin = self._enqueue(self.station, 2)
+        queue_store.rebuild_station(self.station.id)
+
+        with patch.object(QuerySet, 'update', side_effect=DatabaseError('db down')):
+            with self.assertRaises(DatabaseError):
+                QueueService.claim_next_waiting(self.station, emergency_only=True)
+        self.assertEqual(queue_store.waiting_count(self.station.id), 2)
+
+        # Transaction ngoài rollback sau khi pop → reconcile định kỳ trả lại
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            QueueService.claim_next_waiting(self.station, emergency_only=True)
+            raise RuntimeError('rollback')
+        self.assertEqual(queue_store.waiting_count(self.station.id), 1)
+        self.assertEqual(queue_store.reconcile(), 2)
+
+        called = [QueueService.claim_next_waiting(self.station).id for _ in range(2)]
+        self.assertEqual(called, [emergency.id, walkin.id])
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class DailySequenceTests(QueueTestMixin, TestCase):
+    """Cấp số thứ tự trong ngày theo (station, ngày)."""
+
+    def setUp(self):
+        self.station = self._make_station('PK-SEQ-01')
+
+    def test_sequence_increments(self):
+        seqs = [self._enqueue(self.station, i).queue_number.daily_sequence for i in range(1, 4)]
+        self.assertEqual(seqs, [1, 2, 3])
+
+    def test_sequence_resyncs_after_external_number(self):
+        """Số đã được cấp ngoài bộ đếm (VD: fallback DB) → không trùng, nhảy qua."""
+        first = self._enqueue(self.station, 1)
+        QueueNumber.objects.create(
+            number_code=f'{self.station.code}-MANUAL-002',
+            daily_sequence=2,
+            visit=first.queue_number.visit,
+            station=self.station,
+            created_date=first.queue_number.created_date,
+        )
+
+        entry = self._enqueue(self.station, 3)
+        self.assertEqual(entry.queue_number.daily_sequence, 3)
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class BoardDeltaTests(QueueTestMixin, TestCase):
+    """Bảng LED: chỉ gửi entry thay đổi (queue_delta) kèm seq."""
+
+    def setUp(self):
+        self.station = self._make_station('PK-BRD-01')
+
+    def test_delta_sections(self):
+        entry = self._enqueue(self.station, 1)
+        delta = board.build_delta(self.station, [entry.id])
+        self.assertEqual(delta['changes'][0]['op'], 'upsert')
+        self.assertEqual(delta['changes'][0]['section'], board.SECTION_WAITING)
+        self.assertEqual(delta['total_waiting'], 1)
+
+        entry.status = QueueStatus.COMPLETED
+        entry.end_time = timezone.now()
+        entry.save(update_fields=['status', 'end_time'])
+        delta = board.build_delta(self.station, [entry.id])
+        self.assertEqual(delta['changes'][0]['section'], board.SECTION_COMPLETED)
+        self.assertEqual(delta['total_waiting'], 0)
+
+    def test_delta_removes_missing_entry(self):
+        entry = self._enqueue(self.station, 1)
+        other = self._make_station('PK-BRD-02')
+        delta = board.build_delta(other, [entry.id])
+        self.assertEqual(delta['changes'], [{'op': 'remove', 'entry_id': str(entry.id)}])
+
+    def test_consumer_seq_check(self):
+        consumer = QueueDisplayConsumer()
+        consumer.board_seq = 10
+        self.assertEqual(consumer.check_seq(11), 'send')
+        self.assertEqual(consumer.check_seq(10), 'drop')
+        self.assertEqual(consumer.check_seq(13), 'resync')
+        consumer.board_seq = None
+        self.assertEqual(consumer.check_seq(11), 'resync')
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=150)
+class BoardCoalescingTests(QueueTestMixin, TestCase):
+    """Gộp thay đổi trong cửa sổ QMS_BOARD_COALESCE_MS thành 1 lần push."""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        self.station = self._make_station('PK-BRD-03')
+
+    def test_burst_is_sent_once(self):
+        with patch.object(board, '_schedule_flush') as schedule, \
+                patch.object(board, '_group_send') as send:
+            # Mỗi lần lưu QueueEntry (signal) + view publish lại cùng entry
+            entries = [self._enqueue(self.station, i) for i in range(1, 4)]
+            with self.captureOnCommitCallbacks(execute=True):
+                board.publish_changes(self.station, [entries[0].id])
+            self.assertEqual(schedule.call_count, 1)
+
+            board.flush_station(self.station.id)
+
+        self.assertEqual(send.call_count, 1)
+        message = json.loads(send.call_args[0][1]['frame'])
+        self.assertEqual(message['type'], 'queue_delta')
+        self.assertEqual(
+            {change['entry']['entry_id'] for change in message['changes']},
+            {str(entry.id) for entry in entries},
+        )
+
+    def test_lost_timer_flushed_by_sweeper(self):
+        """Timer gộp push mất theo worker → flush_stale (beat) vẫn gửi, không chờ thay đổi kế tiếp."""
+        with patch.object(board, '_schedule_flush'), patch.object(board, '_group_send') as send:
+            entry = self._enqueue(self.station, 1)  # timer "mất": không ai flush
+            self.assertEqual(board.flush_stale(), 0)  # chưa quá STALE_FLUSH_MS
+            self.assertEqual(board.flush_stale(older_than_ms=0), 1)
+            self.assertEqual(board.flush_stale(older_than_ms=0), 0)
+
+        self.assertEqual(send.call_count, 1)
+        message = json.loads(send.call_args[0][1]['frame'])
+        self.assertEqual([change['entry']['entry_id'] for change in message['changes']], [str(entry.id)])
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class BoardSnapshotTests(QueueTestMixin, TestCase):
+    """Snapshot bảng LED trong Redis, cập nhật theo delta."""
+
+    def setUp(self):
+        self.station = self._make_station('PK-BRD-04')
+
+    def test_apply_delta(self):
+        snapshot = {
+            'currently_serving': [],
+            'waiting_list': [
+                {'entry_id': 'a', 'priority': 0, 'entered_queue_time': '2026-01-31T08:00:00+00:00'},
+                {'entry_id': 'b', 'priority': 0, 'entered_queue_time': '2026-01-31T08:05:00+00:00'},
+            ],
+            'completed_list': [],
+            'no_show_list': [],
+            'total_waiting': 2,
+            'seq': 10,
+        }
+        message = {
+            'seq': 11,
+            'changes': [
+                {'op': 'upsert', 'section': board.SECTION_WAITING,
+                 'entry': {'entry_id': 'c', 'priority': 5, 'entered_queue_time': '2026-01-31T08:10:00+00:00'}},
+                {'op': 'upsert', 'section': board.SECTION_COMPLETED,
+                 'entry': {'entry_id': 'a', 'ended_at': '2026-01-31T08:20:00+00:00'}},
+            ],
+            'total_waiting': 2,
+        }
+
+        result = board.apply_delta(snapshot, message)
+        self.assertEqual([row['entry_id'] for row in result['waiting_list']], ['c', 'b'])
+        self.assertEqual([row['position'] for row in result['waiting_list']], [1, 2])
+        self.assertEqual([row['entry_id'] for row in result['completed_list']], ['a'])
+        self.assertEqual(result['seq'], 11)
+
+    def test_snapshot_served_without_queries(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        self._enqueue(self.station, 1)
+
+        first = board.get_board(self.station.id)
+        with self.assertNumQueries(0):
+            second = board.get_board(self.station.id)
+        self.assertEqual(second, first)
+        self.assertEqual(second['total_waiting'], 1)
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class StationsStatusTests(QueueTestMixin, TestCase):
+    """get_all_stations_status — số query không phụ thuộc số station."""
+
+    def setUp(self):
+        cache.clear()
+        self.stations = [self._make_station(f'PK-ST-0{i}') for i in range(1, 4)]
+        for station in self.stations:
+            for idx in range(1, 3):
+                self._enqueue(station, idx)
+        self.serving = self._enqueue(self.stations[0], 3)
+        QueueEntry.objects.filter(id=self.serving.id).update(status=QueueStatus.IN_PROGRESS)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            status_list = QueueService.get_all_stations_status(use_cache=False)
+
+        by_code = {item['station'].code: item for item in status_list}
+        first = by_code['PK-ST-01']
+        self.assertEqual(first['waiting_count'], 2)
+        self.assertEqual(first['in_progress_count'], 1)
+        self.assertEqual(first['current_patient'], self.serving.queue_number.number_code)
+        self.assertIsNone(by_code['PK-ST-02']['current_patient'])
+
+    def test_cached(self):
+        QueueService.get_all_stations_status()
+        with self.assertNumQueries(0):
+            QueueService.get_all_stations_status()
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0, QMS_DEFAULT_SERVICE_MINUTES=10)
+class WaitEstimatorTests(QueueTestMixin, TestCase):
+    """Thời gian chờ = số người chờ × thời gian phục vụ thực tế của station."""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        self.station = self._make_station('PK-ETA-01')
+
+    def tearDown(self):
+        wait_estimator.reset(self.station.id)
+
+    def test_default_without_history(self):
+        self._enqueue(self.station, 1)
+        self.assertEqual(QueueService.get_estimated_wait_time(self.station), 10)
+
+    def test_complete_service_updates_model(self):
+        entry = self._enqueue(self.station, 1)
+        QueueEntry.objects.filter(id=entry.id).update(
+            status=QueueStatus.IN_PROGRESS,
+            start_time=timezone.now() - timedelta(minutes=20),
+        )
+        entry.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            QueueService.complete_service(entry)
+
+        self.assertAlmostEqual(wait_estimator.average_service_minutes(self.station.id), 20, delta=0.1)
+
+        self._enqueue(self.station, 2)
+        self._enqueue(self.station, 3)
+        self.assertEqual(QueueService.get_estimated_wait_time(self.station), 40)
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class StationRoutingTests(QueueTestMixin, TestCase):
+    """get_optimal_station — station có ít bệnh nhân đang hoạt động nhất."""
+
+    def setUp(self):
+        cache.clear()
+        self.busy = self._make_station('PK-RT-01')
+        self.free = self._make_station('PK-RT-02')
+        self._enqueue(self.busy, 1)
+        self._enqueue(self.busy, 2)
+        self._enqueue(self.free, 3)
+
+    def test_picks_least_loaded(self):
+        station = ClinicalQueueService.get_optimal_station(StationType.DOCTOR)
+        self.assertEqual(station.id, self.free.id)
+
+        # Hoàn thành không còn tính là tải
+        for entry in QueueEntry.objects.filter(station=self.busy):
+            with self.captureOnCommitCallbacks(execute=True):
+                QueueService.complete_service(entry)
+        station = ClinicalQueueService.get_optimal_station(StationType.DOCTOR)
+        self.assertEqual(station.id, self.busy.id)
+
+    def test_constant_queries_with_live_counters(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        ClinicalQueueService.get_optimal_station(StationType.DOCTOR)
+        with self.assertNumQueries(1):
+            station = ClinicalQueueService.get_optimal_station(StationType.DOCTOR)
+        self.assertEqual(station.id, self.free.id)
+
+
+class IndexAdvisorTests(TestCase):
+    """EXPLAIN các query nóng trên bảng có lịch sử lớn — không query nào quét tuần tự."""
+
+    STATIONS = 20
+    HISTORY_DAYS = 30
+    HISTORY_PER_STATION_DAY = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        patient = Patient.objects.create(patient_code='BN-IDX-001', first_name='Index', last_name='Nguyen')
+        visit = Visit.objects.create(patient=patient, visit_code='V-IDX-001', queue_number=1)
+        now = timezone.now()
+        stations = ServiceStation.objects.bulk_create([
+            ServiceStation(code=f'PK-IDX-{i:02d}', name=f'Phòng {i}', station_type=StationType.DOCTOR)
+            for i in range(cls.STATIONS)
+        ])
+
+        numbers, entries = [], []
+        for station in stations:
+            # Lịch sử: các ngày trước, đã xong
+            for day in range(1, cls.HISTORY_DAYS + 1):
+                for seq in range(1, cls.HISTORY_PER_STATION_DAY + 1):
+                    number = QueueNumber(
+                        number_code=f'{station.code}-{day:02d}-{seq:03d}', daily_sequence=seq,
+                        visit=visit, station=station, created_date=(now - timedelta(days=day)).date(),
+                    )
+                    numbers.append(number)
+                    entries.append(QueueEntry(
+                        queue_number=number, station=station, status=QueueStatus.COMPLETED,
+                        end_time=now - timedelta(days=day, minutes=seq),
+                    ))
+            # Hôm nay: vài người chờ / đang khám / đã xong
+            for seq, status in enumerate([QueueStatus.WAITING] * 5 + [QueueStatus.IN_PROGRESS, QueueStatus.COMPLETED], 1):
+                number = QueueNumber(
+                    number_code=f'{station.code}-00-{seq:03d}', daily_sequence=seq,
+                    visit=visit, station=station, created_date=now.date(),
+                )
+                numbers.append(number)
+                entries.append(QueueEntry(
+                    queue_number=number, station=station, status=status,
+                    end_time=now if status == QueueStatus.COMPLETED else None,
+                ))
+
+        QueueNumber.objects.bulk_create(numbers, batch_size=2000)
+        QueueEntry.objects.bulk_create(entries, batch_size=2000)
+        # entered_queue_time là auto_now_add → dời lịch sử về đúng ngày
+        QueueEntry.objects.filter(end_time__lt=now - timedelta(days=1)).update(entered_queue_time=F('end_time'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {QueueEntry._meta.db_table}')
+        cls.station = stations[0]
+
+    def test_no_sequential_scans(self):
+        report = index_advisor.advise(self.station)
+        self.assertEqual(set(report), set(index_advisor.hot_queries(self.station)))
+        offenders = {name: result['plan'] for name, result in report.items() if result['seq_scans']}
+        self.assertEqual(offenders, {})
+
+    def test_detects_sequential_scan(self):
+        """Lọc theo __date (bọc cột trong cast) không dùng được index → advisor phải bắt được."""
+        plan = index_advisor.explain(
+            QueueEntry.objects.filter(end_time__date=timezone.localdate()).order_by('-end_time')
+        )
+        self.assertTrue(index_advisor.seq_scans(plan))
+
+
+class RecordingSynthesizer(OfflineSynthesizer):
+    """OfflineSynthesizer ghi lại các câu được tổng hợp (và các lô synthesize_many)."""
+    texts = []
+    batches = []
+
+    def synthesize(self, text, voice):
+        RecordingSynthesizer.texts.append(text)
+        return super().synthesize(text, voice)
+
+    def synthesize_many(self, texts, voice):
+        RecordingSynthesizer.batches.append(list(texts))
+        return super().synthesize_many(texts, voice)
+
+
+class TtsTestMixin(QueueTestMixin):
+    """MEDIA_ROOT tạm + RecordingSynthesizer."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            TTS_SYNTHESIZER='apps.core_services.qms.tests.RecordingSynthesizer',
+            TTS_SEGMENT_CACHE=True,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        RecordingSynthesizer.texts = []
+        RecordingSynthesizer.batches = []
+
+
+class TtsSegmentTests(TtsTestMixin, TestCase):
+    """Câu gọi số ghép từ các đoạn audio cache sẵn."""
+
+    def setUp(self):
+        super().setUp()
+        self.station = self._make_station('PK-TTS-01')
+
+    def test_only_name_synthesized_once_warm(self):
+        synthesize_announcement('Nguyễn Văn A', 5, self.station, 'vi-VN-HoaiMyNeural')
+        self.assertEqual(RecordingSynthesizer.texts, [
+            tts_segments.CALL_PHRASE, 'Nguyễn Văn A', tts_segments.SEQUENCE_PHRASE, '5',
+            tts_segments.station_phrase(self.station),
+        ])
+
+        RecordingSynthesizer.texts = []
+        synthesize_announcement('Trần Thị B', 5, self.station, 'vi-VN-HoaiMyNeural')
+        self.assertEqual(RecordingSynthesizer.texts, ['Trần Thị B'])
+
+        # Giọng khác → bộ đoạn riêng
+        RecordingSynthesizer.texts = []
+        synthesize_announcement('Trần Thị B', 5, self.station, 'vi-VN-NamMinhNeural')
+        self.assertEqual(len(RecordingSynthesizer.texts), 5)
+
+    def test_clip_is_valid_frame_stream(self):
+        clip = synthesize_announcement('Nguyễn Văn A', 12, self.station, 'vi-VN-HoaiMyNeural')
+        frames = list(iter_frames(clip))
+        self.assertTrue(frames)
+        self.assertEqual(sum(len(frame) for frame in frames), len(clip))
+
+    def test_tags_stripped_before_joining(self):
+        """ID3v2 / ID3v1 / Xing header không được lọt vào giữa clip ghép."""
+        id3v2 = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'x' * 5
+        xing = SILENT_FRAME[:13] + b'Xing' + SILENT_FRAME[17:]
+        id3v1 = b'TAG' + bytes(125)
+        audio = SILENT_FRAME * 3
+        self.assertEqual(mp3_frames(id3v2 + xing + audio + id3v1), audio)
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class TtsStoreTests(TtsTestMixin, TestCase):
+    """Clip lưu theo hash (câu, giọng), entry chỉ trỏ tới hash."""
+
+    def setUp(self):
+        super().setUp()
+        self.client_ = get_redis_client()
+        if self.client_ is None:
+            self.skipTest('Redis không khả dụng')
+        self.client_.delete(tts_store.LRU_KEY, tts_store.SIZES_KEY, tts_store.TOTAL_KEY)
+
+    def test_recall_reuses_clip(self):
+        station = self._make_station('PK-TTS-02')
+        entry = self._enqueue(station, 1)
+        first = generate_tts_audio(str(entry.id))
+        synthesized = len(RecordingSynthesizer.texts)
+
+        # Con trỏ của entry hết hạn (VD: gọi lại hôm sau bỏ qua) → cùng câu → dùng lại clip
+        self.client_.delete(f'tts:audio:{entry.id}')
+        second = generate_tts_audio(str(entry.id))
+        self.assertEqual(second['file_path'], first['file_path'])
+        self.assertEqual(len(RecordingSynthesizer.texts), synthesized)
+        self.assertEqual(str(tts_store.entry_clip(entry.id)), first['file_path'])
+
+    def test_same_text_same_clip(self):
+        digest = tts_store.clip_hash('Mời bệnh nhân  Nguyễn Văn A', 'vi-VN-HoaiMyNeural')
+        self.assertEqual(digest, tts_store.clip_hash(' Mời bệnh nhân Nguyễn Văn A ', 'vi-VN-HoaiMyNeural'))
+        self.assertNotEqual(digest, tts_store.clip_hash('Mời bệnh nhân Nguyễn Văn A', 'vi-VN-NamMinhNeural'))
+        # Ghép từ segment và đọc cả câu là 2 clip khác nhau (đổi TTS_SEGMENT_CACHE không dùng lại clip cũ)
+        self.assertNotEqual(digest, tts_store.clip_hash('Mời bệnh nhân Nguyễn Văn A', 'vi-VN-HoaiMyNeural', 'segments'))
+
+    def test_lru_eviction_keeps_referenced_clips(self):
+        old_referenced, old_free, recent = (tts_store.clip_hash(text, 'v') for text in ('a', 'b', 'c'))
+        for digest in (old_referenced, old_free, recent):
+            tts_store.save_clip(digest, b'x' * 1000)
+        tts_store.link_entry('entry-a', old_referenced)
+        now = timezone.now().timestamp()
+        self.client_.zadd(tts_store.LRU_KEY, {old_referenced: now - 30, old_free: now - 20, recent: now - 10})
+
+        result = tts_store.evict(max_bytes=2000)
+        self.assertEqual(result, {'evicted': 1, 'freed_bytes': 1000})
+        self.assertFalse(tts_store.clip_path(old_free).exists())
+        self.assertEqual(tts_store.entry_clip('entry-a'), tts_store.clip_path(old_referenced))
+
+        # Không dùng từ lâu → bị xóa dù còn entry trỏ tới, con trỏ cũng bị xóa
+        self.client_.zadd(tts_store.LRU_KEY, {old_referenced: now - 30})
+        tts_store.evict(max_age_seconds=25)
+        self.assertIsNone(tts_store.entry_clip('entry-a'))
+        self.assertEqual(int(self.client_.get(tts_store.TOTAL_KEY)), 1000)
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0)
+class AudioReadyTests(TtsTestMixin, TestCase):
+    """Gọi số không chờ TTS: audio_pending ngay, audio_ready khi clip xong."""
+
+    TTS_LATENCY_MS = 1500
+
+    def setUp(self):
+        super().setUp()
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        overrides = override_settings(
+            TTS_SYNTHESIZER_OPTIONS={'latency_ms': self.TTS_LATENCY_MS},
+            TTS_SEGMENT_CACHE=False,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.station = self._make_station('PK-TTS-03')
+
+    def test_call_next_does_not_wait_for_tts(self):
+        entry = self._enqueue(self.station, 1)
+
+        with patch.object(tts_service.generate_tts_audio, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                started = time.monotonic()
+                called = ClinicalQueueService.call_next_patient(self.station)
+                elapsed_ms = (time.monotonic() - started) * 1000
+            # Dựng lại bảng trong lúc chờ → không xếp thêm task
+            ClinicalQueueService._format_called_entry(QueueEntry.objects.get(id=entry.id))
+
+        self.assertLess(elapsed_ms, self.TTS_LATENCY_MS / 2)
+        self.assertIsNone(called['audio_url'])
+        self.assertTrue(called['audio_pending'])
+        delay.assert_called_once_with(str(entry.id))
+        self.assertEqual(RecordingSynthesizer.texts, [])
+
+        # Worker chạy task → audio_ready rồi delta mang audio_url
+        with patch.object(board, '_group_send') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                result = generate_tts_audio(str(entry.id))
+
+        messages = [json.loads(call.args[1]['frame']) for call in send.call_args_list]
+        self.assertEqual(messages[0], {
+            'type': 'audio_ready', 'entry_id': str(entry.id), 'audio_url': result['audio_url'],
+        })
+        row = messages[1]['changes'][0]['entry']
+        self.assertEqual(row['audio_url'], result['audio_url'])
+        self.assertFalse(row['audio_pending'])
+
+    def test_waiting_entry_generates_silently(self):
+        """Tạo trước cho số đang chờ không gửi audio_ready."""
+        entry = self._enqueue(self.station, 1)
+        with patch.object(board, '_group_send') as send:
+            generate_tts_audio(str(entry.id))
+        send.assert_not_called()
+
+
+@override_settings(QMS_BOARD_COALESCE_MS=0, TTS_PRE_GENERATE_COUNT=5, TTS_PRE_GENERATE_MINUTES=2,
+                   TTS_PRE_GENERATE_MAX=8)
+class PreGenerateTests(TtsTestMixin, TestCase):
+    """Tạo trước clip cho các số sắp gọi trong 1 lần chạy task."""
+
+    def setUp(self):
+        super().setUp()
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        self.station = self._make_station('PK-TTS-04')
+
+    def _observe_calls(self, *offsets_seconds):
+        start = timezone.now() - timedelta(hours=1)
+        for offset in offsets_seconds:
+            wait_estimator.observe_call(self.station.id, at=start + timedelta(seconds=offset))
+
+    def test_window_follows_call_rate(self):
+        self.assertEqual(tts_service.pre_generate_window(self.station.id), 5)  # chưa có dữ liệu
+        # 1 lượt / 30s → 2 lượt/phút × 2 phút
+        self._observe_calls(0, 30, 60, 90)
+        self.assertEqual(tts_service.pre_generate_window(self.station.id), 4)
+        # Nghỉ trưa không kéo tốc độ xuống; gọi dồn dập bị chặn ở MAX
+        self._observe_calls(5000, 5005, 5010, 5015, 5020, 5025, 5030)
+        self.assertEqual(tts_service.pre_generate_window(self.station.id), 8)
+
+    def test_one_batch_for_window(self):
+        entries = [self._enqueue(self.station, i) for i in range(1, 6)]
+        generate_tts_audio(str(entries[0].id))  # đã có clip (và các đoạn cố định đã cache)
+        self._observe_calls(0, 60, 120)  # 1 lượt/phút × 2 phút → cửa sổ 2
+        RecordingSynthesizer.texts, RecordingSynthesizer.batches = [], []
+
+        with patch.object(tts_service.generate_tts_audio, 'delay') as delay, \
+                self.assertNumQueries(2):
+            result = tts_service.pre_generate_for_upcoming(str(self.station.id))
+
+        delay.assert_not_called()
+        self.assertEqual(result, {
+            'station': self.station.code, 'window': 2, 'linked': 1, 'generated': 1, 'skipped': 1,
+        })
+        self.assertEqual(RecordingSynthesizer.batches, [[entries[1].queue_number.visit.patient.full_name]])
+        self.assertEqual(
+            set(tts_store.entry_clips([entry.id for entry in entries])),
+            {str(entries[0].id), str(entries[1].id)},
+        )
+
+
+@override_settings(
+    QMS_BOARD_COALESCE_MS=0,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class BoardFrameTests(QueueTestMixin, TestCase):
+    """Mỗi thay đổi được serialize 1 lần; màn hình LED và màn hình bác sĩ chỉ chuyển tiếp frame."""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        self.station = self._make_station('PK-BRD-05')
+        self.layer = get_channel_layer()
+        self.channels = [async_to_sync(self.layer.new_channel)() for _ in range(3)]
+        for channel in self.channels:
+            async_to_sync(self.layer.group_add)(board.group_name(self.station.id), channel)
+
+    def _consumer(self, consumer_class, board_seq=None):
+        consumer = consumer_class()
+        consumer.station_id = str(self.station.id)
+        consumer.board_seq = board_seq
+        consumer.send = AsyncMock()
+        return consumer
+
+    def test_frame_shared_by_all_screens(self):
+        with patch.object(board.json, 'dumps', wraps=json.dumps) as dumps:
+            entry = self._enqueue(self.station, 1)
+        events = [async_to_sync(self.layer.receive)(channel) for channel in self.channels]
+
+        self.assertEqual(dumps.call_count, 1)
+        self.assertEqual(len({event['frame'] for event in events}), 1)
+        event = events[0]
+        frame = json.loads(event['frame'])
+        self.assertEqual(frame['type'], 'queue_delta')
+        self.assertEqual(frame['seq'], event['seq'])
+        self.assertEqual(frame['changes'][0]['entry']['entry_id'], str(entry.id))
+
+        display = self._consumer(QueueDisplayConsumer, board_seq=event['seq'] - 1)
+        clinical = self._consumer(ClinicalConsumer)
+        with patch.object(consumers.json, 'dumps', side_effect=AssertionError('json.dumps per socket')):
+            async_to_sync(display.queue_delta)(event)
+            async_to_sync(clinical.queue_delta)(event)
+        display.send.assert_awaited_once_with(text_data=event['frame'])
+        clinical.send.assert_awaited_once_with(text_data=event['frame'])
+        self.assertEqual(display.board_seq, event['seq'])
+
+    def test_connect_frame_is_snapshot(self):
+        self._enqueue(self.station, 1)
+        board_data = board.get_board(self.station.id)
+
+        with self.assertNumQueries(0):
+            seq, frame = board.get_board_frame(self.station.id)
+        self.assertEqual(seq, board_data['seq'])
+        self.assertEqual(json.loads(frame), {'type': 'queue_update', 'seq': seq, 'data': board_data})
@@ -0,0 +1,121 @@
+"""
+TTS segment cache — assemble queue announcements from pre-rendered audio.
+
+    "Mời bệnh nhân {tên}, số thứ tự {số}, vào {phòng}"
+
+Only the patient name is new for each call. The carrier phrases, the numbers
+and the station labels are synthesized once per voice and kept as raw MP3
+frames in MEDIA_ROOT/TTS_AUDIO_DIR/segments/{sha1(voice, text)}.mp3 (shared by
+every worker, written atomically). A clip is the concatenation of the
+segments' frames with short silent gaps where the sentence has commas.
+
+Names are not cached here: they rarely repeat within a segment's lifetime and
+would make the directory grow with the patient list.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+from .tts_synthesizers import get_synthesizer, mp3_frames
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_DIR = 'segments'
+CALL_PHRASE = 'Mời bệnh nhân'
+SEQUENCE_PHRASE = 'số thứ tự'
+STATION_PHRASE = 'vào'
+PAUSE_MS = 240  # dấu phẩy giữa các vế
+
+
+def _voice(voice=None) -> str:
+    return voice or getattr(settings, 'TTS_VOICE', 'vi-VN-HoaiMyNeural')
+
+
+def _segment_dir() -> Path:
+    segment_dir = Path(settings.MEDIA_ROOT) / settings.TTS_AUDIO_DIR / SEGMENT_DIR
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    return segment_dir
+
+
+def segment_path(text: str, voice=None) -> Path:
+    digest = hashlib.sha1(f'{_voice(voice)}\n{text}'.encode('utf-8')).hexdigest()
+    return _segment_dir() / f'{digest}.mp3'
+
+
+def station_phrase(station) -> str:
+    from .tts_service import _get_station_label
+    return f'{STATION_PHRASE} {_get_station_label(station)}'
+
+
+def _store_segment(text: str, voice, audio: bytes) -> bytes:
+    """Write a synthesized segment's frames to the cache (atomic). Returns the frames."""
+    path = segment_path(text, voice)
+    frames = mp3_frames(audio)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(frames)
+        os.replace(tmp_path, path)  # worker khác ghi cùng lúc → cùng nội dung, ai thắng cũng được
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+    logger.info('[TTS] Cached segment "%s" (%d bytes)', text, len(frames))
+    return frames
+
+
+def get_segment(text: str, voice=None, synthesizer=None) -> bytes:
+    """Frames of a cached segment, synthesized and stored on first use."""
+    try:
+        return segment_path(text, voice).read_bytes()
+    except FileNotFoundError:
+        pass
+
+    synthesizer = synthesizer or get_synthesizer()
+    return _store_segment(text, voice, synthesizer.synthesize(text, _voice(voice)))
+
+
+def assemble_announcement(patient_name: str, daily_sequence: int, station, voice=None, synthesizer=None,
+                          name_audio: bytes = None) -> bytes:
+    """
+    MP3 of the full announcement; synthesizes only the patient name (+ any
+    segment not cached yet). name_audio: the name already synthesized.
+    """
+    synthesizer = synthesizer or get_synthesizer()
+    pause = synthesizer.silence(PAUSE_MS)
+    return b''.join([
+        get_segment(CALL_PHRASE, voice, synthesizer),
+        mp3_frames(name_audio if name_audio is not None else synthesizer.synthesize(patient_name, _voice(voice))),
+        pause,
+        get_segment(SEQUENCE_PHRASE, voice, synthesizer),
+        get_segment(str(daily_sequence), voice, synthesizer),
+        pause,
+        get_segment(station_phrase(station), voice, synthesizer),
+    ])
+
+
+def assemble_announcements(announcements, voice=None, synthesizer=None) -> list:
+    """assemble_announcement for several (patient_name, daily_sequence, station) — names in one batch."""
+    synthesizer = synthesizer or get_synthesizer()
+    names = synthesizer.synthesize_many([name for name, _, _ in announcements], _voice(voice))
+    return [
+        assemble_announcement(name, daily_sequence, station, voice, synthesizer, name_audio=name_audio)
+        for (name, daily_sequence, station), name_audio in zip(announcements, names)
+    ]
+
+
+def warm_segments(stations, max_number: int, voice=None) -> int:
+    """Pre-render carrier phrases, numbers 1..max_number and station labels. Returns how many were new."""
+    texts = [CALL_PHRASE, SEQUENCE_PHRASE]
+    texts += [str(number) for number in range(1, max_number + 1)]
+    texts += [station_phrase(station) for station in stations]
+
+    missing = [text for text in dict.fromkeys(texts) if not segment_path(text, voice).exists()]
+    with get_synthesizer() as synthesizer:
+        for text, audio in zip(missing, synthesizer.synthesize_many(missing, _voice(voice))):
+            _store_segment(text, voice, audio)
+    return len(missing)
@@ -2,52 +2,36 @@
 TTS Service — Text-to-Speech Audio Generation for Patient Calling
 
 This module provides Celery tasks to:
-1. Generate Vietnamese TTS audio for patient announcements using edge-tts
-2. Pre-generate audio for upcoming patients in the queue
+1. Generate Vietnamese TTS audio for patient announcements
+   (backend: settings.TTS_SYNTHESIZER, edge-tts by default)
+   — never awaited by a request: a called entry without a clip is shown as
+   audio_pending and its displays get an `audio_ready` event once it lands
+2. Pre-generate audio for upcoming patients in the queue — one batched task
+   per call-next; the look-ahead follows the station's observed call rate
 3. Clean up old audio files daily
 
-Audio files are stored in MEDIA_ROOT/audio/tts/ and cached in Redis.
+Clips are stored once per (text, voice) under MEDIA_ROOT/audio/tts/clips/ and
+entries point to them through Redis (see tts_store).
+With TTS_SEGMENT_CACHE on, a clip is assembled from cached segments and only
+the patient name is synthesized (see tts_segments).
 """
 
-import os
-import re
 import logging
-import asyncio
-from pathlib import Path
-from datetime import date, timedelta
+import math
 
+import redis
 from celery import shared_task
 from django.conf import settings
+from django.db import transaction
 
-import redis
+from apps.core_services.core.utils import get_redis_client
+from . import tts_segments, tts_store
+from .tts_synthesizers import get_synthesizer
 
 logger = logging.getLogger(__name__)
 
-
-def _get_redis_client():
-    """Get a Redis client for TTS audio path caching."""
-    return redis.Redis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=settings.REDIS_DB,
-        decode_responses=True,
-    )
-
-
-def _get_audio_dir() -> Path:
-    """Get the TTS audio directory, creating it if needed."""
-    audio_dir = Path(settings.MEDIA_ROOT) / settings.TTS_AUDIO_DIR
-    audio_dir.mkdir(parents=True, exist_ok=True)
-    return audio_dir
-
-
-def _sanitize_filename(name: str) -> str:
-    """Sanitize a name for use in filenames."""
-    # Replace Vietnamese chars and spaces  
-    name = name.lower().strip()
-    name = re.sub(r'[^\w\s-]', '', name)
-    name = re.sub(r'[\s]+', '_', name)
-    return name[:50]  # Limit length
+PENDING_TTL = 30  # seconds — a lost task is dispatched again after this
+PRE_GENERATE_MIN = 2  # always have the next couple of entries ready
 
 
 def _get_station_label(station) -> str:
@@ -78,31 +62,78 @@ def build_announcement_text(patient_name: str, daily_sequence: int, station) ->
     Example output:
         "Mời bệnh nhân Nguyễn Văn A, số thứ tự 5, vào phòng khám Nội 1"
     """
-    station_label = _get_station_label(station)
     return (
-        f"Mời bệnh nhân {patient_name}, "
-        f"số thứ tự {daily_sequence}, "
-        f"vào {station_label}"
+        f"{tts_segments.CALL_PHRASE} {patient_name}, "
+        f"{tts_segments.SEQUENCE_PHRASE} {daily_sequence}, "
+        f"{tts_segments.station_phrase(station)}"
     )
 
 
-def _run_tts(text: str, output_path: str, voice: str = 'vi-VN-HoaiMyNeural') -> None:
-    """
-    Run edge-tts to generate an MP3 file.
-    edge-tts is async, so we run it in an event loop.
+def synthesize_announcement(patient_name: str, daily_sequence: int, station, voice: str) -> bytes:
+    """MP3 bytes of the announcement — from cached segments, or the whole sentence at once."""
+    if getattr(settings, 'TTS_SEGMENT_CACHE', True):
+        return tts_segments.assemble_announcement(patient_name, daily_sequence, station, voice)
+    text = build_announcement_text(patient_name, daily_sequence, station)
+    return get_synthesizer().synthesize(text, voice)
+
+
+def synthesize_announcements(announcements, voice: str, synthesizer=None) -> list:
+    """synthesize_announcement for several (patient_name, daily_sequence, station) in one synthesizer session."""
+    synthesizer = synthesizer or get_synthesizer()
+    if getattr(settings, 'TTS_SEGMENT_CACHE', True):
+        return tts_segments.assemble_announcements(announcements, voice, synthesizer)
+    texts = [build_announcement_text(*announcement) for announcement in announcements]
+    return synthesizer.synthesize_many(texts, voice)
+
+
+def _announcement(entry) -> tuple:
+    patient = entry.queue_number.visit.patient
+    patient_name = getattr(patient, 'full_name', None) or str(patient)
+    return patient_name, entry.queue_number.daily_sequence, entry.station
+
+
+def _store_clips(entries) -> tuple:
     """
-    import edge_tts
+    Point each entry at the clip of its sentence, synthesizing the clips not
+    stored yet in one synthesizer session (same sentence → synthesized once).
 
-    async def _generate():
-        communicate = edge_tts.Communicate(text, voice)
-        await communicate.save(output_path)
+    Returns ({entry_id: path}, number of clips synthesized).
+    """
+    voice = getattr(settings, 'TTS_VOICE', 'vi-VN-HoaiMyNeural')
+    mode = 'segments' if getattr(settings, 'TTS_SEGMENT_CACHE', True) else 'whole'
+    digests, announcements = {}, {}
+    for entry in entries:
+        announcement = _announcement(entry)
+        digest = tts_store.clip_hash(build_announcement_text(*announcement), voice, mode)
+        digests[str(entry.id)] = digest
+        announcements.setdefault(digest, announcement)
+
+    paths = tts_store.find_clips(announcements)
+    missing = [digest for digest in announcements if digest not in paths]
+    if missing:
+        logger.info('[TTS] Generating %d clips', len(missing))
+        with get_synthesizer() as synthesizer:
+            clips = synthesize_announcements([announcements[digest] for digest in missing], voice, synthesizer)
+        for digest, audio in zip(missing, clips):
+            paths[digest] = tts_store.save_clip(digest, audio)
+
+    tts_store.link_entries(digests)
+    return {entry_id: paths[digest] for entry_id, digest in digests.items()}, len(missing)
+
+
+def pre_generate_window(station_id) -> int:
+    """
+    Number of waiting entries to have clips for: the calls expected within
+    TTS_PRE_GENERATE_MINUTES at the station's observed call rate
+    (TTS_PRE_GENERATE_COUNT until a rate is known), capped at TTS_PRE_GENERATE_MAX.
+    """
+    from . import wait_estimator
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(_generate())
-    finally:
-        loop.close()
+    rate = wait_estimator.calls_per_minute(station_id)
+    if rate is None:
+        return settings.TTS_PRE_GENERATE_COUNT
+    expected = math.ceil(rate * getattr(settings, 'TTS_PRE_GENERATE_MINUTES', 10))
+    return max(PRE_GENERATE_MIN, min(expected, getattr(settings, 'TTS_PRE_GENERATE_MAX', 30)))
 
 
 @shared_task(bind=True, max_retries=2, default_retry_delay=5)
@@ -112,9 +143,10 @@ def generate_tts_audio(self, entry_id: str) -> dict:
 
     1. Load patient info from QueueEntry
     2. Build announcement text
-    3. Generate MP3 via edge-tts
-    4. Save file to disk
-    5. Cache path in Redis (TTL 24h)
+    3. Reuse the stored clip with the same (text, voice), or generate the MP3
+       (cached segments + synthesized name, or the whole sentence) and store it
+    4. Point the entry at the clip (Redis, TTL 24h)
+    5. If the entry is being called, push audio_ready to its displays
 
     Args:
         entry_id: UUID string of the QueueEntry
@@ -135,50 +167,78 @@ def generate_tts_audio(self, entry_id: str) -> dict:
         logger.warning('[TTS] QueueEntry not found: %s', entry_id)
         return {'error': f'QueueEntry not found: {entry_id}'}
 
-    patient = entry.queue_number.visit.patient
-    patient_name = getattr(patient, 'full_name', None) or str(patient)
-    daily_seq = entry.queue_number.daily_sequence
-    station = entry.station
-
-    # Check if already generated (Redis)
-    r = _get_redis_client()
-    redis_key = f'tts:audio:{entry_id}'
-    cached = r.get(redis_key)
+    # Check if already generated for this entry
+    cached = tts_store.entry_clip(entry_id)
     if cached:
         logger.info('[TTS] Audio already cached for entry=%s', entry_id)
-        return {'file_path': cached, 'audio_url': _file_to_url(cached)}
-
-    # Build text
-    text = build_announcement_text(patient_name, daily_seq, station)
-    logger.info('[TTS] Generating: "%s"', text)
-
-    # File path
-    audio_dir = _get_audio_dir()
-    safe_name = _sanitize_filename(patient_name)
-    filename = f"call_{entry_id}_{safe_name}.mp3"
-    file_path = str(audio_dir / filename)
+        audio_url = _file_to_url(str(cached))
+        _announce_ready(entry, audio_url)
+        return {'file_path': str(cached), 'audio_url': audio_url}
 
+    # Same sentence + voice → same clip (reused if stored)
     try:
-        voice = getattr(settings, 'TTS_VOICE', 'vi-VN-HoaiMyNeural')
-        _run_tts(text, file_path, voice)
+        paths, _ = _store_clips([entry])
     except Exception as exc:
-        logger.error('[TTS] edge-tts failed for entry=%s: %s', entry_id, exc)
+        logger.error('[TTS] synthesis failed for entry=%s: %s', entry_id, exc)
         raise self.retry(exc=exc)
 
-    # Cache in Redis (TTL 24 hours)
-    r.setex(redis_key, 86400, file_path)
+    path = paths[str(entry.id)]
+    audio_url = _file_to_url(str(path))
+    _announce_ready(entry, audio_url)
+    return {'file_path': str(path), 'audio_url': audio_url}
 
-    logger.info('[TTS] Generated audio: %s', file_path)
-    return {'file_path': file_path, 'audio_url': _file_to_url(file_path)}
+
+def _announce_ready(entry, audio_url: str) -> None:
+    """Push audio_ready to the station's displays if the entry is being called."""
+    from . import board
+    from .models import QueueStatus
+
+    if entry.status not in (QueueStatus.CALLED, QueueStatus.IN_PROGRESS):
+        return  # pre-generated for a waiting entry — played when it is called
+    try:
+        board.publish_audio_ready(entry.station_id, entry.id, audio_url)
+    except Exception:
+        logger.exception('[TTS] audio_ready push failed for entry=%s', entry.id)
+
+
+def _dispatch(entry_id: str) -> None:
+    try:
+        generate_tts_audio.delay(entry_id)
+    except Exception:
+        logger.exception('[TTS] Failed to dispatch generate_tts_audio for entry=%s', entry_id)
+
+
+def request_audio(entry_id) -> bool:
+    """
+    Queue generation of an entry's clip without waiting for it (after commit,
+    at most once per PENDING_TTL). generate_tts_audio pushes audio_ready when
+    the clip lands.
+
+    Returns True if a clip is on its way (dispatched now or earlier),
+    False if it cannot be generated (no Redis → no broker / no clip pointer).
+    """
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        first = client.set(f'tts:pending:{entry_id}', 1, nx=True, ex=PENDING_TTL)
+    except redis.RedisError as e:
+        logger.warning('[TTS] request_audio failed for entry=%s: %s', entry_id, e)
+        return False
+    if first:
+        transaction.on_commit(lambda: _dispatch(str(entry_id)))
+    return True
 
 
 @shared_task
 def pre_generate_for_upcoming(station_id: str) -> dict:
     """
-    Celery task: Pre-generate TTS audio for the next N patients in the queue.
+    Celery task: Pre-generate TTS audio for the next waiting patients.
 
-    This is triggered after a patient is called, so the next batch
-    of announcements are ready before they're needed.
+    Triggered after each call-next. One invocation handles the whole window:
+    pre_generate_window() entries (from the station's call rate), one MGET to
+    find those that already point to a clip, and one synthesizer session
+    for all the missing clips.
 
     Args:
         station_id: UUID string of the ServiceStation
@@ -191,93 +251,71 @@ def pre_generate_for_upcoming(station_id: str) -> dict:
         logger.warning('[TTS] Station not found: %s', station_id)
         return {'error': f'Station not found: {station_id}'}
 
-    count = settings.TTS_PRE_GENERATE_COUNT
-
-    # Get next N waiting entries
-    upcoming = QueueEntry.objects.filter(
+    window = pre_generate_window(station.id)
+    upcoming = list(QueueEntry.objects.filter(
         station=station,
         status=QueueStatus.WAITING,
-    ).order_by('-priority', 'entered_queue_time')[:count]
-
-    r = _get_redis_client()
+    ).select_related(
+        'queue_number',
+        'queue_number__visit',
+        'queue_number__visit__patient',
+        'station',
+    ).order_by('-priority', 'entered_queue_time')[:window])
+
+    ready = tts_store.entry_clips([entry.id for entry in upcoming])
+    missing = [entry for entry in upcoming if str(entry.id) not in ready]
     generated = 0
-    skipped = 0
-
-    for entry in upcoming:
-        redis_key = f'tts:audio:{entry.id}'
-        if r.exists(redis_key):
-            skipped += 1
-            continue
-        # Dispatch individual generation task
-        generate_tts_audio.delay(str(entry.id))
-        generated += 1
+    if missing:
+        try:
+            _, generated = _store_clips(missing)
+        except Exception as exc:
+            # Best-effort: entries still get their clip on demand when called
+            logger.error('[TTS] Pre-generate failed for station=%s: %s', station.code, exc)
+            return {'station': station.code, 'window': window, 'error': str(exc)}
 
     logger.info(
-        '[TTS] Pre-generate for station=%s: dispatched=%d, skipped=%d',
-        station.code, generated, skipped,
+        '[TTS] Pre-generate for station=%s: window=%d, linked=%d, generated=%d, skipped=%d',
+        station.code, window, len(missing), generated, len(ready),
     )
-    return {'station': station.code, 'generated': generated, 'skipped': skipped}
+    return {
+        'station': station.code,
+        'window': window,
+        'linked': len(missing),
+        'generated': generated,
+        'skipped': len(ready),
+    }
 
 
 @shared_task
 def cleanup_old_audio() -> dict:
     """
-    Celery Beat task: Delete TTS audio files older than 1 day.
+    Celery Beat task: Evict TTS clips unused for TTS_AUDIO_MAX_AGE_HOURS, then
+    least recently used ones until the store fits in TTS_AUDIO_MAX_MB.
+    Works from the Redis index only (no directory walk / key SCAN), except when
+    the index is missing and has to be rebuilt from disk once.
     Runs daily at 23:59 (configured in config/celery.py).
     """
-    import time
-
-    audio_dir = _get_audio_dir()
-    cutoff = time.time() - 86400  # 24 hours ago
-
-    deleted = 0
-    errors = 0
-
-    for f in audio_dir.glob('call_*.mp3'):
-        try:
-            if f.stat().st_mtime < cutoff:
-                f.unlink()
-                deleted += 1
-        except Exception as exc:
-            logger.error('[TTS] Failed to delete %s: %s', f, exc)
-            errors += 1
-
-    # Also flush old Redis keys (they have TTL, but clean up anyway)
-    r = _get_redis_client()
-    cursor = 0
-    flushed = 0
-    while True:
-        cursor, keys = r.scan(cursor, match='tts:audio:*', count=100)
-        for key in keys:
-            path = r.get(key)
-            if path and not os.path.exists(path):
-                r.delete(key)
-                flushed += 1
-        if cursor == 0:
-            break
-
+    rebuilt = tts_store.rebuild_index() if tts_store.index_missing() else None
+    result = tts_store.evict(
+        max_age_seconds=getattr(settings, 'TTS_AUDIO_MAX_AGE_HOURS', 24) * 3600,
+        max_bytes=tts_store.max_store_bytes(),
+    )
     logger.info(
-        '[TTS] Cleanup: deleted=%d files, flushed=%d Redis keys, errors=%d',
-        deleted, flushed, errors,
+        '[TTS] Cleanup: evicted=%d clips, freed=%d bytes, index_rebuilt=%s',
+        result['evicted'], result['freed_bytes'], rebuilt is not None,
     )
-    return {'deleted': deleted, 'flushed': flushed, 'errors': errors}
+    return {**result, 'index_rebuilt': rebuilt}
 
 
 def get_audio_url(entry_id: str) -> str | None:
     """
-    Get the audio URL for a QueueEntry from Redis cache.
+    Get the audio URL of the clip a QueueEntry points to.
 
     Returns:
         URL string or None if not cached
     """
-    r = _get_redis_client()
-    redis_key = f'tts:audio:{entry_id}'
-    file_path = r.get(redis_key)
-
-    if file_path and os.path.exists(file_path):
-        return _file_to_url(file_path)
-
-    return None
+    path = tts_store.entry_clip(entry_id)
+    return _file_to_url(str(path)) if path else None
 
 
 def _file_to_url(file_path: str) -> str:
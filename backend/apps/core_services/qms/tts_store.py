@@ -0,0 +1,306 @@
+"""
+TTS audio store — content-addressed, deduplicated announcement clips.
+
+A clip is identified by sha256(assembly mode, voice, normalized text) and written once to
+MEDIA_ROOT/TTS_AUDIO_DIR/clips/{hash[:2]}/{hash}.mp3. A queue entry only
+points to a hash, so a recall after a skip, or any other entry announcing the
+same sentence, reuses the clip instead of synthesizing a byte-identical copy.
+The mode ('segments' / 'whole', see TTS_SEGMENT_CACHE) is part of the address:
+toggling the setting never serves clips built the other way.
+
+Redis index (shared client, best-effort — without Redis clips are still found
+by hash on disk, entries just lose their pointer):
+    tts:audio:{entry_id}     → clip hash (TTL ENTRY_TTL)
+    tts:clip:{hash}:refs     SET of entry ids pointing to the clip
+    tts:clips                ZSET hash → last use (unix seconds), the LRU order
+    tts:clips:bytes          HASH hash → size; tts:clips:total = sum of sizes
+
+evict() removes clips by age and down to the size cap from the index alone —
+unreferenced clips first, least recently used first.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import unicodedata
+from pathlib import Path
+
+import redis
+from django.conf import settings
+
+from apps.core_services.core.utils import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+CLIP_DIR = 'clips'
+ENTRY_TTL = 86400
+LRU_KEY = 'tts:clips'
+SIZES_KEY = 'tts:clips:bytes'
+TOTAL_KEY = 'tts:clips:total'
+EVICT_BATCH = 100
+
+
+def _entry_key(entry_id) -> str:
+    return f'tts:audio:{entry_id}'
+
+
+def _refs_key(clip_hash) -> str:
+    return f'tts:clip:{clip_hash}:refs'
+
+
+def _audio_dir() -> Path:
+    return Path(settings.MEDIA_ROOT) / settings.TTS_AUDIO_DIR
+
+
+def normalize_text(text: str) -> str:
+    """NFC + collapsed whitespace: the same sentence typed differently maps to one clip."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def clip_hash(text: str, voice: str, mode: str = 'whole') -> str:
+    return hashlib.sha256(f'{mode}\n{voice}\n{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+def clip_path(digest: str) -> Path:
+    return _audio_dir() / CLIP_DIR / digest[:2] / f'{digest}.mp3'
+
+
+def _touch(client, digest) -> None:
+    if client is None:
+        return
+    try:
+        client.zadd(LRU_KEY, {digest: time.time()})
+    except redis.RedisError as e:
+        logger.warning('[TTS_STORE] touch failed for %s: %s', digest, e)
+
+
+def find_clip(digest: str):
+    """Path of a stored clip (marked as used), or None."""
+    return find_clips([digest]).get(digest)
+
+
+def find_clips(digests) -> dict:
+    """{hash: path} of the clips already stored, all marked as used in one round trip."""
+    found = {digest: clip_path(digest) for digest in digests if clip_path(digest).exists()}
+    client = get_redis_client()
+    if client is not None and found:
+        try:
+            client.zadd(LRU_KEY, {digest: time.time() for digest in found})
+        except redis.RedisError as e:
+            logger.warning('[TTS_STORE] touch failed: %s', e)
+    return found
+
+
+def save_clip(digest: str, audio: bytes) -> Path:
+    """Store a clip under its hash (atomic; a concurrent writer of the same hash writes the same bytes)."""
+    path = clip_path(digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(audio)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+    client = get_redis_client()
+    if client is None:
+        return path
+    try:
+        if client.hsetnx(SIZES_KEY, digest, len(audio)):
+            total = client.incrby(TOTAL_KEY, len(audio))
+        else:
+            total = int(client.get(TOTAL_KEY) or 0)
+        _touch(client, digest)
+    except redis.RedisError as e:
+        logger.warning('[TTS_STORE] index update failed for %s: %s', digest, e)
+        return path
+
+    max_bytes = max_store_bytes()
+    if max_bytes and total > max_bytes:
+        evict(max_bytes=max_bytes)
+    return path
+
+
+def link_entry(entry_id, digest: str) -> None:
+    """Point a queue entry at a clip (1 reference)."""
+    link_entries({entry_id: digest})
+
+
+def link_entries(links: dict) -> None:
+    """link_entry for {entry_id: hash} in one pipeline."""
+    client = get_redis_client()
+    if client is None or not links:
+        return
+    now = time.time()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for entry_id, digest in links.items():
+            pipe.set(_entry_key(entry_id), digest, ex=ENTRY_TTL)
+            pipe.sadd(_refs_key(digest), str(entry_id))
+            pipe.expire(_refs_key(digest), ENTRY_TTL)
+        pipe.zadd(LRU_KEY, {digest: now for digest in links.values()})
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[TTS_STORE] link failed for %d entries: %s', len(links), e)
+
+
+def entry_clip(entry_id):
+    """Path of the clip an entry points to (if the file is still there), or None."""
+    return entry_clips([entry_id]).get(str(entry_id))
+
+
+def entry_clips(entry_ids) -> dict:
+    """{entry_id: path} for the entries whose clip is stored — one MGET for all of them."""
+    entry_ids = [str(entry_id) for entry_id in entry_ids]
+    client = get_redis_client()
+    if client is None or not entry_ids:
+        return {}
+    try:
+        pointers = client.mget([_entry_key(entry_id) for entry_id in entry_ids])
+    except redis.RedisError as e:
+        logger.warning('[TTS_STORE] lookup failed for %d entries: %s', len(entry_ids), e)
+        return {}
+
+    found, used = {}, {}
+    for entry_id, digest in zip(entry_ids, pointers):
+        if not digest:
+            continue
+        if os.sep in digest or '/' in digest:
+            # Key cũ (trước store theo hash) lưu thẳng đường dẫn file — hết hạn sau ENTRY_TTL
+            if os.path.exists(digest):
+                found[entry_id] = Path(digest)
+            continue
+        path = clip_path(digest)
+        if path.exists():
+            found[entry_id] = path
+            used[digest] = time.time()
+    if used:
+        try:
+            client.zadd(LRU_KEY, used)
+        except redis.RedisError as e:
+            logger.warning('[TTS_STORE] touch failed: %s', e)
+    return found
+
+
+def max_store_bytes() -> int:
+    return getattr(settings, 'TTS_AUDIO_MAX_MB', 512) * 1024 * 1024
+
+
+def _live_refs(client, digest) -> int:
+    """Số entry còn trỏ tới clip (bỏ các entry đã hết hạn / đã trỏ sang clip khác)."""
+    entry_ids = client.smembers(_refs_key(digest))
+    if not entry_ids:
+        return 0
+    entry_ids = list(entry_ids)
+    pointers = client.mget([_entry_key(entry_id) for entry_id in entry_ids])
+    stale = [entry_id for entry_id, pointer in zip(entry_ids, pointers) if pointer != digest]
+    if stale:
+        client.srem(_refs_key(digest), *stale)
+    return len(entry_ids) - len(stale)
+
+
+def _remove(client, digest) -> int:
+    """Delete a clip + its index entries and the entries pointing to it. Returns freed bytes."""
+    try:
+        clip_path(digest).unlink()
+    except FileNotFoundError:
+        pass
+    size = int(client.hget(SIZES_KEY, digest) or 0)
+    entry_ids = client.smembers(_refs_key(digest))
+    pipe = client.pipeline(transaction=True)
+    pipe.zrem(LRU_KEY, digest)
+    pipe.hdel(SIZES_KEY, digest)
+    pipe.decrby(TOTAL_KEY, size)
+    pipe.delete(_refs_key(digest))
+    pipe.execute()
+    for entry_id in entry_ids:
+        if client.get(_entry_key(entry_id)) == digest:
+            client.delete(_entry_key(entry_id))
+    return size
+
+
+def evict(max_age_seconds: int = None, max_bytes: int = None) -> dict:
+    """
+    Drop clips unused for max_age_seconds, then the least recently used ones
+    until the store fits in max_bytes (unreferenced clips go first).
+    """
+    client = get_redis_client()
+    if client is None:
+        return {'evicted': 0, 'freed_bytes': 0}
+
+    evicted = freed = 0
+    try:
+        if max_age_seconds:
+            for digest in client.zrangebyscore(LRU_KEY, '-inf', time.time() - max_age_seconds):
+                freed += _remove(client, digest)
+                evicted += 1
+
+        if max_bytes:
+            total = int(client.get(TOTAL_KEY) or 0)
+            for only_unreferenced in (True, False):
+                start = 0
+                while total > max_bytes:
+                    batch = client.zrange(LRU_KEY, start, start + EVICT_BATCH - 1)
+                    if not batch:
+                        break
+                    kept = 0
+                    for digest in batch:
+                        if total <= max_bytes:
+                            break
+                        if only_unreferenced and _live_refs(client, digest):
+                            kept += 1
+                            continue
+                        size = _remove(client, digest)
+                        total -= size
+                        freed += size
+                        evicted += 1
+                    start += kept
+    except redis.RedisError as e:
+        logger.warning('[TTS_STORE] eviction failed: %s', e)
+
+    if evicted:
+        logger.info('[TTS_STORE] Evicted %d clips (%d bytes)', evicted, freed)
+    return {'evicted': evicted, 'freed_bytes': freed}
+
+
+def rebuild_index() -> int:
+    """
+    Re-register every clip on disk (after Redis lost the index) and delete the
+    per-entry files written before the store existed. Returns the number of clips.
+    """
+    client = get_redis_client()
+    if client is None:
+        return 0
+    audio_dir = _audio_dir()
+    for legacy in audio_dir.glob('call_*.mp3'):
+        legacy.unlink(missing_ok=True)
+
+    sizes, lru = {}, {}
+    for path in (audio_dir / CLIP_DIR).glob('*/*.mp3'):
+        stat = path.stat()
+        sizes[path.stem] = stat.st_size
+        lru[path.stem] = stat.st_mtime
+
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(LRU_KEY, SIZES_KEY)
+    if sizes:
+        pipe.hset(SIZES_KEY, mapping=sizes)
+        pipe.zadd(LRU_KEY, lru)
+    pipe.set(TOTAL_KEY, sum(sizes.values()))
+    pipe.execute()
+    logger.info('[TTS_STORE] Rebuilt index: %d clips', len(sizes))
+    return len(sizes)
+
+
+def index_missing() -> bool:
+    client = get_redis_client()
+    if client is None:
+        return False
+    try:
+        return not client.exists(TOTAL_KEY)
+    except redis.RedisError:
+        return False
@@ -0,0 +1,182 @@
+"""
+TTS synthesizers — pluggable text → MP3 backends for queue announcements.
+
+settings.TTS_SYNTHESIZER is the dotted path of the backend class:
+    EdgeTTSSynthesizer   Microsoft Edge neural voices (needs network)
+    OfflineSynthesizer   silent clip whose length follows the text — no network,
+                         deterministic; for tests and benchmarks
+
+Every backend returns the same stream format as edge-tts (MPEG-2 Layer III,
+24 kHz, 48 kbit/s, mono) so cached segments can be joined by concatenating
+their frames (see tts_segments).
+
+A synthesizer used as a context manager is a session: every call made inside
+the block shares its resources (edge-tts: one event loop), and
+synthesize_many() renders a batch of texts concurrently within it.
+"""
+
+import asyncio
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Silent MPEG-2 Layer III frame, 24 kHz / 48 kbit/s / mono: 144 bytes = 576 samples = 24 ms.
+# All-zero side info → part2_3_length 0 → decoders output silence.
+SILENT_FRAME = b'\xff\xf3\x64\xc0' + bytes(140)
+FRAME_MS = 24
+
+_BITRATES_KBPS = {
+    'mpeg1': (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    'mpeg2': (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def frame_length(header: bytes):
+    """Byte length of the Layer III frame starting with `header`, None if it is not one."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0b11  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (header[1] >> 1) & 0b11    # 1 = Layer III
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0b11
+    padding = (header[2] >> 1) & 1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES_KBPS['mpeg1' if version == 3 else 'mpeg2'][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+
+def iter_frames(data: bytes):
+    """Yield the MP3 frames of `data` (stops at the first byte that is not a frame)."""
+    offset = 0
+    while offset < len(data):
+        length = frame_length(data[offset:offset + 4])
+        if not length or offset + length > len(data):
+            return
+        yield data[offset:offset + length]
+        offset += length
+
+
+def mp3_frames(data: bytes) -> bytes:
+    """
+    Raw audio frames of an MP3 file: drops ID3v2 / ID3v1 tags and the Xing/Info
+    header frame, which would otherwise end up in the middle of a joined clip.
+    """
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    first_length = frame_length(data[:4])
+    if first_length and (b'Xing' in data[:first_length] or b'Info' in data[:first_length]):
+        data = data[first_length:]
+    return data
+
+
+def silent_frames(duration_ms: int) -> bytes:
+    return SILENT_FRAME * max(round(duration_ms / FRAME_MS), 1)
+
+
+class BaseSynthesizer:
+    """Interface: synthesize(text, voice) → MP3 bytes in the shared stream format."""
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        raise NotImplementedError
+
+    def synthesize_many(self, texts, voice: str) -> list:
+        """MP3 bytes of each text, in order (backends with a network session override this)."""
+        return [self.synthesize(text, voice) for text in texts]
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def silence(self, duration_ms: int) -> bytes:
+        return silent_frames(duration_ms)
+
+
+class EdgeTTSSynthesizer(BaseSynthesizer):
+    """
+    Microsoft Edge online TTS (edge-tts). edge-tts is async → calls run in an
+    event loop, private per call or shared for a `with` block. synthesize_many
+    streams up to `concurrency` texts at once over that loop.
+    """
+
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = concurrency
+        self._loop = None
+
+    def __enter__(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self
+
+    def close(self) -> None:
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+
+    def _run(self, coro):
+        if self._loop is not None:
+            return self._loop.run_until_complete(coro)
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    @staticmethod
+    async def _collect(text: str, voice: str) -> bytes:
+        import edge_tts
+
+        audio = bytearray()
+        async for chunk in edge_tts.Communicate(text, voice).stream():
+            if chunk['type'] == 'audio':
+                audio.extend(chunk['data'])
+        return bytes(audio)
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        return self._run(self._collect(text, voice))
+
+    def synthesize_many(self, texts, voice: str) -> list:
+        async def _gather():
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def _one(text):
+                async with semaphore:
+                    return await self._collect(text, voice)
+
+            return await asyncio.gather(*(_one(text) for text in texts))
+
+        return list(self._run(_gather())) if texts else []
+
+
+class OfflineSynthesizer(BaseSynthesizer):
+    """
+    Stand-in without network: silence of ms_per_char per character.
+    latency_ms simulates the round trip of a remote backend in benchmarks.
+    """
+
+    def __init__(self, ms_per_char: int = 60, latency_ms: int = 0):
+        self.ms_per_char = ms_per_char
+        self.latency_ms = latency_ms
+
+    def synthesize(self, text: str, voice: str) -> bytes:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return silent_frames(len(text) * self.ms_per_char)
+
+
+def get_synthesizer() -> BaseSynthesizer:
+    """Backend from settings.TTS_SYNTHESIZER (+ optional TTS_SYNTHESIZER_OPTIONS kwargs)."""
+    backend = import_string(settings.TTS_SYNTHESIZER)
+    return backend(**getattr(settings, 'TTS_SYNTHESIZER_OPTIONS', {}))
@@ -18,31 +18,20 @@ from django.utils import timezone
 
 from .models import QueueNumber, QueueEntry, ServiceStation, QueueStatus
 from .serializers import QueueNumberSerializer, ServiceStationSerializer
-from .services import ClinicalQueueService
+from .services import QueueService, ClinicalQueueService
+from . import board as board_store
 
 
-def _broadcast_queue_update(station):
+def _broadcast_queue_update(station, entry_ids=None):
     """
-    Push the full queue board to all WebSocket-connected displays for this station.
+    Push queue board changes to all WebSocket-connected displays for this station.
+    entry_ids given → only those entries are sent (queue_delta); otherwise the full board.
     Safe to call from sync context (views).
     """
-    try:
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        channel_layer = get_channel_layer()
-        if channel_layer is None:
-            return
-        board = ClinicalQueueService.get_queue_board(station)
-        async_to_sync(channel_layer.group_send)(
-            f'qms_station_{station.id}',
-            {
-                'type': 'queue_update',
-                'data': board,
-            },
-        )
-    except Exception:
-        import logging
-        logging.getLogger(__name__).exception('Failed to broadcast queue update')
+    if entry_ids:
+        board_store.publish_changes(station, entry_ids)
+    else:
+        board_store.publish_board(station)
 
 
 # ====================================================================
@@ -275,9 +264,8 @@ def doctor_call_next(request):
             'message': result['error'],
             'active_count': result.get('active_count', 0),
         }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-    
-    _broadcast_queue_update(station)
 
+    # Bảng hiển thị được cập nhật trong claim_next_waiting / signals
     return Response({
         'success': True,
         'message': f"Mời {result['display_label']} - {result['patient_name']}",
@@ -314,7 +302,7 @@ def queue_board(request):
     logger = logging.getLogger('qms')
 
     try:
-        board = ClinicalQueueService.get_queue_board(station)
+        board = board_store.get_board(station.id)
     except Exception as exc:
         logger.exception('get_queue_board crashed for station %s: %s', station_id, exc)
         return Response(
@@ -364,31 +352,30 @@ def queue_entry_update_status(request, entry_id):
             status=status.HTTP_404_NOT_FOUND,
         )
 
-    entry.status = new_status
-    if new_status == 'CALLED':
+    if new_status == 'COMPLETED':
+        QueueService.complete_service(entry)
+    elif new_status == 'CALLED':
+        entry.status = new_status
         # Re-call: xóa end_time, đặt lại called_time
         entry.end_time = None
         entry.called_time = timezone.now()
         entry.save(update_fields=['status', 'end_time', 'called_time'])
     else:
+        entry.status = new_status
         entry.end_time = timezone.now()
         entry.save(update_fields=['status', 'end_time'])
 
-    _broadcast_queue_update(entry.station)
+    _broadcast_queue_update(entry.station, entry_ids=[entry.id])
 
-    # TTS: generate audio for recall
+    # TTS: clip của lần gọi trước (nếu còn) — chưa có thì tạo nền, không chờ
     audio_url = None
+    audio_pending = False
     if new_status == 'CALLED':
         try:
-            from apps.core_services.qms.tts_service import generate_tts_audio, get_audio_url
+            from apps.core_services.qms.tts_service import get_audio_url, request_audio
             audio_url = get_audio_url(str(entry.id))
             if not audio_url:
-                task = generate_tts_audio.apply_async(args=[str(entry.id)], expires=30)
-                try:
-                    result = task.get(timeout=5)
-                    audio_url = result.get('audio_url') if isinstance(result, dict) else None
-                except Exception:
-                    pass
+                audio_pending = request_audio(entry.id)
         except Exception:
             pass
 
@@ -399,6 +386,7 @@ def queue_entry_update_status(request, entry_id):
         'queue_number': entry.queue_number.number_code,
         'status': new_status,
         'audio_url': audio_url,
+        'audio_pending': audio_pending,
     })
 
 
@@ -412,19 +400,16 @@ def serve_tts_audio(request, entry_id):
     Returns: MP3 file (audio/mpeg) or 404
     """
     from django.http import FileResponse
-    from apps.core_services.qms.tts_service import get_audio_url, _get_redis_client
-    import os
+    from apps.core_services.qms import tts_store
 
-    r = _get_redis_client()
-    redis_key = f'tts:audio:{entry_id}'
-    file_path = r.get(redis_key)
+    file_path = tts_store.entry_clip(entry_id)
 
-    if file_path and os.path.exists(file_path):
+    if file_path is not None:
         return FileResponse(
             open(file_path, 'rb'),
             content_type='audio/mpeg',
             as_attachment=False,
-            filename=os.path.basename(file_path),
+            filename=file_path.name,
         )
 
     return Response(
@@ -474,7 +459,9 @@ class QueueNumberViewSet(viewsets.ModelViewSet):
                 ]
             ).order_by('-entered_queue_time').first()
 
-            if entry:
+            if entry and new_status == 'COMPLETED':
+                QueueService.complete_service(entry)
+            elif entry:
                 entry.status = new_status
                 entry.end_time = timezone.now()
                 entry.save(update_fields=['status', 'end_time'])
@@ -0,0 +1,195 @@
+"""
+QMS Wait Estimator — rolling service-time model per station and hour of day.
+
+Each station has one Redis hash `qms:svc:{station_id}`:
+    h{0..23}   EWMA of service minutes for patients started in that hour
+    all        EWMA over the whole day (used while an hour has few samples)
+    n_{field}  sample count of each field
+    last_call  unix time of the latest call-next, call_gap = EWMA of seconds
+               between calls (the station's call rate)
+
+complete_service() feeds one observation (end_time - start_time, or
+called_time when the visit was never explicitly started), so the model is
+updated incrementally and an estimate is a single HMGET — no history scan.
+Nothing here is the source of truth: if Redis loses the hash the model
+relearns (or `manage.py rebuild_wait_estimator` replays recent history).
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from apps.core_services.core.utils import get_redis_client
+
+logger = logging.getLogger('qms')
+
+ALPHA = 0.2              # weight of the newest observation
+MIN_HOUR_SAMPLES = 3     # below this the daily average is used for that hour
+MIN_MINUTES = 0.5        # ignore accidental double clicks...
+MAX_MINUTES = 180        # ...and entries left open for hours
+MODEL_TTL = 30 * 86400   # stations that stop receiving patients are forgotten
+MAX_CALL_GAP = 30 * 60   # longer pauses (lunch, end of shift) are not part of the rate
+
+# KEYS[1]=hash, ARGV[1]=minutes, ARGV[2]=alpha, ARGV[3]=ttl, ARGV[4..]=fields
+_UPDATE_SCRIPT = """
+local x = tonumber(ARGV[1])
+local alpha = tonumber(ARGV[2])
+for i = 4, #ARGV do
+    local field = ARGV[i]
+    local current = redis.call('HGET', KEYS[1], field)
+    local value = x
+    if current then
+        value = tonumber(current) + alpha * (x - tonumber(current))
+    end
+    redis.call('HSET', KEYS[1], field, tostring(value))
+    redis.call('HINCRBY', KEYS[1], 'n_' .. field, 1)
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return 1
+"""
+_update_script = None
+
+# KEYS[1]=hash, ARGV[1]=now (s), ARGV[2]=alpha, ARGV[3]=max gap (s), ARGV[4]=ttl
+_CALL_SCRIPT = """
+local now = tonumber(ARGV[1])
+local last = tonumber(redis.call('HGET', KEYS[1], 'last_call') or '')
+redis.call('HSET', KEYS[1], 'last_call', ARGV[1])
+if last then
+    local gap = now - last
+    if gap > 0 and gap <= tonumber(ARGV[3]) then
+        local current = tonumber(redis.call('HGET', KEYS[1], 'call_gap') or '')
+        local value = gap
+        if current then
+            value = current + tonumber(ARGV[2]) * (gap - current)
+        end
+        redis.call('HSET', KEYS[1], 'call_gap', tostring(value))
+    end
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return 1
+"""
+_call_script = None
+
+
+def _key(station_id) -> str:
+    return f'qms:svc:{station_id}'
+
+
+def _hour(at=None) -> int:
+    return timezone.localtime(at or timezone.now()).hour
+
+
+def default_service_minutes() -> float:
+    return float(getattr(settings, 'QMS_DEFAULT_SERVICE_MINUTES', 10))
+
+
+def observe(station_id, started_at, ended_at) -> None:
+    """Feed one completed service into the model."""
+    if not started_at or not ended_at:
+        return
+    minutes = (ended_at - started_at).total_seconds() / 60
+    if not MIN_MINUTES <= minutes <= MAX_MINUTES:
+        return
+
+    global _update_script
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        if _update_script is None:
+            _update_script = client.register_script(_UPDATE_SCRIPT)
+        _update_script(
+            keys=[_key(station_id)],
+            args=[minutes, ALPHA, MODEL_TTL, f'h{_hour(started_at)}', 'all'],
+        )
+    except redis.RedisError as e:
+        logger.warning('[WAIT_MODEL] update failed for station=%s: %s', station_id, e)
+
+
+def observe_entry(entry) -> None:
+    """Feed a just-completed QueueEntry into the model."""
+    observe(entry.station_id, entry.start_time or entry.called_time, entry.end_time)
+
+
+def observe_call(station_id, at=None) -> None:
+    """Feed one call-next into the station's call-rate model."""
+    global _call_script
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        if _call_script is None:
+            _call_script = client.register_script(_CALL_SCRIPT)
+        _call_script(
+            keys=[_key(station_id)],
+            args=[(at or timezone.now()).timestamp(), ALPHA, MAX_CALL_GAP, MODEL_TTL],
+        )
+    except redis.RedisError as e:
+        logger.warning('[WAIT_MODEL] call update failed for station=%s: %s', station_id, e)
+
+
+def calls_per_minute(station_id):
+    """Observed call rate of a station (calls / minute), None until two calls were seen."""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        gap = client.hget(_key(station_id), 'call_gap')
+    except redis.RedisError as e:
+        logger.warning('[WAIT_MODEL] read call rate failed for station=%s: %s', station_id, e)
+        return None
+    return 60 / float(gap) if gap else None
+
+
+def _pick(values) -> float:
+    hour_value, hour_count, all_value = values
+    if hour_value is not None and int(hour_count or 0) >= MIN_HOUR_SAMPLES:
+        return float(hour_value)
+    if all_value is not None:
+        return float(all_value)
+    return default_service_minutes()
+
+
+def average_service_minutes(station_id, at=None) -> float:
+    """Expected minutes per patient at a station for the hour of `at` (default: now)."""
+    return average_service_minutes_many([station_id], at)[str(station_id)]
+
+
+def average_service_minutes_many(station_ids, at=None) -> dict:
+    """Same as average_service_minutes for several stations in one round trip."""
+    hour_field = f'h{_hour(at)}'
+    fields = [hour_field, f'n_{hour_field}', 'all']
+    station_ids = [str(station_id) for station_id in station_ids]
+
+    client = get_redis_client()
+    if client is None or not station_ids:
+        return {station_id: default_service_minutes() for station_id in station_ids}
+    try:
+        pipe = client.pipeline(transaction=False)
+        for station_id in station_ids:
+            pipe.hmget(_key(station_id), fields)
+        rows = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning('[WAIT_MODEL] read failed: %s', e)
+        return {station_id: default_service_minutes() for station_id in station_ids}
+
+    return {
+        station_id: _pick(values)
+        for station_id, values in zip(station_ids, rows)
+    }
+
+
+def estimate_wait_minutes(waiting_count: int, avg_service_minutes: float) -> int:
+    return int(round(waiting_count * avg_service_minutes))
+
+
+def reset(station_id) -> None:
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.delete(_key(station_id))
+    except redis.RedisError as e:
+        logger.warning('[WAIT_MODEL] reset failed for station=%s: %s', station_id, e)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:49
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Bảng lượt khám được ghi liên tục trong giờ tiếp đón → tạo index không khóa ghi
+    atomic = False
+
+    dependencies = [
+        ('reception', '0014_visit_pre_triage_summary_visit_triage_hints_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='visit',
+            index=models.Index(fields=['-check_in_time', '-id'], name='visit_checkin_idx'),
+        ),
+    ]
@@ -110,5 +110,11 @@ class Visit(UUIDModel):
 
     queue_number = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            # Danh sách lượt khám: lọc khoảng ngày + phân trang keyset (check_in_time, id) — pagination.py
+            models.Index(fields=['-check_in_time', '-id'], name='visit_checkin_idx'),
+        ]
+
     def __str__(self):
         return f"Visit {self.visit_code} - {self.patient}"
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Phân trang keyset cho danh sách lượt khám — màn hình tiếp đón / phòng khám poll liên tục.
+
+    GET /reception/visits/?today=1             → {"next": "…?cursor=…", "previous": null, "results": [...]}
+    GET /reception/visits/?today=1&cursor=…    → trang kế
+
+Thứ tự (check_in_time DESC, id DESC). Trang sau = các dòng đứng sau dòng cuối
+theo cặp (check_in_time, id) — đi thẳng trên index visit_checkin_idx, không
+OFFSET / COUNT(*), nên trang 1 hay trang 100 tốn như nhau và bản ghi mới
+check-in không làm trang sau bị lặp / sót dòng.
+
+Có ?page= → phân trang theo trang như cũ (dashboard cần `count`).
+"""
+
+import base64
+import json
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+ORDERING = ('-check_in_time', '-id')
+REVERSE_ORDERING = ('check_in_time', 'id')
+
+
+def encode_cursor(visit, reverse=False) -> str:
+    payload = {
+        't': visit.check_in_time.isoformat() if visit.check_in_time else None,
+        'id': str(visit.pk),
+        'r': int(reverse),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(raw: str):
+    """Cursor → (check_in_time | None, id, reverse). Sai định dạng → NotFound (như CursorPagination của DRF)."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(raw.encode()))
+        check_in_time = parse_datetime(payload['t']) if payload['t'] else None
+        if payload['t'] and check_in_time is None:
+            raise ValueError(payload['t'])
+        return check_in_time, uuid.UUID(payload['id']), bool(payload.get('r'))
+    except (TypeError, ValueError, KeyError, AttributeError):
+        raise NotFound('Cursor không hợp lệ.')
+
+
+def after(check_in_time, pk) -> Q:
+    """Các dòng đứng sau (check_in_time, pk) theo ORDERING (DESC, NULL đứng đầu như Postgres)."""
+    if check_in_time is None:
+        return Q(check_in_time__isnull=True, id__lt=pk) | Q(check_in_time__isnull=False)
+    return Q(check_in_time__lt=check_in_time) | Q(check_in_time=check_in_time, id__lt=pk)
+
+
+def before(check_in_time, pk) -> Q:
+    """Các dòng đứng trước (check_in_time, pk) theo ORDERING."""
+    if check_in_time is None:
+        return Q(check_in_time__isnull=True, id__gt=pk)
+    return Q(check_in_time__gt=check_in_time) | Q(check_in_time=check_in_time, id__gt=pk) | Q(check_in_time__isnull=True)
+
+
+class VisitKeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.legacy = None
+        if request.query_params.get('page'):
+            self.legacy = PageNumberPagination()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        raw = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if raw:
+            check_in_time, pk, reverse = decode_cursor(raw)
+            queryset = queryset.filter(before(check_in_time, pk) if reverse else after(check_in_time, pk))
+        queryset = queryset.order_by(*(REVERSE_ORDERING if reverse else ORDERING))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Đi tới: còn trang sau nếu lấy dư 1 dòng; có trang trước nếu đang đứng ở cursor.
+        # Đi lùi: ngược lại.
+        self.has_next = bool(rows) and (reverse or has_more)
+        self.has_previous = bool(rows) and ((not reverse and bool(raw)) or (reverse and has_more))
+        self.page = rows
+        return rows
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self._link(encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self._link(encode_cursor(self.page[0], reverse=True))
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import Visit
+from apps.core_services.patients.models import Patient
 from apps.core_services.patients.serializers import PatientSerializer
+from apps.core_services.departments.models import Department
 from apps.core_services.departments.serializers import DepartmentSerializer
 
 
@@ -26,3 +28,53 @@ class VisitSerializer(serializers.ModelSerializer):
             'recommended_department', 'confirmed_department', 'triage_confirmed_at',
         )
 
+
+
+class VisitPatientBriefSerializer(serializers.ModelSerializer):
+    full_name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Patient
+        fields = ['id', 'patient_code', 'first_name', 'last_name', 'full_name', 'date_of_birth', 'gender']
+
+
+class VisitDepartmentBriefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Department
+        fields = ['id', 'code', 'name']
+
+
+class VisitListSerializer(serializers.ModelSerializer):
+    """
+    Danh sách lượt khám (tiếp đón / phòng khám poll liên tục) — chỉ các cột màn hình danh sách dùng.
+    Phản hồi AI, BHYT, tóm tắt trước khám... lấy qua GET /reception/visits/{id}/.
+    """
+    patient_detail = VisitPatientBriefSerializer(source='patient', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    priority_display = serializers.CharField(source='get_priority_display', read_only=True)
+    recommended_department_detail = VisitDepartmentBriefSerializer(source='recommended_department', read_only=True)
+    confirmed_department_detail = VisitDepartmentBriefSerializer(source='confirmed_department', read_only=True)
+
+    # Cột Visit / Patient / Department cần nạp — VisitViewSet dùng cho .only()
+    QUERY_FIELDS = (
+        'id', 'visit_code', 'status', 'priority', 'queue_number', 'check_in_time', 'check_out_time',
+        'chief_complaint', 'vital_signs', 'triage_code', 'triage_confidence', 'triage_key_factors',
+        'triage_matched_departments', 'triage_method', 'triage_confirmed_at', 'pending_merge',
+        'patient__id', 'patient__patient_code', 'patient__first_name', 'patient__last_name',
+        'patient__date_of_birth', 'patient__gender',
+        'recommended_department__id', 'recommended_department__code', 'recommended_department__name',
+        'confirmed_department__id', 'confirmed_department__code', 'confirmed_department__name',
+    )
+
+    class Meta:
+        model = Visit
+        fields = [
+            'id', 'visit_code', 'patient', 'patient_detail',
+            'status', 'status_display', 'priority', 'priority_display',
+            'queue_number', 'check_in_time', 'check_out_time',
+            'chief_complaint', 'vital_signs', 'triage_code', 'triage_confidence', 'triage_key_factors',
+            'triage_matched_departments', 'triage_method', 'triage_confirmed_at', 'pending_merge',
+            'recommended_department', 'recommended_department_detail',
+            'confirmed_department', 'confirmed_department_detail',
+        ]
+        read_only_fields = fields
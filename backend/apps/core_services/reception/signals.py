@@ -8,10 +8,13 @@ from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
+from apps.core_services.core.utils import timing
+
 from .models import Visit
 
 
 @receiver(post_save, sender=Visit)
+@timing.staged('broadcast')
 def broadcast_visit_event(sender, instance, created, **kwargs):
     """
     When a Visit is created, broadcast to the reception_notifications group
@@ -0,0 +1,123 @@
+"""
+Reception Tests — Tiếp đón
+
+Tests:
+  1. Danh sách lượt khám - phân trang keyset (check_in_time, id): đi tới / lùi đủ, không lặp khi có lượt mới
+  2. Danh sách lượt khám - ?today= theo khoảng giờ trong ngày; ?page= giữ phân trang theo trang (count)
+  3. Danh sách lượt khám - ?station_id= qua EXISTS: mỗi visit 1 dòng dù có nhiều phiếu tại station
+  4. Danh sách lượt khám - serializer gọn, số query không đổi theo số dòng; cursor sai → 404
+"""
+
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.core_services.authentication.models import User
+from apps.core_services.patients.models import Patient
+from apps.core_services.qms.models import QueueEntry, QueueNumber, ServiceStation, StationType
+from .models import Visit
+
+URL = '/api/v1/reception/visits/'
+
+
+class VisitListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(patient_code='BN-LIST-001', first_name='An', last_name='Nguyen')
+        cls.now = timezone.now().replace(microsecond=0)
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(email='tiepdon.list@test.vn', password='x', phone='0900000010')
+        self.client.force_authenticate(user)
+
+    def _visit(self, idx, check_in_time, **extra):
+        return Visit.objects.create(
+            patient=self.patient, visit_code=f'V-LIST-{idx:03d}', queue_number=idx,
+            check_in_time=check_in_time, **extra,
+        )
+
+    def _walk(self, url, params=None, key='next'):
+        codes, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            codes += [v['visit_code'] for v in response.data['results']]
+            pages += 1
+            if not response.data[key]:
+                return codes, pages, response
+            response = self.client.get(response.data[key])
+
+    def test_keyset_pages_forward_and_back(self):
+        # 45 lượt, nhiều lượt trùng check_in_time → thứ tự phụ theo id
+        visits = [self._visit(i, self.now - timedelta(minutes=i // 3)) for i in range(45)]
+        expected = [v.visit_code for v in sorted(visits, key=lambda v: (v.check_in_time, v.pk), reverse=True)]
+
+        codes, pages, last = self._walk(URL)
+        self.assertEqual(codes, expected)
+        self.assertEqual(pages, 3)
+        self.assertNotIn('count', last.data)
+
+        # Đi lùi từ trang cuối về trang đầu
+        back = []
+        response = self.client.get(last.data['previous'])
+        while True:
+            back = [v['visit_code'] for v in response.data['results']] + back
+            if not response.data['previous']:
+                break
+            response = self.client.get(response.data['previous'])
+        self.assertEqual(back, expected[:40])
+
+        # Lượt mới check-in giữa chừng không đẩy dòng cũ sang trang sau (không lặp)
+        first = self.client.get(URL)
+        self._visit(99, self.now + timedelta(minutes=1))
+        second = self.client.get(first.data['next'])
+        self.assertEqual([v['visit_code'] for v in second.data['results']], expected[20:40])
+
+    def test_today_range_and_legacy_page(self):
+        start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+        self._visit(1, start)
+        self._visit(2, start - timedelta(seconds=1))  # hôm qua
+        self._visit(3, start + timedelta(days=1))  # 00:00 ngày mai
+
+        response = self.client.get(URL, {'today': 'true'})
+        self.assertEqual([v['visit_code'] for v in response.data['results']], ['V-LIST-001'])
+
+        response = self.client.get(URL, {'page': 1})
+        self.assertEqual(response.data['count'], 3)
+
+    def test_station_filter_exists(self):
+        station = ServiceStation.objects.create(code='TD-LIST', name='Tiếp đón', station_type=StationType.TRIAGE)
+        other = ServiceStation.objects.create(code='TD-OTHER', name='Tiếp đón 2', station_type=StationType.TRIAGE)
+        here = self._visit(1, self.now)
+        elsewhere = self._visit(2, self.now)
+        for seq, (visit, target) in enumerate([(here, station), (here, station), (elsewhere, other)], start=1):
+            number = QueueNumber.objects.create(
+                number_code=f'TD-{seq:03d}', daily_sequence=seq, visit=visit, station=target,
+            )
+            QueueEntry.objects.create(queue_number=number, station=target)
+            QueueEntry.objects.create(queue_number=number, station=target)
+
+        response = self.client.get(URL, {'station_id': str(station.id)})
+        self.assertEqual([v['visit_code'] for v in response.data['results']], ['V-LIST-001'])
+
+    def test_slim_serializer_constant_queries_and_bad_cursor(self):
+        self._visit(1, self.now, triage_ai_response='x' * 1000)
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.get(URL)
+        row = response.data['results'][0]
+        self.assertNotIn('triage_ai_response', row)
+        self.assertEqual(row['patient_detail']['full_name'], 'Nguyen An')
+
+        for i in range(2, 12):
+            self._visit(i, self.now)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(URL)
+        self.assertEqual(len(many), len(one))
+
+        self.assertEqual(self.client.get(URL, {'cursor': 'khong-hop-le'}).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/reception/visits/{row["id"]}/').data['triage_ai_response'], 'x' * 1000)
@@ -2,35 +2,53 @@ from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
+from datetime import datetime, timedelta
+from apps.core_services.core.utils import CodeAllocator
 from .models import Visit
-from .serializers import VisitSerializer
-import uuid
+from .pagination import VisitKeysetPagination
+from .serializers import VisitListSerializer, VisitSerializer
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def today_range():
+    """[00:00 hôm nay, 00:00 ngày mai) theo giờ địa phương — so sánh thẳng check_in_time, dùng được index."""
+    start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    return start, start + timedelta(days=1)
+
+
 class VisitViewSet(viewsets.ModelViewSet):
     queryset = Visit.objects.select_related(
         'patient', 'recommended_department', 'confirmed_department'
-    ).all().order_by('-check_in_time')
+    ).all().order_by('-check_in_time', '-id')
     serializer_class = VisitSerializer
+    pagination_class = VisitKeysetPagination
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['visit_code', 'patient__patient_code', 'patient__first_name']
     filterset_fields = ['priority', 'patient']
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return VisitListSerializer
+        return VisitSerializer
+
     def get_queryset(self):
         qs = Visit.objects.select_related(
             'patient', 'recommended_department', 'confirmed_department'
-        ).all().order_by('-check_in_time')
+        ).all().order_by('-check_in_time', '-id')
+        if self.action == 'list':
+            qs = qs.only(*VisitListSerializer.QUERY_FIELDS)
 
-        # Filter: chỉ lấy hôm nay
+        # Filter: chỉ lấy hôm nay (station_id cũng chỉ xét hôm nay)
         today_param = self.request.query_params.get('today')
-        if today_param and today_param.lower() in ('true', '1', 'yes'):
-            today = timezone.now().date()
-            qs = qs.filter(check_in_time__date=today)
+        station_id = self.request.query_params.get('station_id')
+        if (today_param and today_param.lower() in ('true', '1', 'yes')) or (station_id and not today_param):
+            start, end = today_range()
+            qs = qs.filter(check_in_time__gte=start, check_in_time__lt=end)
 
         # Filter: hỗ trợ comma-separated status (VD: WAITING,IN_PROGRESS,PENDING_RESULTS)
         status_param = self.request.query_params.get('status')
@@ -39,43 +57,30 @@ class VisitViewSet(viewsets.ModelViewSet):
             qs = qs.filter(status__in=statuses)
 
         # Filter: chỉ lấy visits được đưa vào hàng đợi tại station này hôm nay
-        station_id = self.request.query_params.get('station_id')
+        # EXISTS thay cho JOIN queue_numbers → entries + DISTINCT (1 visit có nhiều phiếu)
         if station_id:
-            if not today_param:
-                today = timezone.now().date()
-                qs = qs.filter(check_in_time__date=today)
-            qs = qs.filter(
-                queue_numbers__entries__station_id=station_id
-            ).distinct()
+            from apps.core_services.qms.models import QueueEntry
+            qs = qs.filter(Exists(QueueEntry.objects.filter(
+                queue_number__visit=OuterRef('pk'), station_id=station_id,
+            )))
 
         return qs
 
     def perform_create(self, serializer):
-        # Auto-generate visit_code and queue_number
-        today = timezone.now().date()
-        today_str = timezone.now().strftime('%Y%m%d')
-        
-        # Calculate queue_number for today
-        today_count = Visit.objects.filter(check_in_time__date=today).count()
-        queue_number = today_count + 1
-        
-        # Generate visit_code
-        code = f"V{today_str}-{uuid.uuid4().hex[:6].upper()}"
-        visit = serializer.save(
-            visit_code=code, 
+        # Auto-generate visit_code and queue_number (số thứ tự lượt khám trong ngày)
+        visit = CodeAllocator.create('visit', lambda code: serializer.save(
+            visit_code=code.code,
             check_in_time=timezone.now(),
-            queue_number=queue_number
-        )
+            queue_number=code.sequence,
+        ))
 
         # ---  Snapshot BHYT vào Visit (để Billing dùng không cần tra lại) ---
         try:
-            from apps.core_services.insurance_mock.mock_data import (
-                LOOKUP_BY_FULL_CODE, LOOKUP_BY_SHORT_CODE
-            )
+            from apps.core_services.insurance_mock.lookup import InsuranceLookupService
             patient = visit.patient
             ins_num = getattr(patient, 'insurance_number', None)
             if ins_num:
-                record = LOOKUP_BY_FULL_CODE.get(ins_num.upper()) or LOOKUP_BY_SHORT_CODE.get(ins_num)
+                record = InsuranceLookupService.lookup(ins_num)  # cache dùng chung với Kiosk / API tra cứu
                 if record:
                     data = record.get('data', {}) if isinstance(record, dict) and 'data' in record else record
                     benefit_rate = data.get('benefit_rate')
@@ -160,15 +165,7 @@ class VisitViewSet(viewsets.ModelViewSet):
                                     'visit': visit_payload,
                                 }
                             )
-                            # Queue board update
-                            board = ClinicalQueueService.get_queue_board(optimal_station)
-                            async_to_sync(channel_layer.group_send)(
-                                f'clinical_station_{optimal_station.id}',
-                                {
-                                    'type': 'queue_update',
-                                    'data': board,
-                                }
-                            )
+                            # Bảng hàng chờ: board publisher gửi delta (signal QueueEntry) cho cả màn hình bác sĩ
                     except Exception as ws_err:
                         logger.warning(f"Failed to broadcast clinical WS for emergency: {ws_err}")
                 except Exception as e:
@@ -236,64 +233,10 @@ class VisitViewSet(viewsets.ModelViewSet):
         # Query bệnh án cũ (ClinicalRecord) để gửi cho AI
         medical_history_text = ""
         try:
-            from apps.medical_services.emr.models import ClinicalRecord
-            from apps.medical_services.lis.models import LabOrder
-            from apps.medical_services.ris.models import ImagingOrder
-            
-            # Fetch up to 30 past visits (Visit model is in the same app)
-            from apps.core_services.reception.models import Visit
-            past_visits = Visit.objects.filter(
-                patient=patient,
-                status__in=[Visit.Status.COMPLETED, Visit.Status.IN_PROGRESS, Visit.Status.PENDING_RESULTS]
-            ).exclude(id=visit.id).order_by('-check_in_time')[:30]
-            
-            if past_visits.exists():
-                history_parts = []
-                for idx, pv in enumerate(past_visits, 1):
-                    # Fetch ClinicalRecord for this visit
-                    cr = ClinicalRecord.objects.filter(visit=pv).first()
-                    
-                    parts = []
-                    if pv.chief_complaint:
-                        parts.append(f"Lý do khám: {pv.chief_complaint}")
-                    elif cr and cr.chief_complaint:
-                        parts.append(f"Lý do khám: {cr.chief_complaint}")
-                    
-                    if cr:
-                        if cr.history_of_present_illness:
-                            parts.append(f"Bệnh sử: {cr.history_of_present_illness}")
-                        if cr.physical_exam:
-                            parts.append(f"Khám lâm sàng: {cr.physical_exam}")
-                        if cr.medical_summary:
-                            parts.append(f"Tóm tắt bệnh án gốc: {cr.medical_summary}")
-                        if cr.final_diagnosis:
-                            parts.append(f"Chẩn đoán: {cr.final_diagnosis}")
-                        if cr.treatment_plan:
-                            parts.append(f"Điều trị: {cr.treatment_plan}")
-                        
-                    # Fetch Lab results
-                    lab_orders = LabOrder.objects.filter(visit=pv, status__in=['COMPLETED', 'VERIFIED']).prefetch_related('details__result', 'details__test')
-                    for order in lab_orders:
-                        for detail in order.details.all():
-                            if hasattr(detail, 'result'):
-                                res = detail.result
-                                val = res.value_numeric if res.value_numeric is not None else res.value_string
-                                unit = detail.test.unit or ''
-                                if res.is_abnormal:
-                                    parts.append(f"Xét nghiệm {detail.test.name}: {val} {unit} [BẤT THƯỜNG]")
-                                else:
-                                    parts.append(f"Xét nghiệm {detail.test.name}: {val} {unit}")
-                                    
-                    # Fetch Imaging results
-                    imaging_orders = ImagingOrder.objects.filter(visit=pv, status__in=['REPORTED', 'VERIFIED']).select_related('result', 'procedure')
-                    for order in imaging_orders:
-                        if hasattr(order, 'result'):
-                            res = order.result
-                            parts.append(f"CĐHA {order.procedure.name} - Kết luận: {res.conclusion}" + (" [BẤT THƯỜNG]" if res.is_abnormal else ""))
-                            
-                    date_str = pv.check_in_time.strftime('%d/%m/%Y') if pv.check_in_time else "N/A"
-                    history_parts.append(f"[{date_str}] " + "; ".join(parts))
-                medical_history_text = "\n".join(history_parts)
+            from apps.medical_services.emr.history import PatientHistoryService
+
+            # Tối đa 30 lượt khám cũ, mỗi lượt một dòng — số query cố định
+            medical_history_text = PatientHistoryService.load(patient, exclude_visit=visit).render_lines()
         except Exception as e:
             logger.warning(f"Could not fetch medical history: {e}")
         
@@ -642,16 +585,7 @@ YÊU CẦU:
                             'visit': visit_payload,
                         },
                     )
-                    # 2. Broadcast queue board update
-                    from apps.core_services.qms.services import ClinicalQueueService as _CQS
-                    board = _CQS.get_queue_board(optimal_station)
-                    async_to_sync(channel_layer.group_send)(
-                        f'clinical_station_{optimal_station.id}',
-                        {
-                            'type': 'queue_update',
-                            'data': board,
-                        },
-                    )
+                    # 2. Bảng hàng chờ: board publisher gửi delta (signal QueueEntry) cho cả màn hình bác sĩ
             except Exception as ws_err:
                 logger.warning(f"Failed to broadcast clinical WS: {ws_err}")
             
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class EmrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.medical_services.emr'
\ No newline at end of file
+    name = 'apps.medical_services.emr'
+
+    def ready(self):
+        import apps.medical_services.emr.signals  # noqa: F401
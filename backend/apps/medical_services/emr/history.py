@@ -0,0 +1,349 @@
+"""
+Patient history digest — bệnh án cũ của bệnh nhân cho các prompt AI.
+
+Kiosk (tóm tắt trước phân luồng) và Phân luồng (run_triage) cùng cần các lượt
+khám trước: hồ sơ bệnh án, kết quả xét nghiệm, kết quả CĐHA. Digest tải tất cả
+trong một số query cố định (không phụ thuộc số lượt khám):
+
+    1. Visit + ClinicalRecord + Khoa (select_related)
+    2. LabOrder đã có kết quả
+    3. LabOrderDetail + LabResult + LabTest
+    4. ImagingOrder đã có kết quả + ImagingResult + ImagingProcedure
+
+    digest = PatientHistoryService.load(patient, exclude_visit=visit)
+    digest.render_blocks()  # Kiosk: một khối nhiều dòng cho mỗi lượt khám
+    digest.render_lines()   # Phân luồng: một dòng cho mỗi lượt khám
+
+Digest được cache trong Redis theo bệnh nhân — bệnh nhân tái khám chỉ tốn
+1 lần đọc key (không query DB):
+    emr:history:{patient_id}      JSON của HISTORY_LIMIT + 1 lượt khám (TTL EMR_HISTORY_CACHE_TTL)
+    emr:history:{patient_id}:gen  tăng mỗi lần invalidate — bản build từ dữ liệu cũ
+                                  (bắt đầu trước khi invalidate) không ghi đè cache
+
+signals.py invalidate sau commit khi ClinicalRecord / LabResult / ImagingResult /
+LabOrder / ImagingOrder của một lượt khám trong digest đổi, hoặc một Visit vào /
+ra / đổi trong nhóm trạng thái của digest. Đổi tên xét nghiệm / kỹ thuật / khoa
+chỉ cập nhật khi cache hết hạn.
+"""
+
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+
+import redis
+from django.conf import settings
+from django.db.models import Prefetch
+
+from apps.core_services.core.utils import get_redis_client
+from apps.core_services.reception.models import Visit
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = 30  # lượt khám gần nhất — bao quát hầu hết bệnh nhân
+HISTORY_STATUSES = (Visit.Status.COMPLETED, Visit.Status.IN_PROGRESS, Visit.Status.PENDING_RESULTS)
+LAB_DONE = ('COMPLETED', 'VERIFIED')
+IMAGING_DONE = ('REPORTED', 'VERIFIED')
+ABNORMAL = ' [BẤT THƯỜNG]'
+
+
+@dataclass(frozen=True)
+class LabItem:
+    name: str
+    value: str
+    unit: str = ''
+    abnormal: bool = False
+
+
+@dataclass(frozen=True)
+class ImagingItem:
+    procedure: str
+    conclusion: str
+    abnormal: bool = False
+
+
+@dataclass(frozen=True)
+class VisitDigest:
+    """Một lượt khám cũ. Các trường bệnh án rỗng khi lượt khám chưa có ClinicalRecord."""
+    visit_id: str
+    date: str | None  # dd/mm/YYYY
+    department: str | None
+    chief_complaint: str = ''  # Visit.chief_complaint
+    record_complaint: str = ''  # ClinicalRecord.chief_complaint
+    history_of_present_illness: str = ''
+    physical_exam: str = ''
+    medical_summary: str = ''
+    final_diagnosis: str = ''
+    treatment_plan: str = ''
+    has_record: bool = False
+    labs: tuple[LabItem, ...] = ()
+    imaging: tuple[ImagingItem, ...] = ()
+
+    def render_block(self, idx: int) -> str:
+        complaint = self.chief_complaint
+        if not complaint:
+            complaint = self.final_diagnosis or self.record_complaint or 'Không rõ lý do'
+
+        lines = [
+            f"--- Lượt khám {idx} ({self.date or 'N/A'}) ---",
+            f"Khoa: {self.department or 'N/A'}",
+            f"Lý do khám/Chẩn đoán sơ bộ: {complaint}",
+        ]
+        for label, value in (
+            ('Bệnh sử', self.history_of_present_illness),
+            ('Khám lâm sàng', self.physical_exam),
+            ('Tóm tắt bệnh án (BS ghi nhận)', self.medical_summary),
+            ('Chẩn đoán cuối cùng', self.final_diagnosis),
+            ('Hướng điều trị', self.treatment_plan),
+        ):
+            if value:
+                lines.append(f"{label}: {value}")
+
+        if self.labs:
+            lines.append("Xét nghiệm:")
+            lines.extend(
+                f"  - {lab.name}: {lab.value} {lab.unit}" + (ABNORMAL if lab.abnormal else '')
+                for lab in self.labs
+            )
+        if self.imaging:
+            lines.append("Chẩn đoán hình ảnh:")
+            for img in self.imaging:
+                lines.append(f"  - {img.procedure}:")
+                lines.append(f"    + Kết luận: {img.conclusion}" + (ABNORMAL if img.abnormal else ''))
+        return '\n'.join(lines)
+
+    def render_line(self) -> str:
+        parts = []
+        complaint = self.chief_complaint or self.record_complaint
+        if complaint:
+            parts.append(f"Lý do khám: {complaint}")
+        for label, value in (
+            ('Bệnh sử', self.history_of_present_illness),
+            ('Khám lâm sàng', self.physical_exam),
+            ('Tóm tắt bệnh án gốc', self.medical_summary),
+            ('Chẩn đoán', self.final_diagnosis),
+            ('Điều trị', self.treatment_plan),
+        ):
+            if value:
+                parts.append(f"{label}: {value}")
+        parts.extend(
+            f"Xét nghiệm {lab.name}: {lab.value} {lab.unit}" + (ABNORMAL if lab.abnormal else '')
+            for lab in self.labs
+        )
+        parts.extend(
+            f"CĐHA {img.procedure} - Kết luận: {img.conclusion}" + (ABNORMAL if img.abnormal else '')
+            for img in self.imaging
+        )
+        return f"[{self.date or 'N/A'}] " + "; ".join(parts)
+
+
+@dataclass(frozen=True)
+class PatientHistoryDigest:
+    """Các lượt khám cũ của một bệnh nhân, mới nhất trước."""
+    patient_id: str
+    visits: tuple[VisitDigest, ...] = field(default_factory=tuple)
+
+    def render_blocks(self, empty: str = 'Chưa có lịch sử khám.') -> str:
+        if not self.visits:
+            return empty
+        return '\n\n'.join(v.render_block(idx) for idx, v in enumerate(self.visits, 1))
+
+    def render_lines(self, empty: str = '') -> str:
+        if not self.visits:
+            return empty
+        return '\n'.join(v.render_line() for v in self.visits)
+
+    def without(self, exclude_visit_id=None, limit: int = HISTORY_LIMIT) -> 'PatientHistoryDigest':
+        exclude_visit_id = str(exclude_visit_id) if exclude_visit_id else None
+        visits = [v for v in self.visits if v.visit_id != exclude_visit_id]
+        return PatientHistoryDigest(patient_id=self.patient_id, visits=tuple(visits[:limit]))
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> 'PatientHistoryDigest':
+        data = json.loads(raw)
+        return cls(
+            patient_id=data['patient_id'],
+            visits=tuple(
+                VisitDigest(**{
+                    **visit,
+                    'labs': tuple(LabItem(**lab) for lab in visit['labs']),
+                    'imaging': tuple(ImagingItem(**img) for img in visit['imaging']),
+                })
+                for visit in data['visits']
+            ),
+        )
+
+
+def _cache_key(patient_id) -> str:
+    return f'emr:history:{patient_id}'
+
+
+def _generation_key(patient_id) -> str:
+    return f'emr:history:{patient_id}:gen'
+
+
+def _cache_ttl() -> int:
+    return getattr(settings, 'EMR_HISTORY_CACHE_TTL', 86400)
+
+
+class PatientHistoryService:
+    @staticmethod
+    def queryset(patient_id, exclude_visit_id=None, limit: int = HISTORY_LIMIT):
+        """Các lượt khám cũ (đã khám / đang khám / chờ kết quả) kèm toàn bộ dữ liệu digest cần."""
+        from apps.medical_services.lis.models import LabOrder, LabOrderDetail
+        from apps.medical_services.ris.models import ImagingOrder
+
+        visits = Visit.objects.filter(patient_id=patient_id, status__in=HISTORY_STATUSES)
+        if exclude_visit_id:
+            visits = visits.exclude(id=exclude_visit_id)
+        return visits.select_related(
+            'clinical_record', 'confirmed_department',
+        ).prefetch_related(
+            Prefetch(
+                'lab_orders',
+                queryset=LabOrder.objects.filter(status__in=LAB_DONE).order_by('order_time').prefetch_related(
+                    Prefetch(
+                        'details',
+                        queryset=LabOrderDetail.objects.select_related('result', 'test').order_by('created_at'),
+                    ),
+                ),
+            ),
+            Prefetch(
+                'imaging_orders',
+                queryset=ImagingOrder.objects.filter(
+                    status__in=IMAGING_DONE,
+                ).select_related('result', 'procedure').order_by('order_time'),
+            ),
+        ).order_by('-check_in_time')[:limit]
+
+    @staticmethod
+    def digest_visit(visit) -> VisitDigest:
+        """VisitDigest từ một Visit lấy qua queryset() (không query thêm)."""
+        record = getattr(visit, 'clinical_record', None)
+
+        labs = []
+        for order in visit.lab_orders.all():
+            for detail in order.details.all():
+                result = getattr(detail, 'result', None)
+                if result is None:
+                    continue
+                value = result.value_numeric if result.value_numeric is not None else result.value_string
+                labs.append(LabItem(
+                    name=detail.test.name,
+                    value=str(value),
+                    unit=detail.test.unit or '',
+                    abnormal=result.is_abnormal,
+                ))
+
+        imaging = []
+        for order in visit.imaging_orders.all():
+            result = getattr(order, 'result', None)
+            if result is None:
+                continue
+            imaging.append(ImagingItem(
+                procedure=order.procedure.name,
+                conclusion=result.conclusion or '',
+                abnormal=result.is_abnormal,
+            ))
+
+        return VisitDigest(
+            visit_id=str(visit.id),
+            date=visit.check_in_time.strftime('%d/%m/%Y') if visit.check_in_time else None,
+            department=visit.confirmed_department.name if visit.confirmed_department else None,
+            chief_complaint=visit.chief_complaint or '',
+            record_complaint=(record.chief_complaint or '') if record else '',
+            history_of_present_illness=(record.history_of_present_illness or '') if record else '',
+            physical_exam=(record.physical_exam or '') if record else '',
+            medical_summary=(record.medical_summary or '') if record else '',
+            final_diagnosis=(record.final_diagnosis or '') if record else '',
+            treatment_plan=(record.treatment_plan or '') if record else '',
+            has_record=record is not None,
+            labs=tuple(labs),
+            imaging=tuple(imaging),
+        )
+
+    @staticmethod
+    def build(patient_id, exclude_visit_id=None, limit: int = HISTORY_LIMIT) -> PatientHistoryDigest:
+        """Digest đọc thẳng từ DB (4 query), không qua cache."""
+        visits = PatientHistoryService.queryset(patient_id, exclude_visit_id, limit)
+        return PatientHistoryDigest(
+            patient_id=str(patient_id),
+            visits=tuple(PatientHistoryService.digest_visit(v) for v in visits),
+        )
+
+    @staticmethod
+    def load(patient, exclude_visit=None, limit: int = HISTORY_LIMIT) -> PatientHistoryDigest:
+        """
+        Digest các lượt khám cũ của bệnh nhân (tối đa `limit`, mới nhất trước),
+        bỏ qua exclude_visit (lượt khám hiện tại).
+
+        Cache hit: 1 lần đọc Redis, 0 query. Miss / không có Redis: 4 query.
+        """
+        patient_id = str(getattr(patient, 'pk', patient))
+        exclude_id = getattr(exclude_visit, 'pk', exclude_visit)
+        if limit > HISTORY_LIMIT:
+            return PatientHistoryService.build(patient_id, exclude_id, limit)
+
+        client = get_redis_client()
+        if client is None:
+            return PatientHistoryService.build(patient_id, exclude_id, limit)
+
+        try:
+            raw, generation = client.mget(_cache_key(patient_id), _generation_key(patient_id))
+        except redis.RedisError as e:
+            logger.warning('[HISTORY] cache read failed for patient=%s: %s', patient_id, e)
+            return PatientHistoryService.build(patient_id, exclude_id, limit)
+        if raw:
+            return PatientHistoryDigest.from_json(raw).without(exclude_id, limit)
+
+        # +1: lượt khám bị loại (lượt hiện tại) vẫn để lại đủ HISTORY_LIMIT lượt
+        digest = PatientHistoryService.build(patient_id, limit=HISTORY_LIMIT + 1)
+        PatientHistoryService._store(client, patient_id, digest, generation)
+        return digest.without(exclude_id, limit)
+
+    @staticmethod
+    def _store(client, patient_id, digest: PatientHistoryDigest, generation) -> None:
+        """Ghi cache nếu chưa có invalidate nào kể từ lúc đọc generation."""
+        try:
+            with client.pipeline() as pipe:
+                pipe.watch(_generation_key(patient_id))
+                if pipe.get(_generation_key(patient_id)) != generation:
+                    return
+                pipe.multi()
+                pipe.set(_cache_key(patient_id), digest.to_json(), ex=_cache_ttl())
+                pipe.execute()
+        except redis.WatchError:
+            pass  # invalidate chen vào giữa → bản này đã cũ
+        except redis.RedisError as e:
+            logger.warning('[HISTORY] cache write failed for patient=%s: %s', patient_id, e)
+
+    @staticmethod
+    def invalidate(patient_id) -> None:
+        """Bỏ digest đã cache của bệnh nhân (gọi sau commit)."""
+        client = get_redis_client()
+        if client is None or not patient_id:
+            return
+        try:
+            pipe = client.pipeline(transaction=True)
+            pipe.delete(_cache_key(patient_id))
+            pipe.incr(_generation_key(patient_id))
+            pipe.expire(_generation_key(patient_id), _cache_ttl())
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning('[HISTORY] invalidate failed for patient=%s: %s', patient_id, e)
+
+    @staticmethod
+    def invalidate_visit(patient_id, visit_id) -> None:
+        """invalidate nếu digest đang cache có lượt khám này (lượt ngoài digest đổi → cache vẫn đúng)."""
+        client = get_redis_client()
+        if client is None or not patient_id:
+            return
+        try:
+            raw = client.get(_cache_key(patient_id))
+        except redis.RedisError as e:
+            logger.warning('[HISTORY] cache read failed for patient=%s: %s', patient_id, e)
+            return
+        if raw and any(v.visit_id == str(visit_id) for v in PatientHistoryDigest.from_json(raw).visits):
+            PatientHistoryService.invalidate(patient_id)
@@ -0,0 +1,70 @@
+"""
+Signals for EMR app.
+Keeps the cached patient history digest (history.PatientHistoryService) in
+step with the rows it is built from. Everything runs after commit, so a
+rolled-back change never drops the cache and a rebuild never sees it early.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .history import HISTORY_STATUSES, PatientHistoryService
+
+# Trường Visit mà digest dùng — save(update_fields=...) không đụng tới thì bỏ qua
+VISIT_DIGEST_FIELDS = {'status', 'chief_complaint', 'check_in_time', 'confirmed_department', 'patient'}
+
+
+def _invalidate_visit(patient_id, visit_id):
+    transaction.on_commit(lambda: PatientHistoryService.invalidate_visit(patient_id, visit_id))
+
+
+@receiver([post_save, post_delete], sender='reception.Visit')
+def invalidate_history_on_visit_change(sender, instance, **kwargs):
+    """
+    Visit đang ở trạng thái của digest (mới vào / đổi nội dung) → invalidate.
+    Ngoài nhóm đó: chỉ khi digest đang cache có nó (vừa rời nhóm / bị xoá) —
+    check-in, phân luồng, xếp hàng... không làm mất cache.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not VISIT_DIGEST_FIELDS & set(update_fields):
+        return
+    patient_id = instance.patient_id
+    if kwargs.get('signal') is post_save and instance.status in HISTORY_STATUSES:
+        transaction.on_commit(lambda: PatientHistoryService.invalidate(patient_id))
+    else:
+        _invalidate_visit(patient_id, instance.id)
+
+
+@receiver([post_save, post_delete], sender='emr.ClinicalRecord')
+def invalidate_history_on_record_change(sender, instance, **kwargs):
+    from apps.core_services.reception.models import Visit
+
+    visit_id = instance.visit_id
+    patient_id = Visit.objects.filter(id=visit_id).values_list('patient_id', flat=True).first()
+    _invalidate_visit(patient_id, visit_id)
+
+
+@receiver([post_save, post_delete], sender='lis.LabOrder')
+@receiver([post_save, post_delete], sender='ris.ImagingOrder')
+def invalidate_history_on_order_change(sender, instance, **kwargs):
+    """Trạng thái phiếu quyết định kết quả có vào digest hay không."""
+    _invalidate_visit(instance.patient_id, instance.visit_id)
+
+
+@receiver([post_save, post_delete], sender='lis.LabResult')
+def invalidate_history_on_lab_result_change(sender, instance, **kwargs):
+    from apps.medical_services.lis.models import LabOrder
+
+    order = LabOrder.objects.filter(details__id=instance.detail_id).values('patient_id', 'visit_id').first()
+    if order:
+        _invalidate_visit(order['patient_id'], order['visit_id'])
+
+
+@receiver([post_save, post_delete], sender='ris.ImagingResult')
+def invalidate_history_on_imaging_result_change(sender, instance, **kwargs):
+    from apps.medical_services.ris.models import ImagingOrder
+
+    order = ImagingOrder.objects.filter(id=instance.order_id).values('patient_id', 'visit_id').first()
+    if order:
+        _invalidate_visit(order['patient_id'], order['visit_id'])
@@ -1,3 +1,218 @@
+"""
+EMR Tests — Bệnh án
+
+Tests:
+  1. History digest - số query cố định dù bệnh nhân có bao nhiêu lượt khám / kết quả
+  2. History digest - nội dung prompt Kiosk (khối) và Phân luồng (dòng), bỏ lượt khám hiện tại
+  3. History cache - tái khám đọc 1 key (0 query); signals invalidate đúng lúc (cần Redis)
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.core_services.authentication.models import Staff, User
+from apps.core_services.core.utils import get_redis_client
+from apps.core_services.departments.models import Department
+from apps.core_services.patients.models import Patient
+from apps.core_services.reception.models import Visit
+from apps.medical_services.lis.models import LabCategory, LabOrder, LabOrderDetail, LabResult, LabTest
+from apps.medical_services.ris.models import ImagingOrder, ImagingProcedure, ImagingResult, Modality
+from .history import PatientHistoryService, _generation_key
+from .models import ClinicalRecord
+
+
+class HistoryTestMixin:
+    """Bệnh nhân có nhiều lượt khám cũ kèm bệnh án, xét nghiệm, CĐHA."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email='bs.digest@test.vn', password='x', phone='0900000001')
+        cls.doctor = Staff.objects.create(user=user, role=Staff.StaffRole.DOCTOR)
+        cls.department = Department.objects.create(name='Nội tổng quát', code='NOI-DG')
+        cls.patient = Patient.objects.create(patient_code='BN-DG-001', first_name='Digest', last_name='Nguyen')
+        category = LabCategory.objects.create(name='Sinh hóa (digest)')
+        cls.glucose = LabTest.objects.create(category=category, code='GLU-DG', name='Glucose', unit='mmol/L',
+                                         min_limit=3.9, max_limit=6.4)
+        cls.hba1c = LabTest.objects.create(category=category, code='HBA1C-DG', name='HbA1c', unit='%')
+        modality = Modality.objects.create(code='XQ-DG', name='X-Quang')
+        cls.chest_xray = ImagingProcedure.objects.create(modality=modality, code='XQ-NGUC-DG', name='X-Quang ngực')
+        cls.visits = 0
+
+    def setUp(self):
+        # Lưu ClinicalRecord → thread index RAG (embedding, mở kết nối DB riêng) — không cần ở đây
+        indexing = patch('apps.ai_engine.rag_service.signals._run_async_indexing')
+        indexing.start()
+        self.addCleanup(indexing.stop)
+        PatientHistoryService.invalidate(self.patient.id)  # Redis không rollback theo test
+
+    def _past_visit(self, days_ago, with_results=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self._create_past_visit(days_ago, with_results)
+
+    def _create_past_visit(self, days_ago, with_results):
+        type(self).visits += 1
+        idx = type(self).visits
+        visit = Visit.objects.create(
+            patient=self.patient,
+            visit_code=f'V-DG-{idx:03d}',
+            status=Visit.Status.COMPLETED,
+            queue_number=idx,
+            check_in_time=timezone.now() - timedelta(days=days_ago),
+            confirmed_department=self.department,
+            chief_complaint=f'Đau bụng lần {idx}',
+        )
+        ClinicalRecord.objects.create(
+            visit=visit,
+            doctor=self.doctor,
+            chief_complaint='Đau thượng vị',
+            history_of_present_illness='Đau 3 ngày',
+            final_diagnosis='Viêm dạ dày',
+            treatment_plan='PPI 4 tuần',
+        )
+        if not with_results:
+            return visit
+
+        lab = LabOrder.objects.create(visit=visit, patient=self.patient, doctor=self.doctor, status='VERIFIED')
+        for test, value in ((self.glucose, 8.2), (self.hba1c, 5.4)):
+            detail = LabOrderDetail.objects.create(order=lab, test=test)
+            LabResult.objects.create(detail=detail, value_string=str(value), value_numeric=value)  # cờ theo ngưỡng
+        # Chưa có kết quả → không vào digest
+        LabOrder.objects.create(visit=visit, patient=self.patient, doctor=self.doctor, status='PENDING')
+
+        imaging = ImagingOrder.objects.create(
+            visit=visit, patient=self.patient, doctor=self.doctor, procedure=self.chest_xray, status='REPORTED',
+        )
+        ImagingResult.objects.create(
+            order=imaging, radiologist=self.doctor, findings='Bóng tim to', conclusion='Tim to độ I', is_abnormal=True,
+        )
+        return visit
+
+
+class HistoryDigestTests(HistoryTestMixin, TestCase):
+    """Digest bệnh án cũ dùng chung cho Kiosk và Phân luồng."""
+
+    def test_constant_query_count(self):
+        """1 lượt khám hay 12 lượt khám (mỗi lượt 3 xét nghiệm + CĐHA) → cùng số query."""
+        self._past_visit(days_ago=1)
+        with self.assertNumQueries(4):
+            digest = PatientHistoryService.load(self.patient)
+        self.assertEqual(len(digest.visits), 1)
+
+        for days_ago in range(2, 13):
+            self._past_visit(days_ago=days_ago)
+        self._past_visit(days_ago=20, with_results=False)
+
+        with self.assertNumQueries(4):
+            digest = PatientHistoryService.load(self.patient)  # thêm lượt khám → cache đã bị bỏ
+        self.assertEqual(len(digest.visits), 13)
+        # Render không chạm DB
+        with self.assertNumQueries(0):
+            digest.render_blocks()
+            digest.render_lines()
+
+    def test_rendered_prompts(self):
+        """Khối (Kiosk) / dòng (Phân luồng) chứa đủ bệnh án, xét nghiệm, CĐHA; lượt hiện tại bị loại."""
+        older = self._past_visit(days_ago=30, with_results=False)
+        latest = self._past_visit(days_ago=2)
+        current = Visit.objects.create(
+            patient=self.patient, visit_code='V-DG-NOW', status=Visit.Status.IN_PROGRESS, queue_number=99,
+            check_in_time=timezone.now(),
+        )
+
+        digest = PatientHistoryService.load(self.patient, exclude_visit=current)
+        self.assertEqual([v.visit_id for v in digest.visits], [str(latest.id), str(older.id)])
+        self.assertEqual(len(digest.visits[0].labs), 2)
+        self.assertEqual(digest.visits[1].labs, ())
+
+        blocks = digest.render_blocks()
+        date = latest.check_in_time.strftime('%d/%m/%Y')
+        self.assertTrue(blocks.startswith(f'--- Lượt khám 1 ({date}) ---\nKhoa: Nội tổng quát\n'))
+        self.assertIn(f'Lý do khám/Chẩn đoán sơ bộ: {latest.chief_complaint}', blocks)
+        self.assertIn('Chẩn đoán cuối cùng: Viêm dạ dày', blocks)
+        self.assertIn('Xét nghiệm:\n  - Glucose: 8.2 mmol/L [BẤT THƯỜNG]\n  - HbA1c: 5.4 %', blocks)
+        self.assertIn('Chẩn đoán hình ảnh:\n  - X-Quang ngực:\n    + Kết luận: Tim to độ I [BẤT THƯỜNG]', blocks)
+        self.assertIn('--- Lượt khám 2 (', blocks)
+
+        lines = digest.render_lines().split('\n')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith(f'[{date}] Lý do khám: {latest.chief_complaint}; Bệnh sử: Đau 3 ngày'))
+        self.assertIn('; Xét nghiệm Glucose: 8.2 mmol/L [BẤT THƯỜNG]; ', lines[0])
+        self.assertTrue(lines[0].endswith('; CĐHA X-Quang ngực - Kết luận: Tim to độ I [BẤT THƯỜNG]'))
+        self.assertNotIn('V-DG-NOW', digest.render_blocks())
+
+        empty = PatientHistoryService.load(Patient.objects.create(patient_code='BN-DG-002', first_name='Moi'))
+        self.assertEqual(empty.render_blocks(), 'Chưa có lịch sử khám.')
+        self.assertEqual(empty.render_lines(), '')
+
+
+class HistoryCacheTests(HistoryTestMixin, TestCase):
+    """Digest cache trong Redis, signals invalidate sau commit."""
+
+    def setUp(self):
+        if get_redis_client() is None:
+            self.skipTest('Redis không khả dụng')
+        super().setUp()
+        self.visit = self._past_visit(days_ago=3)
+        with self.assertNumQueries(4):
+            self.digest = PatientHistoryService.load(self.patient)
+
+    def test_returning_patient_reads_cache(self):
+        """Lần sau: 0 query, cùng nội dung; lượt hiện tại vẫn bị loại khi đọc từ cache."""
+        with self.assertNumQueries(0):
+            cached = PatientHistoryService.load(self.patient)
+        self.assertEqual(cached, self.digest)
+        with self.assertNumQueries(0):
+            self.assertEqual(PatientHistoryService.load(self.patient, exclude_visit=self.visit).visits, ())
+
+    def test_result_change_invalidates(self):
+        """Kết quả CĐHA của lượt khám trong digest đổi → lần đọc sau build lại."""
+        result = ImagingResult.objects.get(order__visit=self.visit)
+        result.conclusion = 'Bình thường'
+        result.is_abnormal = False
+        with self.captureOnCommitCallbacks(execute=True):
+            result.save()
+
+        with self.assertNumQueries(4):
+            digest = PatientHistoryService.load(self.patient)
+        self.assertEqual(digest.visits[0].imaging[0].conclusion, 'Bình thường')
+        self.assertFalse(digest.visits[0].imaging[0].abnormal)
+
+    def test_visit_status_changes(self):
+        """Check-in / xếp hàng không bỏ cache; lượt khám vào trạng thái của digest thì có."""
+        with self.captureOnCommitCallbacks(execute=True):
+            today = Visit.objects.create(
+                patient=self.patient, visit_code='V-DG-TODAY', status=Visit.Status.CHECK_IN, queue_number=50,
+                check_in_time=timezone.now(),
+            )
+            today.status = Visit.Status.WAITING
+            today.save()
+        with self.assertNumQueries(0):
+            PatientHistoryService.load(self.patient, exclude_visit=today)
+
+        today.status = Visit.Status.IN_PROGRESS
+        with self.captureOnCommitCallbacks(execute=True):
+            today.save(update_fields=['status'])
+        with self.assertNumQueries(4):
+            digest = PatientHistoryService.load(self.patient)
+        self.assertEqual(digest.visits[0].visit_id, str(today.id))
+
+        # Huỷ lượt khám đang có trong digest → rời digest
+        today.status = Visit.Status.CANCELLED
+        with self.captureOnCommitCallbacks(execute=True):
+            today.save()
+        self.assertEqual([v.visit_id for v in PatientHistoryService.load(self.patient).visits], [str(self.visit.id)])
+
+    def test_stale_build_not_cached(self):
+        """Build bắt đầu trước một lần invalidate không được ghi đè cache."""
+        client = get_redis_client()
+        PatientHistoryService.invalidate(self.patient.id)
+        generation = client.get(_generation_key(self.patient.id))
+        stale = PatientHistoryService.build(self.patient.id)
 
-# Create your tests here.
+        PatientHistoryService.invalidate(self.patient.id)  # thay đổi commit trong lúc build
+        PatientHistoryService._store(client, self.patient.id, stale, generation)
+        with self.assertNumQueries(4):
+            PatientHistoryService.load(self.patient)
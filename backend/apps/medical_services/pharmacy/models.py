@@ -252,11 +252,16 @@ class Prescription(UUIDModel):
 
     def save(self, *args, **kwargs):
         if self._state.adding and not self.prescription_code:
-            import uuid
-            self.prescription_code = f"RX-{uuid.uuid4().hex[:6].upper()}"
-            # Ensure it's unique
-            while Prescription.objects.filter(prescription_code=self.prescription_code).exists():
-                self.prescription_code = f"RX-{uuid.uuid4().hex[:6].upper()}"
+            # RX-YYYYMMDD-00001 — bộ đếm trung tâm, không dò exists() trên bảng;
+            # mã đã có (bộ đếm tụt / lô trùng) → create() dò lại bộ đếm và thử mã mới
+            from apps.core_services.core.utils import CodeAllocator
+
+            def insert(code):
+                self.prescription_code = code.code
+                super(Prescription, self).save(*args, **kwargs)
+
+            CodeAllocator.create('prescription', insert)
+            return
         super().save(*args, **kwargs)
 
 
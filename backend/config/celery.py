@@ -22,4 +22,19 @@ app.conf.beat_schedule = {
         'schedule': crontab(hour=23, minute=59),
         'args': (),
     },
+    'flush-stale-boards': {
+        'task': 'apps.core_services.qms.tasks.flush_stale_boards',
+        'schedule': 5.0,  # giây — trần thời gian 1 bảng hiển thị có thể bị treo
+        'args': (),
+    },
+    'reconcile-station-load': {
+        'task': 'apps.core_services.qms.tasks.reconcile_station_load',
+        'schedule': crontab(minute='*/5'),
+        'args': (),
+    },
+    'reconcile-queue-index': {
+        'task': 'apps.core_services.qms.tasks.reconcile_queue_index',
+        'schedule': crontab(minute='*/5'),
+        'args': (),
+    },
 }
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # trigram lookups (patients.search)
     'channels',  # Django Channels for WebSocket
     'apps.api',  # Streaming API 
     'apps.ai_engine.agents',
@@ -138,8 +139,11 @@ DATABASES = {
 REDIS_HOST = config('REDIS_HOST', default='localhost')
 REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
 REDIS_DB = config('REDIS_DB', default=0, cast=int)
+REDIS_TEST_DB = config('REDIS_TEST_DB', default=15, cast=int)  # manage.py test chạy trên DB này (FLUSHDB)
 REDIS_AGENT_MEMORY_TTL = config('REDIS_AGENT_MEMORY_TTL', default=86400, cast=int)
 
+TEST_RUNNER = 'apps.core_services.core.test_runner.RedisTestDBRunner'
+
 # Django Channels — Channel Layers (uses Redis above)
 CHANNEL_LAYERS = {
     'default': {
@@ -174,6 +178,7 @@ RAG_VECTOR_DB = config('RAG_VECTOR_DB', default='pgvector')
 RAG_EMBEDDING_PROVIDER = config('RAG_EMBEDDING_PROVIDER', default='google')
 RAG_EMBEDDING_MODEL = config('RAG_EMBEDDING_MODEL', default='gemini-embedding-001')
 RAG_EMBEDDING_DIMENSION = config('RAG_EMBEDDING_DIMENSION', default=768, cast=int)
+RAG_EMBEDDING_CACHE_SIZE = config('RAG_EMBEDDING_CACHE_SIZE', default=2048, cast=int)  # số vector giữ trong LRU mỗi process
 RAG_TOP_K_RESULTS = config('RAG_TOP_K_RESULTS', default=5, cast=int)
 RAG_SIMILARITY_THRESHOLD = config('RAG_SIMILARITY_THRESHOLD', default=0.5, cast=float)
 
@@ -269,6 +274,14 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Ho_Chi_Minh'
+# Tóm tắt AI lúc check-in Kiosk chạy trên queue riêng — worker riêng với concurrency cố định
+# (docker-compose: celery_ai_worker) để giờ cao điểm không vắt kiệt kết nối Postgres / LLM
+KIOSK_AI_SUMMARY_QUEUE = config('KIOSK_AI_SUMMARY_QUEUE', default='ai_summary')
+CELERY_TASK_ROUTES = {
+    'apps.core_services.kiosk.tasks.summarize_visit': {'queue': KIOSK_AI_SUMMARY_QUEUE},
+}
+# Mục tiêu thời gian phản hồi mỗi bước Kiosk (quét / đăng ký) — vượt thì đếm vào kiosk.latency.*.budget
+KIOSK_LATENCY_BUDGET_MS = config('KIOSK_LATENCY_BUDGET_MS', default=1000, cast=int)
 
 # ── Media files (TTS audio, uploads) ─────────────────────────────────
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -277,4 +290,30 @@ MEDIA_URL = '/media/'
 # ── TTS Configuration ────────────────────────────────────────────────
 TTS_VOICE = config('TTS_VOICE', default='vi-VN-HoaiMyNeural')
 TTS_AUDIO_DIR = 'audio/tts'  # relative to MEDIA_ROOT
+# Tạo trước clip cho số sắp gọi: đủ cho số lượt gọi dự kiến trong N phút tới (theo tốc độ gọi
+# thực tế của phòng), tối đa TTS_PRE_GENERATE_MAX; COUNT dùng khi phòng chưa có dữ liệu
 TTS_PRE_GENERATE_COUNT = config('TTS_PRE_GENERATE_COUNT', default=5, cast=int)
+TTS_PRE_GENERATE_MINUTES = config('TTS_PRE_GENERATE_MINUTES', default=10, cast=int)
+TTS_PRE_GENERATE_MAX = config('TTS_PRE_GENERATE_MAX', default=30, cast=int)
+# Backend tổng hợp giọng nói (edge-tts cần mạng; OfflineSynthesizer cho test / benchmark)
+TTS_SYNTHESIZER = config('TTS_SYNTHESIZER', default='apps.core_services.qms.tts_synthesizers.EdgeTTSSynthesizer')
+# Ghép câu gọi từ các đoạn audio cache sẵn (câu dẫn, số, phòng) — chỉ tổng hợp tên bệnh nhân
+TTS_SEGMENT_CACHE = config('TTS_SEGMENT_CACHE', default=True, cast=bool)
+# Kho clip (theo hash câu + giọng): giới hạn dung lượng (LRU) và tuổi tối đa khi dọn hằng ngày
+TTS_AUDIO_MAX_MB = config('TTS_AUDIO_MAX_MB', default=512, cast=int)
+TTS_AUDIO_MAX_AGE_HOURS = config('TTS_AUDIO_MAX_AGE_HOURS', default=24, cast=int)
+
+# ── QMS Display Board ────────────────────────────────────────────────
+# Gộp mọi thay đổi của 1 station trong cửa sổ này thành 1 lần push (ms, 0 = gửi ngay)
+QMS_BOARD_COALESCE_MS = config('QMS_BOARD_COALESCE_MS', default=150, cast=int)
+# Thời gian phục vụ mặc định khi chưa đủ dữ liệu thực tế (phút / bệnh nhân)
+QMS_DEFAULT_SERVICE_MINUTES = config('QMS_DEFAULT_SERVICE_MINUTES', default=10, cast=int)
+
+# ── EMR ──────────────────────────────────────────────────────────────
+# Digest bệnh án cũ theo bệnh nhân (Redis) — signals tự invalidate, TTL chỉ để giới hạn bộ nhớ
+EMR_HISTORY_CACHE_TTL = config('EMR_HISTORY_CACHE_TTL', default=86400, cast=int)
+
+# ── Insurance (BHYT) ─────────────────────────────────────────────────
+# Cache kết quả tra cứu cổng BHYT theo CCCD / mã thẻ (giây) — có thẻ / không có thẻ
+INSURANCE_LOOKUP_TTL = config('INSURANCE_LOOKUP_TTL', default=900, cast=int)
+INSURANCE_LOOKUP_NEGATIVE_TTL = config('INSURANCE_LOOKUP_NEGATIVE_TTL', default=60, cast=int)
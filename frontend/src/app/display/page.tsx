@@ -2,9 +2,13 @@
 
 import { useState, useEffect, useCallback, useRef } from 'react';
 import { qmsApi } from '@/lib/services';
+import { applyBoardDelta, emptyBoard } from '@/lib/qmsBoard';
 import type {
+    AudioReadyMessage,
     CalledPatient,
+    QueueBoardData,
     QueueBoardEntry,
+    QueueDeltaMessage,
     NoShowEntry,
 } from '@/types';
 
@@ -14,6 +18,9 @@ const sourceColors: Record<string, string> = {
     WALK_IN: '#8c8c8c',
 };
 
+// Chờ audio_ready tối đa bấy lâu rồi mới phát dự phòng
+const AUDIO_WAIT_MS = 8000;
+
 // Derive WS base URL from API URL
 function getWsUrl(stationId: string): string {
     const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1';
@@ -34,9 +41,11 @@ export default function PublicDisplayPage() {
     const pollRef = useRef<ReturnType<typeof setInterval> | null>(null);
     const reconnectTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
     const prevServingRef = useRef<Set<string>>(new Set());
+    const boardRef = useRef<QueueBoardData>(emptyBoard());
+    const pendingAudioRef = useRef<Map<string, { patient: CalledPatient; timer: ReturnType<typeof setTimeout> }>>(new Map());
 
     // TTS audio playback for display screen
-    const playTtsForPatient = useCallback((patient: CalledPatient) => {
+    const playAudio = useCallback((patient: CalledPatient) => {
         const API_BASE = (process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1');
         if (patient.audio_url) {
             const baseUrl = API_BASE.replace(/\/api\/v1\/?$/, '');
@@ -72,6 +81,20 @@ export default function PublicDisplayPage() {
         }
     }, []);
 
+    // Clip đang tạo (audio_pending) → phát khi nhận audio_ready, hết hạn chờ thì phát dự phòng
+    const playTtsForPatient = useCallback((patient: CalledPatient) => {
+        if (patient.audio_url || !patient.audio_pending) {
+            playAudio(patient);
+            return;
+        }
+        if (pendingAudioRef.current.has(patient.entry_id)) return;
+        const timer = setTimeout(() => {
+            pendingAudioRef.current.delete(patient.entry_id);
+            playAudio(patient);
+        }, AUDIO_WAIT_MS);
+        pendingAudioRef.current.set(patient.entry_id, { patient, timer });
+    }, [playAudio]);
+
     // Clock
     useEffect(() => {
         const tick = () => setClock(new Date().toLocaleTimeString('vi-VN', { hour: '2-digit', minute: '2-digit', second: '2-digit' }));
@@ -156,7 +179,26 @@ export default function PublicDisplayPage() {
                 try {
                     const msg = JSON.parse(event.data);
                     if (msg.type === 'queue_update' && msg.data) {
+                        boardRef.current = { ...msg.data, seq: msg.seq ?? null };
                         applyBoardData(msg.data);
+                    } else if (msg.type === 'queue_delta') {
+                        const delta = msg as QueueDeltaMessage;
+                        const seq = boardRef.current.seq;
+                        if (seq == null || delta.seq !== seq + 1) {
+                            // Mất gói / chưa có bảng → xin lại toàn bộ bảng
+                            ws.send(JSON.stringify({ type: 'resync' }));
+                            return;
+                        }
+                        boardRef.current = applyBoardDelta(boardRef.current, delta);
+                        applyBoardData(boardRef.current as unknown as Record<string, unknown>);
+                    } else if (msg.type === 'audio_ready') {
+                        const ready = msg as AudioReadyMessage;
+                        const pending = pendingAudioRef.current.get(ready.entry_id);
+                        if (pending) {
+                            clearTimeout(pending.timer);
+                            pendingAudioRef.current.delete(ready.entry_id);
+                            playAudio({ ...pending.patient, audio_url: ready.audio_url });
+                        }
                     }
                 } catch {
                     // ignore parse errors
@@ -197,7 +239,7 @@ export default function PublicDisplayPage() {
                 wsRef.current.close();
             }
         };
-    }, [stationId, applyBoardData]);
+    }, [stationId, applyBoardData, playAudio]);
 
     const nextUp = waitingList.slice(0, 8);
 
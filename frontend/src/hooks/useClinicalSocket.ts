@@ -32,7 +32,8 @@ const WS_BASE = process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8000';
  * useClinicalSocket — connects to ws/clinical/<stationId>/ for real-time
  * clinical dashboard notifications.
  *
- * Fires callbacks when new patients are assigned to the connected station.
+ * Fires callbacks when new patients are assigned to the connected station
+ * and whenever the station's queue board changes (queue_update / queue_delta).
  * Auto-reconnects with exponential backoff.
  */
 export function useClinicalSocket(
@@ -77,6 +78,9 @@ export function useClinicalSocket(
                         onNewPatientRef.current?.(msg.visit as ClinicalVisitPayload);
                     } else if (msg.type === 'queue_update' && msg.data) {
                         onQueueUpdateRef.current?.(msg.data);
+                    } else if (msg.type === 'queue_delta') {
+                        // Bảng của phòng thay đổi (cùng frame gửi cho màn hình LED)
+                        onQueueUpdateRef.current?.(msg);
                     }
                 } catch {
                     // Ignore malformed messages
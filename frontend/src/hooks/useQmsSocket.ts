@@ -1,7 +1,8 @@
 'use client';
 
 import { useState, useEffect, useRef, useCallback } from 'react';
-import type { CalledPatient, NoShowEntry } from '@/types';
+import { applyBoardDelta, emptyBoard } from '@/lib/qmsBoard';
+import type { CalledPatient, NoShowEntry, QueueBoardData, QueueDeltaMessage } from '@/types';
 
 interface QmsBoardData {
     currently_serving: CalledPatient[];
@@ -24,6 +25,7 @@ const WS_BASE = process.env.NEXT_PUBLIC_WS_URL || 'ws://localhost:8000';
  * queue board updates.
  *
  * Replaces polling setInterval(fetchQueueBoard, N).
+ * Applies queue_delta messages locally; asks for a resync on a seq gap.
  * Auto-reconnects with exponential backoff.
  */
 export function useQmsSocket(
@@ -33,6 +35,7 @@ export function useQmsSocket(
     const wsRef = useRef<WebSocket | null>(null);
     const reconnectTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
     const reconnectAttemptRef = useRef(0);
+    const boardRef = useRef<QueueBoardData>(emptyBoard());
 
     const onBoardUpdateRef = useRef(options.onBoardUpdate);
     onBoardUpdateRef.current = options.onBoardUpdate;
@@ -61,11 +64,22 @@ export function useQmsSocket(
                 try {
                     const msg = JSON.parse(event.data);
                     if (msg.type === 'queue_update' && msg.data) {
-                        onBoardUpdateRef.current?.({
-                            currently_serving: msg.data.currently_serving || [],
-                            no_show_list: msg.data.no_show_list || [],
-                        });
+                        boardRef.current = { ...msg.data, seq: msg.seq ?? null };
+                    } else if (msg.type === 'queue_delta') {
+                        const delta = msg as QueueDeltaMessage;
+                        const seq = boardRef.current.seq;
+                        if (seq == null || delta.seq !== seq + 1) {
+                            ws.send(JSON.stringify({ type: 'resync' }));
+                            return;
+                        }
+                        boardRef.current = applyBoardDelta(boardRef.current, delta);
+                    } else {
+                        return;
                     }
+                    onBoardUpdateRef.current?.({
+                        currently_serving: boardRef.current.currently_serving || [],
+                        no_show_list: boardRef.current.no_show_list || [],
+                    });
                 } catch {
                     // Ignore
                 }
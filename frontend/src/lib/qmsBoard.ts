@@ -0,0 +1,93 @@
+/**
+ * QMS Board — áp dụng queue_delta (WebSocket) lên bảng hàng chờ đang giữ ở client.
+ *
+ * Server chỉ gửi các entry thay đổi kèm seq; client tự xếp lại từng danh sách
+ * theo cùng thứ tự với get_queue_board và cắt độ dài như server.
+ */
+
+import type {
+    CalledPatient,
+    NoShowEntry,
+    QueueBoardChange,
+    QueueBoardData,
+    QueueBoardEntry,
+    QueueCompletedEntry,
+    QueueDeltaMessage,
+} from '@/types';
+
+const COMPLETED_LIMIT = 10;
+const NO_SHOW_LIMIT = 20;
+
+const ts = (value?: string | null) => (value ? Date.parse(value) : 0);
+
+function withoutEntry<T extends { entry_id: string }>(list: T[], entryId: string): T[] {
+    return list.filter((e) => e.entry_id !== entryId);
+}
+
+/** Bảng rỗng — dùng trước khi nhận queue_update đầu tiên */
+export function emptyBoard(): QueueBoardData {
+    return {
+        station: { code: '', name: '' },
+        currently_serving: [],
+        waiting_list: [],
+        completed_list: [],
+        no_show_list: [],
+        total_waiting: 0,
+        estimated_wait_minutes: 0,
+        seq: null,
+    };
+}
+
+/**
+ * Trả về bảng mới sau khi áp dụng delta (không sửa bảng cũ).
+ * Caller kiểm tra seq trước: server đã bỏ delta cũ và tự resync khi mất gói.
+ */
+export function applyBoardDelta(board: QueueBoardData, delta: QueueDeltaMessage): QueueBoardData {
+    let serving = board.currently_serving;
+    let waiting = board.waiting_list;
+    let completed = board.completed_list;
+    let noShow = board.no_show_list;
+
+    delta.changes.forEach((change: QueueBoardChange) => {
+        const entryId = change.op === 'remove' ? change.entry_id : change.entry.entry_id;
+        serving = withoutEntry(serving, entryId);
+        waiting = withoutEntry(waiting, entryId);
+        completed = withoutEntry(completed, entryId);
+        noShow = withoutEntry(noShow, entryId);
+
+        if (change.op !== 'upsert') return;
+        switch (change.section) {
+            case 'currently_serving':
+                serving = [...serving, change.entry as CalledPatient];
+                break;
+            case 'waiting_list':
+                waiting = [...waiting, change.entry as QueueBoardEntry];
+                break;
+            case 'completed_list':
+                completed = [...completed, change.entry as QueueCompletedEntry];
+                break;
+            case 'no_show_list':
+                noShow = [...noShow, change.entry as NoShowEntry];
+                break;
+        }
+    });
+
+    // Cùng thứ tự với ClinicalQueueService.get_queue_board
+    serving = [...serving].sort((a, b) => b.priority - a.priority || ts(a.called_time) - ts(b.called_time));
+    waiting = [...waiting]
+        .sort((a, b) => b.priority - a.priority || ts(a.entered_queue_time) - ts(b.entered_queue_time))
+        .map((e, idx) => ({ ...e, position: idx + 1 }));
+    completed = [...completed].sort((a, b) => ts(b.ended_at) - ts(a.ended_at)).slice(0, COMPLETED_LIMIT);
+    noShow = [...noShow].sort((a, b) => ts(b.ended_at) - ts(a.ended_at)).slice(0, NO_SHOW_LIMIT);
+
+    return {
+        ...board,
+        currently_serving: serving,
+        waiting_list: waiting,
+        completed_list: completed,
+        no_show_list: noShow,
+        total_waiting: delta.total_waiting ?? waiting.length,
+        estimated_wait_minutes: delta.estimated_wait_minutes ?? board.estimated_wait_minutes,
+        seq: delta.seq,
+    };
+}
@@ -198,6 +198,9 @@ export interface CalledPatient {
     station_name: string;
     wait_time_minutes: number | null;
     audio_url: string | null;
+    /** Clip TTS đang được tạo — chờ tin audio_ready (WebSocket) */
+    audio_pending?: boolean;
+    called_time?: string | null;
 }
 
 /** Entry trong danh sách chờ */
@@ -211,6 +214,7 @@ export interface QueueBoardEntry {
     priority: number;
     priority_label?: string;
     wait_time_minutes: number | null;
+    entered_queue_time?: string | null;
 }
 
 /** Entry đã hoàn thành */
@@ -222,6 +226,7 @@ export interface QueueCompletedEntry {
     source_type: QueueSourceType;
     status: QueueStatus;
     end_time: string | null;
+    ended_at?: string | null;
 }
 
 /** Response từ queue/board/ endpoint */
@@ -233,6 +238,33 @@ export interface QueueBoardData {
     no_show_list: NoShowEntry[];
     total_waiting: number;
     estimated_wait_minutes: number;
+    /** Số phiên bản bảng (WebSocket) — null khi server không có Redis */
+    seq?: number | null;
+}
+
+/** 1 thay đổi trong queue_delta (WebSocket) */
+export type QueueBoardChange =
+    | {
+        op: 'upsert';
+        section: 'currently_serving' | 'waiting_list' | 'completed_list' | 'no_show_list';
+        entry: CalledPatient | QueueBoardEntry | QueueCompletedEntry | NoShowEntry;
+    }
+    | { op: 'remove'; entry_id: string };
+
+/** Tin nhắn queue_delta — chỉ gồm các entry thay đổi */
+export interface QueueDeltaMessage {
+    type: 'queue_delta';
+    seq: number;
+    changes: QueueBoardChange[];
+    total_waiting?: number;
+    estimated_wait_minutes?: number;
+}
+
+/** Tin nhắn audio_ready — clip TTS của số đang gọi đã sẵn sàng */
+export interface AudioReadyMessage {
+    type: 'audio_ready';
+    entry_id: string;
+    audio_url: string;
 }
 
 /** Entry vắng mặt (có thể gọi lại) */
@@ -245,6 +277,7 @@ export interface NoShowEntry {
     source_type: QueueSourceType;
     status: string;
     end_time: string | null;
+    ended_at?: string | null;
 }
 
 /** Booking check-in lateness info */